@@ -3,12 +3,15 @@ import json
 import logging
 import os
 import socket
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from io import open
+from io import BytesIO, open
 
 # Third party imports
-from googleapiclient.discovery import build
+import googleapiclient.http
 from googleapiclient.errors import HttpError
 
 # Project imports
@@ -17,9 +20,14 @@ import common
 import gcs_utils
 import resources
 from constants import bq_utils as bq_consts
+from utils import bq_columns, service_cache
 
 socket.setdefaulttimeout(bq_consts.SOCKET_TIMEOUT)
 
+# Finished job resources never change, so they are kept to avoid refetching
+_finished_jobs = OrderedDict()
+_finished_jobs_lock = threading.Lock()
+
 
 class InvalidOperationError(RuntimeError):
     """Raised when an invalid Big Query operation attempted during the validation process"""
@@ -29,6 +37,14 @@ class InvalidOperationError(RuntimeError):
         super(InvalidOperationError, self).__init__(self.msg)
 
 
+class LoadJobError(InvalidOperationError):
+    """Raised when a load job finished with an error"""
+
+    def __init__(self, error_result):
+        self.error_result = error_result
+        super(LoadJobError, self).__init__(error_result.get('message'))
+
+
 class BigQueryJobWaitError(RuntimeError):
     """Raised when jobs fail to complete after waiting"""
 
@@ -125,7 +141,12 @@ def get_validation_results_dataset_id():
 
 
 def create_service():
-    return build('bigquery', 'v2', cache={})
+    """
+    Get the BigQuery client for the current thread, building it if needed
+
+    :return: a BigQuery discovery client
+    """
+    return service_cache.get_service('bigquery', 'v2')
 
 
 def get_table_id(hpo_id, table_name):
@@ -353,39 +374,217 @@ def sleeper(poll_interval):
     return
 
 
+def _is_job_done(job_resource):
+    """
+    Check if a job resource describes a completed job
+
+    :param job_resource: the job resource or None if it is unknown
+    :return: a bool indicating whether the job is done
+    """
+    if job_resource is None:
+        return False
+    return job_resource[bq_consts.STATUS][bq_consts.STATE] == bq_consts.DONE
+
+
+def _runtime_poll_interval(job_resources):
+    """
+    Get a poll interval proportional to the runtime of the slowest running job
+
+    Jobs which have been running for a long time are unlikely to finish soon, so
+    there is no need to poll them often.
+
+    :param job_resources: resources of the jobs which are still running
+    :return: seconds to wait before polling again, 0 if runtimes are unknown
+    """
+    start_times = [
+        int(job_resource[bq_consts.STATISTICS][bq_consts.START_TIME])
+        for job_resource in job_resources
+        if bq_consts.START_TIME in job_resource.get(bq_consts.STATISTICS, {})
+    ]
+    if not start_times:
+        return 0
+    slowest_runtime = time.time() - min(start_times) / 1000.0
+    return min(bq_consts.MAX_POLL_INTERVAL,
+               slowest_runtime * bq_consts.POLL_RUNTIME_FRACTION)
+
+
 def wait_on_jobs(job_ids, retry_count=bq_consts.BQ_DEFAULT_RETRY_COUNT):
     """
     Implements exponential backoff to wait for jobs to complete
+
+    All outstanding jobs are polled with a single batch request. The poll
+    interval grows with the runtime of the slowest running job.
+
     :param job_ids: list of job_id strings
     :param retry_count: max number of iterations for exponent
     :return: list of jobs that failed to complete or empty list if all completed
     """
     job_ids = list(job_ids)
-    poll_interval = 1
+    backoff_interval = poll_interval = 1
     for _ in range(retry_count):
         logging.info(
             f'Waiting {poll_interval} seconds for completion of job(s): {job_ids}'
         )
         sleeper(poll_interval)
-        job_ids = [job_id for job_id in job_ids if not job_status_done(job_id)]
+        job_resources = get_jobs_details(job_ids)
+        job_ids = [
+            job_id for job_id in job_ids
+            if not _is_job_done(job_resources.get(job_id))
+        ]
         if not job_ids:
             return job_ids
-        if poll_interval < bq_consts.MAX_POLL_INTERVAL:
-            poll_interval *= 2
+        if backoff_interval < bq_consts.MAX_POLL_INTERVAL:
+            backoff_interval *= 2
+        running_jobs = [
+            job_resources[job_id]
+            for job_id in job_ids
+            if job_id in job_resources
+        ]
+        poll_interval = max(backoff_interval,
+                            _runtime_poll_interval(running_jobs))
     logging.info(f'Job(s) {job_ids} failed to complete')
     return job_ids
 
 
+def _get_finished_job(job_id):
+    """
+    Get the resource of a finished job fetched previously
+
+    :param job_id: the job id
+    :return: the job resource or None if the job is not known to be finished
+    """
+    with _finished_jobs_lock:
+        return _finished_jobs.get(job_id)
+
+
+def _store_job(job_id, job_resource):
+    """
+    Keep the resource of a job if it is finished so it is not fetched again
+
+    :param job_id: the job id
+    :param job_resource: the job resource
+    """
+    if not _is_job_done(job_resource):
+        return
+    with _finished_jobs_lock:
+        _finished_jobs[job_id] = job_resource
+        while len(_finished_jobs) > bq_consts.JOB_CACHE_SIZE:
+            _finished_jobs.popitem(last=False)
+
+
 def get_job_details(job_id):
     """Get job resource corresponding to job_id
+
+    The resources of finished jobs are cached, so they are only fetched once.
+
     :param job_id: id of the job to get (i.e. `jobReference.jobId` in response body of insert request)
     :returns: the job resource (for details see https://goo.gl/bUE49Z)
     """
+    job_resource = _get_finished_job(job_id)
+    if job_resource is not None:
+        return job_resource
     bq_service = create_service()
     app_id = app_identity.get_application_id()
-    return bq_service.jobs().get(
+    job_resource = bq_service.jobs().get(
         projectId=app_id,
         jobId=job_id).execute(num_retries=bq_consts.BQ_DEFAULT_RETRY_COUNT)
+    _store_job(job_id, job_resource)
+    return job_resource
+
+
+def get_jobs_details(job_ids):
+    """
+    Get the job resources corresponding to several job ids
+
+    Jobs are fetched together using batch http requests rather than one
+    request per job. The resources of finished jobs are cached, so they are
+    only fetched once. Requests failing with transient errors are batched
+    again with backoff, then sent one at a time with retries.
+
+    :param job_ids: ids of the jobs to get
+    :return: dict of job id to job resource. Jobs which could not be fetched
+        are omitted.
+    """
+    job_resources = dict()
+    unfinished_job_ids = []
+    for job_id in job_ids:
+        job_resource = _get_finished_job(job_id)
+        if job_resource is None:
+            unfinished_job_ids.append(job_id)
+        else:
+            job_resources[job_id] = job_resource
+    if not unfinished_job_ids:
+        return job_resources
+
+    retry_job_ids = []
+
+    def _store_response(request_id, response, exception):
+        if exception is not None:
+            logging.warning(f'Failed to get status of job {request_id}: '
+                            f'{exception}')
+            if _is_retryable_error(exception):
+                retry_job_ids.append(request_id)
+            return
+        job_resources[request_id] = response
+        _store_job(request_id, response)
+
+    app_id = app_identity.get_application_id()
+    for attempt in range(bq_consts.JOB_BATCH_RETRY_COUNT):
+        if attempt:
+            sleeper(2**(attempt - 1))
+        bq_service = create_service()
+        for i in range(0, len(unfinished_job_ids), bq_consts.JOB_BATCH_SIZE):
+            batch_job_ids = unfinished_job_ids[i:i + bq_consts.JOB_BATCH_SIZE]
+            batch = bq_service.new_batch_http_request(callback=_store_response)
+            for job_id in batch_job_ids:
+                batch.add(bq_service.jobs().get(projectId=app_id, jobId=job_id),
+                          request_id=job_id)
+            try:
+                batch.execute()
+            except (HttpError, socket.error) as e:
+                logging.warning(f'Failed to get status of jobs in batch: {e}')
+                service_cache.invalidate_on_error(e)
+                retry_job_ids.extend(job_id for job_id in batch_job_ids
+                                     if job_id not in job_resources and
+                                     job_id not in retry_job_ids)
+        unfinished_job_ids = list(retry_job_ids)
+        retry_job_ids.clear()
+        if not unfinished_job_ids:
+            return job_resources
+
+    # get the jobs the batches failed to get one at a time, with retries
+    for job_id in unfinished_job_ids:
+        try:
+            job_resources[job_id] = get_job_details(job_id)
+        except (HttpError, socket.error) as e:
+            logging.warning(f'Failed to get status of job {job_id}: {e}')
+    return job_resources
+
+
+def _is_retryable_error(exception):
+    """
+    Determine if a failed request is worth sending again
+
+    :param exception: the error raised by the request
+    :return: True if the error is transient, i.e. a server error or a rate
+        limit error, False otherwise
+    """
+    if not isinstance(exception, HttpError):
+        return isinstance(exception, socket.error)
+    status = int(exception.resp.status)
+    if status in bq_consts.RETRYABLE_HTTP_STATUSES:
+        return True
+    if status == 403:
+        try:
+            content = json.loads(exception.content.decode('utf-8'))
+            reasons = [
+                error.get('reason')
+                for error in content['error'].get('errors', [])
+            ]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return False
+        return any(reason in bq_consts.RATE_LIMIT_REASONS for reason in reasons)
+    return False
 
 
 def merge_tables(source_dataset_id, source_table_id_list,
@@ -643,113 +842,152 @@ def get_dataset_id_from_obj(dataset_obj):
     return dataset_obj['id'].split(':')[-1]
 
 
-def large_response_to_rowlist(query_response):
+def get_query_results_page(job_id,
+                           page_token=None,
+                           start_index=None,
+                           max_results=None):
     """
-    Convert a query response to a list of dictionary objects
-
-    This automatically uses the pageToken feature to iterate through a
-    large result set.  Use cautiously.
-
-    :param query_response: the query response object to iterate
-    :return: list of dictionaries
+    Fetch a page of the results of a query job
+
+    :param job_id: identifies the query job
+    :param page_token: token of the page returned with the previous page
+    :param start_index: zero-based index of the first row of the page, used
+        instead of a page token to fetch pages out of order
+    :param max_results: maximum number of rows of the page
+    :return: the getQueryResults response (see https://goo.gl/bQ7o2t)
     """
     bq_service = create_service()
     app_id = app_identity.get_application_id()
+    kwargs = dict(projectId=app_id, jobId=job_id)
+    if page_token is not None:
+        kwargs['pageToken'] = page_token
+    if start_index is not None:
+        kwargs['startIndex'] = start_index
+    if max_results is not None:
+        kwargs['maxResults'] = max_results
+    return bq_service.jobs().getQueryResults(**kwargs).execute(
+        num_retries=bq_consts.BQ_DEFAULT_RETRY_COUNT)
 
-    page_token = query_response.get(bq_consts.PAGE_TOKEN)
-    job_ref = query_response.get(bq_consts.JOB_REFERENCE)
-    job_id = job_ref.get(bq_consts.JOB_ID)
-
-    result_list = response2rows(query_response)
-    while page_token:
-        next_grouping = bq_service.jobs() \
-            .getQueryResults(projectId=app_id, jobId=job_id, pageToken=page_token) \
-            .execute(num_retries=bq_consts.BQ_DEFAULT_RETRY_COUNT)
-        page_token = next_grouping.get(bq_consts.PAGE_TOKEN)
-        intermediate_rows = response2rows(next_grouping)
-        result_list.extend(intermediate_rows)
-
-    return result_list
 
+def _get_job_id(query_response):
+    return query_response.get(bq_consts.JOB_REFERENCE).get(bq_consts.JOB_ID)
 
-def response2rows(r):
-    """
-    Convert a query response to a list of dict
 
-    :param r: a query response object
-    :return: list of dict
+def iter_response_pages(query_response, prefetch=True):
     """
-    rows = r.get(bq_consts.ROWS, [])
-    schema = r.get(bq_consts.SCHEMA, {bq_consts.FIELDS: None})[bq_consts.FIELDS]
-    return [_transform_row(row, schema) for row in rows]
+    Iterate through the pages of a query response
 
+    The first page is the query response itself.  With prefetch, the next page
+    is fetched in the background while the current one is processed, so at
+    most two pages are held at a time.
 
-def _recurse_on_row(col_dict, nested_value):
+    :param query_response: the query response object to iterate
+    :param prefetch: if True, fetch the next page while the current one is processed
+    :return: generator of query responses
     """
-    Apply the schema specified by the given dict to the nested value by recursing on it.
+    job_id = _get_job_id(query_response)
+    page = query_response
+    if not prefetch:
+        while page is not None:
+            page_token = page.get(bq_consts.PAGE_TOKEN)
+            yield page
+            page = get_query_results_page(
+                job_id, page_token=page_token) if page_token else None
+        return
+
+    # the worker thread uses a discovery client of its own
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        while page is not None:
+            page_token = page.get(bq_consts.PAGE_TOKEN)
+            next_page = executor.submit(
+                get_query_results_page, job_id,
+                page_token=page_token) if page_token else None
+            yield page
+            page = next_page.result() if next_page else None
+
+
+def iter_response_batches(query_response, prefetch=True):
+    """
+    Iterate through the results of a query response one page of columns at a time
 
-        :param col_dict: the schema to apply to the nested value.
-        :param nested_value: A value nested in a BigQuery row.
-        :returns: Union[dict, list] objects from applied schema.
-        """
+    :param query_response: the query response object to iterate
+    :param prefetch: if True, fetch the next page while the current one is processed
+    :return: generator of OrderedDicts of column name => bq_columns.Column
+    """
+    for page in iter_response_pages(query_response, prefetch):
+        yield bq_columns.decode_response(page)
 
-    row_value = None
 
-    # Multiple nested records
-    if col_dict['mode'] == 'REPEATED' and isinstance(nested_value, list):
-        row_value = [
-            _transform_row(record['v'], col_dict['fields'])
-            for record in nested_value
-        ]
+def iter_response_rows(query_response, prefetch=True):
+    """
+    Iterate through the rows of a query response page by page
 
-    # A single nested record
-    else:
-        row_value = _transform_row(nested_value, col_dict['fields'])
+    Unlike large_response_to_rowlist, only the rows of the current page and the
+    page being prefetched are held in memory.
 
-    return row_value
+    :param query_response: the query response object to iterate
+    :param prefetch: if True, fetch the next page while the current one is processed
+    :return: generator of dict
+    """
+    for page in iter_response_pages(query_response, prefetch):
+        for row in response2rows(page):
+            yield row
 
 
-def _transform_row(row, schema):
+def _fetch_pages_in_parallel(query_response, max_workers):
     """
-    Apply the given schema to the given BigQuery data row. Adapted from https://goo.gl/dWszQJ.
+    Fetch the remaining pages of a query response concurrently by row index
 
-    :param row: A single BigQuery row to transform
-    :param schema: The BigQuery table schema to apply to the row, specifically
-        the list of field dicts.
-    :returns: Row as a dict
+    :param query_response: the query response object to iterate
+    :param max_workers: maximum number of pages fetched at the same time
+    :return: list of query responses, in row order, the first being query_response
     """
+    page_size = len(query_response.get(bq_consts.ROWS, []))
+    total_rows = int(query_response.get(bq_consts.TOTAL_ROWS, 0))
+    if not query_response.get(bq_consts.PAGE_TOKEN) or page_size == 0:
+        return list(iter_response_pages(query_response, prefetch=False))
+
+    job_id = _get_job_id(query_response)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pages = executor.map(
+            lambda start_index: get_query_results_page(
+                job_id, start_index=start_index, max_results=page_size),
+            range(page_size, total_rows, page_size))
+        return [query_response] + list(pages)
+
+
+def large_response_to_rowlist(query_response,
+                              parallel=False,
+                              max_workers=bq_consts.DEFAULT_PAGE_FETCH_WORKERS):
+    """
+    Convert a query response to a list of dictionary objects
 
-    log = {}
-
-    # Match each schema column with its associated row value
-    for index, col_dict in enumerate(schema):
-        col_name = col_dict['name']
-        row_value = row['f'][index]['v']
-
-        if row_value is None:
-            log[col_name] = None
-            continue
-
-        # Recurse on nested records
-        if col_dict['type'] == 'RECORD':
-            row_value = _recurse_on_row(col_dict, row_value)
-
-        # Otherwise just cast the value
-        elif col_dict['type'] == 'INTEGER':
-            row_value = int(row_value)
+    This automatically uses the pageToken feature to iterate through a
+    large result set.  Use cautiously, iter_response_rows reads the results
+    without holding all of them in memory.
 
-        elif col_dict['type'] == 'FLOAT':
-            row_value = float(row_value)
+    :param query_response: the query response object to iterate
+    :param parallel: if True, fetch all of the pages concurrently
+    :param max_workers: maximum number of pages fetched at the same time when parallel
+    :return: list of dictionaries
+    """
+    if not parallel:
+        return list(iter_response_rows(query_response))
 
-        elif col_dict['type'] == 'BOOLEAN':
-            row_value = row_value in ('True', 'true', 'TRUE')
+    result_list = []
+    for page in _fetch_pages_in_parallel(query_response, max_workers):
+        result_list.extend(response2rows(page))
+    return result_list
 
-        elif col_dict['type'] == 'TIMESTAMP':
-            row_value = float(row_value)
 
-        log[col_name] = row_value
+def response2rows(r):
+    """
+    Convert a query response to a list of dict
 
-    return log
+    :param r: a query response object
+    :return: list of dict
+    """
+    return bq_columns.response_to_dicts(r)
 
 
 def list_all_table_ids(dataset_id=None):
@@ -842,12 +1080,65 @@ def create_dataset(project_id=None,
     return insert_result
 
 
-def csv_line_to_sql_row_expr(row: dict, fields: list):
+# field types whose values are written to JSON records as numbers
+JSON_CONVERTERS = {
+    'integer': int,
+    'int64': int,
+    'float': float,
+    'float64': float
+}
+
+
+def get_field_map(fields):
+    """
+    Map each field name to its spec, with lower case type and mode
+
+    The map is built once per table so each value is matched to its field with a
+    dictionary lookup rather than a search through the fields.
+
+    :param fields: bigquery fields spec with keys {name, type, mode, description}
+    :return: dict of field name => field spec
+    """
+    return {
+        field['name']: dict(field,
+                            type=field['type'].lower(),
+                            mode=field.get('mode', 'nullable').lower())
+        for field in fields
+    }
+
+
+def _get_field(field_map, field_name, val):
+    field = field_map.get(field_name)
+    if field is None:
+        raise InvalidOperationError(
+            f'Unable to marshal {val}: field "{field_name}" was not found')
+    return field
+
+
+def _empty_value(field, field_name):
+    """
+    Get the value stored for a missing value of a field
+
+    :param field: the field spec from get_field_map
+    :param field_name: name of the field
+    :return: None for nullable fields and '' for required string fields
+    :raises InvalidOperationError: if the field is required and not a string
+    """
+    if field['mode'] == 'nullable':
+        return None
+    if field['type'] == 'string':
+        return ''
+    raise InvalidOperationError(
+        f'Value not provided for required field {field_name}')
+
+
+def csv_line_to_sql_row_expr(row: dict, fields: list, field_map: dict = None):
     """
     Translate a dict to a SQL row expression based on a fields spec
 
     :param row: dict whose values are all strings
     :param fields: bigquery fields spec with keys {name, type, mode, description}
+    :param field_map: the result of get_field_map(fields), to avoid building it for each row
     :return: SQL expression for row object
     :rtype: str
     :example:
@@ -857,21 +1148,15 @@ def csv_line_to_sql_row_expr(row: dict, fields: list):
     >>> csv_line_to_sql_row_expr({'int_col': '1234', 'date_col': '2019-01-01', 'str_col': ''}, fields)
     "(1234, '2019-01-01', NULL)"
     """
+    if field_map is None:
+        field_map = get_field_map(fields)
     val_exprs = []
     # TODO refactor for all other types or use external library
     for field_name, val in row.items():
-        field = next(filter(lambda f: f['name'] == field_name, fields), None)
-        if field is None:
-            raise InvalidOperationError(
-                f'Unable to marshal {val}: field "{field_name}" was not found')
+        field = _get_field(field_map, field_name, val)
         if not val:
-            if field['mode'] == 'nullable':
-                val_expr = "NULL"
-            elif field['type'] == 'string':
-                val_expr = "''"
-            else:
-                raise InvalidOperationError(
-                    f'Value not provided for required field {field_name}')
+            empty = _empty_value(field, field_name)
+            val_expr = "NULL" if empty is None else "''"
         elif field['type'] in ['string', 'date', 'timestamp']:
             val_expr = f"'{val}'"
         else:
@@ -881,11 +1166,198 @@ def csv_line_to_sql_row_expr(row: dict, fields: list):
     return f'({cols})'
 
 
+def row_to_json_record(row, field_map):
+    """
+    Translate a dict to a newline delimited JSON record based on a fields spec
+
+    Missing values follow the rules of csv_line_to_sql_row_expr.  Numbers read as
+    strings are converted, BigQuery parses other strings into the type of their field.
+
+    :param row: dict of field name => value, either strings read from a CSV or typed values
+    :param field_map: the result of get_field_map
+    :return: JSON record
+    :rtype: str
+    """
+    record = {}
+    for field_name, val in row.items():
+        field = _get_field(field_map, field_name, val)
+        if val is None or val == '':
+            val = _empty_value(field, field_name)
+            if val is None:
+                continue
+        elif isinstance(val, str) and field['type'] in JSON_CONVERTERS:
+            val = JSON_CONVERTERS[field['type']](val)
+        record[field_name] = val
+    return json.dumps(record, default=str)
+
+
+def _is_quota_error(error_result):
+    """
+    True if the error of a load job is due to the load job quotas
+
+    :param error_result: errorResult of a job status or an error of an API response
+    :return: bool
+    """
+    return error_result.get('reason') in bq_consts.LOAD_JOB_QUOTA_REASONS
+
+
+def _http_error_result(http_error):
+    """
+    Get the first error of an HttpError's response
+
+    :param http_error: an HttpError
+    :return: dict with keys reason and message, empty if the response can not be parsed
+    """
+    try:
+        content = json.loads(http_error.content.decode('utf-8'))
+        return content['error']['errors'][0]
+    except (ValueError, KeyError, IndexError, AttributeError):
+        return {}
+
+
+def load_rows_with_load_job(project_id, dataset_id, table_name, rows, fields):
+    """
+    Replace the contents of a table with rows uploaded as a load job
+
+    The rows are serialized as newline delimited JSON and sent with the job
+    request as a media upload, so no bucket is needed.
+
+    :param project_id: project containing the dataset
+    :param dataset_id: dataset where the table needs to be created
+    :param table_name: name of the table to be created
+    :param rows: iterable of dict
+    :param fields: fields in list of dicts format
+    :return: the finished load job
+    :raises InvalidOperationError: if the load job failed
+    """
+    field_map = get_field_map(fields)
+    data = BytesIO()
+    for row in rows:
+        data.write(row_to_json_record(row, field_map).encode('utf-8'))
+        data.write(b'\n')
+    data.seek(0)
+
+    load = {
+        bq_consts.SCHEMA: {
+            bq_consts.FIELDS: fields
+        },
+        'destinationTable': {
+            'projectId': project_id,
+            'datasetId': dataset_id,
+            'tableId': table_name
+        },
+        'sourceFormat': bq_consts.NEWLINE_DELIMITED_JSON,
+        'writeDisposition': bq_consts.WRITE_TRUNCATE,
+        'createDisposition': bq_consts.CREATE_IF_NEEDED
+    }
+    job_body = {'configuration': {'load': load}}
+    media_body = googleapiclient.http.MediaIoBaseUpload(
+        data, mimetype=bq_consts.OCTET_STREAM, resumable=True)
+    bq_service = create_service()
+    insert_result = bq_service.jobs().insert(
+        projectId=project_id, body=job_body, media_body=media_body).execute(
+            num_retries=bq_consts.BQ_DEFAULT_RETRY_COUNT)
+
+    job_id = insert_result[bq_consts.JOB_REFERENCE][bq_consts.JOB_ID]
+    incomplete_jobs = wait_on_jobs([job_id])
+    if incomplete_jobs:
+        raise InvalidOperationError(
+            f'Load job {job_id} of {table_name} is taking too long')
+    job = get_job_details(job_id)
+    error_result = job['status'].get('errorResult')
+    if error_result:
+        raise LoadJobError(error_result)
+    return job
+
+
+def load_rows_with_inserts(project_id, dataset_id, table_name, rows, fields):
+    """
+    Replace the contents of a table with rows inserted by chunks of INSERT statements
+
+    :param project_id: project containing the dataset
+    :param dataset_id: dataset where the table needs to be created
+    :param table_name: name of the table to be created
+    :param rows: iterable of dict whose values are all strings
+    :param fields: fields in list of dicts format
+    :return: BQ response for the last insert query
+    """
+    field_map = get_field_map(fields)
+    field_names = ', '.join([field['name'] for field in fields])
+
+    create_table(table_id=table_name,
+                 fields=fields,
+                 drop_existing=True,
+                 dataset_id=dataset_id)
+
+    result = None
+    row_exprs = []
+    for row in rows:
+        row_exprs.append(csv_line_to_sql_row_expr(row, fields, field_map))
+        if len(row_exprs) == bq_consts.INSERT_CHUNK_SIZE:
+            result = _insert_row_exprs(project_id, dataset_id, table_name,
+                                       field_names, row_exprs)
+            row_exprs = []
+    if row_exprs:
+        result = _insert_row_exprs(project_id, dataset_id, table_name,
+                                   field_names, row_exprs)
+    return result
+
+
+def _insert_row_exprs(project_id, dataset_id, table_name, field_names,
+                      row_exprs):
+    table_populate_query = bq_consts.INSERT_QUERY.format(
+        project_id=project_id,
+        dataset_id=dataset_id,
+        table_id=table_name,
+        columns=field_names,
+        mapping_list=', '.join(row_exprs))
+    return query(table_populate_query)
+
+
+def load_table_from_rows(project_id,
+                         dataset_id,
+                         table_name,
+                         rows,
+                         fields,
+                         use_load_job=True):
+    """
+    Loads BQ table from an in-memory table
+
+    A load job is used unless the load job quotas of the table are exhausted, in which
+    case the rows are inserted with chunks of INSERT statements instead.
+
+    :param project_id: project containing the dataset
+    :param dataset_id: dataset where the table needs to be created
+    :param table_name: name of the table to be created
+    :param rows: list of dict
+    :param fields: fields in list of dicts format
+    :param use_load_job: if False, always insert the rows with INSERT statements
+    :return: the finished load job or BQ response for the last insert query
+    """
+    if use_load_job:
+        try:
+            return load_rows_with_load_job(project_id, dataset_id, table_name,
+                                           rows, fields)
+        except HttpError as e:
+            error_result = _http_error_result(e)
+            if not _is_quota_error(error_result):
+                raise
+        except LoadJobError as e:
+            error_result = e.error_result
+            if not _is_quota_error(error_result):
+                raise
+        logging.warning(f"Inserting rows of {table_name} with queries, load "
+                        f"job failed with {error_result.get('message')}")
+    return load_rows_with_inserts(project_id, dataset_id, table_name, rows,
+                                  fields)
+
+
 def load_table_from_csv(project_id,
                         dataset_id,
                         table_name,
                         csv_path=None,
-                        fields=None):
+                        fields=None,
+                        use_load_job=True):
     """
     Loads BQ table from a csv file without making use of GCS buckets
 
@@ -896,7 +1368,8 @@ def load_table_from_csv(project_id,
                      If None, assumes that the file exists in the resource_files folder with the name table_name.csv
     :param fields: fields in list of dicts format. If set to None, assumes that
                    the fields are stored in a json file in resource_files/fields named table_name.json
-    :return: BQ response for the load query
+    :param use_load_job: if False, insert the rows with INSERT statements rather than a load job
+    :return: the finished load job or BQ response for the last insert query
     """
     if csv_path is None:
         csv_path = os.path.join(resources.resource_files_path,
@@ -908,23 +1381,8 @@ def load_table_from_csv(project_id,
                                        table_name + '.json')
         with open(fields_filename, 'r') as f:
             fields = json.load(f)
-    field_names = ', '.join([field['name'] for field in fields])
-    row_exprs = [csv_line_to_sql_row_expr(t, fields) for t in table_list]
-    formatted_mapping_list = ', '.join(row_exprs)
-
-    create_table(table_id=table_name,
-                 fields=fields,
-                 drop_existing=True,
-                 dataset_id=dataset_id)
-
-    table_populate_query = bq_consts.INSERT_QUERY.format(
-        project_id=project_id,
-        dataset_id=dataset_id,
-        table_id=table_name,
-        columns=field_names,
-        mapping_list=formatted_mapping_list)
-    result = query(table_populate_query)
-    return result
+    return load_table_from_rows(project_id, dataset_id, table_name, table_list,
+                                fields, use_load_job)
 
 
 def get_hpo_info():
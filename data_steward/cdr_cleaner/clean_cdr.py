@@ -7,6 +7,8 @@ to the query engine.
 # Python imports
 import logging
 import inspect
+import re
+from collections import OrderedDict
 
 # Third party imports
 import app_identity
@@ -14,6 +16,7 @@ import app_identity
 # Project imports
 import bq_utils
 import sandbox
+from constants import bq_utils as bq_consts
 import cdr_cleaner.clean_cdr_engine as clean_engine
 import cdr_cleaner.cleaning_rules.backfill_pmi_skip_codes as back_fill_pmi_skip
 import cdr_cleaner.cleaning_rules.clean_years as clean_years
@@ -54,6 +57,7 @@ from cdr_cleaner.cleaning_rules.null_concept_ids_for_numeric_ppi import NullConc
 from cdr_cleaner.cleaning_rules.clean_ppi_numeric_fields_using_parameters import CleanPPINumericFieldsUsingParameters
 from constants.cdr_cleaner.clean_cdr import DataStage as stage
 from constants.cdr_cleaner import clean_cdr as cdr_consts
+from constants.cdr_cleaner.clean_cdr_engine import DEFAULT_CONCURRENT_JOBS
 
 LOGGER = logging.getLogger(__name__)
 
@@ -210,6 +214,181 @@ def add_module_info_decorator(query_function, *positional_args, **keyword_args):
     ]
 
 
+def add_rule_info(query_list, rule):
+    """
+    Add the dependency information of a cleaning rule to its query dictionaries
+
+    The clean engine uses it to determine which queries can run concurrently.
+
+    :param query_list: a list of query dictionaries generated by the rule
+    :param rule: the BaseCleaningRule instance generating the queries
+    :return: a list of query dictionaries containing the rule information
+    """
+    rule_info_dict = {
+        cdr_consts.RULE_NAME: rule.__class__.__name__,
+        cdr_consts.DEPENDS_ON: [
+            clazz.__name__ for clazz in rule.get_depends_on_classes()
+        ],
+        cdr_consts.AFFECTED_TABLES: list(rule.affected_tables or [])
+    }
+
+    return [dict(**query, **rule_info_dict) for query in query_list]
+
+
+def _table_pattern(dataset_id, table_id):
+    """
+    Get a pattern matching the fully qualified reference to a table in a query
+
+    :param dataset_id: the dataset containing the table
+    :param table_id: the table name
+    :return: a compiled regular expression
+    """
+    return re.compile(
+        rf'`[\w-]+\.{re.escape(dataset_id)}\.{re.escape(table_id)}`')
+
+
+def _is_fusible(query):
+    """
+    Determine if a query dictionary can be fused with the queries around it
+
+    Rules opt in by setting the fusible key of their query dictionaries.  Only
+    standard SQL queries truncating their destination table with rows selected
+    from that same table can be fused.
+
+    :param query: a query dictionary
+    :return: True if the query can be fused, False otherwise
+    """
+    destination_dataset = query.get(cdr_consts.DESTINATION_DATASET)
+    destination_table = query.get(cdr_consts.DESTINATION_TABLE)
+    return bool(
+        query.get(cdr_consts.FUSIBLE, False) and destination_dataset and
+        destination_table and
+        query.get(cdr_consts.DISPOSITION) == bq_consts.WRITE_TRUNCATE and
+        not query.get(cdr_consts.LEGACY_SQL, False) and
+        _table_pattern(destination_dataset, destination_table).search(
+            query.get(cdr_consts.QUERY, '')))
+
+
+def _join_unique(queries, key, default):
+    """
+    Join the distinct values of a key of query dictionaries, in order
+
+    :param queries: a list of query dictionaries
+    :param key: the key to read
+    :param default: the value used when the key is not set
+    :return: the distinct values joined into a string
+    """
+    values = OrderedDict(
+        (str(query.get(key, default)), None) for query in queries)
+    return cdr_consts.FUSED_NAME_SEPARATOR.join(values)
+
+
+def _fuse_table_queries(queries):
+    """
+    Compose queries rewriting the same table into a single query
+
+    Each query becomes a CTE reading the output of the previous one instead of
+    the table, so the table is scanned and written once.
+
+    :param queries: a list of fusible query dictionaries with the same
+        destination
+    :return: a query dictionary running all the queries
+    """
+    if len(queries) == 1:
+        return queries[0]
+
+    first_query = queries[0]
+    dataset_id = first_query[cdr_consts.DESTINATION_DATASET]
+    table_id = first_query[cdr_consts.DESTINATION_TABLE]
+    pattern = _table_pattern(dataset_id, table_id)
+
+    steps = []
+    step_name = None
+    for index, query in enumerate(queries):
+        sql = query[cdr_consts.QUERY]
+        if step_name is not None:
+            sql = pattern.sub(lambda _, name=step_name: name, sql)
+        step_name = cdr_consts.FUSED_STEP_NAME.format(table_id=table_id,
+                                                      index=index)
+        steps.append(
+            cdr_consts.FUSED_STEP_TEMPLATE.format(step_name=step_name,
+                                                  query=sql.strip()))
+
+    fused_query = dict(first_query)
+    fused_query[cdr_consts.QUERY] = cdr_consts.FUSED_QUERY_TEMPLATE.format(
+        steps=', '.join(steps), last_step_name=step_name)
+    fused_query[cdr_consts.MODULE_NAME] = _join_unique(
+        queries, cdr_consts.MODULE_NAME, cdr_consts.MODULE_NAME_DEFAULT_VALUE)
+    fused_query[cdr_consts.FUNCTION_NAME] = _join_unique(
+        queries, cdr_consts.FUNCTION_NAME,
+        cdr_consts.FUNCTION_NAME_DEFAULT_VALUE)
+    fused_query[cdr_consts.BATCH] = all(
+        query.get(cdr_consts.BATCH) for query in queries)
+    fused_query[cdr_consts.RETRY_COUNT] = max(
+        query.get(cdr_consts.RETRY_COUNT, bq_consts.BQ_DEFAULT_RETRY_COUNT)
+        for query in queries)
+
+    # queries of different rules no longer carry the information of one rule,
+    # so the clean engine runs them as it runs legacy rules
+    rule_names = {query.get(cdr_consts.RULE_NAME) for query in queries}
+    if len(rule_names) > 1 or None in rule_names:
+        for key in [
+                cdr_consts.RULE_NAME, cdr_consts.DEPENDS_ON,
+                cdr_consts.AFFECTED_TABLES
+        ]:
+            fused_query.pop(key, None)
+
+    LOGGER.info(f"Fused {len(queries)} queries rewriting "
+                f"{dataset_id}.{table_id} into a single query")
+    return fused_query
+
+
+def fuse_queries(query_list):
+    """
+    Fuse consecutive fusible queries rewriting the same table
+
+    Within a run of consecutive fusible queries, the queries are grouped by
+    destination table and each group is fused into a single query, see
+    _fuse_table_queries.  Groups run in the order of their first query.
+    Queries are only moved past queries of other tables, and a run ends before
+    a query reading a table rewritten earlier in the run, so every query sees
+    the same data it would see when run on its own.  Queries which are not
+    fusible, e.g. queries saving rows to sandbox tables, are kept in place.
+
+    :param query_list: a list of query dictionaries
+    :return: a list of query dictionaries where fused queries are composed
+    """
+    fused_list = []
+    table_queries = OrderedDict()
+
+    for query in query_list:
+        if not _is_fusible(query):
+            fused_list.extend(
+                _fuse_table_queries(queries)
+                for queries in table_queries.values())
+            table_queries = OrderedDict()
+            fused_list.append(query)
+            continue
+
+        destination = (query[cdr_consts.DESTINATION_DATASET],
+                       query[cdr_consts.DESTINATION_TABLE])
+        reads_rewritten_table = any(
+            _table_pattern(*table).search(query[cdr_consts.QUERY])
+            for table in table_queries
+            if table != destination)
+        if reads_rewritten_table:
+            fused_list.extend(
+                _fuse_table_queries(queries)
+                for queries in table_queries.values())
+            table_queries = OrderedDict()
+
+        table_queries.setdefault(destination, []).append(query)
+
+    fused_list.extend(
+        _fuse_table_queries(queries) for queries in table_queries.values())
+    return fused_list
+
+
 def _gather_ehr_queries(project_id, dataset_id, sandbox_dataset_id):
     """
     gathers all the queries required to clean ehr dataset
@@ -301,7 +480,7 @@ def _get_query_list(cleaning_classes, project_id, dataset_id,
     :param cleaning_classes:  the list of classes generating SQL cleaning statements
     :param project_id: project name
     :param dataset_id: de_identified dataset name
-    :return: returns list of queries
+    :return: returns list of queries, consecutive fusible queries fused
     """
     query_list = []
 
@@ -326,8 +505,10 @@ def _get_query_list(cleaning_classes, project_id, dataset_id,
                     positionals = class_info[1:]
 
                 query_list.extend(
-                    add_module_info_decorator(instance.get_query_specs,
-                                              *positionals, **keywords))
+                    add_rule_info(
+                        add_module_info_decorator(instance.get_query_specs,
+                                                  *positionals, **keywords),
+                        instance))
             else:
                 # if the class is not of the common base class, raise an error
                 # will prevent running manual cleaning rules that have not been
@@ -340,15 +521,19 @@ def _get_query_list(cleaning_classes, project_id, dataset_id,
                     add_module_info_decorator(clazz, project_id, dataset_id,
                                               sandbox_dataset_id))
 
-    return query_list
+    return fuse_queries(query_list)
 
 
-def clean_rdr_dataset(project_id=None, dataset_id=None):
+def clean_rdr_dataset(project_id=None,
+                      dataset_id=None,
+                      max_concurrent_jobs=DEFAULT_CONCURRENT_JOBS):
     """
     Run all clean rules defined for the rdr dataset.
 
     :param project_id:  Name of the BigQuery project.
     :param dataset_id:  Name of the dataset to clean
+    :param max_concurrent_jobs:  the maximum number of cleaning queries to run
+        at the same time
     """
     if project_id is None:
         project_id = app_identity.get_application_id()
@@ -366,15 +551,23 @@ def clean_rdr_dataset(project_id=None, dataset_id=None):
     query_list = _gather_rdr_queries(project_id, dataset_id, sandbox_dataset_id)
 
     LOGGER.info("Cleaning rdr_dataset")
-    clean_engine.clean_dataset(project_id, query_list, stage.RDR)
+    clean_engine.clean_dataset(project_id,
+                               query_list,
+                               stage.RDR,
+                               max_concurrent_jobs,
+                               report_dataset_id=sandbox_dataset_id)
 
 
-def clean_ehr_dataset(project_id=None, dataset_id=None):
+def clean_ehr_dataset(project_id=None,
+                      dataset_id=None,
+                      max_concurrent_jobs=DEFAULT_CONCURRENT_JOBS):
     """
     Run all clean rules defined for the ehr dataset.
 
     :param project_id:  Name of the BigQuery project.
     :param dataset_id:  Name of the dataset to clean
+    :param max_concurrent_jobs:  the maximum number of cleaning queries to run
+        at the same time
     """
     if project_id is None:
         project_id = app_identity.get_application_id()
@@ -392,15 +585,23 @@ def clean_ehr_dataset(project_id=None, dataset_id=None):
     query_list = _gather_ehr_queries(project_id, dataset_id, sandbox_dataset_id)
 
     LOGGER.info("Cleaning ehr_dataset")
-    clean_engine.clean_dataset(project_id, query_list, stage.EHR)
+    clean_engine.clean_dataset(project_id,
+                               query_list,
+                               stage.EHR,
+                               max_concurrent_jobs,
+                               report_dataset_id=sandbox_dataset_id)
 
 
-def clean_unioned_ehr_dataset(project_id=None, dataset_id=None):
+def clean_unioned_ehr_dataset(project_id=None,
+                              dataset_id=None,
+                              max_concurrent_jobs=DEFAULT_CONCURRENT_JOBS):
     """
     Run all clean rules defined for the unioned ehr dataset.
 
     :param project_id:  Name of the BigQuery project.
     :param dataset_id:  Name of the dataset to clean
+    :param max_concurrent_jobs:  the maximum number of cleaning queries to run
+        at the same time
     """
     if project_id is None:
         project_id = app_identity.get_application_id()
@@ -419,15 +620,23 @@ def clean_unioned_ehr_dataset(project_id=None, dataset_id=None):
                                              sandbox_dataset_id)
 
     LOGGER.info("Cleaning unioned_dataset")
-    clean_engine.clean_dataset(project_id, query_list, stage.UNIONED)
+    clean_engine.clean_dataset(project_id,
+                               query_list,
+                               stage.UNIONED,
+                               max_concurrent_jobs,
+                               report_dataset_id=sandbox_dataset_id)
 
 
-def clean_combined_dataset(project_id=None, dataset_id=None):
+def clean_combined_dataset(project_id=None,
+                           dataset_id=None,
+                           max_concurrent_jobs=DEFAULT_CONCURRENT_JOBS):
     """
     Run all clean rules defined for the ehr and rdr dataset.
 
     :param project_id:  Name of the BigQuery project.
     :param dataset_id:  Name of the dataset to clean
+    :param max_concurrent_jobs:  the maximum number of cleaning queries to run
+        at the same time
     """
     if project_id is None:
         project_id = app_identity.get_application_id()
@@ -446,15 +655,24 @@ def clean_combined_dataset(project_id=None, dataset_id=None):
                                           sandbox_dataset_id)
 
     LOGGER.info("Cleaning combined_dataset")
-    clean_engine.clean_dataset(project_id, query_list, stage.COMBINED)
+    clean_engine.clean_dataset(project_id,
+                               query_list,
+                               stage.COMBINED,
+                               max_concurrent_jobs,
+                               report_dataset_id=sandbox_dataset_id)
 
 
-def clean_combined_de_identified_dataset(project_id=None, dataset_id=None):
+def clean_combined_de_identified_dataset(
+    project_id=None,
+    dataset_id=None,
+    max_concurrent_jobs=DEFAULT_CONCURRENT_JOBS):
     """
     Run all clean rules defined for the deidentified ehr and rdr dataset.
 
     :param project_id:  Name of the BigQuery project.
     :param dataset_id:  Name of the dataset to clean
+    :param max_concurrent_jobs:  the maximum number of cleaning queries to run
+        at the same time
     """
     if project_id is None:
         project_id = app_identity.get_application_id()
@@ -473,15 +691,23 @@ def clean_combined_de_identified_dataset(project_id=None, dataset_id=None):
                                                     sandbox_dataset_id)
 
     LOGGER.info("Cleaning de-identified dataset")
-    clean_engine.clean_dataset(project_id, query_list, stage.DEID_BASE)
+    clean_engine.clean_dataset(project_id,
+                               query_list,
+                               stage.DEID_BASE,
+                               max_concurrent_jobs,
+                               report_dataset_id=sandbox_dataset_id)
 
 
-def clean_combined_de_identified_clean_dataset(project_id=None,
-                                               dataset_id=None):
+def clean_combined_de_identified_clean_dataset(
+    project_id=None,
+    dataset_id=None,
+    max_concurrent_jobs=DEFAULT_CONCURRENT_JOBS):
     """
     Run all clean rules defined for the deidentified ehr and rdr clean dataset.
     :param project_id:  Name of the BigQuery project.
     :param dataset_id:  Name of the dataset to clean
+    :param max_concurrent_jobs:  the maximum number of cleaning queries to run
+        at the same time
     """
     if project_id is None:
         project_id = app_identity.get_application_id()
@@ -500,19 +726,28 @@ def clean_combined_de_identified_clean_dataset(project_id=None,
                                                      sandbox_dataset_id)
 
     LOGGER.info("Cleaning de-identified dataset")
-    clean_engine.clean_dataset(project_id, query_list, stage.DEID_CLEAN)
+    clean_engine.clean_dataset(project_id,
+                               query_list,
+                               stage.DEID_CLEAN,
+                               max_concurrent_jobs,
+                               report_dataset_id=sandbox_dataset_id)
 
 
-def clean_all_cdr():
+def clean_all_cdr(max_concurrent_jobs=DEFAULT_CONCURRENT_JOBS):
     """
     Runs cleaning rules on all the datasets
+
+    :param max_concurrent_jobs:  the maximum number of cleaning queries to run
+        at the same time
     """
-    clean_ehr_dataset()
-    clean_unioned_ehr_dataset()
-    clean_rdr_dataset()
-    clean_combined_dataset()
-    clean_combined_de_identified_dataset()
-    clean_combined_de_identified_clean_dataset()
+    clean_ehr_dataset(max_concurrent_jobs=max_concurrent_jobs)
+    clean_unioned_ehr_dataset(max_concurrent_jobs=max_concurrent_jobs)
+    clean_rdr_dataset(max_concurrent_jobs=max_concurrent_jobs)
+    clean_combined_dataset(max_concurrent_jobs=max_concurrent_jobs)
+    clean_combined_de_identified_dataset(
+        max_concurrent_jobs=max_concurrent_jobs)
+    clean_combined_de_identified_clean_dataset(
+        max_concurrent_jobs=max_concurrent_jobs)
 
 
 if __name__ == '__main__':
@@ -530,20 +765,31 @@ if __name__ == '__main__':
                             [s for s in stage if s is not stage.UNSPECIFIED]),
                         help='Specify the dataset')
     parser.add_argument('-s', action='store_true', help='Send logs to console')
+    parser.add_argument(
+        '-j',
+        '--max_concurrent_jobs',
+        dest='max_concurrent_jobs',
+        action='store',
+        type=int,
+        default=DEFAULT_CONCURRENT_JOBS,
+        help='Maximum number of cleaning queries to run at the same time.  '
+        'Queries of rules that do not depend on each other run concurrently.')
     args = parser.parse_args()
     clean_engine.add_console_logging(args.s)
     if args.data_stage == stage.EHR:
-        clean_ehr_dataset()
+        clean_ehr_dataset(max_concurrent_jobs=args.max_concurrent_jobs)
     elif args.data_stage == stage.UNIONED:
-        clean_unioned_ehr_dataset()
+        clean_unioned_ehr_dataset(max_concurrent_jobs=args.max_concurrent_jobs)
     elif args.data_stage == stage.RDR:
-        clean_rdr_dataset()
+        clean_rdr_dataset(max_concurrent_jobs=args.max_concurrent_jobs)
     elif args.data_stage == stage.COMBINED:
-        clean_combined_dataset()
+        clean_combined_dataset(max_concurrent_jobs=args.max_concurrent_jobs)
     elif args.data_stage == stage.DEID_BASE:
-        clean_combined_de_identified_dataset()
+        clean_combined_de_identified_dataset(
+            max_concurrent_jobs=args.max_concurrent_jobs)
     elif args.data_stage == stage.DEID_CLEAN:
-        clean_combined_de_identified_clean_dataset()
+        clean_combined_de_identified_clean_dataset(
+            max_concurrent_jobs=args.max_concurrent_jobs)
     else:
         raise OSError(
             f'Dataset selection should be from [{stage.EHR}, {stage.UNIONED}, {stage.RDR}, {stage.COMBINED},'
@@ -1,16 +1,26 @@
 from __future__ import print_function
 
+import heapq
 import logging
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
 
 import googleapiclient
 import oauth2client
+from google.api_core.exceptions import GoogleAPIError
 import app_identity
 from constants.cdr_cleaner.clean_cdr import DataStage as stage
-from constants.cdr_cleaner.clean_cdr_engine import FILENAME, FAILURE_MESSAGE_TEMPLATE
+from constants.cdr_cleaner.clean_cdr_engine import (FILENAME,
+                                                    FAILURE_MESSAGE_TEMPLATE,
+                                                    DEFAULT_CONCURRENT_JOBS)
 
 import bq_utils
+from cdr_cleaner import run_report
 from constants import bq_utils as bq_consts
 from constants.cdr_cleaner import clean_cdr as cdr_consts
+from constants.cdr_cleaner import run_report as report_consts
 
 LOGGER = logging.getLogger(__name__)
 
@@ -37,13 +47,27 @@ def add_console_logging(add_handler):
         logging.getLogger('').addHandler(handler)
 
 
-def clean_dataset(project=None, statements=None, data_stage=stage.UNSPECIFIED):
+def clean_dataset(project=None,
+                  statements=None,
+                  data_stage=stage.UNSPECIFIED,
+                  max_concurrent_jobs=DEFAULT_CONCURRENT_JOBS,
+                  report_dataset_id=None):
     """
        Run the assigned cleaning rules.
 
+       Each executed statement is timed and its job statistics are saved in a
+       run report.  See cdr_cleaner.run_report.
+
        :param project:  the project name
        :param statements:  a list of dictionary objects to run the query
        :param data_stage:  an enum to indicate what stage of the cleaning this is
+       :param max_concurrent_jobs:  the maximum number of statements to run at
+           the same time.  When greater than one, statements that do not
+           depend on each other are run concurrently.  See
+           get_statement_dependencies.
+       :param report_dataset_id:  if set, the statements of the run report are
+           appended to the run report table of this dataset
+       :return:  the run report
        """
     if project is None or project == '' or project.isspace():
         project = app_identity.get_application_id()
@@ -52,75 +76,17 @@ def clean_dataset(project=None, statements=None, data_stage=stage.UNSPECIFIED):
     if statements is None:
         statements = []
 
-    failures = 0
-    successes = 0
-
-    statement_length = len(statements)
-    for index, statement in enumerate(statements):
-        rule_query = statement.get(cdr_consts.QUERY, '')
-        legacy_sql = statement.get(cdr_consts.LEGACY_SQL, False)
-        destination_table = statement.get(cdr_consts.DESTINATION_TABLE, None)
-        retry = statement.get(cdr_consts.RETRY_COUNT,
-                              bq_consts.BQ_DEFAULT_RETRY_COUNT)
-        disposition = statement.get(cdr_consts.DISPOSITION,
-                                    bq_consts.WRITE_EMPTY)
-        destination_dataset = statement.get(cdr_consts.DESTINATION_DATASET,
-                                            None)
-        batch = statement.get(cdr_consts.BATCH, None)
-
-        module_name = statement.get(cdr_consts.MODULE_NAME,
-                                    cdr_consts.MODULE_NAME_DEFAULT_VALUE)
-        function_name = statement.get(cdr_consts.FUNCTION_NAME,
-                                      cdr_consts.FUNCTION_NAME_DEFAULT_VALUE)
-
-        try:
-            LOGGER.info(
-                f"Running query {index} out of {statement_length} generated by "
-                f"{module_name}.{function_name} \n{rule_query}")
-
-            results = bq_utils.query(rule_query,
-                                     use_legacy_sql=legacy_sql,
-                                     destination_table_id=destination_table,
-                                     retry_count=retry,
-                                     write_disposition=disposition,
-                                     destination_dataset_id=destination_dataset,
-                                     batch=batch)
-
-        except (oauth2client.client.HttpAccessTokenRefreshError,
-                googleapiclient.errors.HttpError) as exp:
-
-            LOGGER.exception(
-                format_failure_message(project_id=project,
-                                       statement=statement,
-                                       exception=exp))
-            failures += 1
-            continue
+    run_date = datetime.now()
+    start_time = time.time()
+    if max_concurrent_jobs > 1:
+        records = _run_concurrently(project, statements, max_concurrent_jobs)
+    else:
+        records = _run_sequentially(project, statements)
 
-        # wait for job to finish
-        query_job_id = results['jobReference']['jobId']
-        incomplete_jobs = bq_utils.wait_on_jobs([query_job_id])
-        if incomplete_jobs:
-            failures += 1
-            raise bq_utils.BigQueryJobWaitError(incomplete_jobs)
-
-        # check if the job is complete and an error has occurred
-        is_errored, error_message = bq_utils.job_status_errored(query_job_id)
-
-        if is_errored:
-            LOGGER.error(
-                format_failure_message(project_id=project,
-                                       statement=statement,
-                                       exception=error_message))
-            failures += 1
-        else:
-            if destination_table is not None:
-                updated_rows = results.get("totalRows")
-                if updated_rows is not None:
-                    LOGGER.info(
-                        f"Query returned {updated_rows} rows for {destination_dataset}.{destination_table}"
-                    )
-
-            successes += 1
+    report = run_report.build_run_report(project, data_stage, run_date,
+                                         time.time() - start_time, records)
+    successes = report[report_consts.SUCCESSES]
+    failures = report[report_consts.FAILURES]
 
     if successes > 0:
         LOGGER.info(
@@ -139,6 +105,231 @@ def clean_dataset(project=None, statements=None, data_stage=stage.UNSPECIFIED):
             f"There were no failures in applying cleaning rules for {project}.{data_stage}"
         )
 
+    run_report.log_slowest_rules(report)
+    run_report.save_run_report(report)
+    if report_dataset_id:
+        try:
+            run_report.upload_run_report(report, project, report_dataset_id)
+        except (GoogleAPIError, OSError, ValueError):
+            # the report is not worth failing a finished cleaning run
+            LOGGER.exception(
+                f"Unable to upload run report {report[report_consts.RUN_ID]} "
+                f"to {project}.{report_dataset_id}")
+
+    return report
+
+
+def _run_sequentially(project, statements):
+    """
+    Run the statements one at a time in list order
+
+    :param project:  the project name
+    :param statements:  a list of dictionary objects to run the query
+    :return: a list of the records of the executed statements
+    """
+    statement_length = len(statements)
+    return [
+        run_statement(project, statement, index, statement_length)
+        for index, statement in enumerate(statements)
+    ]
+
+
+def _run_concurrently(project, statements, max_concurrent_jobs):
+    """
+    Run statements as soon as the statements they depend on have finished
+
+    Ready statements are started in list order and at most max_concurrent_jobs
+    statements run at the same time.  As with sequential runs, statements that
+    fail do not stop the statements depending on them.  If a job does not
+    finish, no new statements are started and the error is raised once the
+    running statements finish.
+
+    :param project:  the project name
+    :param statements:  a list of dictionary objects to run the query
+    :param max_concurrent_jobs:  the maximum number of statements to run at once
+    :return: a list of the records of the executed statements
+    """
+    records = []
+
+    dependencies = get_statement_dependencies(statements)
+    dependents = defaultdict(list)
+    for index, predecessors in enumerate(dependencies):
+        for predecessor in predecessors:
+            dependents[predecessor].append(index)
+    remaining = [len(predecessors) for predecessors in dependencies]
+    ready = [index for index, count in enumerate(remaining) if count == 0]
+    heapq.heapify(ready)
+
+    statement_length = len(statements)
+    LOGGER.info(f"Running {statement_length} queries with up to "
+                f"{max_concurrent_jobs} concurrent jobs")
+    with ThreadPoolExecutor(max_workers=max_concurrent_jobs) as executor:
+        running = dict()
+        while ready or running:
+            while ready and len(running) < max_concurrent_jobs:
+                index = heapq.heappop(ready)
+                future = executor.submit(run_statement, project,
+                                         statements[index], index,
+                                         statement_length)
+                running[future] = index
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                # a job that did not finish stops the run, as it would
+                # when running sequentially
+                records.append(future.result())
+                for dependent in dependents[index]:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        heapq.heappush(ready, dependent)
+
+    return records
+
+
+def get_statement_dependencies(statements):
+    """
+    Determine the earlier statements each statement must wait for
+
+    Statements generated by a BaseCleaningRule carry the rule name, the rules
+    it depends on and the tables it affects (see clean_cdr._get_query_list).
+    Such a statement waits for:
+        the previous statement of the same rule, so a rule's queries keep
+            their order,
+        every earlier statement of the rules it depends on, and
+        the last earlier statement touching one of its tables, i.e. its
+            affected tables and its destination table.
+
+    Statements lacking rule information, e.g. those of legacy function-based
+    rules, or rules that do not declare any table, are barriers.  They wait for
+    every earlier statement and every later statement waits for them, which
+    keeps the sequential semantics around them.
+
+    :param statements:  a list of dictionary objects to run the query
+    :return: a list of the set of indices of the statements each statement
+        depends on
+    """
+    dependencies = []
+    barrier = None
+    rule_statements = defaultdict(list)
+    table_statements = dict()
+
+    for index, statement in enumerate(statements):
+        rule_name = statement.get(cdr_consts.RULE_NAME)
+        tables = set(statement.get(cdr_consts.AFFECTED_TABLES) or [])
+        destination_table = statement.get(cdr_consts.DESTINATION_TABLE)
+        if destination_table:
+            tables.add(destination_table)
+
+        if rule_name is None or not tables:
+            dependencies.append(set(range(index)))
+            barrier = index
+            # earlier statements are implied by waiting for the barrier
+            rule_statements.clear()
+            table_statements.clear()
+            continue
+
+        predecessors = set()
+        if barrier is not None:
+            predecessors.add(barrier)
+        if rule_statements[rule_name]:
+            predecessors.add(rule_statements[rule_name][-1])
+        for dependency in statement.get(cdr_consts.DEPENDS_ON, []):
+            predecessors.update(rule_statements[dependency])
+        for table in tables:
+            if table in table_statements:
+                predecessors.add(table_statements[table])
+            table_statements[table] = index
+
+        rule_statements[rule_name].append(index)
+        dependencies.append(predecessors)
+
+    return dependencies
+
+
+def run_statement(project, statement, index, statement_length):
+    """
+    Run a single statement and wait for it to finish
+
+    :param project:  the project name
+    :param statement:  a dictionary object to run the query
+    :param index:  the position of the statement in the list of statements
+    :param statement_length:  the number of statements in the list
+    :return: the run report record of the statement
+    :raises BigQueryJobWaitError: if the query job did not finish
+    """
+    rule_query = statement.get(cdr_consts.QUERY, '')
+    legacy_sql = statement.get(cdr_consts.LEGACY_SQL, False)
+    destination_table = statement.get(cdr_consts.DESTINATION_TABLE, None)
+    retry = statement.get(cdr_consts.RETRY_COUNT,
+                          bq_consts.BQ_DEFAULT_RETRY_COUNT)
+    disposition = statement.get(cdr_consts.DISPOSITION, bq_consts.WRITE_EMPTY)
+    destination_dataset = statement.get(cdr_consts.DESTINATION_DATASET, None)
+    batch = statement.get(cdr_consts.BATCH, None)
+
+    module_name = statement.get(cdr_consts.MODULE_NAME,
+                                cdr_consts.MODULE_NAME_DEFAULT_VALUE)
+    function_name = statement.get(cdr_consts.FUNCTION_NAME,
+                                  cdr_consts.FUNCTION_NAME_DEFAULT_VALUE)
+
+    start_time = time.time()
+    try:
+        LOGGER.info(
+            f"Running query {index} out of {statement_length} generated by "
+            f"{module_name}.{function_name} \n{rule_query}")
+
+        results = bq_utils.query(rule_query,
+                                 use_legacy_sql=legacy_sql,
+                                 destination_table_id=destination_table,
+                                 retry_count=retry,
+                                 write_disposition=disposition,
+                                 destination_dataset_id=destination_dataset,
+                                 batch=batch)
+
+    except (oauth2client.client.HttpAccessTokenRefreshError,
+            googleapiclient.errors.HttpError) as exp:
+
+        LOGGER.exception(
+            format_failure_message(project_id=project,
+                                   statement=statement,
+                                   exception=exp))
+        return run_report.get_statement_record(statement, index,
+                                               report_consts.STATUS_FAILED,
+                                               time.time() - start_time)
+
+    # wait for job to finish
+    query_job_id = results['jobReference']['jobId']
+    incomplete_jobs = bq_utils.wait_on_jobs([query_job_id])
+    if incomplete_jobs:
+        raise bq_utils.BigQueryJobWaitError(incomplete_jobs)
+    wall_seconds = time.time() - start_time
+
+    # check if the job is complete and an error has occurred
+    is_errored, error_message = bq_utils.job_status_errored(query_job_id)
+    job_resource = bq_utils.get_job_details(query_job_id)
+
+    if is_errored:
+        LOGGER.error(
+            format_failure_message(project_id=project,
+                                   statement=statement,
+                                   exception=error_message))
+        return run_report.get_statement_record(statement, index,
+                                               report_consts.STATUS_FAILED,
+                                               wall_seconds, query_job_id,
+                                               job_resource)
+
+    if destination_table is not None:
+        updated_rows = results.get("totalRows")
+        if updated_rows is not None:
+            LOGGER.info(
+                f"Query returned {updated_rows} rows for {destination_dataset}.{destination_table}"
+            )
+
+    return run_report.get_statement_record(statement, index,
+                                           report_consts.STATUS_SUCCESS,
+                                           wall_seconds, query_job_id,
+                                           job_resource)
+
 
 def format_failure_message(project_id, statement, exception):
 
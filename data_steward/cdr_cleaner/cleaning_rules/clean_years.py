@@ -68,6 +68,7 @@ def get_year_of_birth_queries(project_id, dataset_id):
                 MAX_YEAR_OF_BIRTH=MAX_YEAR_OF_BIRTH)
             query[cdr_consts.DESTINATION_TABLE] = table
             query[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+            query[cdr_consts.FUSIBLE] = True
             query[cdr_consts.DESTINATION_DATASET] = dataset_id
             queries.append(query)
     person_query = dict()
@@ -79,6 +80,7 @@ def get_year_of_birth_queries(project_id, dataset_id):
         MAX_YEAR_OF_BIRTH=MAX_YEAR_OF_BIRTH)
     person_query[cdr_consts.DESTINATION_TABLE] = person
     person_query[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+    person_query[cdr_consts.FUSIBLE] = True
     person_query[cdr_consts.DESTINATION_DATASET] = dataset_id
     queries.append(person_query)
     return queries
@@ -146,6 +146,7 @@ class EnsureDateDatetimeConsistency(BaseCleaningRule):
                 cols=self.get_cols(table))
             query[cdr_consts.DESTINATION_TABLE] = table
             query[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+            query[cdr_consts.FUSIBLE] = True
             query[cdr_consts.DESTINATION_DATASET] = self.get_dataset_id()
             queries.append(query)
         return queries
@@ -81,6 +81,7 @@ def get_negative_ages_queries(project_id, dataset_id):
             table_date=date_fields[table])
         query_na[cdr_consts.DESTINATION_TABLE] = table
         query_na[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+        query_na[cdr_consts.FUSIBLE] = True
         query_na[cdr_consts.DESTINATION_DATASET] = dataset_id
         query_ma[cdr_consts.QUERY] = MAX_AGE_QUERY.format(
             project_id=project_id,
@@ -91,6 +92,7 @@ def get_negative_ages_queries(project_id, dataset_id):
             MAX_AGE=MAX_AGE)
         query_ma[cdr_consts.DESTINATION_TABLE] = table
         query_ma[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+        query_ma[cdr_consts.FUSIBLE] = True
         query_ma[cdr_consts.DESTINATION_DATASET] = dataset_id
         queries.extend([query_na, query_ma])
 
@@ -105,6 +107,7 @@ def get_negative_ages_queries(project_id, dataset_id):
         person_table=person_table)
     query[cdr_consts.DESTINATION_TABLE] = death
     query[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+    query[cdr_consts.FUSIBLE] = True
     query[cdr_consts.DESTINATION_DATASET] = dataset_id
     queries.append(query)
     return queries
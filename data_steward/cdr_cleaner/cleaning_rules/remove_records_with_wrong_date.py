@@ -128,6 +128,7 @@ def get_remove_records_with_wrong_date_queries(
         project_id, dataset_id, OBSERVATION_TABLE, observation_year_threshold)
     query[cdr_consts.DESTINATION_TABLE] = OBSERVATION_TABLE
     query[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+    query[cdr_consts.FUSIBLE] = True
     query[cdr_consts.DESTINATION_DATASET] = dataset_id
     query[cdr_consts.BATCH] = True
     queries.append(query)
@@ -138,6 +139,7 @@ def get_remove_records_with_wrong_date_queries(
             project_id, dataset_id, domain_table, year_threshold)
         query[cdr_consts.DESTINATION_TABLE] = domain_table
         query[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+        query[cdr_consts.FUSIBLE] = True
         query[cdr_consts.DESTINATION_DATASET] = dataset_id
         query[cdr_consts.BATCH] = True
         queries.append(query)
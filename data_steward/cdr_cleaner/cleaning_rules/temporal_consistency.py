@@ -103,6 +103,7 @@ def get_bad_end_date_queries(project_id, dataset_id):
             table_end_date=table_dates[table][1])
         query[cdr_consts.DESTINATION_TABLE] = table
         query[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+        query[cdr_consts.FUSIBLE] = True
         query[cdr_consts.DESTINATION_DATASET] = dataset_id
         queries.append(query)
     query = dict()
@@ -112,6 +113,7 @@ def get_bad_end_date_queries(project_id, dataset_id):
         placeholder_date=placeholder_date)
     query[cdr_consts.DESTINATION_TABLE] = visit_occurrence
     query[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+    query[cdr_consts.FUSIBLE] = True
     query[cdr_consts.DESTINATION_DATASET] = dataset_id
     queries.append(query)
     return queries
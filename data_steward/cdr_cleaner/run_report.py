@@ -0,0 +1,241 @@
+"""
+Reports the cost of each statement executed while cleaning a dataset.
+
+Every statement executed by clean_cdr_engine is recorded with its wall time and
+the queue time, bytes processed, slot milliseconds and rows affected read from
+its finished job.  The records of a run are saved as a json run report which
+ranks the slowest rules, and appended to the _cleaning_run_report table so runs
+of different CDR releases can be compared.
+"""
+# Python imports
+import json
+import logging
+import os
+from collections import OrderedDict
+
+# Third party imports
+from google.cloud import bigquery
+
+# Project imports
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+from constants.cdr_cleaner import run_report as consts
+from utils import bq
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _to_int(value):
+    """
+    Convert an int64 value of a job resource, which is sent as a string
+
+    :param value: the value to convert, possibly None
+    :return: the value as an int, or None if it is not set
+    """
+    return int(value) if value is not None else None
+
+
+def get_statement_record(statement,
+                         index,
+                         status,
+                         wall_seconds,
+                         job_id=None,
+                         job_resource=None):
+    """
+    Get the record of an executed statement
+
+    :param statement: the dictionary object describing the query
+    :param index: the position of the statement in the list of statements
+    :param status: STATUS_SUCCESS or STATUS_FAILED
+    :param wall_seconds: seconds elapsed from submitting the statement until
+        its job finished
+    :param job_id: the job which executed the statement, if one was created
+    :param job_resource: the finished job resource, if one was created
+    :return: a dictionary of the statement's metrics
+    """
+    job_resource = job_resource if job_resource else {}
+    statistics = job_resource.get(consts.STATISTICS, {})
+    query_statistics = statistics.get(consts.QUERY, {})
+
+    queue_seconds = None
+    if consts.START_TIME in statistics and consts.CREATION_TIME in statistics:
+        queue_seconds = (int(statistics[consts.START_TIME]) -
+                         int(statistics[consts.CREATION_TIME])) / 1000.0
+
+    total_slot_ms = statistics.get(
+        consts.JOB_TOTAL_SLOT_MS,
+        query_statistics.get(consts.JOB_TOTAL_SLOT_MS))
+    total_bytes_processed = statistics.get(
+        consts.JOB_TOTAL_BYTES_PROCESSED,
+        query_statistics.get(consts.JOB_TOTAL_BYTES_PROCESSED))
+    rows_affected = query_statistics.get(consts.NUM_DML_AFFECTED_ROWS)
+    query_plan = query_statistics.get(consts.QUERY_PLAN)
+    if rows_affected is None and query_plan:
+        # a query writing a destination table reports its rows in the
+        # final stage of its plan
+        rows_affected = query_plan[-1].get(consts.RECORDS_WRITTEN)
+
+    return {
+        consts.STATEMENT_INDEX:
+            index,
+        consts.MODULE_NAME:
+            statement.get(cdr_consts.MODULE_NAME,
+                          cdr_consts.MODULE_NAME_DEFAULT_VALUE),
+        consts.FUNCTION_NAME:
+            statement.get(cdr_consts.FUNCTION_NAME,
+                          cdr_consts.FUNCTION_NAME_DEFAULT_VALUE),
+        consts.JOB_ID:
+            job_id,
+        consts.STATUS:
+            status,
+        consts.WALL_SECONDS:
+            wall_seconds,
+        consts.QUEUE_SECONDS:
+            queue_seconds,
+        consts.TOTAL_BYTES_PROCESSED:
+            _to_int(total_bytes_processed),
+        consts.TOTAL_SLOT_MS:
+            _to_int(total_slot_ms),
+        consts.ROWS_AFFECTED:
+            _to_int(rows_affected)
+    }
+
+
+def get_slowest_rules(records, limit=consts.SLOWEST_RULES_COUNT):
+    """
+    Rank the rules of a run by the wall time of their statements
+
+    :param records: the statement records of the run
+    :param limit: the number of rules to return
+    :return: a list of dictionaries totalling the metrics of each rule, slowest
+        rule first
+    """
+    rules = OrderedDict()
+    for record in records:
+        key = (record[consts.MODULE_NAME], record[consts.FUNCTION_NAME])
+        rule = rules.setdefault(
+            key, {
+                consts.MODULE_NAME: record[consts.MODULE_NAME],
+                consts.FUNCTION_NAME: record[consts.FUNCTION_NAME],
+                consts.STATEMENT_COUNT: 0,
+                consts.WALL_SECONDS: 0.0,
+                consts.TOTAL_BYTES_PROCESSED: 0,
+                consts.TOTAL_SLOT_MS: 0
+            })
+        rule[consts.STATEMENT_COUNT] += 1
+        for metric in [
+                consts.WALL_SECONDS, consts.TOTAL_BYTES_PROCESSED,
+                consts.TOTAL_SLOT_MS
+        ]:
+            rule[metric] += record[metric] or 0
+
+    return sorted(rules.values(),
+                  key=lambda rule: rule[consts.WALL_SECONDS],
+                  reverse=True)[:limit]
+
+
+def build_run_report(project_id, data_stage, run_date, wall_seconds, records):
+    """
+    Build the report of a cleaning run
+
+    :param project_id: the project the run was executed in
+    :param data_stage: the stage of the cleaning run
+    :param run_date: the datetime the run started
+    :param wall_seconds: seconds elapsed during the run
+    :param records: the statement records of the run
+    :return: a dictionary describing the run, its statements and its slowest
+        rules
+    """
+    run_id = f"{data_stage}_{run_date.strftime('%Y%m%d_%H%M%S')}"
+    records = sorted(records, key=lambda record: record[consts.STATEMENT_INDEX])
+    successes = sum(1 for record in records
+                    if record[consts.STATUS] == consts.STATUS_SUCCESS)
+
+    return {
+        consts.RUN_ID: run_id,
+        consts.PROJECT_ID: project_id,
+        consts.DATA_STAGE: str(data_stage),
+        consts.RUN_DATE: run_date.isoformat(),
+        consts.WALL_SECONDS: wall_seconds,
+        consts.SUCCESSES: successes,
+        consts.FAILURES: len(records) - successes,
+        consts.STATEMENTS: records,
+        consts.SLOWEST_RULES: get_slowest_rules(records)
+    }
+
+
+def log_slowest_rules(report):
+    """
+    Log the slowest rules of a run report
+
+    :param report: the run report
+    """
+    lines = [
+        f"{rule[consts.WALL_SECONDS]:.1f}s "
+        f"{rule[consts.TOTAL_BYTES_PROCESSED]} bytes "
+        f"{rule[consts.TOTAL_SLOT_MS]} slot ms in "
+        f"{rule[consts.STATEMENT_COUNT]} queries for "
+        f"{rule[consts.MODULE_NAME]}.{rule[consts.FUNCTION_NAME]}"
+        for rule in report[consts.SLOWEST_RULES]
+    ]
+    LOGGER.info(f"Slowest rules of run {report[consts.RUN_ID]}:\n" +
+                '\n'.join(lines))
+
+
+def save_run_report(report, report_dir=consts.RUN_REPORT_DIR):
+    """
+    Save a run report as a json file
+
+    :param report: the run report
+    :param report_dir: the directory to save the report in
+    :return: the path of the saved report
+    """
+    os.makedirs(report_dir, exist_ok=True)
+    report_path = os.path.join(
+        report_dir,
+        consts.RUN_REPORT_FILENAME.format(run_id=report[consts.RUN_ID]))
+    with open(report_path, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+    LOGGER.info(f"Saved cleaning run report to {report_path}")
+    return report_path
+
+
+def get_report_rows(report):
+    """
+    Get the rows of the run report table for a run report
+
+    :param report: the run report
+    :return: a list of dictionaries, one per statement
+    """
+    run_info = {
+        consts.RUN_ID: report[consts.RUN_ID],
+        consts.PROJECT_ID: report[consts.PROJECT_ID],
+        consts.DATA_STAGE: report[consts.DATA_STAGE],
+        consts.RUN_DATE: report[consts.RUN_DATE]
+    }
+    return [dict(**record, **run_info) for record in report[consts.STATEMENTS]]
+
+
+def upload_run_report(report, project_id, dataset_id, client=None):
+    """
+    Append the statements of a run report to the run report table
+
+    :param report: the run report
+    :param project_id: the project containing the dataset
+    :param dataset_id: the dataset of the run report table, created if needed
+    :param client: an optional BigQuery client
+    :return: the finished load job
+    """
+    if client is None:
+        client = bq.get_client(project_id)
+
+    table_id = f'{project_id}.{dataset_id}.{consts.RUN_REPORT_TABLE}'
+    job_config = bigquery.LoadJobConfig(
+        schema=bq.get_table_schema(consts.RUN_REPORT_TABLE),
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND)
+    load_job = client.load_table_from_json(get_report_rows(report),
+                                           table_id,
+                                           job_config=job_config)
+    load_job.result()
+    LOGGER.info(f"Appended {len(report[consts.STATEMENTS])} statements of run "
+                f"{report[consts.RUN_ID]} to {table_id}")
+    return load_job
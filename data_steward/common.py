@@ -161,6 +161,9 @@ TRANSFORM_FILES = 'transform_files'
 APPEND_VOCABULARY = 'append_vocabulary'
 APPEND_CONCEPTS = 'append_concepts'
 ADD_AOU_VOCABS = 'add_aou_vocabs'
+PREPARE_VOCABULARY = 'prepare_vocabulary'
+# size of the byte ranges of the vocabulary files processed in parallel
+VOCABULARY_CHUNK_SIZE = 32 * 1024 * 1024
 ERRORS = 'errors'
 AOU_GEN_ID = 'AoU_General'
 AOU_GEN_NAME = 'AoU_General'
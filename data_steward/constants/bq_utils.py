@@ -2,6 +2,17 @@
 SOCKET_TIMEOUT = 600000
 BQ_DEFAULT_RETRY_COUNT = 10
 MAX_POLL_INTERVAL = 500
+# Fraction of the slowest running job's runtime to wait before polling again
+POLL_RUNTIME_FRACTION = 0.25
+# Maximum number of requests sent in a single batch http request
+JOB_BATCH_SIZE = 50
+# Attempts of a batch http request before falling back to a request per job
+JOB_BATCH_RETRY_COUNT = 3
+# Http statuses of transient errors, worth requesting again
+RETRYABLE_HTTP_STATUSES = [429, 500, 502, 503, 504]
+RATE_LIMIT_REASONS = ['rateLimitExceeded', 'userRateLimitExceeded']
+# Maximum number of finished job resources kept in memory
+JOB_CACHE_SIZE = 10000
 # Maximum results returned by list_tables (API has a low default value)
 LIST_TABLES_MAX_RESULTS = 10000
 DATE_FORMAT = '%Y%m%d'
@@ -28,7 +39,13 @@ WRITE_APPEND = 'WRITE_APPEND'
 PAGE_TOKEN = 'pageToken'
 JOB_REFERENCE = 'jobReference'
 JOB_ID = 'jobId'
+STATUS = 'status'
+STATE = 'state'
+DONE = 'DONE'
+STATISTICS = 'statistics'
+START_TIME = 'startTime'
 ROWS = 'rows'
+TOTAL_ROWS = 'totalRows'
 SCHEMA = 'schema'
 FIELDS = 'fields'
 DATASET_REF = 'datasetReference'
@@ -54,6 +71,14 @@ VALIDATION_DATASET_FORMAT = 'validation_{}'
 VALIDATION_DATASET_REGEX = 'validation_\d{8}'
 VALIDATION_DATE_FORMAT = '%Y%m%d'
 
+# Rows per statement when a table is loaded with INSERT statements
+INSERT_CHUNK_SIZE = 1000
+# Load jobs of a table fall back to INSERT statements on these errors
+LOAD_JOB_QUOTA_REASONS = ['quotaExceeded', 'rateLimitExceeded']
+NEWLINE_DELIMITED_JSON = 'NEWLINE_DELIMITED_JSON'
+CREATE_IF_NEEDED = 'CREATE_IF_NEEDED'
+OCTET_STREAM = 'application/octet-stream'
+
 INSERT_QUERY = """
 INSERT INTO `{project_id}.{dataset_id}.{table_id}`
   ({columns})
@@ -64,3 +89,6 @@ GET_HPO_CONTENTS_QUERY = """
 SELECT *
 FROM `{project_id}.{LOOKUP_TABLES_DATASET_ID}.{HPO_SITE_ID_MAPPINGS_TABLE_ID}`
 """
+
+# Number of result pages fetched at once when a response is read in parallel
+DEFAULT_PAGE_FETCH_WORKERS = 4
@@ -24,12 +24,26 @@ MODULE_NAME = 'module_name'
 FUNCTION_NAME = 'function_name'
 LINE_NO = 'line_no'
 DESTINATION = 'destination'
+RULE_NAME = 'rule_name'
+DEPENDS_ON = 'depends_on'
+AFFECTED_TABLES = 'affected_tables'
+FUSIBLE = 'fusible'
 
 # Query dictionary default_values
 MODULE_NAME_DEFAULT_VALUE = 'Unknown module'
 FUNCTION_NAME_DEFAULT_VALUE = 'Unknown function'
 LINE_NO_DEFAULT_VALUE = 'Unknown line number'
 
+# Consecutive fusible queries rewriting the same table are chained as CTEs
+FUSED_STEP_NAME = 'fused_{table_id}_{index}'
+FUSED_STEP_TEMPLATE = '''{step_name} AS (
+{query}
+)'''
+FUSED_QUERY_TEMPLATE = '''WITH {steps}
+SELECT * FROM {last_step_name}
+'''
+FUSED_NAME_SEPARATOR = ' + '
+
 
 @unique
 class DataStage(Enum):
@@ -3,6 +3,9 @@ import tempfile
 
 FILENAME = os.path.join(tempfile.gettempdir(), 'cleaner.log')
 
+# Statements are run one at a time unless more concurrent jobs are requested
+DEFAULT_CONCURRENT_JOBS = 1
+
 FAILURE_MESSAGE_TEMPLATE = '''
 The failed query was generated from the below module:
     module_name={module_name}
@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+RUN_REPORT_TABLE = '_cleaning_run_report'
+RUN_REPORT_DIR = os.path.join(tempfile.gettempdir(), 'cleaning_run_reports')
+RUN_REPORT_FILENAME = '{run_id}.json'
+SLOWEST_RULES_COUNT = 10
+
+STATUS_SUCCESS = 'success'
+STATUS_FAILED = 'failed'
+
+# run report keys
+RUN_ID = 'run_id'
+PROJECT_ID = 'project_id'
+DATA_STAGE = 'data_stage'
+RUN_DATE = 'run_date'
+WALL_SECONDS = 'wall_seconds'
+SUCCESSES = 'successes'
+FAILURES = 'failures'
+STATEMENTS = 'statements'
+SLOWEST_RULES = 'slowest_rules'
+
+# statement record keys, see resource_files/fields/_cleaning_run_report.json
+STATEMENT_INDEX = 'statement_index'
+MODULE_NAME = 'module_name'
+FUNCTION_NAME = 'function_name'
+JOB_ID = 'job_id'
+STATUS = 'status'
+QUEUE_SECONDS = 'queue_seconds'
+TOTAL_BYTES_PROCESSED = 'total_bytes_processed'
+TOTAL_SLOT_MS = 'total_slot_ms'
+ROWS_AFFECTED = 'rows_affected'
+STATEMENT_COUNT = 'statement_count'
+
+# job resource keys
+STATISTICS = 'statistics'
+QUERY = 'query'
+CREATION_TIME = 'creationTime'
+START_TIME = 'startTime'
+JOB_TOTAL_BYTES_PROCESSED = 'totalBytesProcessed'
+JOB_TOTAL_SLOT_MS = 'totalSlotMs'
+NUM_DML_AFFECTED_ROWS = 'numDmlAffectedRows'
+QUERY_PLAN = 'queryPlan'
+RECORDS_WRITTEN = 'recordsWritten'
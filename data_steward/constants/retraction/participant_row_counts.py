@@ -33,3 +33,7 @@ UNION ALL
 ALL_COUNT = 'all_count'
 ALL_EHR_COUNT = 'all_ehr_count'
 MAP_EHR_COUNT = 'map_ehr_count'
+DATASET_ID = 'dataset_id'
+
+# Number of datasets counted at the same time
+DEFAULT_MAX_WORKERS = 8
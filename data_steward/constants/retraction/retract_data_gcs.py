@@ -0,0 +1,6 @@
+# Files are streamed through memory in chunks of this many bytes, a multiple
+# of 256 KiB as required by resumable uploads
+CHUNK_SIZE = 32 * 256 * 1024
+# Number of files retracted at the same time
+DEFAULT_MAX_WORKERS = 4
+BYTES_PER_MB = 1024 * 1024
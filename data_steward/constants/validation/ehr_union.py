@@ -28,3 +28,85 @@ GENDER_CONSTANT_FACTOR = 1 * CONCEPT_CONSTANT_FACTOR
 RACE_CONSTANT_FACTOR = 2 * CONCEPT_CONSTANT_FACTOR
 DOB_CONSTANT_FACTOR = 3 * CONCEPT_CONSTANT_FACTOR
 ETHNICITY_CONSTANT_FACTOR = 4 * CONCEPT_CONSTANT_FACTOR
+
+# Number of union jobs which may run at the same time
+DEFAULT_MAX_CONCURRENT_JOBS = 8
+
+# Steps of the union task graph
+CREATE_STEP = 'create'
+MAPPING_STEP = 'mapping'
+LOAD_STEP = 'load'
+PERSON_TO_OBSERVATION_MAPPING_STEP = 'person_to_observation_mapping'
+PERSON_TO_OBSERVATION_STEP = 'person_to_observation'
+
+# Keys of union tasks and their timings
+STEP = 'step'
+TABLE = 'table'
+FUNCTION = 'function'
+ARGS = 'args'
+DEPENDS_ON = 'depends_on'
+SECONDS = 'seconds'
+
+# Incremental union
+# Tracks the submission last unioned for each HPO in the output dataset
+UNION_METADATA_TABLE = '_ehr_union_metadata'
+HPO_ID = 'hpo_id'
+HPO_OFFSET = 'hpo_offset'
+LAST_MODIFIED_TIME = 'last_modified_time'
+REMOVE_STEP = 'remove'
+
+UNION_METADATA_QUERY = '''
+SELECT hpo_id, hpo_offset, last_modified_time
+FROM `{project_id}.{dataset_id}.{metadata_table}`
+'''
+
+SAVE_UNION_METADATA_QUERY = '''
+SELECT *, CURRENT_TIMESTAMP() AS union_time
+FROM UNNEST(ARRAY<STRUCT<hpo_id STRING, hpo_offset INT64, last_modified_time INT64>>[
+  {rows}
+])
+'''
+
+# last_modified_time is in milliseconds since the epoch
+TABLES_LAST_MODIFIED_QUERY = '''
+SELECT table_id, last_modified_time
+FROM `{project_id}.{dataset_id}.__TABLES__`
+'''
+
+REMOVE_OUTPUT_SLICE_QUERY = '''
+DELETE FROM `{project_id}.{dataset_id}.{output_table}`
+WHERE {table_name}_id IN (
+  SELECT {table_name}_id
+  FROM `{project_id}.{dataset_id}.{mapping_table}`
+  WHERE src_hpo_id IN ({hpo_ids}))
+'''
+
+REMOVE_MAPPING_SLICE_QUERY = '''
+DELETE FROM `{project_id}.{dataset_id}.{mapping_table}`
+WHERE src_hpo_id IN ({hpo_ids})
+'''
+
+PERSON_TO_OBSERVATION_HPO_FILTER = '''
+SELECT *
+FROM ({person_to_obs_query})
+WHERE person_id IN (
+  SELECT src_person_id
+  FROM {output_dataset_id}._mapping_person
+  WHERE src_hpo_id IN ({hpo_ids}))
+'''
+
+# person-derived observation ids are shared by the HPOs which submitted the person, so when
+# a slice is removed they are removed for every HPO and the persons missing them are moved again
+PERSON_TO_OBSERVATION_MISSING_FILTER = '''
+SELECT *
+FROM ({person_to_obs_query})
+WHERE person_id NOT IN (
+  SELECT person_id
+  FROM {output_dataset_id}.unioned_ehr_observation
+  WHERE observation_id >= {pto_offset}
+  AND observation_id < {hpo_offset_start})
+'''
+
+PERSON_TO_OBSERVATION_MAPPING_HPO_FILTER = '''
+AND mp.src_hpo_id IN ({hpo_ids})
+'''
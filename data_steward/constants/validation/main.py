@@ -203,5 +203,19 @@ ERROR = 'error'
 ERRORS = 'errors'
 REASON = 'reason'
 
+# Load the files of a submission concurrently unless set to false
+CONCURRENT_LOADS_ENV = 'VALIDATION_CONCURRENT_LOADS'
+FALSE_VALUES = ['false', 'no', '0']
+
+# Concurrent validation of HPO sites
+HPO_WORKERS_ENV = 'VALIDATION_HPO_WORKERS'
+DEFAULT_HPO_WORKERS = 4
+# Estimated time to validate a single site's submission
+ESTIMATED_HPO_SECONDS = 15 * 60
+# Interval of the validation cron, each shard of sites is given a slot this long
+VALIDATION_INTERVAL_SECONDS = 3 * 60 * 60
+HPO_STATUS_OK = 'ok'
+HPO_STATUS_FAILED = 'failed'
+
 FOLDER_NAME_REGEX = r'\d{4}-\d{2}-\d{2}-v\d+'
 FOLDER_NAMING_CONVENTION = 'YYYY-MM-DD-vN/'
@@ -0,0 +1,229 @@
+from constants.validation.participants import identity_match as id_match
+from constants.validation.participants import writers as writer_consts
+
+MATCH = id_match.MATCH
+MISMATCH = id_match.MISMATCH
+MISSING = id_match.MISSING
+YES = writer_consts.YES
+
+# Table names
+ID_MATCH_TABLE = id_match.ID_MATCH_TABLE
+LOCATION_TABLE = 'location'
+
+# Common table expression names of the site match query
+RDR_CTE = 'rdr'
+NAME_CTE = 'name'
+EMAIL_CTE = 'email'
+PHONE_CTE = 'phone'
+ADDRESS_CTE = 'address'
+PERSON_CTE = 'person'
+SITE_PERSON_CTE = 'site_person'
+
+# Derived field names
+BIRTH_DATE_FIELD = id_match.BIRTH_DATE_FIELD
+ALGORITHM_FIELD = writer_consts.ALGORITHM_FIELD
+
+# observation_source_concept_id of the RDR value of each compared field
+RDR_FIELD_CONCEPTS = [
+    (id_match.FIRST_NAME_FIELD, id_match.OBS_PII_NAME_FIRST),
+    (id_match.LAST_NAME_FIELD, id_match.OBS_PII_NAME_LAST),
+    (id_match.EMAIL_FIELD, id_match.OBS_PII_EMAIL_ADDRESS),
+    (id_match.PHONE_NUMBER_FIELD, id_match.OBS_PII_PHONE),
+    (id_match.ADDRESS_ONE_FIELD, id_match.OBS_PII_STREET_ADDRESS_ONE),
+    (id_match.ADDRESS_TWO_FIELD, id_match.OBS_PII_STREET_ADDRESS_TWO),
+    (id_match.CITY_FIELD, id_match.OBS_PII_STREET_ADDRESS_CITY),
+    (id_match.STATE_FIELD, id_match.OBS_PII_STREET_ADDRESS_STATE),
+    (id_match.ZIP_CODE_FIELD, id_match.OBS_PII_STREET_ADDRESS_ZIP),
+    (id_match.BIRTH_DATE_FIELD, id_match.OBS_PII_BIRTH_DATETIME),
+    (id_match.SEX_FIELD, id_match.OBS_PII_SEX),
+]
+
+RDR_FIELD_VALUE = ('MAX(IF(observation_source_concept_id = {concept_id}, '
+                   'value_as_string, NULL)) AS {field}')
+
+RDR_VALUES = ('SELECT person_id, {field_values} '
+              'FROM `{project}.{dataset}.{table}` '
+              'GROUP BY person_id')
+
+# PII values of a site, one row per person.
+# (common table expression, table suffix, [(column, aggregate, type)])
+SITE_SOURCES = [
+    (NAME_CTE, id_match.PII_NAME_TABLE, [
+        (id_match.FIRST_NAME_FIELD, 'MAX(CAST(first_name AS STRING))',
+         'STRING'),
+        (id_match.LAST_NAME_FIELD, 'MAX(CAST(last_name AS STRING))', 'STRING'),
+    ]),
+    (EMAIL_CTE, id_match.PII_EMAIL_TABLE, [
+        (id_match.EMAIL_FIELD, 'MAX(CAST(email AS STRING))', 'STRING'),
+    ]),
+    (PHONE_CTE, id_match.PII_PHONE_TABLE, [
+        (id_match.PHONE_NUMBER_FIELD, 'MAX(CAST(phone_number AS STRING))',
+         'STRING'),
+    ]),
+    (ADDRESS_CTE, id_match.PII_ADDRESS_TABLE, [
+        (id_match.ADDRESS_ONE_FIELD, 'MAX(CAST(location.address_1 AS STRING))',
+         'STRING'),
+        (id_match.ADDRESS_TWO_FIELD, 'MAX(CAST(location.address_2 AS STRING))',
+         'STRING'),
+        (id_match.CITY_FIELD, 'MAX(CAST(location.city AS STRING))', 'STRING'),
+        (id_match.STATE_FIELD, 'MAX(CAST(location.state AS STRING))', 'STRING'),
+        (id_match.ZIP_CODE_FIELD, 'MAX(CAST(location.zip AS STRING))',
+         'STRING'),
+    ]),
+    (PERSON_CTE, id_match.EHR_PERSON_TABLE_SUFFIX, [
+        (id_match.GENDER_FIELD, 'MAX(gender_concept_id)', 'INT64'),
+        (BIRTH_DATE_FIELD, 'MAX(DATE(birth_datetime))', 'DATE'),
+    ]),
+]
+
+SITE_VALUES = ('SELECT pii.person_id, {aggregates} '
+               'FROM `{project}.{dataset}.{table}` AS pii '
+               '{join}'
+               'GROUP BY pii.person_id')
+
+# location values of the pii_address table are stored in the rdr dataset
+LOCATION_JOIN = ('JOIN `{project}.{rdr_dataset}.{location_table}` AS location '
+                 'ON location.location_id = pii.location_id ')
+
+# stands in for the PII values of a site missing the table
+EMPTY_SITE_VALUES = 'SELECT CAST(NULL AS INT64) AS person_id, {columns} LIMIT 0'
+
+SITE_PERSON_VALUES = 'SELECT person_id FROM {cte}'
+
+# Normalizers of participant_validation.normalizers as temporary SQL functions
+NORMALIZER_FUNCTIONS = """
+CREATE TEMP FUNCTION MatchResult(rdr_value ANY TYPE, pii_value ANY TYPE, is_match BOOL) AS (
+  CASE
+    WHEN rdr_value IS NULL OR pii_value IS NULL THEN '{missing}'
+    WHEN is_match THEN '{match}'
+    ELSE '{mismatch}'
+  END
+);
+
+CREATE TEMP FUNCTION NormalizeName(value STRING) AS (
+  LOWER(REGEXP_REPLACE(IFNULL(value, ''), r'[^\\p{{L}}]', ''))
+);
+
+CREATE TEMP FUNCTION NormalizeEmail(value STRING) AS (
+  IF(STRPOS(TRIM(IFNULL(value, '')), '{at}') > 0, LOWER(TRIM(value)), '')
+);
+
+CREATE TEMP FUNCTION NormalizePhone(value STRING) AS (
+  REGEXP_REPLACE(IFNULL(value, ''), r'[^0-9]', '')
+);
+
+CREATE TEMP FUNCTION NormalizeState(value STRING) AS (
+  IF(LOWER(TRIM(IFNULL(value, ''))) IN UNNEST({states}), LOWER(TRIM(value)), '')
+);
+
+CREATE TEMP FUNCTION ZeroFill(code STRING, width INT64) AS (
+  IF(LENGTH(code) < width, LPAD(code, width, '0'), code)
+);
+
+CREATE TEMP FUNCTION NormalizeZip(value STRING) AS (
+  REGEXP_REPLACE(
+    ZeroFill(REGEXP_EXTRACT(TRIM(IFNULL(value, '')), r'^[^ -]*'), 5),
+    r'[^0-9]', '')
+);
+
+CREATE TEMP FUNCTION ExpandCityAbbreviation(token STRING) AS (
+  IFNULL((SELECT expansion FROM UNNEST({city_abbreviations}) WHERE abbreviation = token), token)
+);
+
+CREATE TEMP FUNCTION NormalizeCity(value STRING) AS (
+  ARRAY_TO_STRING(ARRAY(
+    SELECT ExpandCityAbbreviation(token)
+    FROM UNNEST(REGEXP_EXTRACT_ALL(
+      REGEXP_REPLACE(LOWER(IFNULL(value, '')), r'[^\\p{{L}}\\p{{N}}\\s]', ''),
+      r'\\S+')) AS token WITH OFFSET AS position
+    ORDER BY position), ' ')
+);
+
+CREATE TEMP FUNCTION ExpandStreetAbbreviation(token STRING) AS (
+  IFNULL((SELECT expansion FROM UNNEST({street_abbreviations}) WHERE abbreviation = token), token)
+);
+
+CREATE TEMP FUNCTION StripNumericEnding(token STRING) AS (
+  IF(REGEXP_CONTAINS(token, r'^{numeric_endings}'), SUBSTR(token, 1, LENGTH(token) - 2), token)
+);
+
+CREATE TEMP FUNCTION SplitAlphaNumeric(token STRING) AS (
+  IF(REGEXP_CONTAINS(token, r'^{alpha_numeric}'),
+     CONCAT(REGEXP_REPLACE(token, r'[^0-9]', ''), ' ', REGEXP_REPLACE(token, r'[^a-zA-Z]', '')),
+     token)
+);
+
+CREATE TEMP FUNCTION NormalizeStreet(value STRING) AS (
+  ARRAY_TO_STRING(ARRAY(
+    SELECT SplitAlphaNumeric(StripNumericEnding(ExpandStreetAbbreviation(token)))
+    FROM UNNEST(REGEXP_EXTRACT_ALL(
+      REGEXP_REPLACE(LOWER(IFNULL(value, '')), r'[^\\p{{L}}\\p{{N}}]', ' '),
+      r'\\S+')) AS token WITH OFFSET AS position
+    ORDER BY position), ' ')
+);
+
+CREATE TEMP FUNCTION StreetTokens(address_one STRING, address_two STRING) AS (
+  ARRAY_TO_STRING(ARRAY(
+    SELECT DISTINCT token
+    FROM UNNEST(REGEXP_EXTRACT_ALL(
+      CONCAT(NormalizeStreet(address_one), ' ', NormalizeStreet(address_two)),
+      r'\\S+')) AS token
+    ORDER BY token), ' ')
+);
+"""
+
+# Match result of each field of the <site>_identity_match table, in the order
+# of the fields of the table
+FIELD_MATCHES = [
+    (id_match.PERSON_ID_FIELD, '{site_person}.person_id'),
+    (id_match.FIRST_NAME_FIELD,
+     'MatchResult({rdr}.first_name, {name}.first_name, '
+     'NormalizeName({rdr}.first_name) = NormalizeName({name}.first_name))'),
+    (id_match.MIDDLE_NAME_FIELD, "'{missing}'"),
+    (id_match.LAST_NAME_FIELD, 'MatchResult({rdr}.last_name, {name}.last_name, '
+     'NormalizeName({rdr}.last_name) = NormalizeName({name}.last_name))'),
+    (id_match.PHONE_NUMBER_FIELD,
+     'MatchResult({rdr}.phone_number, {phone}.phone_number, '
+     'NormalizePhone({rdr}.phone_number) = '
+     'NormalizePhone({phone}.phone_number))'),
+    (id_match.EMAIL_FIELD, 'MatchResult({rdr}.email, {email}.email, '
+     'NormalizeEmail({rdr}.email) = NormalizeEmail({email}.email))'),
+    (id_match.ADDRESS_ONE_FIELD, "IF({address}.person_id IS NULL, '{missing}', "
+     "IF(StreetTokens({rdr}.address_1, {rdr}.address_2) = "
+     "StreetTokens({address}.address_1, {address}.address_2), "
+     "'{match}', '{mismatch}'))"),
+    (id_match.ADDRESS_TWO_FIELD, "IF({address}.person_id IS NULL, '{missing}', "
+     "IF(StreetTokens({rdr}.address_1, {rdr}.address_2) = "
+     "StreetTokens({address}.address_1, {address}.address_2), "
+     "'{match}', '{mismatch}'))"),
+    (id_match.CITY_FIELD, 'MatchResult({rdr}.city, {address}.city, '
+     'NormalizeCity({rdr}.city) = NormalizeCity({address}.city))'),
+    (id_match.STATE_FIELD, 'MatchResult({rdr}.state, {address}.state, '
+     'NormalizeState({rdr}.state) = NormalizeState({address}.state))'),
+    (id_match.ZIP_CODE_FIELD, 'MatchResult({rdr}.zip, {address}.zip, '
+     'NormalizeZip({rdr}.zip) = NormalizeZip({address}.zip))'),
+    (id_match.BIRTH_DATE_FIELD,
+     'MatchResult({rdr}.birth_date, {person}.birth_date, '
+     'SAFE_CAST(SUBSTR(TRIM({rdr}.birth_date), 1, 10) AS DATE) = '
+     '{person}.birth_date)'),
+    (id_match.SEX_FIELD, 'MatchResult({rdr}.sex, {sex}, '
+     'LOWER({rdr}.sex) = {sex})'),
+    (ALGORITHM_FIELD, "'{yes}'"),
+]
+
+# gender_concept_id of the ehr person as the sex value reported to the RDR
+SEX_VALUE = 'CASE {person}.gender_concept_id {cases} END'
+SEX_VALUE_CASE = "WHEN {concept_id} THEN '{sex}'"
+
+SITE_MATCH_QUERY = """
+{functions}
+INSERT INTO `{project}.{dataset}.{table}` ({fields})
+WITH {ctes}
+SELECT
+  {matches}
+FROM {site_person}
+{joins}
+"""
+
+CTE = '{name} AS ({query})'
+CTE_JOIN = ('LEFT JOIN {name} ' 'ON {name}.person_id = {site_person}.person_id')
@@ -134,3 +134,15 @@ CITY_ABBREVIATIONS = {
     'st': 'saint',
     'afb': 'air force base',
 }
+
+# characters removed or replaced by the normalizers
+COMPILED_NON_ALPHA = re.compile(r'[\W\d_]+')
+
+COMPILED_NON_DIGIT = re.compile(r'\D+')
+
+COMPILED_NON_ALPHA_NUMERIC = re.compile(r'[\W_]+')
+
+COMPILED_NON_ALPHA_NUMERIC_OR_SPACE = re.compile(r'[^\w\s]+|_+')
+
+# number of normalized values each normalizer keeps
+NORMALIZER_CACHE_SIZE = 2**16
@@ -2,12 +2,16 @@
 https://github.com/all-of-us/raw-data-repository/blob/1.60.6/rdr_service/services/gcp_logging.py. This custom handler
 groups all the log messages generated within the same http request into an operation, this grouping mechanism allows
 us to quickly navigate to the relevant log message. """
+import atexit
 import collections
 import json
 import logging
 import os
+import queue
 import string
+import sys
 import threading
+import time
 import app_identity
 from datetime import datetime, timezone
 from enum import IntEnum
@@ -16,6 +20,7 @@ import random
 import requests
 from flask import request, Response
 
+from google.api_core import exceptions as gcp_exceptions
 from google.api.monitored_resource_pb2 import MonitoredResource
 from google.cloud import logging as gcp_logging
 from google.cloud import logging_v2 as gcp_logging_v2
@@ -31,6 +36,22 @@ import curation_logging.gcp_request_log_pb2  # pylint: disable=unused-import
 
 # How many log lines should be batched before pushing them to StackDriver.
 _LOG_BUFFER_SIZE = 100
+# How many log entries may wait to be published before new entries are dropped.
+_PUBLISH_QUEUE_SIZE = 1000
+# How many log entries are sent to StackDriver in one request.
+_PUBLISH_BATCH_SIZE = 50
+# How many times a batch is resent after a transient failure, and the delay
+# in seconds before the first retry, which doubles with each retry.
+_PUBLISH_RETRIES = 3
+_PUBLISH_RETRY_DELAY = 0.5
+# How many seconds to wait for pending log entries when flushing.
+_FLUSH_TIMEOUT = 10.0
+
+# Errors after which publishing a batch is retried.
+TRANSIENT_ERRORS = (gcp_exceptions.ServiceUnavailable,
+                    gcp_exceptions.DeadlineExceeded,
+                    gcp_exceptions.InternalServerError,
+                    gcp_exceptions.TooManyRequests)
 
 GAE_LOGGING_MODULE_ID = 'app-' + os.environ.get('GAE_SERVICE', 'default')
 GAE_LOGGING_VERSION_ID = os.environ.get('GAE_VERSION', 'devel')
@@ -215,20 +236,198 @@ def update_long_operation(request_log_id, op_status):
     return operation_pb2
 
 
+class LogEntryPublisher(object):
+    """
+    Sends log entries to google stack driver logging from a background thread.  Thread safe.
+
+    Request threads only enqueue LogEntry protos.  A single worker thread publishes them in batches of up to
+    `batch_size` entries, retrying transient failures.  Entries are dropped rather than blocking the caller when
+    `queue_size` entries are already waiting.
+    """
+
+    def __init__(self,
+                 queue_size=_PUBLISH_QUEUE_SIZE,
+                 batch_size=_PUBLISH_BATCH_SIZE,
+                 retries=_PUBLISH_RETRIES,
+                 retry_delay=_PUBLISH_RETRY_DELAY):
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._batch_size = batch_size
+        self._retries = retries
+        self._retry_delay = retry_delay
+
+        self._logging_client = gcp_logging_v2.LoggingServiceV2Client()
+        self._worker = None
+        self._lock = threading.Lock()
+
+        self._stats = {
+            'enqueued': 0,
+            'published': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+            'retries': 0,
+            'total_latency': 0.0,
+            'max_latency': 0.0
+        }
+
+    def _start(self):
+        """
+        Start the worker thread if it is not running.
+        """
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run,
+                                                name='stackdriver-publisher',
+                                                daemon=True)
+                self._worker.start()
+
+    def enqueue(self, log_entry_pb2):
+        """
+        Queue a log entry to be published.  Never blocks.
+        :param log_entry_pb2: LogEntry pb2 object.
+        :return: True if the entry was queued, False if it was dropped because the queue is full.
+        """
+        self._start()
+        try:
+            self._queue.put_nowait((log_entry_pb2, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+            return False
+        with self._lock:
+            self._stats['enqueued'] += 1
+        return True
+
+    def _next_batch(self):
+        """
+        Wait for a log entry and take up to `batch_size` entries from the queue.
+        :return: List of (LogEntry pb2, enqueue time) tuples.
+        """
+        batch = [self._queue.get()]
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        """
+        Publish queued log entries until the process exits.
+        """
+        while True:
+            batch = self._next_batch()
+            try:
+                self._publish(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _publish(self, batch):
+        """
+        Send a batch of log entries to StackDriver, retrying transient failures.
+        :param batch: List of (LogEntry pb2, enqueue time) tuples.
+        """
+        log_entries = [log_entry_pb2 for log_entry_pb2, _ in batch]
+        delay = self._retry_delay
+        for attempt in range(self._retries + 1):
+            try:
+                self._logging_client.write_log_entries(
+                    log_entries,
+                    log_name=LOG_NAME_TEMPLATE.format(
+                        project_id=app_identity.get_application_id()))
+                break
+            except TRANSIENT_ERRORS as exc:
+                if attempt == self._retries:
+                    self._record_failure(batch, exc)
+                    return
+                with self._lock:
+                    self._stats['retries'] += 1
+                time.sleep(delay)
+                delay *= 2
+            # pylint: disable=broad-except
+            except Exception as exc:
+                self._record_failure(batch, exc)
+                return
+
+        published_at = time.monotonic()
+        with self._lock:
+            self._stats['published'] += len(batch)
+            self._stats['batches'] += 1
+            for _, enqueued_at in batch:
+                latency = published_at - enqueued_at
+                self._stats['total_latency'] += latency
+                self._stats['max_latency'] = max(self._stats['max_latency'],
+                                                 latency)
+
+    def _record_failure(self, batch, exc):
+        """
+        Count log entries which could not be published.  Reported on stderr, since logging from the publisher
+        would queue more log entries.
+        :param batch: List of (LogEntry pb2, enqueue time) tuples.
+        :param exc: The error raised while publishing.
+        """
+        with self._lock:
+            self._stats['failed'] += len(batch)
+        print(f'Unable to publish {len(batch)} log entries: {exc!r}',
+              file=sys.stderr)
+
+    def flush(self, timeout=_FLUSH_TIMEOUT):
+        """
+        Wait until every queued log entry has been published or has failed.
+        :param timeout: Maximum seconds to wait.
+        :return: True if the queue was emptied, False if the timeout expired.
+        """
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(
+                lambda: not self._queue.unfinished_tasks, timeout)
+
+    def get_stats(self):
+        """
+        Get the publishing counters.
+        :return: dict of entries enqueued, published, dropped and failed, batches sent, retries, and the
+            average and maximum seconds from enqueueing an entry to publishing it.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['pending'] = self._queue.qsize()
+        stats['avg_latency'] = (stats['total_latency'] / stats['published']
+                                if stats['published'] else 0.0)
+        return stats
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher() -> LogEntryPublisher:
+    """
+    Return the LogEntryPublisher shared by all threads, creating it on first use.
+    :return: LogEntryPublisher object
+    """
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = LogEntryPublisher()
+            atexit.register(_publisher.flush)
+        return _publisher
+
+
 class GCPStackDriverLogger(object):
     """
     Sends log records to google stack driver logging.  Each thread needs its own copy of this object.
-    Buffers up to `buffer_size` log records into one ProtoBuffer to be submitted.
+    Buffers up to `buffer_size` log records into one ProtoBuffer to be submitted by `publisher`.
     """
 
-    def __init__(self, buffer_size=_LOG_BUFFER_SIZE):
+    def __init__(self, buffer_size=_LOG_BUFFER_SIZE, publisher=None):
 
         self._buffer_size = buffer_size
         self._buffer = collections.deque()
 
         self._reset()
 
-        self._logging_client = gcp_logging_v2.LoggingServiceV2Client()
+        self._publisher = publisher if publisher else get_publisher()
         self._operation_pb2 = None
 
         # Used to determine how long a request took.
@@ -349,7 +548,7 @@ class GCPStackDriverLogger(object):
 
     def publish_to_stackdriver(self):
         """
-        Send a set of log entries to StackDriver.
+        Queue the buffered log records as a log entry to be sent to StackDriver.
         """
         insert_id = \
             ''.join(random.choice(string.ascii_uppercase + string.ascii_lowercase + string.digits) for _ in range(16))
@@ -429,10 +628,7 @@ class GCPStackDriverLogger(object):
         log_entry_pb2 = gcp_logging_v2.types.log_entry_pb2.LogEntry(
             **log_entry_pb2_args)
 
-        self._logging_client.write_log_entries(
-            [log_entry_pb2],
-            log_name=LOG_NAME_TEMPLATE.format(
-                project_id=app_identity.get_application_id()))
+        self._publisher.enqueue(log_entry_pb2)
 
 
 def get_gcp_logger() -> GCPStackDriverLogger:
@@ -496,10 +692,13 @@ def begin_request_logging():
 def end_request_logging(response):
     """
     Finalize and send any log entries.  Not guarantied to always be called.
+    Waits for the queued log entries to be published, since the instance may
+    be suspended once the request is finished.
     """
     _logger = get_gcp_logger()
     if _logger:
         _logger.finalize(_response=response, _request=request)
+        get_publisher().flush()
     return response
 
 
@@ -510,3 +709,13 @@ def flush_request_logs():
     _logger = get_gcp_logger()
     if _logger:
         _logger.finalize(_request=request)
+
+
+def flush_thread_logs():
+    """
+    Send any log records buffered by the current thread.  For worker threads
+    which are not tied to a request.
+    """
+    _logger = get_gcp_logger()
+    if _logger:
+        _logger.finalize()
@@ -76,195 +76,33 @@ DESIGN:
 import json
 import logging
 import os
-import time
 from copy import copy
-from datetime import datetime
 
 # Third party imports
-import numpy as np
 import pandas as pd
 from google.cloud import bigquery as bq
-from google.oauth2 import service_account
 
 # Project imports
 import bq_utils
 import constants.bq_utils as bq_consts
 from deid.parser import parse_args
 from deid.press import Press
-from resources import DEID_PATH
+from deid.session import DeidSession
 
 LOGGER = logging.getLogger(__name__)
 
 
-def milliseconds_since_epoch():
-    """
-    Helper method to get the number of milliseconds from the epoch to now
-
-    :return:  an integer number of milliseconds
-    """
-    return int(
-        (datetime.utcnow() - datetime(1970, 1, 1)).total_seconds() * 1000)
-
-
-def create_participant_mapping_table(table, map_tablename, lower_bound,
-                                     max_day_shift, credentials):
-    # create the deid_map table.  set upper and lower bounds of the research_id array
-    records = table.shape[0]
-    upper_bound = lower_bound + (10 * records)
-    map_table = pd.DataFrame({"person_id": table['person_id'].tolist()})
-
-    # generate random research_ids
-    research_id_array = np.random.choice(np.arange(lower_bound, upper_bound),
-                                         records,
-                                         replace=False)
-
-    # throw in some extra, non-deterministic shuffling
-    for _ in range(milliseconds_since_epoch() % 5):
-        np.random.shuffle(research_id_array)
-    map_table['research_id'] = research_id_array
-
-    # generate date shift values
-    shift_array = np.random.choice(np.arange(1, max_day_shift), records)
-
-    # throw in some extra, non-deterministic shuffling
-    for _ in range(milliseconds_since_epoch() % 5):
-        np.random.shuffle(shift_array)
-    map_table['shift'] = shift_array
-
-    # write this to bigquery.
-    map_table.to_gbq(map_tablename, credentials=credentials, if_exists='fail')
-    LOGGER.info('created new patient mapping table')
-
-
-def create_person_id_src_hpo_map(input_dataset, credentials):
-    """
-    Create a table containing person_ids and src_hpo_ids
-
-    :param input_dataset:  the input dataset to deid
-    :param credentidals:  the credentials needed to create a new table.
-    """
-    map_tablename = "_mapping_person_src_hpos"
-    sql = ("select person_id, src_hpo_id "
-           "from {input_dataset}._mapping_{table} "
-           "join {input_dataset}.{table} "
-           "using ({table}_id) "
-           "where src_hpo_id not like 'rdr'")
-
-    # list dataset contents
-    dataset_tables = bq_utils.list_dataset_contents(input_dataset)
-    mapping_tables = []
-    mapped_tables = []
-    for table in dataset_tables:
-        if table.startswith('_mapping_'):
-            mapping_tables.append(table)
-            mapped_tables.append(table[9:])
-
-    # make sure mapped tables all exist
-    check_tables = []
-    for table in mapped_tables:
-        if table in dataset_tables:
-            check_tables.append(table)
-
-    # make sure check_tables contain person_id fields
-    person_id_tables = []
-    for table in check_tables:
-        info = bq_utils.get_table_info(table, dataset_id=input_dataset)
-        schema = info.get('schema', {})
-        for field_info in schema.get('fields', []):
-            if 'person_id' in field_info.get('name'):
-                person_id_tables.append(table)
-
-    # revamp mapping tables to contain only mapping tables for tables
-    # with person_id fields
-    mapping_tables = ['_mapping_' + table for table in person_id_tables]
-
-    sql_statement = []
-    for table in person_id_tables:
-        sql_statement.append(
-            sql.format(table=table, input_dataset=input_dataset))
-
-    final_query = ' UNION ALL '.join(sql_statement)
-
-    # create the mapping table
-    if map_tablename not in dataset_tables:
-        fields = [{
-            "type": "integer",
-            "name": "person_id",
-            "mode": "required",
-            "description": "the person_id of someone with an ehr record"
-        }, {
-            "type": "string",
-            "name": "src_hpo_id",
-            "mode": "required",
-            "description": "the src_hpo_id of an ehr record"
-        }]
-        bq_utils.create_table(map_tablename, fields, dataset_id=input_dataset)
-
-    bq_utils.query(final_query,
-                   destination_table_id=map_tablename,
-                   destination_dataset_id=input_dataset,
-                   write_disposition=bq_consts.WRITE_TRUNCATE)
-    LOGGER.info(f"Created mapping table:\t{input_dataset}.{map_tablename}")
-
-
-def create_allowed_states_table(input_dataset, credentials):
-    """
-    Create a mapping table of src_hpos to states they are located in.
-    """
-
-    map_tablename = input_dataset + "._mapping_src_hpos_to_allowed_states"
-    data = pd.read_csv(
-        os.path.join(DEID_PATH, 'config', 'internal_tables',
-                     'src_hpos_to_allowed_states.csv'))
-
-    # write this to bigquery.
-    data.to_gbq(map_tablename, credentials=credentials, if_exists='replace')
-
-
-def create_questionnaire_mapping_table(table,
-                                       map_tablename,
-                                       lower_bound,
-                                       credentials,
-                                       exists_flag=None):
-    """
-    Create a random mapping table for questionnaire response ids.
-
-    :param lower_bound:  The smallest number that may be used as an identifier.
-    """
-    if not exists_flag:
-        exists_flag = 'fail'
-
-    # create the deid table.  set upper and lower bounds of the research_id array
-    records = table.shape[0]
-    upper_bound = lower_bound + (10 * records)
-    qr_id_list = table['questionnaire_response_id'].tolist()
-    map_table = pd.DataFrame({"questionnaire_response_id": qr_id_list})
-
-    # generate random research_questionnaire_response_ids
-    research_id_array = np.random.choice(np.arange(lower_bound, upper_bound),
-                                         records,
-                                         replace=False)
-
-    # throw in some extra, non-deterministic shuffling
-    for _ in range(milliseconds_since_epoch() % 5):
-        np.random.shuffle(research_id_array)
-    map_table['research_response_id'] = research_id_array
-
-    # write this to bigquery.
-    map_table.to_gbq(map_tablename,
-                     credentials=credentials,
-                     if_exists=exists_flag)
-    LOGGER.info('created new questionnaire response mapping table')
-
-
 class AOU(Press):
 
     def __init__(self, **args):
         args['store'] = 'bigquery'
         Press.__init__(self, **args)
         self.private_key = args.get('private_key', '')
-        self.credentials = service_account.Credentials.from_service_account_file(
-            self.private_key)
+        self.session = args.get('session')
+        if self.session is None:
+            self.session = DeidSession(self.idataset, self.private_key)
+        self.credentials = self.session.credentials
+        self.client = self.session.client
         self.partition = args.get('cluster', False)
         self.priority = args.get('interactive', 'BATCH')
 
@@ -284,128 +122,14 @@ class AOU(Press):
         Press.initialize(self, **args)
         LOGGER.info(f"BEGINNING de-identification on table:\t{self.tablename}")
 
-        age_limit = args['age_limit']
-        max_day_shift = args['max_day_shift']
-        million = 1000000
-        map_tablename = self.idataset + "._deid_map"
-
-        sql = (
-            "SELECT DISTINCT person_id, EXTRACT(YEAR FROM CURRENT_DATE()) - year_of_birth as age "
-            "FROM person ORDER BY 2")
-        job_config = {'query': {'defaultDataset': {'datasetId': self.idataset}}}
-        person_table = self.get_dataframe(sql=sql, query_config=job_config)
-        LOGGER.info(f"patient count is:\t{person_table.shape[0]}")
-        map_table = pd.DataFrame()
-
         # only need to create these tables deidentifying the observation table
         if 'observation' in self.get_tablename().lower().split('.'):
-            create_allowed_states_table(self.idataset, self.credentials)
-            self.map_questionnaire_response_ids(million)
-            create_person_id_src_hpo_map(self.idataset, self.credentials)
-
-        if person_table.shape[0] > 0:
-            person_table = person_table[person_table.age < age_limit]
-            map_sql = 'SELECT * FROM ' + map_tablename
-            job_config = {
-                'query': {
-                    'defaultDataset': {
-                        'datasetId': self.idataset
-                    }
-                }
-            }
-            map_table = self.get_dataframe(sql=map_sql, query_config=job_config)
-            if map_table.shape[0] > 0:
-                # Make sure the mapping table is mapping the expected data
-                map_table_set = set(map_table.loc[:, 'person_id'].tolist())
-                person_set = set(person_table.loc[:, 'person_id'].tolist())
-                if map_table_set == person_set:
-                    LOGGER.info('participant mapping table contains '
-                                'all person ids.  continuing...')
-                else:
-                    LOGGER.info(
-                        "creating new participant mapping table because the current mapping table doesn't match"
-                    )
-                    create_participant_mapping_table(person_table,
-                                                     map_tablename, million,
-                                                     max_day_shift,
-                                                     self.credentials)
-            else:
-                LOGGER.info(
-                    "creating new participant mapping table because one doesn't exist"
-                )
-                create_participant_mapping_table(person_table, map_tablename,
-                                                 million, max_day_shift,
-                                                 self.credentials)
-        else:
-            LOGGER.error("Unable to initialize Deid.  Check "
-                         "configuration files, parameters, and credentials.")
-
-        LOGGER.info(f"map table contains {map_table.shape[0]} participants.")
-        return person_table.shape[0] > 0 or map_table.shape[0] > 0
+            self.session.initialize_observation_maps()
 
-    def map_questionnaire_response_ids(self, lower_bound):
-        """
-        Create a random mapping table for questionnaire response ids.
+        return self.session.initialize_participant_map(
+            age_limit=args['age_limit'], max_day_shift=args['max_day_shift'])
 
-        :param lower_bound:  The smallest number that may be used as an identifier.
-        """
-        map_tablename = self.idataset + "._deid_questionnaire_response_map"
-        sql = ("SELECT DISTINCT o.questionnaire_response_id "
-               "FROM observation as o "
-               "WHERE o.questionnaire_response_id IS NOT NULL "
-               "ORDER BY 1")
-        job_config = {'query': {'defaultDataset': {'datasetId': self.idataset}}}
-        observation_table = self.get_dataframe(sql=sql, query_config=job_config)
-        LOGGER.info(
-            f"total of distinct questionnaire_response_ids:\t{observation_table.shape[0]}"
-        )
-        map_table = pd.DataFrame()
-
-        if observation_table.shape[0] > 0:
-            map_sql = 'SELECT * FROM ' + map_tablename
-            job_config = {
-                'query': {
-                    'defaultDataset': {
-                        'datasetId': self.idataset
-                    }
-                }
-            }
-            map_table = self.get_dataframe(sql=map_sql, query_config=job_config)
-            if map_table.shape[0] > 0:
-                # Make sure the mapping table is mapping the expected data
-                map_table_set = set(
-                    map_table.loc[:, 'questionnaire_response_id'].tolist())
-                observation_set = set(
-                    observation_table.loc[:,
-                                          'questionnaire_response_id'].tolist())
-                if map_table_set == observation_set:
-                    LOGGER.info('questionnaire response mapping table contains '
-                                'all questionnaire response ids')
-                else:
-                    LOGGER.warning(
-                        'creating new questionnaire response mapping '
-                        'table because the existing table doesn\'t match')
-                    # The tables do NOT contain the same mapped elements
-                    create_questionnaire_mapping_table(observation_table,
-                                                       map_tablename,
-                                                       lower_bound,
-                                                       self.credentials,
-                                                       'replace')
-            else:
-                LOGGER.info('creating a new questionnaire response mapping '
-                            'table because it doesn\'t exist')
-                # create the deid table.  set upper and lower bounds of the research_id array
-                create_questionnaire_mapping_table(observation_table,
-                                                   map_tablename, lower_bound,
-                                                   self.credentials)
-        else:
-            LOGGER.error("No questionnaire_response_ids found.")
-
-        LOGGER.info(
-            f"questionnaire response mapping table contains {map_table.shape[0]} records"
-        )
-
-    def get_dataframe(self, sql=None, limit=None, query_config=None):
+    def get_dataframe(self, sql=None, limit=None):
         """
         This function will execute a query to a data-frame (for easy handling)
         """
@@ -417,17 +141,7 @@ class AOU(Press):
             sql = sql + " LIMIT " + str(limit)
 
         try:
-            if query_config:
-                df = pd.read_gbq(sql,
-                                 credentials=self.credentials,
-                                 dialect='standard',
-                                 configuration=query_config)
-            else:
-                df = pd.read_gbq(sql,
-                                 credentials=self.credentials,
-                                 dialect='standard')
-
-            return df
+            return self.client.query(sql, location='US').to_dataframe()
         except Exception:
             LOGGER.exception(f"Unable to execute the query:\t{sql}")
 
@@ -598,15 +312,10 @@ class AOU(Press):
         """
         dml = False if dml is None else dml
         table_name = self.get_tablename()
-        client = bq.Client.from_service_account_json(self.private_key)
+        client = self.client
         #
         # Let's make sure the out dataset exists
-        datasets = list(client.list_datasets())
-        found = np.sum(
-            [1 for dataset in datasets if dataset.dataset_id == self.odataset])
-        if not found:
-            dataset = bq.Dataset(client.dataset(self.odataset))
-            client.create_dataset(dataset)
+        self.session.ensure_dataset(self.odataset)
 
         # create the output table
         if create:
@@ -670,47 +379,64 @@ class AOU(Press):
                 LOGGER.info(
                     f"submitted a bigquery job for table:\t{table_name}\t\t"
                     f"status:\t'pending'\t\tvalue:\t{response.job_id}")
-                self.wait(client, response.job_id)
+                self.wait(response.job_id)
 
-    def wait(self, client, job_id):
+    def wait(self, job_id):
         """
         Wait for the query to finish executing.
 
-        :param client:  The BigQuery client object.
+        The run's job monitor polls the jobs of every table being de-identified.
+
         :param job_id:  job_id to verify finishes.
         """
         LOGGER.info(
             f"sleeping for table:\t{self.get_tablename()}\t\tjob_id:\t{job_id}")
-        status = 'NONE'
-
-        while True:
-            status = client.get_job(job_id).state
+        job = self.session.job_monitor.wait(job_id)
+        if job.error_result:
+            LOGGER.error(f"job for table:\t{self.get_tablename()}\t\t"
+                         f"job_id:\t{job_id}\t\terror:\t{job.error_result}")
 
-            if status == 'DONE':
-                break
-            else:
-                time.sleep(5)
+        LOGGER.info(f"awake.  status is:\t{job.state}")
 
-        LOGGER.info(f"awake.  status is:\t{status}")
 
-
-def main(raw_args=None):
+def prepare(raw_args=None, session=None):
     """
-    Run the de-identifying software.
+    Initialize de-identification of a table and generate its SQL.
 
-    Entry point for de-identification.  Setting the main this way allows the
-    module to run as a stand alone script or as part of the pipeline.
+    :param raw_args:  the command line arguments
+    :param session:  an optional DeidSession shared by the tables of a run.
+        A session for this table only is created if not given.
+    :return:  the AOU instance ready to run, or None if it could not be
+        initialized
     """
     sys_args = parse_args(raw_args)
 
-    handle = AOU(**sys_args)
+    handle = AOU(session=session, **sys_args)
 
     if handle.initialize(age_limit=sys_args.get('age-limit'),
                          max_day_shift=365):
-        handle.do()
-    else:
-        print("Unable to initialize process ")
-        print("\tEnsure that the parameters are correct")
+        handle.prepare()
+        return handle
+
+    print("Unable to initialize process ")
+    print("\tEnsure that the parameters are correct")
+    return None
+
+
+def main(raw_args=None, session=None):
+    """
+    Run the de-identifying software.
+
+    Entry point for de-identification.  Setting the main this way allows the
+    module to run as a stand alone script or as part of the pipeline.
+
+    :param raw_args:  the command line arguments
+    :param session:  an optional DeidSession shared by the tables of a run.
+        A session for this table only is created if not given.
+    """
+    handle = prepare(raw_args, session=session)
+    if handle:
+        handle.run()
 
 
 if __name__ == '__main__':
@@ -9,6 +9,9 @@
 """
 from argparse import ArgumentParser, ArgumentTypeError
 
+# percent of the table sampled by the simulation, 100 reads the whole table
+SAMPLE_PERCENT = 10
+
 
 class Parse(object):
     """
@@ -199,6 +202,22 @@ def parse_args(raw_args=None):
         type=query_priority,
         const='INTERACTIVE',
         help='Run the query in interactive mode.  Default is batch mode.')
+    parser.add_argument(
+        '--sample-percent',
+        dest='sample-percent',
+        action='store',
+        default=SAMPLE_PERCENT,
+        type=int,
+        choices=range(1, 101),
+        metavar='[1-100]',
+        help=('Optional parameter to set the percent of each table sampled '
+              f'by the simulate action.  Defaults to {SAMPLE_PERCENT}.'))
+    parser.add_argument(
+        '--rebuild-plans',
+        dest='rebuild-plans',
+        action='store_true',
+        help=('Compile the rules of the table again instead of reusing a '
+              'saved deid plan.'))
     parser.add_argument('--version', action='version', version='deid-02')
     # normally, the parsed arguments are returned as a namespace object.  To avoid
     # rewriting a lot of existing code, the namespace elements will be turned into
@@ -0,0 +1,248 @@
+"""
+Compiled deid plans.
+
+A deid plan is everything de-identifying a table executes, compiled from the
+rule configuration and the table's schema:
+
+    - columns   the ordered column expressions applied to every record
+    - filters   the row suppression filters
+    - sql       the queries creating the de-identified table
+    - dml       the DML statements executed on the de-identified table
+    - rules     the applied rules, used to simulate the transformations
+
+Plans are saved as JSON files named after the table and a hash of the rule
+configuration files, the table's schema, the deid settings and the source of
+the modules compiling the rules, so a rerun with unchanged inputs reuses the
+saved plan instead of compiling the rules again.  run_deid --rebuild-plans
+compiles every plan again regardless.
+
+Plans can be compared from the command line, e.g. between config versions:
+
+    python deid/plan.py LOGS/plans/observation-<old>.json LOGS/plans/observation-<new>.json
+"""
+# Python imports
+import difflib
+import hashlib
+import json
+import logging
+import os
+from argparse import ArgumentParser
+from functools import lru_cache
+
+LOGGER = logging.getLogger(__name__)
+
+# increment when the plan contents change, so older plans are compiled again
+PLAN_VERSION = 1
+PLANS_DIRECTORY = 'plans'
+# modules of the deid package compiling the rules into a plan
+COMPILER_MODULES = ['aou.py', 'plan.py', 'press.py', 'rules.py']
+
+
+@lru_cache()
+def get_compiler_hash():
+    """
+    Hash the source of the modules compiling deid plans.
+
+    A change to the compiler invalidates the saved plans without having to
+    increment PLAN_VERSION.
+
+    :return:  the hexadecimal digest of the compiler modules' source
+    """
+    hash_obj = hashlib.sha256()
+    deid_dir = os.path.dirname(os.path.abspath(__file__))
+    for module in COMPILER_MODULES:
+        with open(os.path.join(deid_dir, module), 'rb') as fp:
+            hash_obj.update(fp.read())
+        hash_obj.update(b'\0')
+    return hash_obj.hexdigest()
+
+
+def get_plan_key(file_paths, columns, **settings):
+    """
+    Hash the inputs a deid plan is compiled from.
+
+    :param file_paths:  paths of the rule configuration and schema files.
+        Paths that are not files are skipped.
+    :param columns:  the ordered column names of the table
+    :param settings:  other values the plan depends on, e.g. dataset names
+    :return:  the hexadecimal digest identifying the plan
+    """
+    hash_obj = hashlib.sha256()
+    hash_obj.update(str(PLAN_VERSION).encode())
+    hash_obj.update(get_compiler_hash().encode())
+    for file_path in file_paths:
+        if file_path and os.path.isfile(file_path):
+            with open(file_path, 'rb') as fp:
+                hash_obj.update(fp.read())
+        # separate the files, so moving content between files changes the key
+        hash_obj.update(b'\0')
+
+    values = dict(settings, columns=columns)
+    hash_obj.update(json.dumps(values, sort_keys=True).encode())
+    return hash_obj.hexdigest()
+
+
+def get_plan_path(plan_dir, tablename, key):
+    """
+    Get the path of a table's deid plan.
+
+    :param plan_dir:  the directory of the saved plans
+    :param tablename:  name of the table
+    :param key:  the plan key, see get_plan_key
+    :return:  the path of the plan file
+    """
+    return os.path.join(plan_dir, f'{tablename}-{key}.json')
+
+
+def create_plan(key, tablename, idataset, odataset, pipeline, columns, filters,
+                rules, sql, dml):
+    """
+    Create a deid plan.
+
+    :param key:  the plan key, see get_plan_key
+    :param tablename:  name of the table
+    :param idataset:  name of the input dataset
+    :param odataset:  name of the output dataset
+    :param pipeline:  the ordered operations applied to the table
+    :param columns:  list of [column, expression] pairs applied to every record
+    :param filters:  list of row suppression filter dictionaries
+    :param rules:  list of the applied rule dictionaries
+    :param sql:  list of queries creating the de-identified table
+    :param dml:  list of DML statements to execute on the de-identified table
+    :return:  the plan dictionary
+    """
+    return {
+        'version': PLAN_VERSION,
+        'key': key,
+        'table': tablename,
+        'idataset': idataset,
+        'odataset': odataset,
+        'pipeline': list(pipeline),
+        'columns': [list(pair) for pair in columns],
+        'filters': filters,
+        'rules': rules,
+        'sql': sql,
+        'dml': dml
+    }
+
+
+def save_plan(plan, path):
+    """
+    Save a deid plan as a JSON file.
+
+    :param plan:  the plan dictionary
+    :param path:  the path of the plan file
+    """
+    plan_dir = os.path.dirname(path)
+    if plan_dir:
+        os.makedirs(plan_dir, exist_ok=True)
+
+    with open(path, 'w') as plan_file:
+        json.dump(plan, plan_file, indent=2, sort_keys=True)
+    LOGGER.info(f"saved deid plan:\t{path}")
+
+
+def load_plan(path):
+    """
+    Load a saved deid plan.
+
+    :param path:  the path of the plan file
+    :return:  the plan dictionary, or None if the plan does not exist or was
+        saved by a different plan version
+    """
+    try:
+        with open(path, 'r') as plan_file:
+            plan = json.load(plan_file)
+    except OSError:
+        return None
+    except ValueError:
+        LOGGER.warning(f"ignoring unreadable deid plan:\t{path}")
+        return None
+
+    if plan.get('version') != PLAN_VERSION:
+        LOGGER.info(f"ignoring deid plan of version {plan.get('version')}:\t"
+                    f"{path}")
+        return None
+
+    return plan
+
+
+def format_plan(plan):
+    """
+    Format a deid plan as lines of text, one expression or statement per line.
+
+    :param plan:  the plan dictionary
+    :return:  a list of strings
+    """
+    lines = [
+        f"table: {plan.get('table')}", f"idataset: {plan.get('idataset')}",
+        f"odataset: {plan.get('odataset')}",
+        f"pipeline: {', '.join(plan.get('pipeline', []))}", '[columns]'
+    ]
+    lines.extend(f'{column}: {expression}'
+                 for column, expression in plan.get('columns', []))
+    lines.append('[filters]')
+    lines.extend(item.get('filter', '') for item in plan.get('filters', []))
+    lines.append('[sql]')
+    lines.extend(
+        ' '.join(statement.split()) for statement in plan.get('sql', []))
+    lines.append('[dml]')
+    lines.extend(
+        ' '.join(statement.split()) for statement in plan.get('dml', []))
+    return lines
+
+
+def diff_plans(old_plan, new_plan, old_name='old', new_name='new'):
+    """
+    Compare two deid plans.
+
+    :param old_plan:  the plan dictionary compared from
+    :param new_plan:  the plan dictionary compared to
+    :param old_name:  label of the old plan in the diff
+    :param new_name:  label of the new plan in the diff
+    :return:  a list of unified diff lines, empty if the plans are the same
+    """
+    return list(
+        difflib.unified_diff(format_plan(old_plan),
+                             format_plan(new_plan),
+                             fromfile=old_name,
+                             tofile=new_name,
+                             lineterm=''))
+
+
+def parse_args(raw_args=None):
+    """
+    Parse command line arguments.
+
+    Returns a namespace of the arguments.
+    """
+    parser = ArgumentParser(description='Compare two compiled deid plans')
+    parser.add_argument('old_plan',
+                        action='store',
+                        help='Path of the plan file to compare from')
+    parser.add_argument('new_plan',
+                        action='store',
+                        help='Path of the plan file to compare to')
+    return parser.parse_args(raw_args)
+
+
+def main(raw_args=None):
+    """
+    Print the differences of two deid plans.
+
+    :return:  1 if the plans differ, 0 if they are the same
+    """
+    args = parse_args(raw_args)
+    plans = []
+    for path in [args.old_plan, args.new_plan]:
+        with open(path, 'r') as plan_file:
+            plans.append(json.load(plan_file))
+
+    lines = diff_plans(plans[0], plans[1], args.old_plan, args.new_plan)
+    for line in lines:
+        print(line)
+    return 1 if lines else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -15,11 +15,49 @@ import numpy as np
 
 # Project imports
 import bq_utils
-from resources import fields_for
+from deid import plan as deid_plan
+from deid.parser import SAMPLE_PERCENT
+from resources import fields_for, fields_path
 from deid.rules import Deid, create_on_string
 
 LOGGER = logging.getLogger(__name__)
 
+# the most value pairs reported for a shifted field, and for any other field
+SIMULATION_SHIFT_LIMIT = 5
+SIMULATION_VALUES_LIMIT = 100
+ROW_SUPPRESSION = 'ROW SUPPRESSION'
+SIMULATION_COLUMNS = [
+    'attribute', 'task', 'original', 'transformed', 'row_count'
+]
+
+# the sample is named after the table, as rules refer to the table's fields
+# by the table name
+SIMULATION_SQL = """
+WITH {tablename} AS (
+  SELECT * FROM `{idataset}.{tablename}`{sample}
+)
+{selects}
+"""
+
+SIMULATION_FIELD_SQL = """(
+  SELECT '{field}' AS attribute, '{task}' AS task,
+    CAST(deid_original AS STRING) AS original,
+    CAST({field} AS STRING) AS transformed,
+    COUNT(*) AS row_count
+  FROM (SELECT {field} AS deid_original, {apply} FROM {tablename}{where})
+  GROUP BY attribute, task, original, transformed
+  ORDER BY row_count DESC
+  LIMIT {limit}
+)"""
+
+SIMULATION_SUPPRESSION_SQL = """(
+  SELECT '{attribute}' AS attribute, '{task}' AS task,
+    CAST(NULL AS STRING) AS original,
+    CAST(NULL AS STRING) AS transformed,
+    COUNTIF({filters}) AS row_count
+  FROM {tablename}
+)"""
+
 
 def set_up_logging(log_path, idataset):
     """
@@ -73,6 +111,7 @@ class Press(ABC):
             self.tablepath).split('.json')[0].strip()
 
         self.logpath = args.get('logs', 'logs')
+        self.rules_path = args.get('rules')
         set_up_logging(self.logpath, self.idataset)
 
         with codecs.open(args.get('rules'), 'r') as config:
@@ -107,6 +146,16 @@ class Press(ABC):
         self.action = [term.strip() for term in args['action'].split(',')
                       ] if 'action' in args else ['submit']
 
+        self.sample_percent = args.get('sample-percent', SAMPLE_PERCENT)
+
+        # the generated rules and SQL of the table, see prepare
+        self.statements = None
+        self.plan = None
+        self.plan_dir = args.get(
+            'plans', os.path.join(self.logpath, deid_plan.PLANS_DIRECTORY))
+        self.rebuild_plans = args.get('rebuild-plans', False)
+        self._table_columns = {}
+
     def meta(self, data_frame):
         return pd.DataFrame({
             "names": list(data_frame.dtypes.to_dict().keys()),
@@ -127,16 +176,20 @@ class Press(ABC):
     def get_table_columns(self, tablename):
         """
         Return a list of columns for the given table name.
+
+        The schema of each table is only requested once.
         """
-        info = bq_utils.get_table_info(tablename, dataset_id=self.idataset)
-        schema = info.get('schema', {})
-        fields = schema.get('fields')
+        if tablename not in self._table_columns:
+            info = bq_utils.get_table_info(tablename, dataset_id=self.idataset)
+            schema = info.get('schema', {})
+            fields = schema.get('fields')
 
-        field_names = []
-        for field in fields:
-            field_names.append(field.get('name'))
+            field_names = []
+            for field in fields:
+                field_names.append(field.get('name'))
+            self._table_columns[tablename] = field_names
 
-        return field_names
+        return list(self._table_columns[tablename])
 
     @abstractmethod
     def get_dataframe(self, sql=None, limit=None):
@@ -159,9 +212,69 @@ class Press(ABC):
         """
         pass
 
-    def do(self):
+    def get_plan_key(self):
         """
-        This function actually runs deid and using both rule specifications and application of the rules
+        Hash the rule configuration, schema and settings the table's plan
+        is compiled from.
+
+        :return:  the plan key, see deid.plan.get_plan_key
+        """
+        schema_path = os.path.join(fields_path, self.tablename + '.json')
+        return deid_plan.get_plan_key(
+            [self.rules_path, self.tablepath, schema_path],
+            self.get_table_columns(self.tablename),
+            idataset=self.idataset,
+            odataset=self.odataset,
+            tablename=self.tablename,
+            pipeline=self.pipeline,
+            filters=self.deid_rules['suppress']['FILTERS'])
+
+    def prepare(self):
+        """
+        Get the table's deid plan and write its SQL to the table's SQL log file.
+
+        A plan saved by a previous run with the same rule configuration,
+        schema and settings is reused unless rebuild_plans is set, otherwise
+        the rules are compiled and the plan is saved.  The statements are kept
+        to be executed by run.
+
+        :return:  a tuple of the rules applied to the table, the list of
+            queries creating the de-identified table and the list of DML
+            statements to execute on the de-identified table
+        """
+        key = self.get_plan_key()
+        plan_path = deid_plan.get_plan_path(self.plan_dir, self.tablename, key)
+        plan = None if self.rebuild_plans else deid_plan.load_plan(plan_path)
+
+        if plan:
+            LOGGER.info(f"reusing deid plan for table:\t{self.get_tablename()}"
+                        f"\t\tplan:\t{plan_path}")
+            self.pipeline = plan['pipeline']
+            self.deid_rules['suppress']['FILTERS'] = plan['filters']
+            p, sql, dml_sql = plan['rules'], plan['sql'], plan['dml']
+        else:
+            p, sql, dml_sql = self.compile()
+            relational_cols = [col for col in p if 'on' not in col]
+            plan = deid_plan.create_plan(
+                key, self.tablename, self.idataset, self.odataset,
+                self.pipeline, self.get_column_expressions(relational_cols),
+                self.deid_rules['suppress']['FILTERS'], p, sql, dml_sql)
+            deid_plan.save_plan(plan, plan_path)
+
+        self.plan = plan
+        if 'debug' not in self.action:
+            self.write_sql(sql, dml_sql)
+
+        self.statements = (p, sql, dml_sql)
+        return self.statements
+
+    def compile(self):
+        """
+        Compile the rules of the table into its SQL.
+
+        :return:  a tuple of the rules applied to the table, the list of
+            queries creating the de-identified table and the list of DML
+            statements to execute on the de-identified table
         """
         self.update_rules()
         d = Deid(pipeline=self.pipeline, rules=self.deid_rules, parent=self)
@@ -212,25 +325,40 @@ class Press(ABC):
                 sql[index] = formatted.replace(':join_tablename',
                                                self.tablename)
 
-        if 'debug' in self.action:
-            self.debug(p)
-        else:
-            # write SQL to file
-            sql_filepath = os.path.join(self.logpath, self.idataset,
-                                        self.tablename + '.sql')
-            with open(sql_filepath, 'w') as sql_file:
-                final_sql = "\n\nAppend these results to previous results\n\n".join(
-                    sql)
+        return p, sql, dml_sql
+
+    def write_sql(self, sql, dml_sql):
+        """
+        Write the SQL of the table to the table's SQL log file.
+
+        :param sql:  the list of queries creating the de-identified table
+        :param dml_sql:  the list of DML statements to execute on the
+            de-identified table
+        """
+        sql_filepath = os.path.join(self.logpath, self.idataset,
+                                    self.tablename + '.sql')
+        with open(sql_filepath, 'w') as sql_file:
+            final_sql = "\n\nAppend these results to previous results\n\n".join(
+                sql)
+            sql_file.write(final_sql)
+
+            if dml_sql:
+                sql_file.write(
+                    '\n\nDML SQL statements to execute on de-identified table data\n\n'
+                )
+                final_sql = '\n\n  ----------------------------------\n\n'.join(
+                    dml_sql)
                 sql_file.write(final_sql)
 
-                if dml_sql:
-                    sql_file.write(
-                        '\n\nDML SQL statements to execute on de-identified table data\n\n'
-                    )
-                    final_sql = '\n\n  ----------------------------------\n\n'.join(
-                        dml_sql)
-                    sql_file.write(final_sql)
+    def run(self):
+        """
+        Execute the statements generated by prepare, according to the action.
+        """
+        p, sql, dml_sql = self.statements
 
+        if 'debug' in self.action:
+            self.debug(p)
+        else:
             if 'submit' in self.action:
                 for index, statement in enumerate(sql):
                     self.submit(statement, not index)
@@ -245,6 +373,13 @@ class Press(ABC):
 
         LOGGER.info(f"FINISHED de-identification on table:\t{self.tablename}")
 
+    def do(self):
+        """
+        This function actually runs deid and using both rule specifications and application of the rules
+        """
+        self.prepare()
+        self.run()
+
     def get_tablename(self):
         return self.idataset + "." + self.tablename if self.idataset else self.tablename
 
@@ -254,110 +389,127 @@ class Press(ABC):
             print(row['label'], not row['apply'])
             print()
 
-    def simulate(self, info):
+    def get_simulation_sql(self, info):
         """
-        This function will attempt to log the various transformations on every field.
+        Create the single query simulating the transformations of a table.
 
-        This will simulate and provide output on possible transformations.
-        :info   payload of that has all the transformations applied to a given table as follows
-                [{apply, label, name}] where
-                    - apply is the SQL to be applied
-                    - label is the flag for the operation (generalize, suppress, compute, shift)
-                    - name  is the attribute name on which the rule gets applied
+        The query reads a TABLESAMPLE of the table once.  It returns the most
+        frequent original and transformed value pairs of every transformed
+        field, with the number of sampled rows of each pair, and a row counting
+        the sampled rows kept by the row suppression filters.
+
+        :info   payload of all the transformations applied to the table, see
+                simulate
+        :return:  a tuple of the query, or None if nothing can be simulated,
+            and the count of rules of each operation
         """
-        table_name = self.idataset + "." + self.tablename
-        suppression_filters = self.deid_rules['suppress']['FILTERS']
-        out = pd.DataFrame()
+        suppression_filters = [
+            row['filter']
+            for row in self.deid_rules['suppress']['FILTERS']
+            if 'filter' in row
+        ]
         counts = {}
-        dirty_date = False
         filters = []
+        selects = []
 
         for item in info:
             labels = item['label'].split('.')
 
             if not (set(labels) & set(self.pipeline)):
-                LOGGER.info(
-                    f"Skipping simulation for table:\t{table_name}\t\tvalues:\t{labels}"
-                )
+                LOGGER.info(f"Skipping simulation for table:\t"
+                            f"{self.get_tablename()}\t\tvalues:\t{labels}")
                 continue
 
-            if labels[0] not in counts:
-                counts[labels[0].strip()] = 0
-
-            counts[labels[0].strip()] += 1
+            operation = labels[0].strip()
+            counts[operation] = counts.get(operation, 0) + 1
 
-            if 'suppress' in labels or item['name'] == 'person_id' or dirty_date:
+            if 'suppress' in labels or item['name'] == 'person_id':
                 continue
 
-            field = item['name']
-            alias = 'original_' + field
-            sql_list = [
-                "SELECT DISTINCT ", field, 'AS ', alias, ",", item['apply'],
-                " FROM ", table_name
-            ]
-
-            if suppression_filters:
-                sql_list.append('WHERE')
-
-                for row in suppression_filters:
-                    sql_list.append(row['filter'])
-
-                    if suppression_filters.index(
-                            row) < len(suppression_filters) - 1:
-                        sql_list.append('AND')
-
+            conditions = list(suppression_filters)
             if 'on' in item:
                 # This applies to meta tables
-                filters.append(item['on'])
-                if suppression_filters:
-                    sql_list.extend(['AND', item['on']])
-                else:
-                    sql_list.extend(['WHERE ', item['on']])
-
-            if 'shift' in labels:
-                data_frame = self.get_dataframe(sql=" ".join(sql_list).replace(
-                    ':idataset', self.idataset),
-                                                limit=5)
-            else:
-                data_frame = self.get_dataframe(
-                    sql=" ".join(sql_list).replace(':idataset', self.idataset))
-
-            if data_frame.shape[0] == 0:
-                LOGGER.info(
-                    f"no data-found for simulation of table:\t{table_name}\t\t"
-                    f"field:\t{field}\t\ttype:\t{item['label']}")
-                continue
+                on_string, _ = create_on_string(item['on'])
+                filters.append(on_string)
+                conditions.append(on_string)
+
+            where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+            limit = SIMULATION_SHIFT_LIMIT if 'shift' in labels else SIMULATION_VALUES_LIMIT
+            # the transformation keeps the field name as its alias
+            selects.append(
+                SIMULATION_FIELD_SQL.format(field=item['name'],
+                                            task=item['label'].upper().replace(
+                                                '.', ' '),
+                                            apply=item['apply'],
+                                            tablename=self.tablename,
+                                            where=where,
+                                            limit=limit))
 
-            data_frame.columns = ['original', 'transformed']
-            data_frame['attribute'] = field
-            data_frame['task'] = item['label'].upper().replace('.', ' ')
-            out = out.append(data_frame)
-        #-- Let's evaluate row suppression here
-        #
-        out.index = range(out.shape[0])
-        rdf = pd.DataFrame()
         if suppression_filters:
-            filters += [
-                item['filter']
-                for item in suppression_filters
-                if 'filter' in item
-            ]
-            original_sql = ' (SELECT COUNT(*) as original FROM :table) AS ORIGINAL_TABLE ,'
-            original_sql = original_sql.replace(':table', table_name)
-            transformed_sql = '(SELECT COUNT(*) AS transformed FROM :table WHERE :filter) AS TRANSF_TABLE'
-            transformed_sql = transformed_sql.replace(':table', table_name)
-            transformed_sql = transformed_sql.replace(':filter',
-                                                      " OR ".join(filters))
-            sql_list = ['SELECT * FROM ', original_sql, transformed_sql]
-
-            r = self.get_dataframe(
-                sql=" ".join(sql_list).replace(":idataset", self.idataset))
-            table_name = self.idataset + "." + self.tablename
-
-            rdf = pd.DataFrame({
-                "operation": ["row-suppression"],
-                "count": r.transformed.tolist()
-            })
+            filters += suppression_filters
+            selects.append(
+                SIMULATION_SUPPRESSION_SQL.format(attribute=ROW_SUPPRESSION,
+                                                  task=ROW_SUPPRESSION,
+                                                  filters=' OR '.join(filters),
+                                                  tablename=self.tablename))
+
+        if not selects:
+            return None, counts
+
+        sample = ''
+        if self.sample_percent < 100:
+            sample = f' TABLESAMPLE SYSTEM ({self.sample_percent} PERCENT)'
+
+        sql = SIMULATION_SQL.format(idataset=self.idataset,
+                                    tablename=self.tablename,
+                                    sample=sample,
+                                    selects='\nUNION ALL\n'.join(selects))
+        return sql.replace(':idataset', self.idataset), counts
+
+    def simulate(self, info):
+        """
+        This function will attempt to log the various transformations on every field.
+
+        This will simulate and provide output on possible transformations.
+        All of the fields are simulated by a single query over a sample of the
+        table, see get_simulation_sql.  Both output files have a sample_percent
+        column, the row-suppression count is estimated for the whole table.
+        :info   payload of that has all the transformations applied to a given table as follows
+                [{apply, label, name}] where
+                    - apply is the SQL to be applied
+                    - label is the flag for the operation (generalize, suppress, compute, shift)
+                    - name  is the attribute name on which the rule gets applied
+        """
+        table_name = self.get_tablename()
+        sql, counts = self.get_simulation_sql(info)
+
+        data_frame = pd.DataFrame()
+        if sql:
+            data_frame = self.get_dataframe(sql=sql)
+        data_frame = data_frame.reindex(columns=SIMULATION_COLUMNS)
+
+        is_suppression = data_frame['task'] == ROW_SUPPRESSION
+        out = data_frame.loc[
+            ~is_suppression,
+            ['original', 'transformed', 'attribute', 'task', 'row_count'
+            ]].reset_index(drop=True)
+        if out.empty:
+            LOGGER.info(f"no data-found for simulation of table:\t{table_name}")
+
+        operations = list(counts.keys())
+        operation_counts = list(counts.values())
+        if is_suppression.any():
+            # scale the count of the sampled rows up to the whole table
+            sampled_count = data_frame.loc[is_suppression, 'row_count'].iloc[0]
+            operations.append('row-suppression')
+            operation_counts.append(
+                int(round(sampled_count * 100 / self.sample_percent)))
+        stats = pd.DataFrame({
+            "operation": operations,
+            "count": operation_counts
+        })
+        out['sample_percent'] = self.sample_percent
+        stats['sample_percent'] = self.sample_percent
 
         now = datetime.now()
         flag = "-".join(
@@ -371,14 +523,6 @@ class Press(ABC):
             # directory already exists.  move on.
             pass
 
-        stats = pd.DataFrame({
-            "operation": counts.keys(),
-            "count": counts.values()
-        })
-        stats = stats.append(rdf)
-        stats.index = range(stats.shape[0])
-        stats.reset_index()
-
         _map = {
             os.path.join(root, 'samples-' + self.tablename + '.csv'): out,
             os.path.join(root, 'stats-' + self.tablename + '.csv'): stats
@@ -390,34 +534,53 @@ class Press(ABC):
         LOGGER.info(
             f"simulation completed for table:\t{table_name}\t\tvalue:\t{root}")
 
-    def to_sql(self, info):
+    def get_column_expressions(self, info):
         """
-        Create an SQL query from table information and config rules.
+        Get the expression of every column of the table.
+
+        The first rule of the pipeline applying to a column sets its
+        expression, columns without rules keep their name.
 
         :info   payload with information of the process to be performed
 
-        :return: An SQL query
+        :return: a list of (column, expression) tuples in column order
         """
-        table_name = self.get_tablename()
-        fields = self.get_table_columns(self.tablename)
-        columns = list(fields)
-        sql_list = []
-        LOGGER.info(
-            f"generating-sql for table:\t{table_name}\t\tfields:\t{fields}")
+        columns = self.get_table_columns(self.tablename)
+        expressions = list(columns)
+        unset = {name: index for index, name in enumerate(columns)}
 
         for rule_id in self.pipeline:
             for row in info:
                 name = row['name']
 
-                if rule_id not in row['label'] or name not in fields:
+                if rule_id not in row['label'] or name not in unset:
                     continue
 
-                index = fields.index(name)
-                fields[index] = row['apply']
+                expressions[unset.pop(name)] = row['apply']
                 LOGGER.info(
                     f"creating SQL for field:\t{name}\t\twith:\t{row['apply']}")
 
-        sql_list = ['SELECT', ",".join(fields), 'FROM ', table_name]
+        return list(zip(columns, expressions))
+
+    def to_sql(self, info):
+        """
+        Create an SQL query from table information and config rules.
+
+        :info   payload with information of the process to be performed
+
+        :return: An SQL query
+        """
+        table_name = self.get_tablename()
+        column_expressions = self.get_column_expressions(info)
+        columns = [column for column, _ in column_expressions]
+        LOGGER.info(
+            f"generating-sql for table:\t{table_name}\t\tfields:\t{columns}")
+
+        sql_list = [
+            'SELECT',
+            ",".join(expression for _, expression in column_expressions),
+            'FROM ', table_name
+        ]
 
         if 'suppress' in self.deid_rules and 'FILTERS' in self.deid_rules[
                 'suppress']:
@@ -0,0 +1,499 @@
+"""
+Run-scoped state shared by the tables de-identified in a single deid run.
+
+A DeidSession holds the credentials and BigQuery client of a run and prepares
+the auxiliary tables every table relies on, once per run:
+
+    - the participant mapping table, _deid_map, is validated against the person
+      table with a set comparison executed in BigQuery, and only rebuilt, again
+      in BigQuery, if the participants differ.
+    - the questionnaire response mapping table is validated and built the
+      same way.
+    - the allowed states and person_id to src_hpo_id mapping tables used by the
+      observation rules.
+
+No participant data is downloaded to validate or build the mapping tables.
+"""
+# Python imports
+import logging
+import os
+import threading
+import time
+
+# Third party imports
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery as bq
+from google.oauth2 import service_account
+
+# Project imports
+import bq_utils
+import constants.bq_utils as bq_consts
+from resources import DEID_PATH
+
+LOGGER = logging.getLogger(__name__)
+
+LOWER_BOUND = 1000000
+DEFAULT_AGE_LIMIT = 89
+DEFAULT_MAX_DAY_SHIFT = 365
+JOB_POLL_INTERVAL = 5
+
+PARTICIPANT_MAP_TABLE = '_deid_map'
+QUESTIONNAIRE_RESPONSE_MAP_TABLE = '_deid_questionnaire_response_map'
+ALLOWED_STATES_TABLE = '_mapping_src_hpos_to_allowed_states'
+ALLOWED_STATES_PATH = os.path.join(DEID_PATH, 'config', 'internal_tables',
+                                   'src_hpos_to_allowed_states.csv')
+ALLOWED_STATES_SCHEMA = [
+    bq.SchemaField('State', 'STRING'),
+    bq.SchemaField('value_source_concept_id', 'INTEGER'),
+    bq.SchemaField('src_hpo_id', 'STRING'),
+]
+
+# persons young enough to be de-identified
+PARTICIPANTS_QUERY = (
+    'SELECT DISTINCT person_id '
+    'FROM `{project}.{dataset}.person` '
+    'WHERE EXTRACT(YEAR FROM CURRENT_DATE()) - year_of_birth < {age_limit}')
+
+QUESTIONNAIRE_RESPONSES_QUERY = ('SELECT DISTINCT questionnaire_response_id '
+                                 'FROM `{project}.{dataset}.observation` '
+                                 'WHERE questionnaire_response_id IS NOT NULL')
+
+# counts the ids expected, the ids mapped, and the ids in only one of the two
+COMPARE_MAP_QUERY = """
+WITH expected AS ({expected_query}),
+mapped AS (SELECT DISTINCT {id_field} FROM `{project}.{dataset}.{map_table}`)
+SELECT
+  (SELECT COUNT(*) FROM expected) AS expected_count,
+  (SELECT COUNT(*) FROM mapped) AS mapped_count,
+  (SELECT COUNT(*)
+   FROM expected
+   FULL OUTER JOIN mapped ON expected.{id_field} = mapped.{id_field}
+   WHERE expected.{id_field} IS NULL OR mapped.{id_field} IS NULL) AS difference_count
+"""
+
+# Each id is mapped to a distinct random research id, picked from its own range
+# of ten values of [lower_bound, lower_bound + 10 * id count).
+BUILD_MAP_QUERY = """
+SELECT
+  {id_field},
+  {lower_bound} + 10 * (ROW_NUMBER() OVER (ORDER BY RAND()) - 1)
+    + CAST(FLOOR(10 * RAND()) AS INT64) AS {research_id_field}{extra_fields}
+FROM ({expected_query})
+"""
+
+# shift in [1, max_day_shift)
+SHIFT_FIELD = (',\n  1 + CAST(FLOOR(({max_day_shift} - 1) * RAND()) AS INT64)'
+               ' AS shift')
+
+
+def create_person_id_src_hpo_map(input_dataset, credentials):
+    """
+    Create a table containing person_ids and src_hpo_ids
+
+    :param input_dataset:  the input dataset to deid
+    :param credentidals:  the credentials needed to create a new table.
+    """
+    map_tablename = "_mapping_person_src_hpos"
+    sql = ("select person_id, src_hpo_id "
+           "from {input_dataset}._mapping_{table} "
+           "join {input_dataset}.{table} "
+           "using ({table}_id) "
+           "where src_hpo_id not like 'rdr'")
+
+    # list dataset contents
+    dataset_tables = bq_utils.list_dataset_contents(input_dataset)
+    mapping_tables = []
+    mapped_tables = []
+    for table in dataset_tables:
+        if table.startswith('_mapping_'):
+            mapping_tables.append(table)
+            mapped_tables.append(table[9:])
+
+    # make sure mapped tables all exist
+    check_tables = []
+    for table in mapped_tables:
+        if table in dataset_tables:
+            check_tables.append(table)
+
+    # make sure check_tables contain person_id fields
+    person_id_tables = []
+    for table in check_tables:
+        info = bq_utils.get_table_info(table, dataset_id=input_dataset)
+        schema = info.get('schema', {})
+        for field_info in schema.get('fields', []):
+            if 'person_id' in field_info.get('name'):
+                person_id_tables.append(table)
+
+    # revamp mapping tables to contain only mapping tables for tables
+    # with person_id fields
+    mapping_tables = ['_mapping_' + table for table in person_id_tables]
+
+    sql_statement = []
+    for table in person_id_tables:
+        sql_statement.append(
+            sql.format(table=table, input_dataset=input_dataset))
+
+    final_query = ' UNION ALL '.join(sql_statement)
+
+    # create the mapping table
+    if map_tablename not in dataset_tables:
+        fields = [{
+            "type": "integer",
+            "name": "person_id",
+            "mode": "required",
+            "description": "the person_id of someone with an ehr record"
+        }, {
+            "type": "string",
+            "name": "src_hpo_id",
+            "mode": "required",
+            "description": "the src_hpo_id of an ehr record"
+        }]
+        bq_utils.create_table(map_tablename, fields, dataset_id=input_dataset)
+
+    bq_utils.query(final_query,
+                   destination_table_id=map_tablename,
+                   destination_dataset_id=input_dataset,
+                   write_disposition=bq_consts.WRITE_TRUNCATE)
+    LOGGER.info(f"Created mapping table:\t{input_dataset}.{map_tablename}")
+
+
+class JobMonitor(object):
+    """
+    Wait on the BigQuery jobs of many threads with a single polling thread.
+
+    Threads register the job they wait on and block until the polling thread
+    finds the job done, so the job states of all of the tables of a run are
+    requested by one thread every poll interval.
+    """
+
+    def __init__(self, client, poll_interval=JOB_POLL_INTERVAL):
+        """
+        :param client:  the BigQuery client used to get the job states
+        :param poll_interval:  seconds to sleep between polls of the jobs
+        """
+        self.client = client
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+
+    def wait(self, job_id):
+        """
+        Wait for a job to finish executing.
+
+        :param job_id:  the id of the job to wait on
+        :return:  the finished job
+        :raises:  the exception raised getting the state of the job
+        """
+        with self._lock:
+            pending = self._pending.get(job_id)
+            if pending is None:
+                pending = {
+                    'event': threading.Event(),
+                    'job': None,
+                    'error': None
+                }
+                self._pending[job_id] = pending
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll,
+                                                name='deid-job-monitor',
+                                                daemon=True)
+                self._thread.start()
+
+        pending['event'].wait()
+        if pending['error'] is not None:
+            raise pending['error']
+        return pending['job']
+
+    def _poll(self):
+        """
+        Poll the pending jobs until there are none left.
+        """
+        while True:
+            with self._lock:
+                job_ids = list(self._pending)
+                if not job_ids:
+                    self._thread = None
+                    return
+
+            for job_id in job_ids:
+                try:
+                    job = self.client.get_job(job_id)
+                    error = None
+                except Exception as exc:
+                    LOGGER.exception(
+                        f"unable to get the state of job:\t{job_id}")
+                    job = None
+                    error = exc
+                else:
+                    if job.state != 'DONE':
+                        continue
+
+                with self._lock:
+                    pending = self._pending.pop(job_id)
+                pending['job'] = job
+                pending['error'] = error
+                pending['event'].set()
+
+            time.sleep(self.poll_interval)
+
+
+class DeidSession(object):
+    """
+    Credentials, client and auxiliary tables shared by the tables of a run.
+
+    The preparation methods are thread safe and only do their work the first
+    time they are called.
+    """
+
+    def __init__(self, input_dataset, private_key, client=None):
+        """
+        :param input_dataset:  name of the dataset to de-identify
+        :param private_key:  service account file location
+        :param client:  an optional BigQuery client, created from the service
+            account file if not given
+        """
+        self.input_dataset = input_dataset
+        self.private_key = private_key
+        if client is None:
+            self.credentials = service_account.Credentials.from_service_account_file(
+                private_key)
+            client = bq.Client(project=self.credentials.project_id,
+                               credentials=self.credentials)
+        else:
+            self.credentials = client._credentials
+        self.client = client
+        self.project = client.project
+
+        self.job_monitor = JobMonitor(client)
+
+        self._lock = threading.RLock()
+        self._participant_map_ready = None
+        self._observation_maps_ready = False
+        self._output_datasets = set()
+
+    def run_query(self, sql, job_config=None):
+        """
+        Run a query and wait for its results.
+
+        :param sql:  the query to run
+        :param job_config:  an optional bigquery.QueryJobConfig
+        :return:  the rows of the results
+        """
+        LOGGER.info(f"running deid session query:\n{sql}")
+        query_job = self.client.query(sql, location='US', job_config=job_config)
+        return list(query_job.result())
+
+    def table_exists(self, table_name, dataset_id=None):
+        """
+        Determine if a table exists.
+
+        :param table_name:  name of the table
+        :param dataset_id:  dataset of the table, the input dataset by default
+        :return:  True if the table exists
+        """
+        dataset_id = dataset_id or self.input_dataset
+        try:
+            self.client.get_table(f'{self.project}.{dataset_id}.{table_name}')
+        except NotFound:
+            return False
+        return True
+
+    def compare_map(self, expected_query, map_table, id_field):
+        """
+        Compare the ids of a mapping table with the ids expected to be mapped.
+
+        :param expected_query:  query returning the distinct ids to be mapped
+        :param map_table:  name of the mapping table in the input dataset
+        :param id_field:  name of the mapped id field
+        :return:  a tuple of the expected id count, the mapped id count and the
+            number of ids only in one of the two.  The mapped id count is None
+            if the mapping table does not exist.
+        """
+        if not self.table_exists(map_table):
+            expected_count = self.run_query(
+                f'SELECT COUNT(*) AS expected_count FROM ({expected_query})'
+            )[0]['expected_count']
+            return expected_count, None, expected_count
+
+        row = self.run_query(
+            COMPARE_MAP_QUERY.format(expected_query=expected_query,
+                                     id_field=id_field,
+                                     project=self.project,
+                                     dataset=self.input_dataset,
+                                     map_table=map_table))[0]
+        return (row['expected_count'], row['mapped_count'],
+                row['difference_count'])
+
+    def build_map(self,
+                  expected_query,
+                  map_table,
+                  id_field,
+                  research_id_field,
+                  lower_bound=LOWER_BOUND,
+                  extra_fields=''):
+        """
+        Replace a mapping table with random research ids for the expected ids.
+
+        :param expected_query:  query returning the distinct ids to be mapped
+        :param map_table:  name of the mapping table in the input dataset
+        :param id_field:  name of the mapped id field
+        :param research_id_field:  name of the research id field
+        :param lower_bound:  the smallest research id
+        :param extra_fields:  additional select list items of the mapping table
+        """
+        sql = BUILD_MAP_QUERY.format(id_field=id_field,
+                                     lower_bound=lower_bound,
+                                     research_id_field=research_id_field,
+                                     extra_fields=extra_fields,
+                                     expected_query=expected_query)
+        job_config = bq.QueryJobConfig()
+        job_config.destination = self.client.dataset(
+            self.input_dataset).table(map_table)
+        job_config.write_disposition = bq.WriteDisposition.WRITE_TRUNCATE
+        self.run_query(sql, job_config=job_config)
+        LOGGER.info(f"created new mapping table:\t{self.input_dataset}."
+                    f"{map_table}")
+
+    def initialize_participant_map(self,
+                                   age_limit=DEFAULT_AGE_LIMIT,
+                                   max_day_shift=DEFAULT_MAX_DAY_SHIFT):
+        """
+        Validate the participant mapping table, building it if needed.
+
+        Only the first call of a session does any work.
+
+        :param age_limit:  persons this age or older are not de-identified
+        :param max_day_shift:  the maximum number of days dates are shifted by
+        :return:  True if there are participants to de-identify
+        """
+        with self._lock:
+            if self._participant_map_ready is not None:
+                return self._participant_map_ready
+
+            if age_limit is None:
+                age_limit = DEFAULT_AGE_LIMIT
+            expected_query = PARTICIPANTS_QUERY.format(
+                project=self.project,
+                dataset=self.input_dataset,
+                age_limit=age_limit)
+            person_count, map_count, difference_count = self.compare_map(
+                expected_query, PARTICIPANT_MAP_TABLE, 'person_id')
+            LOGGER.info(f"patient count is:\t{person_count}")
+
+            if person_count > 0:
+                if map_count is None:
+                    LOGGER.info("creating new participant mapping table "
+                                "because one doesn't exist")
+                elif difference_count:
+                    LOGGER.info(
+                        "creating new participant mapping table because the "
+                        f"current mapping table differs by {difference_count} "
+                        "participants")
+                if map_count is None or difference_count:
+                    self.build_map(expected_query,
+                                   PARTICIPANT_MAP_TABLE,
+                                   'person_id',
+                                   'research_id',
+                                   extra_fields=SHIFT_FIELD.format(
+                                       max_day_shift=max_day_shift))
+                    map_count = person_count
+                else:
+                    LOGGER.info('participant mapping table contains '
+                                'all person ids.  continuing...')
+            else:
+                LOGGER.error(
+                    "Unable to initialize Deid.  Check "
+                    "configuration files, parameters, and credentials.")
+
+            map_count = map_count or 0
+            LOGGER.info(f"map table contains {map_count} participants.")
+            self._participant_map_ready = person_count > 0 or map_count > 0
+            return self._participant_map_ready
+
+    def map_questionnaire_response_ids(self, lower_bound=LOWER_BOUND):
+        """
+        Validate the questionnaire response mapping table, building it if needed.
+
+        :param lower_bound:  The smallest number that may be used as an identifier.
+        """
+        expected_query = QUESTIONNAIRE_RESPONSES_QUERY.format(
+            project=self.project, dataset=self.input_dataset)
+        response_count, map_count, difference_count = self.compare_map(
+            expected_query, QUESTIONNAIRE_RESPONSE_MAP_TABLE,
+            'questionnaire_response_id')
+        LOGGER.info(f"total of distinct questionnaire_response_ids:\t"
+                    f"{response_count}")
+
+        if not response_count:
+            LOGGER.error("No questionnaire_response_ids found.")
+            return
+
+        if map_count is not None and not difference_count:
+            LOGGER.info('questionnaire response mapping table contains '
+                        'all questionnaire response ids')
+            return
+
+        if map_count is None:
+            LOGGER.info('creating a new questionnaire response mapping '
+                        'table because it doesn\'t exist')
+        else:
+            LOGGER.warning('creating new questionnaire response mapping '
+                           'table because the existing table doesn\'t match')
+        self.build_map(expected_query,
+                       QUESTIONNAIRE_RESPONSE_MAP_TABLE,
+                       'questionnaire_response_id',
+                       'research_response_id',
+                       lower_bound=lower_bound)
+
+    def create_allowed_states_table(self):
+        """
+        Load the mapping of src_hpos to the states they are located in.
+        """
+        job_config = bq.LoadJobConfig()
+        job_config.source_format = bq.SourceFormat.CSV
+        job_config.skip_leading_rows = 1
+        job_config.schema = ALLOWED_STATES_SCHEMA
+        job_config.write_disposition = bq.WriteDisposition.WRITE_TRUNCATE
+        table_ref = self.client.dataset(
+            self.input_dataset).table(ALLOWED_STATES_TABLE)
+        with open(ALLOWED_STATES_PATH, 'rb') as csv_file:
+            load_job = self.client.load_table_from_file(csv_file,
+                                                        table_ref,
+                                                        location='US',
+                                                        job_config=job_config)
+        load_job.result()
+        LOGGER.info(f"Created mapping table:\t{self.input_dataset}."
+                    f"{ALLOWED_STATES_TABLE}")
+
+    def initialize_observation_maps(self, lower_bound=LOWER_BOUND):
+        """
+        Create the mapping tables the observation rules rely on.
+
+        Only the first call of a session does any work.
+
+        :param lower_bound:  The smallest number that may be used as an identifier.
+        """
+        with self._lock:
+            if self._observation_maps_ready:
+                return
+
+            self.create_allowed_states_table()
+            self.map_questionnaire_response_ids(lower_bound)
+            create_person_id_src_hpo_map(self.input_dataset, self.credentials)
+            self._observation_maps_ready = True
+
+    def ensure_dataset(self, dataset_id):
+        """
+        Create a dataset if it does not exist yet.
+
+        :param dataset_id:  name of the dataset
+        """
+        with self._lock:
+            if dataset_id in self._output_datasets:
+                return
+
+            dataset = bq.Dataset(self.client.dataset(dataset_id))
+            self.client.create_dataset(dataset, exists_ok=True)
+            self._output_datasets.add(dataset_id)
@@ -6,7 +6,9 @@ import mimetypes
 import os
 from io import BytesIO
 
-import googleapiclient.discovery
+import googleapiclient.http
+
+from utils import service_cache
 
 MIMETYPES = {
     'json': 'application/json',
@@ -15,6 +17,8 @@ MIMETYPES = {
     'eot': 'application/vnd.ms-fontobject'
 }
 GCS_DEFAULT_RETRY_COUNT = 5
+# Resumable transfers move data in chunks of a multiple of 256 KiB
+DEFAULT_CHUNK_SIZE = 32 * 256 * 1024
 
 
 def get_drc_bucket():
@@ -51,7 +55,12 @@ def hpo_gcs_path(hpo_id):
 
 
 def create_service():
-    return googleapiclient.discovery.build('storage', 'v1', cache={})
+    """
+    Get the Cloud Storage client for the current thread, building it if needed
+
+    :return: a Cloud Storage discovery client
+    """
+    return service_cache.get_service('storage', 'v1')
 
 
 def list_bucket_dir(gcs_path):
@@ -154,12 +163,43 @@ def get_object(bucket, name, as_text=True):
     return result_bytes
 
 
-def upload_object(bucket, name, fp):
+def iter_object_chunks(bucket, name, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Download object from a bucket one chunk at a time
+
+    Only one chunk is held in memory at a time, regardless of the object size.
+
+    :param bucket: the bucket containing the file
+    :param name: name of the file to download
+    :param chunk_size: number of bytes to download per request, a multiple of
+        256 KiB
+    :return: a generator of the file contents as bytes chunks
+    """
+    service = create_service()
+    req = service.objects().get_media(bucket=bucket, object=name)
+    out_file = BytesIO()
+    downloader = googleapiclient.http.MediaIoBaseDownload(out_file,
+                                                          req,
+                                                          chunksize=chunk_size)
+    done = False
+    while not done:
+        status, done = downloader.next_chunk(
+            num_retries=GCS_DEFAULT_RETRY_COUNT)
+        yield out_file.getvalue()
+        out_file.seek(0)
+        out_file.truncate()
+    out_file.close()
+
+
+def upload_object(bucket, name, fp, chunk_size=None):
     """
     Upload file to a GCS bucket
     :param bucket: name of the bucket
     :param name: name for the file
     :param fp: a file-like object containing file contents
+    :param chunk_size: if set, the file is sent by a resumable upload in chunks
+        of this many bytes, a multiple of 256 KiB.  Otherwise it is sent in a
+        single request.
     :return: metadata about the uploaded file
     """
     service = create_service()
@@ -169,11 +209,21 @@ def upload_object(bucket, name, fp):
         mimetype = MIMETYPES[ext]
     else:
         (mimetype, encoding) = mimetypes.guess_type(name)
-    media_body = googleapiclient.http.MediaIoBaseUpload(fp, mimetype)
+    if chunk_size is None:
+        media_body = googleapiclient.http.MediaIoBaseUpload(fp, mimetype)
+    else:
+        media_body = googleapiclient.http.MediaIoBaseUpload(
+            fp, mimetype, chunksize=chunk_size, resumable=True)
     req = service.objects().insert(bucket=bucket,
                                    body=body,
                                    media_body=media_body)
-    return req.execute(num_retries=GCS_DEFAULT_RETRY_COUNT)
+    if chunk_size is None:
+        return req.execute(num_retries=GCS_DEFAULT_RETRY_COUNT)
+
+    response = None
+    while response is None:
+        status, response = req.next_chunk(num_retries=GCS_DEFAULT_RETRY_COUNT)
+    return response
 
 
 def delete_object(bucket, name):
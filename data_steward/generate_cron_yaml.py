@@ -3,6 +3,7 @@ import os
 
 import bq_utils
 import resources
+from validation import hpo_shards
 import datetime
 from io import open
 
@@ -33,8 +34,14 @@ def render():
     tpl = j2_env.get_template(resources.CRON_TPL_YAML)
     # TODO obtain cron urls from validation.main/app_base.yaml instead of through template
     hpos = bq_utils.get_hpo_info()
+    hpo_ids = [hpo['hpo_id'] for hpo in hpos]
+    num_shards = hpo_shards.get_num_shards(len(hpos),
+                                           hpo_shards.get_hpo_workers())
+    shard_schedules = hpo_shards.get_shard_schedules(num_shards)
     yesterday = get_yesterday_expr()
-    result = tpl.render(hpos=hpos, yesterday=yesterday)
+    result = tpl.render(hpos=hpos,
+                        yesterday=yesterday,
+                        shard_schedules=shard_schedules)
     return result
 
 
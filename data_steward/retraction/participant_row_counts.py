@@ -14,6 +14,7 @@
 
 # Python imports
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 # Third party imports
 from google.api_core.exceptions import BadRequest
@@ -160,7 +161,12 @@ def get_ehr_query(project_id, dataset_id, pid_source, hpo_id, table_df):
     return query
 
 
-def count_pid_rows_in_dataset(project_id, dataset_id, hpo_id, pid_source):
+def count_pid_rows_in_dataset(project_id,
+                              dataset_id,
+                              hpo_id,
+                              pid_source,
+                              table_df=None,
+                              client=None):
     """
     Returns df containing tables and counts of participant rows for pids in pids_source
 
@@ -168,6 +174,9 @@ def count_pid_rows_in_dataset(project_id, dataset_id, hpo_id, pid_source):
     :param dataset_id: identifies the dataset
     :param hpo_id: Identifies the hpo site that submitted the pids
     :param pid_source: string containing query or list containing pids
+    :param table_df: dataframe from BQ INFORMATION_SCHEMA.COLUMNS for the dataset,
+        queried if not provided
+    :param client: an optional BigQuery client to run the queries with
     :return: df with headers table_id, all_counts, all_ehr_counts, and map_ehr_counts
     """
     dataset_type = ru.get_dataset_type(dataset_id)
@@ -175,7 +184,10 @@ def count_pid_rows_in_dataset(project_id, dataset_id, hpo_id, pid_source):
         ru_consts.TABLE_ID, consts.ALL_COUNT, consts.ALL_EHR_COUNT,
         consts.MAP_EHR_COUNT
     ])
-    table_df = bq.get_table_info_for_dataset(project_id, dataset_id)
+    if table_df is None:
+        table_df = bq.get_table_info_for_dataset(project_id,
+                                                 dataset_id,
+                                                 client=client)
 
     if dataset_type == common.COMBINED:
         query = get_combined_deid_query(project_id, dataset_id, pid_source,
@@ -199,7 +211,7 @@ def count_pid_rows_in_dataset(project_id, dataset_id, hpo_id, pid_source):
         query = get_dataset_query(project_id, dataset_id, pid_source, table_df)
 
     if query:
-        counts_df = bq.query(query, project_id)
+        counts_df = bq.query(query, project_id, client=client)
         # sort by count desc
         counts_df = counts_df.sort_values(by=consts.ALL_COUNT, ascending=False)
     return counts_df
@@ -213,39 +225,104 @@ def log_total_rows(df, dataset_id):
     :param dataset_id: Identifies the dataset under consideration
     :return:
     """
-    rows = df.get_values()
+    rows = df.values
     if rows.size > 0:
         for count_row in rows:
             logging.info('{}, {}, {}, {}, {}'.format(dataset_id, *count_row))
 
 
-def count_pid_rows_in_project(project_id, hpo_id, pid_source, dataset_ids=None):
+def count_dataset(project_id, dataset_id, hpo_id, pid_source, client=None):
     """
-    Logs dataset_name, table_id, all_count, all_ehr_count and map_ehr_count to count rows pertaining to pids
+    Counts participant rows in a dataset, logging datasets which cannot be analyzed
+
+    The table metadata of the dataset is fetched with a single INFORMATION_SCHEMA
+    query and used to build the count query.
+
+    :param project_id: identifies the project
+    :param dataset_id: identifies the dataset
+    :param hpo_id: Identifies the hpo site that submitted the pids
+    :param pid_source: string containing query or list containing pids
+    :param client: an optional BigQuery client to run the queries with
+    :return: df of counts with a dataset_id column, or None if the dataset
+        could not be analyzed
+    """
+    try:
+        table_df = bq.get_table_info_for_dataset(project_id,
+                                                 dataset_id,
+                                                 client=client)
+        # We do not fetch queries for each dataset here and union them since it exceeds BQ query length limits
+        counts_df = count_pid_rows_in_dataset(project_id,
+                                              dataset_id,
+                                              hpo_id,
+                                              pid_source,
+                                              table_df=table_df,
+                                              client=client)
+    except BadRequest:
+        # log non-conforming datasets and continue
+        logging.exception(f'Dataset {dataset_id} could not be analyzed')
+        return None
+    log_total_rows(counts_df, dataset_id)
+    counts_df.insert(0, consts.DATASET_ID, dataset_id)
+    return counts_df
+
+
+def count_pid_rows_in_project(project_id,
+                              hpo_id,
+                              pid_source,
+                              dataset_ids=None,
+                              max_workers=consts.DEFAULT_MAX_WORKERS):
+    """
+    Counts rows pertaining to pids in each dataset of a project
+
+    Datasets are counted concurrently by up to max_workers threads sharing a
+    single BigQuery client.  Logs dataset_name, table_id, all_count,
+    all_ehr_count and map_ehr_count of every dataset.
 
     :param project_id: identifies the project
     :param hpo_id: Identifies the hpo site that submitted the pids
     :param pid_source: string containing query or list containing pids
     :param dataset_ids: list identifying datasets to retract from or None to retract from all datasets
-    :return:
+    :param max_workers: maximum number of datasets counted at the same time
+    :return: df with headers dataset_id, table_id and the counts of each table,
+        in the order of dataset_ids
     """
     dataset_ids = ru.get_dataset_ids_to_target(project_id, dataset_ids)
-    for dataset_id in dataset_ids:
-        try:
-            # We do not fetch queries for each dataset here and union them since it exceeds BQ query length limits
-            counts_df = count_pid_rows_in_dataset(project_id, dataset_id,
-                                                  hpo_id, pid_source)
-            log_total_rows(counts_df, dataset_id)
-        except BadRequest:
-            # log non-conforming datasets and continue
-            logging.exception(f'Dataset {dataset_id} could not be analyzed')
+    client = bq.get_client(project_id)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [
+            executor.submit(count_dataset, project_id, dataset_id, hpo_id,
+                            pid_source, client) for dataset_id in dataset_ids
+        ]
+        counts_dfs = [future.result() for future in futures]
+
+    counts_dfs = [
+        counts_df for counts_df in counts_dfs if counts_df is not None
+    ]
+    if not counts_dfs:
+        return pd.DataFrame(columns=[
+            consts.DATASET_ID, ru_consts.TABLE_ID, consts.ALL_COUNT,
+            consts.ALL_EHR_COUNT, consts.MAP_EHR_COUNT
+        ])
+    return pd.concat(counts_dfs, ignore_index=True, sort=False)
 
 
 if __name__ == '__main__':
     parser = ru.fetch_parser()
+    parser.add_argument(
+        '-w',
+        '--max_workers',
+        action='store',
+        dest='max_workers',
+        type=int,
+        help='Maximum number of datasets counted at the same time',
+        required=False,
+        default=consts.DEFAULT_MAX_WORKERS)
     args = parser.parse_args()
 
     dataset_ids = ru.check_dataset_ids_for_sentinel(args.dataset_ids)
 
-    count_pid_rows_in_project(args.project_id, args.hpo_id, args.pid_source,
-                              dataset_ids)
+    count_pid_rows_in_project(args.project_id,
+                              args.hpo_id,
+                              args.pid_source,
+                              dataset_ids,
+                              max_workers=args.max_workers)
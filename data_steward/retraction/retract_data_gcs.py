@@ -8,14 +8,17 @@ If the submission folder is set to 'all_folders', all the submissions from the s
 If a submission folder is specified, only that folder will be considered for retraction
 """
 
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 import logging
+import tempfile
+import time
 
 import bq_utils
 import common
 import gcs_utils
 import resources
+from constants.retraction import retract_data_gcs as consts
 
 EXTRACT_PIDS_QUERY = """
 SELECT person_id
@@ -30,8 +33,13 @@ PID_IN_COL2 = [
 ]
 
 
-def run_gcs_retraction(project_id, sandbox_dataset_id, pid_table_id, hpo_id,
-                       folder, force_flag):
+def run_gcs_retraction(project_id,
+                       sandbox_dataset_id,
+                       pid_table_id,
+                       hpo_id,
+                       folder,
+                       force_flag,
+                       max_workers=consts.DEFAULT_MAX_WORKERS):
     """
     Retract from a folder/folders in a GCS bucket all records associated with a pid
 
@@ -42,6 +50,8 @@ def run_gcs_retraction(project_id, sandbox_dataset_id, pid_table_id, hpo_id,
     :param folder: the site's submission folder; if set to 'all_folders', retract from all folders by the site
         if set to 'none', skip retraction from bucket folders
     :param force_flag: if False then prompt for each file
+        if True, files from all folders are retracted concurrently
+    :param max_workers: maximum number of files to retract at the same time
     :return: metadata for each object updated in order to retract as a list of lists
     """
 
@@ -85,6 +95,7 @@ def run_gcs_retraction(project_id, sandbox_dataset_id, pid_table_id, hpo_id,
         bucket + '/' + folder_prefix for folder_prefix in to_process_folder_list
     ])
 
+    forced_files = []
     for folder_prefix in to_process_folder_list:
         logging.info('Processing gs://%s/%s' % (bucket, folder_prefix))
         # separate cdm from the unknown (unexpected) files
@@ -117,19 +128,40 @@ def run_gcs_retraction(project_id, sandbox_dataset_id, pid_table_id, hpo_id,
         else:
             # Make sure user types Y to proceed
             response = get_response()
-        if response == "Y":
+        if response == "Y" and force_flag:
+            # retracted with the files of the other folders below
+            result_dict[folder_prefix] = []
+            forced_files.extend(
+                (folder_prefix, file_name) for file_name in found_files)
+        elif response == "Y":
             folder_upload_output = retract(pids, bucket, found_files,
-                                           folder_prefix, force_flag)
+                                           folder_prefix, force_flag,
+                                           max_workers)
             result_dict[folder_prefix] = folder_upload_output
             logging.info("Retraction completed for folder %s/%s " %
                          (bucket, folder_prefix))
         elif response.lower() == "n":
             logging.info("Skipping folder %s" % folder_prefix)
+
+    if forced_files:
+        logging.info(
+            "Attempting to force retract for person_ids %s in %d files" %
+            (pids, len(forced_files)))
+        result_dict.update(
+            retract_files(pids, bucket, forced_files, max_workers))
+        for folder_prefix in to_process_folder_list:
+            logging.info("Retraction completed for folder %s/%s " %
+                         (bucket, folder_prefix))
     logging.info("Retraction from GCS complete")
     return result_dict
 
 
-def retract(pids, bucket, found_files, folder_prefix, force_flag):
+def retract(pids,
+            bucket,
+            found_files,
+            folder_prefix,
+            force_flag,
+            max_workers=consts.DEFAULT_MAX_WORKERS):
     """
     Retract from a folder in a GCS bucket all records associated with a pid
     pid table must follow schema described in retract_data_bq.PID_TABLE_FIELDS and must reside in sandbox_dataset_id
@@ -141,12 +173,11 @@ def retract(pids, bucket, found_files, folder_prefix, force_flag):
     :param found_files: files found in the current folder
     :param folder_prefix: current folder being processed
     :param force_flag: if False then prompt for each file
+    :param max_workers: maximum number of files to retract at the same time
     :return: metadata for each object updated in order to retract
     """
-    result_list = []
+    files_to_retract = []
     for file_name in found_files:
-        table_name = file_name.split(".")[0]
-        lines_removed = 0
         file_gcs_path = '%s/%s%s' % (bucket, folder_prefix, file_name)
         if force_flag:
             logging.info(
@@ -160,60 +191,174 @@ def retract(pids, bucket, found_files, folder_prefix, force_flag):
                 % (pids, bucket, folder_prefix, file_name))
             response = get_response()
         if response == "Y":
-            # Output and input file content initialization
-            retracted_file_string = BytesIO()
-            input_file_bytes = gcs_utils.get_object(bucket,
+            files_to_retract.append((folder_prefix, file_name))
+        elif response.lower() == "n":
+            logging.info("Skipping file %s" % file_gcs_path)
+
+    folder_results = retract_files(pids, bucket, files_to_retract, max_workers)
+    return folder_results.get(folder_prefix, [])
+
+
+def retract_files(pids,
+                  bucket,
+                  files_to_retract,
+                  max_workers=consts.DEFAULT_MAX_WORKERS):
+    """
+    Retract records associated with a pid from files, several files at a time
+
+    :param pids: person_ids to retract
+    :param bucket: bucket containing records to retract
+    :param files_to_retract: a list of (folder_prefix, file_name) tuples
+    :param max_workers: maximum number of files to retract at the same time
+    :return: a dict mapping each folder_prefix to the metadata of its updated
+        objects, in the order of files_to_retract
+    """
+    pids = set(pids)
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(retract_file, pids, bucket, folder_prefix,
+                            file_name)
+            for folder_prefix, file_name in files_to_retract
+        ]
+        results = [future.result() for future in futures]
+
+    folder_results = {}
+    total_bytes = 0
+    for (folder_prefix, _), (upload_result,
+                             bytes_read) in zip(files_to_retract, results):
+        total_bytes += bytes_read
+        if upload_result is not None:
+            folder_results.setdefault(folder_prefix, []).append(upload_result)
+
+    if files_to_retract:
+        log_throughput(f"{len(files_to_retract)} files", total_bytes,
+                       time.time() - start_time)
+    return folder_results
+
+
+def retract_file(pids,
+                 bucket,
+                 folder_prefix,
+                 file_name,
+                 chunk_size=consts.CHUNK_SIZE):
+    """
+    Retract from a file all records associated with a pid
+
+    The file is streamed in chunks and the retained lines are spooled to a
+    local temporary file, which is uploaded in chunks only if lines were
+    removed.  Memory use is bounded by the chunk size.
+
+    :param pids: set of person_ids to retract
+    :param bucket: bucket containing records to retract
+    :param folder_prefix: folder containing the file
+    :param file_name: name of the file to retract from
+    :param chunk_size: number of bytes to download and upload per request
+    :return: a tuple of the metadata of the updated object, or None if the
+        object was not updated, and the number of bytes read
+    """
+    table_name = file_name.split(".")[0]
+    file_gcs_path = '%s/%s%s' % (bucket, folder_prefix, file_name)
+    logging.info("Checking for person_ids %s in path %s" %
+                 (pids, file_gcs_path))
+
+    start_time = time.time()
+    lines_removed = 0
+    bytes_read = 0
+    with tempfile.TemporaryFile() as retracted_file:
+        input_header = None
+        # a line may be split across chunks
+        remainder = b''
+        for chunk in gcs_utils.iter_object_chunks(bucket,
+                                                  folder_prefix + file_name,
+                                                  chunk_size):
+            bytes_read += len(chunk)
+            input_lines = (remainder + chunk).split(b'\n')
+            remainder = input_lines.pop()
+            if input_header is None and input_lines:
+                input_header = input_lines.pop(0)
+                retracted_file.write(input_header + b'\n')
+            lines_removed += write_retained_lines(table_name, pids, input_lines,
+                                                  retracted_file)
+        if input_header is None:
+            retracted_file.write(remainder + b'\n')
+        else:
+            lines_removed += write_retained_lines(table_name, pids, [remainder],
+                                                  retracted_file)
+        log_throughput(file_gcs_path, bytes_read, time.time() - start_time)
+
+        # Write result back to bucket
+        if lines_removed > 0:
+            logging.info("%d rows retracted from %s, overwriting..." %
+                         (lines_removed, file_gcs_path))
+            retracted_file.seek(0)
+            upload_result = gcs_utils.upload_object(bucket,
                                                     folder_prefix + file_name,
-                                                    as_text=False)
-            input_file_lines = input_file_bytes.split(b'\n')
-            input_header = input_file_lines[0]
-            input_contents = input_file_lines[1:]
-            retracted_file_string.write(input_header + b'\n')
-            logging.info("Checking for person_ids %s in path %s" %
-                         (pids, file_gcs_path))
-
-            # Check if file has person_id in first or second column
-            for input_line in input_contents:
-                input_line = input_line.strip()
-                # ensure line is not empty
-                if input_line:
-                    cols = input_line.split(b',')
-                    # ensure at least two columns exist
-                    if len(cols) > 1:
-                        col_1 = cols[0]
-                        col_2 = cols[1]
-                        # skip if non-integer is encountered and keep the line as is
-                        try:
-                            if (table_name in PID_IN_COL1 and int(col_1) in pids) or \
-                                    (table_name in PID_IN_COL2 and int(col_2) in pids):
-                                # do not write back this line since it contains a pid to retract
-                                # increment removed lines counter
-                                lines_removed += 1
-                            else:
-                                # pid not found, retain this line
-                                retracted_file_string.write(input_line + b'\n')
-                        except ValueError:
-                            # write back non-num lines
-                            retracted_file_string.write(input_line + b'\n')
+                                                    retracted_file,
+                                                    chunk_size=chunk_size)
+            logging.info("Retraction successful for file %s" % file_gcs_path)
+            return upload_result, bytes_read
+
+    logging.info("Not updating file %s since pids %s not found" %
+                 (file_gcs_path, pids))
+    return None, bytes_read
+
+
+def write_retained_lines(table_name, pids, input_lines, out_file):
+    """
+    Write the lines which do not belong to a pid to a file
+
+    :param table_name: the table the lines belong to
+    :param pids: set of person_ids to retract
+    :param input_lines: list of lines as bytes, without line breaks
+    :param out_file: binary file-like object to write retained lines to
+    :return: the number of lines removed
+    """
+    lines_removed = 0
+    retained_lines = []
+    # Check if file has person_id in first or second column
+    for input_line in input_lines:
+        input_line = input_line.strip()
+        # ensure line is not empty
+        if input_line:
+            cols = input_line.split(b',', 2)
+            # ensure at least two columns exist
+            if len(cols) > 1:
+                col_1 = cols[0]
+                col_2 = cols[1]
+                # skip if non-integer is encountered and keep the line as is
+                try:
+                    if (table_name in PID_IN_COL1 and int(col_1) in pids) or \
+                            (table_name in PID_IN_COL2 and int(col_2) in pids):
+                        # do not write back this line since it contains a pid to retract
+                        # increment removed lines counter
+                        lines_removed += 1
                     else:
-                        # write back ill-formed lines. Note: These lines do not make it into BigQuery
-                        retracted_file_string.write(input_line + b'\n')
-
-            # Write result back to bucket
-            if lines_removed > 0:
-                logging.info("%d rows retracted from %s, overwriting..." %
-                             (lines_removed, file_gcs_path))
-                upload_result = gcs_utils.upload_object(
-                    bucket, folder_prefix + file_name, retracted_file_string)
-                result_list.append(upload_result)
-                logging.info("Retraction successful for file %s" %
-                             file_gcs_path)
+                        # pid not found, retain this line
+                        retained_lines.append(input_line)
+                except ValueError:
+                    # write back non-num lines
+                    retained_lines.append(input_line)
             else:
-                logging.info("Not updating file %s since pids %s not found" %
-                             (file_gcs_path, pids))
-        elif response.lower() == "n":
-            logging.info("Skipping file %s" % file_gcs_path)
-    return result_list
+                # write back ill-formed lines. Note: These lines do not make it into BigQuery
+                retained_lines.append(input_line)
+    if retained_lines:
+        out_file.write(b'\n'.join(retained_lines) + b'\n')
+    return lines_removed
+
+
+def log_throughput(description, bytes_read, seconds):
+    """
+    Log the rate at which data was retracted
+
+    :param description: what was retracted
+    :param bytes_read: number of bytes read
+    :param seconds: time taken
+    """
+    megabytes = bytes_read / consts.BYTES_PER_MB
+    rate = megabytes / seconds if seconds > 0 else 0
+    logging.info("Read %.1f MB from %s in %.1f s (%.1f MB/s)" %
+                 (megabytes, description, seconds, rate))
 
 
 # Make sure user types Y to proceed
@@ -297,10 +442,20 @@ if __name__ == '__main__':
         action='store_true',
         help='Optional. Indicates pids must be retracted without user prompts',
         required=False)
+    parser.add_argument(
+        '-w',
+        '--max_workers',
+        action='store',
+        dest='max_workers',
+        type=int,
+        default=consts.DEFAULT_MAX_WORKERS,
+        help='Optional. Maximum number of files to retract at the same time',
+        required=False)
 
     args = parser.parse_args()
 
     # result is mainly for debugging file uploads
     result = run_gcs_retraction(args.project_id, args.sandbox_dataset_id,
                                 args.pid_table_id, args.hpo_id,
-                                args.folder_name, args.force_flag)
+                                args.folder_name, args.force_flag,
+                                args.max_workers)
@@ -60,7 +60,7 @@ FROM `{{project}}.{{dataset}}.{{table}}`
 
 RESEARCH_ID_QUERY = jinja_env.from_string("""
 SELECT DISTINCT research_id
-FROM `{{project}}.{{prefix_regex}}_combined._deid_map`
+FROM `{{project}}.{{deid_map_dataset}}._deid_map`
 WHERE person_id = {{pid}}
 """)
 
@@ -135,6 +135,57 @@ FROM `{{deactivated_pids_project}}.{{deactivated_pids_dataset}}.{{deactivated_pi
 WHERE person_id = {{pid}}) END END))
 """)
 
+# Deactivated participants and their earliest deactivation date, as research_ids for deid datasets.
+# Shared by the set based queries, which retract every deactivated participant from a table at once.
+DEACTIVATED_IDS_SUBQUERY = """
+{% if deid_map_dataset %}
+SELECT m.research_id AS person_id, MIN(p.deactivated_date) AS deactivated_date
+FROM `{{deactivated_pids_project}}.{{deactivated_pids_dataset}}.{{deactivated_pids_table}}` p
+JOIN `{{project}}.{{deid_map_dataset}}._deid_map` m
+USING (person_id)
+GROUP BY m.research_id
+{% else %}
+SELECT person_id, MIN(deactivated_date) AS deactivated_date
+FROM `{{deactivated_pids_project}}.{{deactivated_pids_dataset}}.{{deactivated_pids_table}}`
+GROUP BY person_id
+{% endif %}
+"""
+
+# Rows are retracted if their date, or their end date falling back to their start date, is on or after
+# the participant's deactivation date
+RETRACTION_DATE_EXPR = (
+    "{% if date_column %}t.{{date_column}}"
+    "{% else %}COALESCE(t.{{end_date_column}}, t.{{start_date_column}}){% endif %}"
+)
+
+SANDBOX_QUERY_SET = jinja_env.from_string("""
+SELECT t.*
+FROM `{{project}}.{{dataset}}.{{table}}` t
+JOIN (""" + DEACTIVATED_IDS_SUBQUERY + """) d
+ON t.person_id = d.person_id
+WHERE """ + RETRACTION_DATE_EXPR + """ >= d.deactivated_date
+""")
+
+DELETE_QUERY_SET = jinja_env.from_string("""
+DELETE FROM `{{project}}.{{dataset}}.{{table}}` t
+WHERE EXISTS (
+SELECT 1
+FROM (""" + DEACTIVATED_IDS_SUBQUERY + """) d
+WHERE t.person_id = d.person_id
+AND """ + RETRACTION_DATE_EXPR + """ >= d.deactivated_date)
+""")
+
+REMOVED_ROWS_QUERY = jinja_env.from_string("""
+{% for table in tables %}
+SELECT '{{table.dataset}}' AS dataset_id, '{{table.table}}' AS table_id, person_id, COUNT(*) AS row_count
+FROM ({{table.sandbox_query}})
+GROUP BY person_id
+{% if not loop.last %}
+UNION ALL
+{% endif %}
+{% endfor %}
+""")
+
 # Deactivated participant table fields to query off of
 PID_TABLE_FIELDS = [[{
     "type": "integer",
@@ -289,6 +340,18 @@ def get_date_info_for_pids_tables(project_id, client):
     return date_fields_info_df
 
 
+def get_deid_map_dataset(dataset):
+    """
+    Get the combined dataset containing the _deid_map of a deid dataset, based on the release regex prefix
+
+    :param dataset: bq name of the deid dataset
+    :return: bq name of the combined dataset
+    """
+    prefix = dataset.split('_')[0]
+    prefix = prefix.replace('R', '')
+    return f'{prefix}_combined'
+
+
 def get_research_id(project, dataset, pid, client):
     """
     For deid datasets, this function queries the _deid_map table in the associated combined dataset based on the release
@@ -300,12 +363,9 @@ def get_research_id(project, dataset, pid, client):
     :param client: bq client object
     :return: research_id or None if it does not exist for that person_id
     """
-    # Get non deid dataset prefix
-    prefix = dataset.split('_')[0]
-    prefix = prefix.replace('R', '')
-
     research_id_df = client.query(
-        RESEARCH_ID_QUERY.render(project=project, prefix_regex=prefix,
+        RESEARCH_ID_QUERY.render(project=project,
+                                 deid_map_dataset=get_deid_map_dataset(dataset),
                                  pid=pid)).to_dataframe()
     if research_id_df.empty:
         LOGGER.info(f"no research_id associated with person_id {pid}")
@@ -350,29 +410,20 @@ def check_pid_exist(date_row, client, pids_project_id, pids_dataset_id,
     return check_pid_df.loc[0, 'count']
 
 
-def create_queries(project_id, ticket_number, pids_project_id, pids_dataset_id,
-                   pids_table):
+def get_tables_to_retract(date_columns_df, client, pids_project_id,
+                          pids_dataset_id, pids_table):
     """
-    Creates sandbox and truncate queries to run for EHR deactivated retraction
+    Filters the tables to those containing deactivated pids after the earliest deactivated date
 
-    :param project_id: bq name of project
-    :param ticket_number: Jira ticket number to identify and title sandbox table
+    :param date_columns_df: dataframe of date columns of each table, from get_date_info_for_pids_tables
+    :param client: bq client object
     :param pids_project_id: deactivated ehr pids table in bq's project_id
     :param pids_dataset_id: deactivated ehr pids table in bq's dataset_id
     :param pids_table: deactivated pids table in bq's table name
-    :return: list of queries to run
+    :return: tuple of the filtered dataframe and the set of datasets it contains
     """
-    queries_list = []
     dataset_list = set()
     final_date_column_df = pd.DataFrame()
-    # Hit bq and receive df of deactivated ehr pids and deactivated date
-    client = get_client(project_id)
-    deactivated_ehr_pids_df = client.query(
-        DEACTIVATED_PIDS_QUERY.render(project=pids_project_id,
-                                      dataset=pids_dataset_id,
-                                      table=pids_table)).to_dataframe()
-
-    date_columns_df = get_date_info_for_pids_tables(project_id, client)
     LOGGER.info(
         "Dataframe creation complete. DF to be used for creation of retraction queries."
     )
@@ -395,6 +446,33 @@ def create_queries(project_id, ticket_number, pids_project_id, pids_dataset_id,
             final_date_column_df = final_date_column_df.append(
                 row, ignore_index=True)
 
+    return final_date_column_df, dataset_list
+
+
+def create_queries(project_id, ticket_number, pids_project_id, pids_dataset_id,
+                   pids_table):
+    """
+    Creates sandbox and truncate queries to run for EHR deactivated retraction
+
+    :param project_id: bq name of project
+    :param ticket_number: Jira ticket number to identify and title sandbox table
+    :param pids_project_id: deactivated ehr pids table in bq's project_id
+    :param pids_dataset_id: deactivated ehr pids table in bq's dataset_id
+    :param pids_table: deactivated pids table in bq's table name
+    :return: list of queries to run
+    """
+    queries_list = []
+    # Hit bq and receive df of deactivated ehr pids and deactivated date
+    client = get_client(project_id)
+    deactivated_ehr_pids_df = client.query(
+        DEACTIVATED_PIDS_QUERY.render(project=pids_project_id,
+                                      dataset=pids_dataset_id,
+                                      table=pids_table)).to_dataframe()
+
+    date_columns_df = get_date_info_for_pids_tables(project_id, client)
+    final_date_column_df, dataset_list = get_tables_to_retract(
+        date_columns_df, client, pids_project_id, pids_dataset_id, pids_table)
+
     LOGGER.info(
         "Looping through the deactivated PIDS df to create queries based on the retractions needed per PID table"
     )
@@ -495,6 +573,130 @@ def create_queries(project_id, ticket_number, pids_project_id, pids_dataset_id,
     return queries_list
 
 
+def create_set_based_queries(project_id, ticket_number, pids_project_id,
+                             pids_dataset_id, pids_table):
+    """
+    Creates one sandbox and one delete query per table, retracting every deactivated pid at once
+
+    Instead of one pair of queries per pid and table, each query joins the deactivated pids table, and the _deid_map
+    to find research_ids in deid datasets, once per table.
+
+    :param project_id: bq name of project
+    :param ticket_number: Jira ticket number to identify and title sandbox table
+    :param pids_project_id: deactivated ehr pids table in bq's project_id
+    :param pids_dataset_id: deactivated ehr pids table in bq's dataset_id
+    :param pids_table: deactivated pids table in bq's table name
+    :return: list of queries to run
+    """
+    queries_list = []
+    sandbox_datasets = dict()
+    client = get_client(project_id)
+
+    date_columns_df = get_date_info_for_pids_tables(project_id, client)
+    final_date_column_df, dataset_list = get_tables_to_retract(
+        date_columns_df, client, pids_project_id, pids_dataset_id, pids_table)
+
+    for date_row in final_date_column_df.itertuples(index=False):
+        # deid datasets contain research_ids, which are looked up in the _deid_map of the combined dataset
+        deid_map_dataset = None
+        if re.match(DEID_REGEX, date_row.dataset_id):
+            deid_map_dataset = get_deid_map_dataset(date_row.dataset_id)
+
+        # Get or create sandbox dataset, once per dataset
+        key = (date_row.project_id, date_row.dataset_id)
+        if key not in sandbox_datasets:
+            sandbox_datasets[key] = check_and_create_sandbox_dataset(
+                date_row.project_id, date_row.dataset_id)
+        sandbox_dataset = sandbox_datasets[key]
+
+        LOGGER.info(
+            f'Creating Query to retract deactivated pids from {date_row.dataset_id}.{date_row.table}'
+        )
+        date_column = None if pd.isnull(
+            date_row.date_column) else date_row.date_column
+        query_args = dict(project=date_row.project_id,
+                          dataset=date_row.dataset_id,
+                          table=date_row.table,
+                          deid_map_dataset=deid_map_dataset,
+                          deactivated_pids_project=pids_project_id,
+                          deactivated_pids_dataset=pids_dataset_id,
+                          deactivated_pids_table=pids_table,
+                          date_column=date_column,
+                          end_date_column=date_row.end_date_column,
+                          start_date_column=date_row.start_date_column)
+        queries_list.append({
+            clean_consts.QUERY:
+                SANDBOX_QUERY_SET.render(**query_args),
+            clean_consts.DESTINATION:
+                date_row.project_id + '.' + sandbox_dataset + '.' +
+                (ticket_number + '_' + date_row.table),
+            clean_consts.DESTINATION_DATASET:
+                date_row.dataset_id,
+            clean_consts.DESTINATION_TABLE:
+                date_row.table,
+            clean_consts.DISPOSITION:
+                bq_consts.WRITE_APPEND,
+            'type':
+                'sandbox'
+        })
+        queries_list.append({
+            clean_consts.QUERY: DELETE_QUERY_SET.render(**query_args),
+            clean_consts.DESTINATION_DATASET: date_row.dataset_id,
+            clean_consts.DESTINATION_TABLE: date_row.table,
+            'type': 'delete'
+        })
+    LOGGER.info(
+        f"Query list complete, retracting ehr deactivated PIDS from the following datasets: "
+        f"{dataset_list}")
+    return queries_list
+
+
+def get_removed_rows_summary(queries, client):
+    """
+    Counts the rows to remove per pid from each table, using the sandbox queries
+
+    Must be run before the retraction.  Sandbox tables are appended to, so they may also hold the rows of earlier
+    runs with the same ticket number.
+
+    :param queries: list of queries to run the retraction with
+    :param client: bq client object
+    :return: dataframe with the columns dataset_id, table_id, person_id and row_count.  person_id holds research_ids
+        for deid datasets.
+    """
+    sandbox_tables = dict()
+    for query_dict in queries:
+        if query_dict['type'] == 'sandbox':
+            project, sandbox_dataset, _ = query_dict[
+                clean_consts.DESTINATION].split('.')
+            sandbox_tables.setdefault((project, sandbox_dataset), []).append({
+                'dataset': query_dict[clean_consts.DESTINATION_DATASET],
+                'table': query_dict[clean_consts.DESTINATION_TABLE],
+                'sandbox_query': query_dict[clean_consts.QUERY]
+            })
+
+    # One query per sandbox dataset keeps queries within BigQuery's query length limits
+    removed_rows_dfs = [
+        pd.DataFrame(
+            columns=['dataset_id', 'table_id', 'person_id', 'row_count'])
+    ]
+    for tables in sandbox_tables.values():
+        removed_rows_dfs.append(
+            client.query(
+                REMOVED_ROWS_QUERY.render(tables=tables)).to_dataframe())
+    return pd.concat(removed_rows_dfs, ignore_index=True, sort=False)
+
+
+def log_removed_rows(summary_df):
+    """
+    Logs the rows removed per pid
+
+    :param summary_df: dataframe returned by get_removed_rows_summary
+    """
+    for pid, row_count in summary_df.groupby(
+            'person_id')['row_count'].sum().items():
+        LOGGER.info(f'Removed {row_count} rows for PID: {pid}')
+
+
 def run_queries(queries, client):
     """
     Function that will perform the retraction.
@@ -504,6 +706,22 @@ def run_queries(queries, client):
     """
     incomplete_jobs = []
     for query_dict in queries:
+        if query_dict['type'] == 'delete':
+            # DML statements cannot set a destination table
+            LOGGER.info(
+                f"Deleting retracted rows, using query {query_dict['query']}")
+            job = client.query(
+                query_dict['query'],
+                job_config=bigquery.QueryJobConfig(use_query_cache=False))
+            job.result()
+            if job.exception():
+                incomplete_jobs.append(job)
+            else:
+                LOGGER.info(
+                    f"{job.num_dml_affected_rows} rows deleted from {query_dict['destination_table_id']} in "
+                    f"{query_dict['destination_dataset_id']}")
+            continue
+
         # Set configuration.query
         job_config = bigquery.QueryJobConfig(
             use_query_cache=False,
@@ -590,17 +808,37 @@ def parse_args(raw_args=None):
                         action='store_true',
                         required=False,
                         help='Log to the console as well as to a file.')
+    parser.add_argument(
+        '-b',
+        '--set-based',
+        dest='set_based',
+        action='store_true',
+        required=False,
+        help='Retract all deactivated pids with one sandbox and one delete '
+        'query per table, and report the rows removed per pid.')
     return parser.parse_args(raw_args)
 
 
 def main(args=None):
     args = parse_args(args)
     add_console_logging(args.console_log)
-    query_list = create_queries(args.project_id, args.ticket_number,
-                                args.pids_project_id, args.pids_dataset_id,
-                                args.pids_table)
+    if args.set_based:
+        query_list = create_set_based_queries(args.project_id,
+                                              args.ticket_number,
+                                              args.pids_project_id,
+                                              args.pids_dataset_id,
+                                              args.pids_table)
+    else:
+        query_list = create_queries(args.project_id, args.ticket_number,
+                                    args.pids_project_id, args.pids_dataset_id,
+                                    args.pids_table)
     client = get_client(args.project_id)
+    if args.set_based:
+        # the rows are counted before they are removed
+        summary_df = get_removed_rows_summary(query_list, client)
     run_queries(query_list, client)
+    if args.set_based:
+        log_removed_rows(summary_df)
     LOGGER.info("Retraction complete")
 
 
@@ -59,20 +59,9 @@ echo "Creating backup in ${BACKUP_DIR}..."
 mkdir ${BACKUP_DIR}
 cp -a ${IN_DIR}/* ${BACKUP_DIR}
 
-# Format dates, standardize line endings
-echo "Transforming the files in ${IN_DIR}..."
-python ${BASE_DIR}/vocabulary.py transform_files --in_dir ${BACKUP_DIR} --out_dir ${IN_DIR}
-
-TEMP_DIR=$(mktemp -d)
-echo "Created temp dir ${TEMP_DIR}"
-
-# Append vocabulary and concept records
-echo "Adding AoU_General and AoU_Custom to vocabulary in ${IN_DIR}..."
-cp -a ${IN_DIR}/* ${TEMP_DIR}
-
-python ${BASE_DIR}/vocabulary.py add_aou_vocabs --in_dir ${TEMP_DIR} --out_dir ${IN_DIR}
-
-rm -rf ${TEMP_DIR}
+# Format dates, standardize line endings and append vocabulary and concept records
+echo "Preparing the files in ${IN_DIR} and adding AoU_General and AoU_Custom..."
+python ${BASE_DIR}/vocabulary.py prepare_vocabulary --in_dir ${BACKUP_DIR} --out_dir ${IN_DIR}
 
 # Upload to bucket
 if [[ -z "${GCS_PATH}" ]]; then
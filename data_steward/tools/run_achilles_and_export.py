@@ -10,6 +10,7 @@ The following environment variables must be set:
 Note: Any missing CDM tables will be created and will remain empty
 """
 import argparse
+import json
 
 from bq_utils import get_dataset_id
 from validation.main import _upload_achilles_files
@@ -21,6 +22,13 @@ def main(args):
     dataset_id = get_dataset_id()
     target_bucket = args.bucket
     folder_prefix = args.folder + '/'
+    if args.plan:
+        plan = _run_export(datasource_id=dataset_id,
+                           folder_prefix=folder_prefix,
+                           target_bucket=target_bucket,
+                           plan=True)
+        print(json.dumps(plan, indent=2))
+        return
     _run_achilles()
     _run_export(datasource_id=dataset_id,
                 folder_prefix=folder_prefix,
@@ -37,5 +45,10 @@ if __name__ == '__main__':
         '--folder',
         default='',
         help='Identifier for the folder in which achilles results sit.')
+    parser.add_argument(
+        '--plan',
+        action='store_true',
+        help=
+        'List the export queries with the bytes they would process and exit.')
     args = parser.parse_args()
     main(args)
@@ -9,6 +9,7 @@ from datetime import datetime
 import logging
 import os
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Third party imports
 import google
@@ -18,6 +19,7 @@ import bq_utils
 import deid.aou as aou
 from resources import fields_for, fields_path, DEID_PATH
 from deid.parser import odataset_name_verification
+from deid.session import DeidSession
 
 LOGGER = logging.getLogger(__name__)
 DEID_TABLES = [
@@ -35,6 +37,8 @@ VOCABULARY_TABLES = [
 ]
 
 LOGS_PATH = 'LOGS'
+# the number of tables submitted to BigQuery at the same time by default
+MAX_CONCURRENT_TABLES = 4
 
 
 def add_console_logging(add_handler):
@@ -142,6 +146,45 @@ def copy_vocabulary_tables(input_dataset, dest_dataset):
             pass
 
 
+def deid_tables(handles, max_concurrent_tables=MAX_CONCURRENT_TABLES):
+    """
+    Execute the prepared deid of independent tables concurrently.
+
+    Each table's queries and DML statements are still executed in order.  The
+    tables share the job monitor of their deid session.
+
+    :param handles:  dictionary of table names to prepared AOU instances
+    :param max_concurrent_tables:  the most tables executed at the same time
+
+    :return:  a tuple of the list of tables successfully de-identified and the
+        list of tables that encountered exceptions
+    """
+    successes = []
+    exceptions = []
+    if not handles:
+        return successes, exceptions
+
+    max_workers = max(1, min(max_concurrent_tables, len(handles)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(handle.run): table
+            for table, handle in handles.items()
+        }
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                future.result()
+            except google.api_core.exceptions.GoogleAPIError:
+                LOGGER.exception(
+                    f"Encountered deid exception for table {table}:\n")
+                exceptions.append(table)
+            else:
+                LOGGER.info(f"Successfully executed deid on table: {table}")
+                successes.append(table)
+
+    return successes, exceptions
+
+
 def parse_args(raw_args=None):
     """
     Parse command line arguments.
@@ -210,6 +253,23 @@ def parse_args(raw_args=None):
                         action='store_true',
                         required=False,
                         help='Log to the console as well as to a file.')
+    parser.add_argument(
+        '--max-concurrent-tables',
+        dest='max_concurrent_tables',
+        action='store',
+        type=int,
+        required=False,
+        default=MAX_CONCURRENT_TABLES,
+        help=('The most tables to de-identify at the same time.  '
+              f'Defaults to {MAX_CONCURRENT_TABLES}.'))
+    parser.add_argument(
+        '--rebuild-plans',
+        '--no-plan-cache',
+        dest='rebuild_plans',
+        action='store_true',
+        required=False,
+        help=('Compile the deid rules of every table again instead of '
+              'reusing the deid plans saved by previous runs.'))
     parser.add_argument('--version', action='version', version='deid-02')
     return parser.parse_args(raw_args)
 
@@ -219,6 +279,9 @@ def main(raw_args=None):
     Execute deid as a single script.
 
     Responsible for aggregating the tables deid will execute on and calling deid.
+    The tables share a single deid session, so the participant and auxiliary
+    mapping tables are only validated and built once.  The SQL of every table
+    is generated first, then the independent tables are executed concurrently.
     """
     args = parse_args(raw_args)
     add_console_logging(args.console_log)
@@ -228,8 +291,11 @@ def main(raw_args=None):
     tables = get_output_tables(args.input_dataset, known_tables,
                                args.skip_tables, args.tables)
 
+    session = DeidSession(args.input_dataset, args.private_key)
+
     exceptions = []
     successes = []
+    handles = {}
     for table in tables:
         tablepath = None
         if table in configured_tables:
@@ -248,22 +314,33 @@ def main(raw_args=None):
         if args.interactive_mode:
             parameter_list.append('--interactive')
 
+        if args.rebuild_plans:
+            parameter_list.append('--rebuild-plans')
+
         field_names = [field.get('name') for field in fields_for(table)]
         if 'person_id' in field_names:
             parameter_list.append('--cluster')
 
         LOGGER.info(
-            f"Executing deid with:\n\tpython deid/aou.py {' '.join(parameter_list)}"
+            f"Preparing deid with:\n\tpython deid/aou.py {' '.join(parameter_list)}"
         )
 
         try:
-            aou.main(parameter_list)
+            handle = aou.prepare(parameter_list, session=session)
         except google.api_core.exceptions.GoogleAPIError:
             LOGGER.exception("Encountered deid exception:\n")
             exceptions.append(table)
         else:
-            LOGGER.info(f"Successfully executed deid on table: {table}")
-            successes.append(table)
+            if handle:
+                handles[table] = handle
+            else:
+                # nothing to de-identify for the table
+                successes.append(table)
+
+    run_successes, run_exceptions = deid_tables(handles,
+                                                args.max_concurrent_tables)
+    successes.extend(run_successes)
+    exceptions.extend(run_exceptions)
 
     copy_suppressed_table_schemas(known_tables, args.odataset)
 
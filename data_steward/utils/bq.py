@@ -135,8 +135,9 @@ def create_tables(client,
     return successes
 
 
-def query(q, project_id=None, use_cache=False):
-    client = get_client(project_id)
+def query(q, project_id=None, use_cache=False, client=None):
+    if client is None:
+        client = get_client(project_id)
     query_job_config = bigquery.job.QueryJobConfig(use_query_cache=use_cache)
     return client.query(q, job_config=query_job_config).to_dataframe()
 
@@ -152,18 +153,19 @@ def list_datasets(project_id):
     return datasets
 
 
-def get_table_info_for_dataset(project_id, dataset_id):
+def get_table_info_for_dataset(project_id, dataset_id, client=None):
     """
     Get df of INFORMATION_SCHEMA.COLUMNS for a specified dataset
 
     :param project_id: identifies the project
     :param dataset_id: identifies the dataset
+    :param client: an optional BigQuery client to run the query with
     :return df containing table column information
     :raises BadRequest
     """
     table_info_query = consts.TABLE_INFO_QUERY.format(project=project_id,
                                                       dataset=dataset_id)
-    result_df = query(table_info_query, project_id)
+    result_df = query(table_info_query, project_id, client=client)
     return result_df
 
 
@@ -0,0 +1,259 @@
+"""
+Decode BigQuery query responses one column at a time.
+
+The rows of a jobs.query or jobs.getQueryResults response are decoded into a
+typed NumPy array per column rather than cell by cell, so the schema is looked
+up once per column and each column is cast in a single array operation. The
+columns convert to a pandas DataFrame without going through Python objects, and
+to the list of dictionaries returned by bq_utils.response2rows.
+"""
+# Python imports
+from collections import OrderedDict, namedtuple
+
+# Third party imports
+import numpy as np
+import pandas as pd
+
+# Project imports
+from constants import bq_utils as bq_consts
+
+RECORD = 'RECORD'
+INTEGER = 'INTEGER'
+FLOAT = 'FLOAT'
+BOOLEAN = 'BOOLEAN'
+TIMESTAMP = 'TIMESTAMP'
+REPEATED = 'REPEATED'
+TRUE_VALUES = ['True', 'true', 'TRUE']
+
+# values is an ndarray, mask flags the null values or is None if there are none
+Column = namedtuple('Column', ['name', 'type', 'values', 'mask'])
+
+
+def _null_mask(values):
+    """
+    Get the positions of the null values of an object array
+
+    :param values: an object ndarray
+    :return: a boolean ndarray, or None if no value is null
+    """
+    mask = np.equal(values, None)
+    return mask if mask.any() else None
+
+
+def _cast(values, mask, field_type, fill):
+    """
+    Cast an object array of strings, filling null positions first
+
+    :param values: an object ndarray of strings and None
+    :param mask: null mask of the values, or None
+    :param field_type: numpy type to cast to
+    :param fill: value stored at null positions
+    :return: a typed ndarray
+    """
+    if mask is not None:
+        values = values.copy()
+        values[mask] = fill
+    return values.astype(field_type)
+
+
+def _split(values, lengths):
+    """
+    Split a list of values into consecutive lists of the given lengths
+
+    :param values: a flat list
+    :param lengths: the length of each part
+    :return: list of lists
+    """
+    result = []
+    start = 0
+    for length in lengths:
+        result.append(values[start:start + length])
+        start += length
+    return result
+
+
+def _decode_repeated(raw, field):
+    """
+    Decode a REPEATED column, whose values are lists of {'v': value}
+
+    :param raw: list of the cell values
+    :param field: the schema field of the column
+    :return: an object ndarray of lists
+    """
+    lengths = [len(value) if value is not None else 0 for value in raw]
+    items = [item['v'] for value in raw if value is not None for item in value]
+    item_field = dict(field, mode=None)
+    item_column = decode_column(items, item_field)
+    values = np.empty(len(raw), dtype=object)
+    for position, part in enumerate(_split(column_to_list(item_column),
+                                           lengths)):
+        values[position] = part
+    return values
+
+
+def _decode_record(raw, field):
+    """
+    Decode a RECORD column, whose values are rows of the nested schema
+
+    :param raw: an object ndarray of the cell values
+    :param field: the schema field of the column
+    :return: an object ndarray of dictionaries
+    """
+    records = [value for value in raw if value is not None]
+    nested_rows = rows_to_dicts(records, field[bq_consts.FIELDS])
+    values = np.empty(len(raw), dtype=object)
+    positions = [i for i, value in enumerate(raw) if value is not None]
+    for position, nested_row in zip(positions, nested_rows):
+        values[position] = nested_row
+    return values
+
+
+def decode_column(raw, field):
+    """
+    Decode the cell values of a column according to its schema field
+
+    INTEGER columns become int64 arrays, FLOAT and TIMESTAMP columns float64
+    arrays and BOOLEAN columns bool arrays. Other columns keep their values in
+    an object array. Null positions hold 0, NaN or False in typed arrays and
+    are flagged by the mask.
+
+    :param raw: list of the cell values, strings or None
+    :param field: the schema field of the column
+    :return: a Column
+    """
+    field_type = field['type']
+    if field.get('mode') == REPEATED:
+        # lists can not be assigned to an object array in a single operation
+        mask = np.array([value is None for value in raw], dtype=bool)
+        values = _decode_repeated(raw, field)
+        return Column(field['name'], field_type, values,
+                      mask if mask.any() else None)
+
+    values = np.empty(len(raw), dtype=object)
+    values[:] = raw
+    mask = _null_mask(values)
+
+    if field_type == RECORD:
+        values = _decode_record(values, field)
+    elif field_type == INTEGER:
+        values = _cast(values, mask, np.int64, '0')
+    elif field_type in (FLOAT, TIMESTAMP):
+        values = _cast(values, mask, np.float64, 'NaN')
+    elif field_type == BOOLEAN:
+        values = np.isin(values, TRUE_VALUES)
+
+    return Column(field['name'], field_type, values, mask)
+
+
+def decode_rows(rows, fields):
+    """
+    Decode rows of a response into columns
+
+    :param rows: list of rows, each a dictionary {'f': [{'v': value}, ...]}
+    :param fields: the list of schema fields of the rows
+    :return: an OrderedDict of column name => Column
+    """
+    columns = OrderedDict()
+    cells = [row['f'] for row in rows]
+    for index, field in enumerate(fields):
+        raw = [row_cells[index]['v'] for row_cells in cells]
+        columns[field['name']] = decode_column(raw, field)
+    return columns
+
+
+def decode_response(response):
+    """
+    Decode the rows of a query response page into columns
+
+    :param response: a jobs.query or jobs.getQueryResults response
+    :return: an OrderedDict of column name => Column
+    """
+    rows = response.get(bq_consts.ROWS, [])
+    fields = response.get(bq_consts.SCHEMA,
+                          {bq_consts.FIELDS: []})[bq_consts.FIELDS]
+    return decode_rows(rows, fields or [])
+
+
+def column_to_list(column):
+    """
+    Convert a column to a list of Python values with None for null values
+
+    :param column: a Column
+    :return: list
+    """
+    values = column.values.tolist()
+    if column.mask is not None:
+        for position in np.flatnonzero(column.mask):
+            values[position] = None
+    return values
+
+
+def rows_to_dicts(rows, fields):
+    """
+    Decode rows of a response into dictionaries
+
+    :param rows: list of rows, each a dictionary {'f': [{'v': value}, ...]}
+    :param fields: the list of schema fields of the rows
+    :return: list of dict
+    """
+    columns = decode_rows(rows, fields)
+    if not columns:
+        return [dict() for _ in rows]
+    names = list(columns.keys())
+    values = [column_to_list(column) for column in columns.values()]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+def response_to_dicts(response):
+    """
+    Decode the rows of a query response page into dictionaries
+
+    :param response: a jobs.query or jobs.getQueryResults response
+    :return: list of dict
+    """
+    rows = response.get(bq_consts.ROWS, [])
+    fields = response.get(bq_consts.SCHEMA,
+                          {bq_consts.FIELDS: []})[bq_consts.FIELDS]
+    return rows_to_dicts(rows, fields or [])
+
+
+def column_to_array(column):
+    """
+    Convert a column to an array pandas stores without copying Python objects
+
+    Nullable INTEGER columns become pandas integer arrays sharing the values
+    and mask. Nullable BOOLEAN columns fall back to an object array.
+
+    :param column: a Column
+    :return: an ndarray or pandas extension array
+    """
+    if column.mask is None:
+        return column.values
+    if column.type == INTEGER:
+        return pd.arrays.IntegerArray(column.values, column.mask)
+    if column.type == BOOLEAN:
+        return np.array(column_to_list(column), dtype=object)
+    return column.values
+
+
+def columns_to_dataframe(columns):
+    """
+    Convert decoded columns to a DataFrame
+
+    :param columns: an OrderedDict of column name => Column
+    :return: a pandas DataFrame
+    """
+    return pd.DataFrame(OrderedDict(
+        (name, column_to_array(column)) for name, column in columns.items()),
+                        columns=list(columns.keys()),
+                        copy=False)
+
+
+def response_to_dataframe(response):
+    """
+    Decode the rows of a query response page into a DataFrame
+
+    :param response: a jobs.query or jobs.getQueryResults response
+    :return: a pandas DataFrame
+    """
+    return columns_to_dataframe(decode_response(response))
@@ -0,0 +1,114 @@
+"""
+A cache of Google API discovery clients shared by bq_utils and gcs_utils.
+
+Building a discovery client parses the API discovery document and sets up new
+authorized http connections.  Doing so on every API call is expensive, so
+clients are built lazily once and reused.
+
+The httplib2 connections used by discovery clients are not thread-safe, so each
+thread keeps its own clients.  Cached clients are discarded when the configured
+credentials change or when `invalidate` is called.  `invalidate_on_error` is
+called where API errors are handled, so credential and transport errors discard
+the clients which may have caused them.
+"""
+# Python imports
+import logging
+import os
+import socket
+import threading
+
+# Third party imports
+import googleapiclient.discovery
+import httplib2
+from google.auth.exceptions import RefreshError, TransportError
+from googleapiclient.errors import HttpError
+
+LOGGER = logging.getLogger(__name__)
+
+CREDENTIALS_ENV = 'GOOGLE_APPLICATION_CREDENTIALS'
+# Http status of requests with invalid credentials
+UNAUTHORIZED = 401
+
+# This is where each thread keeps its own clients.
+_thread_store = threading.local()
+_lock = threading.Lock()
+# Incremented to discard the clients cached in every thread
+_generation = 0
+_build_count = 0
+
+
+def _build(service_name, version):
+    """
+    Build a new discovery client
+
+    :param service_name: name of the API, e.g. 'bigquery'
+    :param version: version of the API, e.g. 'v2'
+    :return: a discovery client
+    """
+    global _build_count
+    with _lock:
+        _build_count += 1
+    LOGGER.debug(f"Building {service_name} {version} client")
+    return googleapiclient.discovery.build(service_name, version, cache={})
+
+
+def get_service(service_name, version):
+    """
+    Get a client for an API, building it the first time it is requested by the
+    current thread
+
+    :param service_name: name of the API, e.g. 'bigquery'
+    :param version: version of the API, e.g. 'v2'
+    :return: a discovery client
+    """
+    if getattr(_thread_store, 'generation', None) != _generation:
+        _thread_store.services = dict()
+        _thread_store.generation = _generation
+    key = (service_name, version, os.environ.get(CREDENTIALS_ENV))
+    service = _thread_store.services.get(key)
+    if service is None:
+        service = _build(service_name, version)
+        _thread_store.services[key] = service
+    return service
+
+
+def invalidate():
+    """
+    Discard the clients cached by every thread
+
+    Clients are rebuilt on their next use.  Call this after credentials are
+    refreshed so no thread keeps using stale credentials.
+    """
+    global _generation
+    with _lock:
+        _generation += 1
+
+
+def invalidate_on_error(exception):
+    """
+    Discard the cached clients if an error may be caused by a stale client
+
+    Failed credential refreshes, unauthorized requests and broken connections
+    are not fixed by retrying with the same client.
+
+    :param exception: the error raised by an API call
+    :return: True if the clients were discarded, False otherwise
+    """
+    if isinstance(exception, HttpError):
+        is_stale = int(exception.resp.status) == UNAUTHORIZED
+    else:
+        is_stale = isinstance(exception, (RefreshError, TransportError,
+                                          httplib2.HttpLib2Error, socket.error))
+    if is_stale:
+        LOGGER.info(f"Discarding cached clients after error: {exception}")
+        invalidate()
+    return is_stale
+
+
+def get_build_count():
+    """
+    Get the number of clients built by this process
+
+    :return: count of discovery clients built
+    """
+    return _build_count
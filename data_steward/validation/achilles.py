@@ -81,18 +81,31 @@ def run_analysis_job(command):
         raise RuntimeError('Job id %s taking too long' % job_id)
 
 
-def run_analyses(hpo_id):
+def run_analysis_command(command):
+    """
+    Runs a single achilles statement
+    :param command: query to run
+    :return: None
+    """
+    if sql_wrangle.is_truncate(command) or sql_wrangle.is_drop(command):
+        drop_or_truncate_table(command)
+    else:
+        run_analysis_job(command)
+
+
+def run_analyses(hpo_id,
+                 max_concurrent_jobs=sql_wrangle.DEFAULT_MAX_CONCURRENT_JOBS):
     """
     Run the achilles analyses
+
+    Analyses which do not depend on each other's tables are run concurrently
     :param hpo_id: hpo_id of the site to run on
+    :param max_concurrent_jobs: maximum number of queries running at the same time
     :return: None
     """
     commands = _get_run_analysis_commands(hpo_id)
-    for command in commands:
-        if sql_wrangle.is_truncate(command) or sql_wrangle.is_drop(command):
-            drop_or_truncate_table(command)
-        else:
-            run_analysis_job(command)
+    sql_wrangle.run_commands(commands, run_analysis_command,
+                             max_concurrent_jobs)
 
 
 def create_tables(hpo_id, drop_existing=False):
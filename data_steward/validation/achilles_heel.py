@@ -74,7 +74,13 @@ def drop_or_truncate_table(command):
     if sql_wrangle.is_truncate(command):
         table_id = sql_wrangle.get_truncate_table_name(command)
         query = 'DELETE FROM %s WHERE TRUE' % table_id
-        bq_utils.query(query)
+        job_result = bq_utils.query(query)
+        job_id = job_result['jobReference']['jobId']
+        # statements depending on the table may only start once rows are gone
+        incomplete_jobs = bq_utils.wait_on_jobs([job_id])
+        if len(incomplete_jobs) > 0:
+            logging.info('Job id %s taking too long' % job_id)
+            raise RuntimeError('Job id %s taking too long' % job_id)
     else:
         table_id = sql_wrangle.get_drop_table_name(command)
         bq_utils.delete_table(table_id)
@@ -101,19 +107,32 @@ def run_heel_analysis_job(command):
         raise RuntimeError('Job id %s taking too long' % job_id)
 
 
-def run_heel(hpo_id):
+def run_heel_command(command):
+    """
+    Runs a single heel statement
+
+    :param command: query to run
+    :returns: None
+    """
+    if sql_wrangle.is_truncate(command) or sql_wrangle.is_drop(command):
+        drop_or_truncate_table(command)
+    else:
+        run_heel_analysis_job(command)
+
+
+def run_heel(hpo_id,
+             max_concurrent_jobs=sql_wrangle.DEFAULT_MAX_CONCURRENT_JOBS):
     """
     Run heel commands
 
+    Commands which do not depend on each other's tables are run concurrently
+
     :param hpo_id:  string name for the hpo identifier
+    :param max_concurrent_jobs: maximum number of queries running at the same time
     :returns: None
     """
-    commands = _get_heel_commands(hpo_id)
-    for command in commands:
-        if sql_wrangle.is_truncate(command) or sql_wrangle.is_drop(command):
-            drop_or_truncate_table(command)
-        else:
-            run_heel_analysis_job(command)
+    commands = list(_get_heel_commands(hpo_id))
+    sql_wrangle.run_commands(commands, run_heel_command, max_concurrent_jobs)
 
 
 def create_tables(hpo_id, drop_existing=False):
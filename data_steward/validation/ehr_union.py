@@ -60,6 +60,11 @@ Create a new CDM dataset which is the union of all EHR datasets submitted by HPO
    * Use new primary keys in output where applicable
    * Use new visit_occurrence_id where applicable
 
+ 4) Move the demographics of EHR person records to observation.
+
+ The steps run as a task graph (see `get_union_tasks`): mapping tables are loaded concurrently and each output
+ table is loaded as soon as the mapping tables it reads exist.
+
 ## Notes
 Currently the following environment variables must be set:
  * GOOGLE_APPLICATION_CREDENTIALS: path to service account key json file (e.g. /path/to/all-of-us-ehr-dev-abc123.json)
@@ -72,6 +77,10 @@ TODO
 """
 import argparse
 import logging
+import time
+from collections import OrderedDict
+from functools import partial
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import app_identity
 
@@ -114,7 +123,11 @@ def output_table_for(table_id):
     return 'unioned_ehr_' + table_id
 
 
-def _mapping_subqueries(table_name, hpo_ids, dataset_id, project_id):
+def _mapping_subqueries(table_name,
+                        hpo_ids,
+                        dataset_id,
+                        project_id,
+                        hpo_offsets=None):
     """
     Get list of subqueries (one for each HPO table found in the source) that comprise the ID mapping query
 
@@ -122,10 +135,12 @@ def _mapping_subqueries(table_name, hpo_ids, dataset_id, project_id):
     :param hpo_ids: list of HPOs to process
     :param dataset_id: identifies the source dataset
     :param project_id: identifies the GCP project
+    :param hpo_offsets: (optional) dictionary mapping hpo_id => numeric offset, by default get_hpo_offsets(hpo_ids)
     :return: list of subqueries
     """
     result = []
-    hpo_unique_identifiers = get_hpo_offsets(hpo_ids)
+    hpo_unique_identifiers = hpo_offsets if hpo_offsets else get_hpo_offsets(
+        hpo_ids)
 
     # Exclude subqueries that reference tables that are missing from source dataset
     all_table_ids = bq_utils.list_all_table_ids(dataset_id)
@@ -150,7 +165,11 @@ def _mapping_subqueries(table_name, hpo_ids, dataset_id, project_id):
     return result
 
 
-def mapping_query(table_name, hpo_ids, dataset_id=None, project_id=None):
+def mapping_query(table_name,
+                  hpo_ids,
+                  dataset_id=None,
+                  project_id=None,
+                  hpo_offsets=None):
     """
     Get query used to generate new ids for a CDM table
 
@@ -158,6 +177,7 @@ def mapping_query(table_name, hpo_ids, dataset_id=None, project_id=None):
     :param hpo_ids: identifies the HPOs
     :param dataset_id: identifies the BQ dataset containing the input table
     :param project_id: identifies the GCP project containing the dataset
+    :param hpo_offsets: (optional) dictionary mapping hpo_id => numeric offset, by default get_hpo_offsets(hpo_ids)
     :return: the query
     """
     if dataset_id is None:
@@ -165,7 +185,7 @@ def mapping_query(table_name, hpo_ids, dataset_id=None, project_id=None):
     if project_id is None:
         project_id = app_identity.get_application_id()
     subqueries = _mapping_subqueries(table_name, hpo_ids, dataset_id,
-                                     project_id)
+                                     project_id, hpo_offsets)
     union_all_query = UNION_ALL.join(subqueries)
     return '''
     WITH all_{table_name} AS (
@@ -190,24 +210,32 @@ def mapping_table_for(domain_table):
     return '_mapping_' + domain_table
 
 
-def mapping(domain_table, hpo_ids, input_dataset_id, output_dataset_id,
-            project_id):
+def mapping(domain_table,
+            hpo_ids,
+            input_dataset_id,
+            output_dataset_id,
+            project_id,
+            write_disposition='WRITE_TRUNCATE',
+            hpo_offsets=None):
     """
     Create and load a table that assigns unique ids to records in domain tables
-    Note: Overwrites destination table if it already exists
+    Note: Overwrites destination table if it already exists, unless write_disposition is WRITE_APPEND
 
     :param domain_table:
     :param hpo_ids: identifies which HPOs' data to include in union
     :param input_dataset_id: identifies dataset with multiple CDMs, each from an HPO submission
     :param output_dataset_id: identifies dataset where mapping table should be output
     :param project_id: identifies GCP project that contain the datasets
+    :param write_disposition: WRITE_TRUNCATE (default) or WRITE_APPEND
+    :param hpo_offsets: (optional) dictionary mapping hpo_id => numeric offset, by default get_hpo_offsets(hpo_ids)
     :return:
     """
-    q = mapping_query(domain_table, hpo_ids, input_dataset_id, project_id)
+    q = mapping_query(domain_table, hpo_ids, input_dataset_id, project_id,
+                      hpo_offsets)
     mapping_table = mapping_table_for(domain_table)
     logging.info('Query for {mapping_table} is {q}'.format(
         mapping_table=mapping_table, q=q))
-    query(q, mapping_table, output_dataset_id, 'WRITE_TRUNCATE')
+    query(q, mapping_table, output_dataset_id, write_disposition)
 
 
 def query(q, dst_table_id, dst_dataset_id, write_disposition='WRITE_APPEND'):
@@ -618,12 +646,52 @@ def get_person_to_observation_query(dataset_id):
     return q
 
 
-def move_ehr_person_to_observation(output_dataset_id):
+def _person_to_observation_query(output_dataset_id, hpo_ids=None):
+    """
+    Get the query for the person records to move to observation
+
+    :param output_dataset_id: identifies the dataset containing the unioned person table
+    :param hpo_ids: (optional) only include persons submitted by these HPOs, by default include all
+    :return: the query
+    """
+    q = get_person_to_observation_query(output_dataset_id)
+    if hpo_ids is None:
+        return q
+    return eu_constants.PERSON_TO_OBSERVATION_HPO_FILTER.format(
+        person_to_obs_query=q,
+        output_dataset_id=output_dataset_id,
+        hpo_ids=_hpo_ids_expr(hpo_ids))
+
+
+def _missing_person_to_observation_query(output_dataset_id):
+    """
+    Get the query for the person records whose observations are not in the unioned dataset
+
+    :param output_dataset_id: identifies the dataset containing the unioned person table
+    :return: the query
+    """
+    return eu_constants.PERSON_TO_OBSERVATION_MISSING_FILTER.format(
+        person_to_obs_query=get_person_to_observation_query(output_dataset_id),
+        output_dataset_id=output_dataset_id,
+        pto_offset=eu_constants.EHR_PERSON_TO_OBS_CONSTANT,
+        hpo_offset_start=eu_constants.EHR_ID_MULTIPLIER_START *
+        common.ID_CONSTANT_FACTOR)
+
+
+def move_ehr_person_to_observation(output_dataset_id, missing_only=False):
     """
     This function moves the demographics from the EHR person table to
     the observation table in the combined data set
+    :param output_dataset_id: identifies the unioned dataset
+    :param missing_only: if True, only move persons whose observations are not in the unioned
+        dataset, by default move all
     :return:
     """
+    if missing_only:
+        person_to_obs_query = _missing_person_to_observation_query(
+            output_dataset_id)
+    else:
+        person_to_obs_query = get_person_to_observation_query(output_dataset_id)
 
     q = '''
         SELECT
@@ -655,18 +723,17 @@ def move_ehr_person_to_observation(output_dataset_id):
         FROM
             ({person_to_obs_query}
             ORDER BY person_id) AS pto
-        '''.format(
-        output_dataset_id=output_dataset_id,
-        pto_offset=eu_constants.EHR_PERSON_TO_OBS_CONSTANT,
-        gender_concept_id=eu_constants.GENDER_CONCEPT_ID,
-        gender_offset=eu_constants.GENDER_CONSTANT_FACTOR,
-        race_concept_id=eu_constants.RACE_CONCEPT_ID,
-        race_offset=eu_constants.RACE_CONSTANT_FACTOR,
-        dob_concept_id=eu_constants.DOB_CONCEPT_ID,
-        dob_offset=eu_constants.DOB_CONSTANT_FACTOR,
-        ethnicity_concept_id=eu_constants.ETHNICITY_CONCEPT_ID,
-        ethnicity_offset=eu_constants.ETHNICITY_CONSTANT_FACTOR,
-        person_to_obs_query=get_person_to_observation_query(output_dataset_id))
+        '''.format(output_dataset_id=output_dataset_id,
+                   pto_offset=eu_constants.EHR_PERSON_TO_OBS_CONSTANT,
+                   gender_concept_id=eu_constants.GENDER_CONCEPT_ID,
+                   gender_offset=eu_constants.GENDER_CONSTANT_FACTOR,
+                   race_concept_id=eu_constants.RACE_CONCEPT_ID,
+                   race_offset=eu_constants.RACE_CONSTANT_FACTOR,
+                   dob_concept_id=eu_constants.DOB_CONCEPT_ID,
+                   dob_offset=eu_constants.DOB_CONSTANT_FACTOR,
+                   ethnicity_concept_id=eu_constants.ETHNICITY_CONCEPT_ID,
+                   ethnicity_offset=eu_constants.ETHNICITY_CONSTANT_FACTOR,
+                   person_to_obs_query=person_to_obs_query)
     logging.info(
         'Copying EHR person table from {ehr_dataset_id} to unioned dataset. Query is `{q}`'
         .format(ehr_dataset_id=bq_utils.get_dataset_id(), q=q))
@@ -675,14 +742,18 @@ def move_ehr_person_to_observation(output_dataset_id):
     query(q, dst_table_id, dst_dataset_id, write_disposition='WRITE_APPEND')
 
 
-def map_ehr_person_to_observation(output_dataset_id):
+def map_ehr_person_to_observation(output_dataset_id, hpo_ids=None):
     """
     Maps the newly created observation records from person into the observation mapping table
-    :param input_dataset_id:
-    :param output_dataset_id:
-    :param hpo_id:
+    :param output_dataset_id: identifies the unioned dataset
+    :param hpo_ids: (optional) only map persons submitted by these HPOs, by default map all
     """
     table_name = OBSERVATION_TABLE
+    # the observations of a person submitted by several HPOs are mapped to each of them
+    hpo_filter = ''
+    if hpo_ids is not None:
+        hpo_filter = eu_constants.PERSON_TO_OBSERVATION_MAPPING_HPO_FILTER.format(
+            hpo_ids=_hpo_ids_expr(hpo_ids))
 
     q = '''
         SELECT
@@ -700,18 +771,20 @@ def map_ehr_person_to_observation(output_dataset_id):
             JOIN
             {output_dataset_id}._mapping_person AS mp
             ON pto.person_id = mp.src_person_id
-        '''.format(
-        output_dataset_id=output_dataset_id,
-        pto_offset=eu_constants.EHR_PERSON_TO_OBS_CONSTANT,
-        gender_concept_id=eu_constants.GENDER_CONCEPT_ID,
-        gender_offset=eu_constants.GENDER_CONSTANT_FACTOR,
-        race_concept_id=eu_constants.RACE_CONCEPT_ID,
-        race_offset=eu_constants.RACE_CONSTANT_FACTOR,
-        dob_concept_id=eu_constants.DOB_CONCEPT_ID,
-        dob_offset=eu_constants.DOB_CONSTANT_FACTOR,
-        ethnicity_concept_id=eu_constants.ETHNICITY_CONCEPT_ID,
-        ethnicity_offset=eu_constants.ETHNICITY_CONSTANT_FACTOR,
-        person_to_obs_query=get_person_to_observation_query(output_dataset_id))
+            {hpo_filter}
+        '''.format(output_dataset_id=output_dataset_id,
+                   hpo_filter=hpo_filter,
+                   pto_offset=eu_constants.EHR_PERSON_TO_OBS_CONSTANT,
+                   gender_concept_id=eu_constants.GENDER_CONCEPT_ID,
+                   gender_offset=eu_constants.GENDER_CONSTANT_FACTOR,
+                   race_concept_id=eu_constants.RACE_CONCEPT_ID,
+                   race_offset=eu_constants.RACE_CONSTANT_FACTOR,
+                   dob_concept_id=eu_constants.DOB_CONCEPT_ID,
+                   dob_offset=eu_constants.DOB_CONSTANT_FACTOR,
+                   ethnicity_concept_id=eu_constants.ETHNICITY_CONCEPT_ID,
+                   ethnicity_offset=eu_constants.ETHNICITY_CONSTANT_FACTOR,
+                   person_to_obs_query=_person_to_observation_query(
+                       output_dataset_id, hpo_ids))
     dst_dataset_id = output_dataset_id
     dst_table_id = mapping_table_for(table_name)
     logging.info(
@@ -720,57 +793,617 @@ def map_ehr_person_to_observation(output_dataset_id):
     query(q, dst_table_id, dst_dataset_id, write_disposition='WRITE_APPEND')
 
 
-def main(input_dataset_id, output_dataset_id, project_id, hpo_ids=None):
+def load_dependencies(cdm_table):
     """
-    Create a new CDM which is the union of all EHR datasets submitted by HPOs
+    Get the tables whose mapping tables are read when loading a CDM table
+
+    :param cdm_table: name of the CDM table (e.g. 'person', 'visit_occurrence', 'death')
+    :return: list of mapped CDM tables
+    """
+    tables_to_map = cdm.tables_to_map()
+    if cdm_table == eu_constants.FACT_RELATIONSHIP:
+        # fact_ids of measurements are mapped
+        return [common.MEASUREMENT]
+    if not bq_utils.has_primary_key(cdm_table):
+        # e.g. death
+        return []
+
+    result = []
+    if cdm_table in tables_to_map:
+        result.append(cdm_table)
+    field_names = [field['name'] for field in resources.fields_for(cdm_table)]
+    for table, foreign_key in [
+        (eu_constants.VISIT_OCCURRENCE, eu_constants.VISIT_OCCURRENCE_ID),
+        (eu_constants.CARE_SITE, eu_constants.CARE_SITE_ID),
+        (eu_constants.LOCATION, eu_constants.LOCATION_ID)
+    ]:
+        if table != cdm_table and table in tables_to_map and foreign_key in field_names:
+            result.append(table)
+    return result
+
+
+def _task_name(step, table):
+    return '{step}_{table}'.format(step=step, table=table)
+
+
+def _task(step, table, function, args, depends_on=()):
+    """
+    Describe a step of the union
+
+    :param step: name of the step, e.g. 'mapping'
+    :param table: the CDM table the step is run for
+    :param function: function running the step
+    :param args: arguments to call the function with
+    :param depends_on: names of the tasks which must finish before this one starts
+    :return: a dictionary describing the task
+    """
+    return {
+        eu_constants.STEP: step,
+        eu_constants.TABLE: table,
+        eu_constants.FUNCTION: function,
+        eu_constants.ARGS: args,
+        eu_constants.DEPENDS_ON: list(depends_on)
+    }
+
+
+def get_union_tasks(input_dataset_id, output_dataset_id, project_id, hpo_ids):
+    """
+    Get the task graph of the union
+
+    Output tables are created, mapping tables are loaded and each output table is loaded as soon as the
+    mapping tables it reads exist.  The person records are moved to observation once the person and
+    observation tables are loaded.
 
     :param input_dataset_id identifies a dataset containing multiple CDMs, one for each HPO submission
     :param output_dataset_id identifies the dataset to store the new CDM in
     :param project_id: project containing the datasets
-    :param hpo_ids: (optional) identifies HPOs to process, by default process all
-    :returns: list of tables generated successfully
+    :param hpo_ids: identifies HPOs to process
+    :return: an OrderedDict of task name => task, in the order the tasks are started when possible
     """
-    logging.info('EHR union started')
-    if hpo_ids is None:
-        hpo_ids = [item['hpo_id'] for item in bq_utils.get_hpo_info()]
+    tasks = OrderedDict()
+    for table in resources.CDM_TABLES:
+        tasks[_task_name(eu_constants.CREATE_STEP,
+                         table)] = _task(eu_constants.CREATE_STEP, table,
+                                         create_output_table,
+                                         (table, output_dataset_id))
+
+    for domain_table in cdm.tables_to_map() + [PERSON_TABLE]:
+        tasks[_task_name(eu_constants.MAPPING_STEP, domain_table)] = _task(
+            eu_constants.MAPPING_STEP, domain_table, mapping,
+            (domain_table, hpo_ids, input_dataset_id, output_dataset_id,
+             project_id))
 
-    # Create empty output tables to ensure proper schema, clustering, etc.
     for table in resources.CDM_TABLES:
-        result_table = output_table_for(table)
-        logging.info('Creating {dataset_id}.{table_id}...'.format(
-            dataset_id=output_dataset_id, table_id=result_table))
-        bq_utils.create_standard_table(table,
-                                       result_table,
-                                       drop_existing=True,
-                                       dataset_id=output_dataset_id)
-
-    # Create mapping tables
-    for domain_table in cdm.tables_to_map():
-        logging.info(
-            'Mapping {domain_table}...'.format(domain_table=domain_table))
-        mapping(domain_table, hpo_ids, input_dataset_id, output_dataset_id,
-                project_id)
+        depends_on = [_task_name(eu_constants.CREATE_STEP, table)] + [
+            _task_name(eu_constants.MAPPING_STEP, mapped_table)
+            for mapped_table in load_dependencies(table)
+        ]
+        tasks[_task_name(eu_constants.LOAD_STEP, table)] = _task(
+            eu_constants.LOAD_STEP, table, load,
+            (table, hpo_ids, input_dataset_id, output_dataset_id), depends_on)
+
+    # Map and move EHR person records into four rows in observation, one each for race, ethnicity, dob and gender
+    person_to_observation_mapping = _task_name(
+        eu_constants.PERSON_TO_OBSERVATION_MAPPING_STEP, OBSERVATION_TABLE)
+    tasks[person_to_observation_mapping] = _task(
+        eu_constants.PERSON_TO_OBSERVATION_MAPPING_STEP, OBSERVATION_TABLE,
+        map_ehr_person_to_observation, (output_dataset_id,), [
+            _task_name(eu_constants.MAPPING_STEP, PERSON_TABLE),
+            _task_name(eu_constants.MAPPING_STEP, OBSERVATION_TABLE),
+            _task_name(eu_constants.LOAD_STEP, PERSON_TABLE),
+            _task_name(eu_constants.LOAD_STEP, OBSERVATION_TABLE)
+        ])
+    tasks[_task_name(
+        eu_constants.PERSON_TO_OBSERVATION_STEP, OBSERVATION_TABLE)] = _task(
+            eu_constants.PERSON_TO_OBSERVATION_STEP, OBSERVATION_TABLE,
+            move_ehr_person_to_observation, (output_dataset_id,), [
+                _task_name(eu_constants.LOAD_STEP, PERSON_TABLE),
+                _task_name(eu_constants.LOAD_STEP, OBSERVATION_TABLE),
+                person_to_observation_mapping
+            ])
+    return tasks
+
+
+def create_output_table(table, output_dataset_id):
+    """
+    Create an empty output table to ensure proper schema, clustering, etc.
+
+    :param table: name of the CDM table
+    :param output_dataset_id: identifies the dataset to create the table in
+    """
+    result_table = output_table_for(table)
+    logging.info('Creating {dataset_id}.{table_id}...'.format(
+        dataset_id=output_dataset_id, table_id=result_table))
+    bq_utils.create_standard_table(table,
+                                   result_table,
+                                   drop_existing=True,
+                                   dataset_id=output_dataset_id)
+
+
+def _run_task(task):
+    """
+    Run a task of the union
+
+    :param task: the task to run
+    :return: a dictionary of the task's step, table and duration in seconds
+    """
+    start = time.time()
+    task[eu_constants.FUNCTION](*task[eu_constants.ARGS])
+    return {
+        eu_constants.STEP: task[eu_constants.STEP],
+        eu_constants.TABLE: task[eu_constants.TABLE],
+        eu_constants.SECONDS: time.time() - start
+    }
 
-    # Load all tables with union of submitted tables
-    for table_name in resources.CDM_TABLES:
+
+def run_tasks(tasks,
+              max_concurrent_jobs=eu_constants.DEFAULT_MAX_CONCURRENT_JOBS):
+    """
+    Run tasks concurrently, starting each one once the tasks it depends on have finished
+
+    No new task is started after a task fails.  The first error is raised once the running tasks
+    have finished.
+
+    :param tasks: an OrderedDict of task name => task
+    :param max_concurrent_jobs: maximum number of tasks running at the same time
+    :return: list of timings of the finished tasks, in the order they finished
+    :raises RuntimeError: if a task depends on a task which does not exist
+    """
+    for name, task in tasks.items():
+        unknown = set(task[eu_constants.DEPENDS_ON]) - set(tasks)
+        if unknown:
+            raise RuntimeError(
+                'Task {name} depends on unknown tasks {unknown}'.format(
+                    name=name, unknown=sorted(unknown)))
+
+    max_concurrent_jobs = max(1, max_concurrent_jobs)
+    remaining = OrderedDict((name, set(task[eu_constants.DEPENDS_ON]))
+                            for name, task in tasks.items())
+    running = dict()
+    timings = []
+    error = None
+    with ThreadPoolExecutor(max_workers=max_concurrent_jobs) as executor:
+        while True:
+            if error is None:
+                ready = [
+                    name for name, depends_on in remaining.items()
+                    if not depends_on
+                ]
+                for name in ready[:max_concurrent_jobs - len(running)]:
+                    del remaining[name]
+                    running[executor.submit(_run_task, tasks[name])] = name
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    timings.append(future.result())
+                except Exception as e:
+                    logging.exception(
+                        'Union task {name} failed'.format(name=name))
+                    error = error or e
+                    continue
+                for depends_on in remaining.values():
+                    depends_on.discard(name)
+
+    if error is not None:
+        raise error
+    if remaining:
+        raise RuntimeError('Union tasks {names} could not be run'.format(
+            names=list(remaining)))
+    return timings
+
+
+def get_timing_report(timings):
+    """
+    Get the seconds spent on each step for each table
+
+    :param timings: list of timings returned by run_tasks
+    :return: an OrderedDict of table => OrderedDict of step => seconds, slowest table first
+    """
+    report = dict()
+    for timing in timings:
+        steps = report.setdefault(timing[eu_constants.TABLE], OrderedDict())
+        steps[timing[eu_constants.STEP]] = timing[eu_constants.SECONDS]
+    return OrderedDict(
+        sorted(report.items(),
+               key=lambda item: sum(item[1].values()),
+               reverse=True))
+
+
+def log_timing_report(report):
+    """
+    Log the seconds spent on each step for each table
+
+    :param report: report returned by get_timing_report
+    """
+    lines = []
+    for table, steps in report.items():
+        step_times = ', '.join(
+            '{step} {seconds:.1f}s'.format(step=step, seconds=seconds)
+            for step, seconds in steps.items())
+        lines.append('{table}: {step_times}'.format(table=table,
+                                                    step_times=step_times))
+    logging.info('EHR union timings per table:\n' + '\n'.join(lines))
+
+
+def _hpo_ids_expr(hpo_ids):
+    """
+    Get a SQL list of HPO identifiers
+
+    :param hpo_ids: list of HPO identifiers
+    :return: the quoted identifiers separated by commas
+    """
+    return ', '.join(
+        "'{hpo_id}'".format(hpo_id=hpo_id) for hpo_id in sorted(hpo_ids))
+
+
+def get_tables_last_modified(dataset_id, project_id):
+    """
+    Get the time each table of a dataset was last modified
+
+    :param dataset_id: identifies the dataset
+    :param project_id: identifies the GCP project containing the dataset
+    :return: a dictionary mapping table_id => milliseconds since the epoch
+    """
+    q = eu_constants.TABLES_LAST_MODIFIED_QUERY.format(project_id=project_id,
+                                                       dataset_id=dataset_id)
+    rows = bq_utils.large_response_to_rowlist(bq_utils.query(q))
+    return {
+        row['table_id']: row[eu_constants.LAST_MODIFIED_TIME] for row in rows
+    }
+
+
+def get_submission_times(tables_last_modified, hpo_ids):
+    """
+    Identify the submission of each HPO by the time its CDM tables were last loaded
+
+    :param tables_last_modified: dictionary returned by get_tables_last_modified for the input dataset
+    :param hpo_ids: identifies the HPOs
+    :return: a dictionary mapping hpo_id => most recent modification time of its tables, or None if it has none
+    """
+    result = dict()
+    for hpo_id in hpo_ids:
+        times = [
+            tables_last_modified[bq_utils.get_table_id(hpo_id, table)]
+            for table in resources.CDM_TABLES
+            if bq_utils.get_table_id(hpo_id, table) in tables_last_modified
+        ]
+        result[hpo_id] = max(times) if times else None
+    return result
+
+
+def get_union_metadata(output_dataset_id, project_id):
+    """
+    Get the submissions included in the unioned dataset
+
+    :param output_dataset_id: identifies the unioned dataset
+    :param project_id: identifies the GCP project containing the dataset
+    :return: a dictionary mapping hpo_id => dictionary with the hpo_offset and last_modified_time of the
+        unioned submission, or None if the dataset was not unioned incrementally before
+    """
+    if not bq_utils.table_exists(eu_constants.UNION_METADATA_TABLE,
+                                 output_dataset_id):
+        return None
+    q = eu_constants.UNION_METADATA_QUERY.format(
+        project_id=project_id,
+        dataset_id=output_dataset_id,
+        metadata_table=eu_constants.UNION_METADATA_TABLE)
+    rows = bq_utils.large_response_to_rowlist(bq_utils.query(q))
+    return {row[eu_constants.HPO_ID]: row for row in rows}
+
+
+def save_union_metadata(output_dataset_id, hpo_offsets, submission_times):
+    """
+    Record the submissions included in the unioned dataset
+
+    :param output_dataset_id: identifies the unioned dataset
+    :param hpo_offsets: dictionary mapping hpo_id => numeric offset
+    :param submission_times: dictionary returned by get_submission_times
+    """
+    rows = []
+    for hpo_id, hpo_offset in hpo_offsets.items():
+        last_modified_time = submission_times.get(hpo_id)
+        rows.append("('{hpo_id}', {hpo_offset}, {last_modified_time})".format(
+            hpo_id=hpo_id,
+            hpo_offset=hpo_offset,
+            last_modified_time='NULL'
+            if last_modified_time is None else last_modified_time))
+    q = eu_constants.SAVE_UNION_METADATA_QUERY.format(rows=',\n  '.join(rows))
+    query(q, eu_constants.UNION_METADATA_TABLE, output_dataset_id,
+          'WRITE_TRUNCATE')
+
+
+def drop_union_metadata(output_dataset_id):
+    """
+    Forget the submissions included in the unioned dataset
+
+    The next incremental union then unions all HPOs.
+
+    :param output_dataset_id: identifies the unioned dataset
+    """
+    if bq_utils.table_exists(eu_constants.UNION_METADATA_TABLE,
+                             output_dataset_id):
+        bq_utils.delete_table(eu_constants.UNION_METADATA_TABLE,
+                              output_dataset_id)
+
+
+def get_changed_hpo_ids(metadata, hpo_offsets, submission_times):
+    """
+    Identify the HPOs whose slices of the unioned dataset must be replaced
+
+    :param metadata: dictionary returned by get_union_metadata
+    :param hpo_offsets: dictionary mapping hpo_id => numeric offset for the HPOs to union
+    :param submission_times: dictionary returned by get_submission_times
+    :return: list of HPOs that submitted since they were unioned, are new or are no longer unioned,
+        or None if the ids of already unioned HPOs would change, which requires a full union
+    """
+    changed = []
+    for hpo_id, hpo_offset in hpo_offsets.items():
+        unioned = metadata.get(hpo_id)
+        if unioned is None:
+            changed.append(hpo_id)
+        elif unioned[eu_constants.HPO_OFFSET] != hpo_offset:
+            return None
+        elif unioned[eu_constants.LAST_MODIFIED_TIME] != submission_times.get(
+                hpo_id):
+            changed.append(hpo_id)
+    changed.extend(hpo_id for hpo_id in metadata if hpo_id not in hpo_offsets)
+    return changed
+
+
+def remove_hpo_slice(table_name, hpo_ids, output_dataset_id, project_id):
+    """
+    Delete the records of HPOs from a mapped output table and its mapping table
+
+    :param table_name: name of a CDM table whose ids are mapped
+    :param hpo_ids: identifies the HPOs whose records are deleted
+    :param output_dataset_id: identifies the unioned dataset
+    :param project_id: identifies the GCP project containing the dataset
+    """
+    params = dict(project_id=project_id,
+                  dataset_id=output_dataset_id,
+                  table_name=table_name,
+                  output_table=output_table_for(table_name),
+                  mapping_table=mapping_table_for(table_name),
+                  hpo_ids=_hpo_ids_expr(hpo_ids))
+    # records are found through the mapping table, so it is cleared last
+    for q in [
+            eu_constants.REMOVE_OUTPUT_SLICE_QUERY.format(**params),
+            eu_constants.REMOVE_MAPPING_SLICE_QUERY.format(**params)
+    ]:
         logging.info(
-            'Creating union of table {table}...'.format(table=table_name))
-        load(table_name, hpo_ids, input_dataset_id, output_dataset_id)
+            'Removing {hpo_ids} from {table_name}. Query is {q}'.format(
+                hpo_ids=hpo_ids, table_name=table_name, q=q))
+        query_job_id = bq_utils.query(q)['jobReference']['jobId']
+        incomplete_jobs = bq_utils.wait_on_jobs([query_job_id])
+        if incomplete_jobs:
+            raise bq_utils.BigQueryJobWaitError(incomplete_jobs)
+        is_errored, error = bq_utils.job_status_errored(query_job_id)
+        if is_errored:
+            raise bq_utils.InvalidOperationError(
+                'Job {job_id} failed: {error}'.format(job_id=query_job_id,
+                                                      error=error))
+
+
+def get_incremental_union_tasks(input_dataset_id, output_dataset_id, project_id,
+                                hpo_ids, changed_hpo_ids, tables_last_modified):
+    """
+    Get the task graph replacing the slices of changed HPOs in the unioned dataset
+
+    Records of mapped tables are identified by their mapping table, so only the slices of the changed
+    HPOs are removed, remapped and reloaded.  Output tables whose records cannot be traced back to
+    an HPO (e.g. person, death, fact_relationship) are rebuilt from all HPOs, as is _mapping_person.
+
+    :param input_dataset_id identifies a dataset containing multiple CDMs, one for each HPO submission
+    :param output_dataset_id identifies the unioned dataset
+    :param project_id: project containing the datasets
+    :param hpo_ids: identifies all HPOs to union
+    :param changed_hpo_ids: identifies the HPOs whose slices are replaced
+    :param tables_last_modified: dictionary returned by get_tables_last_modified for the input dataset
+    :return: an OrderedDict of task name => task
+    """
+    hpo_offsets = get_hpo_offsets(hpo_ids)
+    submitted_hpo_ids = [
+        hpo_id for hpo_id in changed_hpo_ids if hpo_id in hpo_offsets
+    ]
+    tables_to_map = cdm.tables_to_map()
+    tasks = OrderedDict()
+
+    for table in resources.CDM_TABLES:
+        if table not in tables_to_map:
+            tasks[_task_name(eu_constants.CREATE_STEP,
+                             table)] = _task(eu_constants.CREATE_STEP, table,
+                                             create_output_table,
+                                             (table, output_dataset_id))
+
+    for domain_table in tables_to_map:
+        remove_task = _task_name(eu_constants.REMOVE_STEP, domain_table)
+        tasks[remove_task] = _task(
+            eu_constants.REMOVE_STEP, domain_table, remove_hpo_slice,
+            (domain_table, changed_hpo_ids, output_dataset_id, project_id))
+        # Only HPOs which submitted the table are mapped, since an empty union is not a valid query
+        table_hpo_ids = [
+            hpo_id for hpo_id in submitted_hpo_ids if bq_utils.get_table_id(
+                hpo_id, domain_table) in tables_last_modified
+        ]
+        if table_hpo_ids:
+            tasks[_task_name(eu_constants.MAPPING_STEP, domain_table)] = _task(
+                eu_constants.MAPPING_STEP, domain_table,
+                partial(mapping,
+                        write_disposition='WRITE_APPEND',
+                        hpo_offsets=hpo_offsets),
+                (domain_table, table_hpo_ids, input_dataset_id,
+                 output_dataset_id, project_id), [remove_task])
+    tasks[_task_name(eu_constants.MAPPING_STEP, PERSON_TABLE)] = _task(
+        eu_constants.MAPPING_STEP, PERSON_TABLE, mapping,
+        (PERSON_TABLE, hpo_ids, input_dataset_id, output_dataset_id,
+         project_id))
 
+    for table in resources.CDM_TABLES:
+        if table in tables_to_map:
+            load_hpo_ids = [
+                hpo_id for hpo_id in submitted_hpo_ids
+                if bq_utils.get_table_id(hpo_id, table) in tables_last_modified
+            ]
+            depends_on = [_task_name(eu_constants.REMOVE_STEP, table)]
+        else:
+            load_hpo_ids = hpo_ids
+            depends_on = [_task_name(eu_constants.CREATE_STEP, table)]
+        if not load_hpo_ids:
+            continue
+        for mapped_table in load_dependencies(table):
+            depends_on.append(_task_name(eu_constants.REMOVE_STEP,
+                                         mapped_table))
+            mapping_task = _task_name(eu_constants.MAPPING_STEP, mapped_table)
+            if mapping_task in tasks:
+                depends_on.append(mapping_task)
+        tasks[_task_name(eu_constants.LOAD_STEP, table)] = _task(
+            eu_constants.LOAD_STEP, table, load,
+            (table, load_hpo_ids, input_dataset_id, output_dataset_id),
+            depends_on)
+
+    # Person records of the changed HPOs are mapped to them, the others are already mapped.
+    # Removing a slice removes the observations of its persons for every HPO which submitted
+    # them, so each person whose observations are missing is moved again.
+    observation_tasks = [
+        _task_name(step, OBSERVATION_TABLE) for step in [
+            eu_constants.REMOVE_STEP, eu_constants.MAPPING_STEP,
+            eu_constants.LOAD_STEP
+        ]
+    ]
+    observation_tasks = [name for name in observation_tasks if name in tasks]
+    person_tasks = [
+        _task_name(eu_constants.MAPPING_STEP, PERSON_TABLE),
+        _task_name(eu_constants.LOAD_STEP, PERSON_TABLE)
+    ]
+    person_tasks = [name for name in person_tasks if name in tasks]
+    move_depends_on = person_tasks + observation_tasks
+    if submitted_hpo_ids:
+        person_to_observation_mapping = _task_name(
+            eu_constants.PERSON_TO_OBSERVATION_MAPPING_STEP, OBSERVATION_TABLE)
+        tasks[person_to_observation_mapping] = _task(
+            eu_constants.PERSON_TO_OBSERVATION_MAPPING_STEP, OBSERVATION_TABLE,
+            map_ehr_person_to_observation,
+            (output_dataset_id, submitted_hpo_ids),
+            person_tasks + observation_tasks)
+        move_depends_on.append(person_to_observation_mapping)
+    tasks[_task_name(eu_constants.PERSON_TO_OBSERVATION_STEP,
+                     OBSERVATION_TABLE)] = _task(
+                         eu_constants.PERSON_TO_OBSERVATION_STEP,
+                         OBSERVATION_TABLE,
+                         partial(move_ehr_person_to_observation,
+                                 missing_only=True), (output_dataset_id,),
+                         move_depends_on)
+    return tasks
+
+
+def _run_union(tasks, max_concurrent_jobs):
+    """
+    Run the tasks of a union and report their timings
+
+    :param tasks: an OrderedDict of task name => task
+    :param max_concurrent_jobs: maximum number of union jobs running at the same time
+    :return: the timing report of the union, see get_timing_report
+    """
+    timings = run_tasks(tasks, max_concurrent_jobs)
     logging.info('Creation of Unioned EHR complete')
+    report = get_timing_report(timings)
+    log_timing_report(report)
+    return report
 
-    # create person mapping table
-    domain_table = PERSON_TABLE
-    logging.info('Mapping {domain_table}...'.format(domain_table=domain_table))
-    mapping(domain_table, hpo_ids, input_dataset_id, output_dataset_id,
-            project_id)
 
-    logging.info('Starting process for Person to Observation')
-    # Map and move EHR person records into four rows in observation, one each for race, ethnicity, dob and gender
-    map_ehr_person_to_observation(output_dataset_id)
-    move_ehr_person_to_observation(output_dataset_id)
+def incremental_union(
+    input_dataset_id,
+    output_dataset_id,
+    project_id,
+    hpo_ids,
+    max_concurrent_jobs=eu_constants.DEFAULT_MAX_CONCURRENT_JOBS):
+    """
+    Update the unioned dataset with the submissions received since it was last unioned
 
-    logging.info('Completed Person to Observation')
+    The submission unioned for each HPO is recorded in the _ehr_union_metadata table of the output dataset.
+    Only the slices of HPOs whose submission changed are replaced.  The whole dataset is unioned if it was
+    not unioned incrementally before, if an output table is missing, or if the ids of already unioned HPOs
+    would change, e.g. when an HPO is no longer unioned.
+
+    :param input_dataset_id identifies a dataset containing multiple CDMs, one for each HPO submission
+    :param output_dataset_id identifies the dataset to store the new CDM in
+    :param project_id: project containing the datasets
+    :param hpo_ids: identifies HPOs to process
+    :param max_concurrent_jobs: maximum number of union jobs running at the same time
+    :returns: the timing report of the union, see get_timing_report
+    """
+    hpo_offsets = get_hpo_offsets(hpo_ids)
+    tables_last_modified = get_tables_last_modified(input_dataset_id,
+                                                    project_id)
+    submission_times = get_submission_times(tables_last_modified, hpo_ids)
+
+    metadata = get_union_metadata(output_dataset_id, project_id)
+    changed_hpo_ids = None
+    if metadata is not None:
+        output_tables = set(bq_utils.list_all_table_ids(output_dataset_id))
+        expected_tables = [
+            output_table_for(table) for table in resources.CDM_TABLES
+        ] + [mapping_table_for(table) for table in cdm.tables_to_map()]
+        if output_tables.issuperset(expected_tables):
+            changed_hpo_ids = get_changed_hpo_ids(metadata, hpo_offsets,
+                                                  submission_times)
+
+    if changed_hpo_ids is None:
+        logging.info('Unioning all HPOs')
+        tasks = get_union_tasks(input_dataset_id, output_dataset_id, project_id,
+                                hpo_ids)
+    elif not changed_hpo_ids:
+        logging.info('No submissions since the last union')
+        return OrderedDict()
+    else:
+        logging.info(
+            'Replacing the unioned records of {changed_hpo_ids}'.format(
+                changed_hpo_ids=changed_hpo_ids))
+        tasks = get_incremental_union_tasks(input_dataset_id, output_dataset_id,
+                                            project_id, hpo_ids,
+                                            changed_hpo_ids,
+                                            tables_last_modified)
+    report = _run_union(tasks, max_concurrent_jobs)
+    save_union_metadata(output_dataset_id, hpo_offsets, submission_times)
+    return report
+
+
+def main(input_dataset_id,
+         output_dataset_id,
+         project_id,
+         hpo_ids=None,
+         max_concurrent_jobs=eu_constants.DEFAULT_MAX_CONCURRENT_JOBS,
+         incremental=False):
+    """
+    Create a new CDM which is the union of all EHR datasets submitted by HPOs
+
+    :param input_dataset_id identifies a dataset containing multiple CDMs, one for each HPO submission
+    :param output_dataset_id identifies the dataset to store the new CDM in
+    :param project_id: project containing the datasets
+    :param hpo_ids: (optional) identifies HPOs to process, by default process all
+    :param max_concurrent_jobs: maximum number of union jobs running at the same time
+    :param incremental: only replace the records of HPOs which submitted since the last
+        incremental union, see incremental_union.  Otherwise the record of the last incremental
+        union is dropped, so the next incremental union unions all HPOs.
+    :returns: the timing report of the union, see get_timing_report
+    """
+    logging.info('EHR union started')
+    if hpo_ids is None:
+        hpo_ids = [item['hpo_id'] for item in bq_utils.get_hpo_info()]
+
+    if incremental:
+        return incremental_union(input_dataset_id, output_dataset_id,
+                                 project_id, hpo_ids, max_concurrent_jobs)
+
+    # the output tables no longer match the recorded submissions
+    drop_union_metadata(output_dataset_id)
+    tasks = get_union_tasks(input_dataset_id, output_dataset_id, project_id,
+                            hpo_ids)
+    return _run_union(tasks, max_concurrent_jobs)
 
 
 if __name__ == '__main__':
@@ -788,6 +1421,22 @@ if __name__ == '__main__':
     parser.add_argument('-hpo_id',
                         nargs='+',
                         help='HPOs to process (all by default)')
+    parser.add_argument(
+        '-j',
+        '--max_concurrent_jobs',
+        type=int,
+        default=eu_constants.DEFAULT_MAX_CONCURRENT_JOBS,
+        help='Maximum number of union jobs running at the same time')
+    parser.add_argument(
+        '-i',
+        '--incremental',
+        action='store_true',
+        help='Only replace the records of HPOs which submitted since the last '
+        'incremental union')
     args = parser.parse_args()
     if args.input_dataset_id:
-        main(args.input_dataset_id, args.output_dataset_id, args.project_id)
+        main(args.input_dataset_id,
+             args.output_dataset_id,
+             args.project_id,
+             max_concurrent_jobs=args.max_concurrent_jobs,
+             incremental=args.incremental)
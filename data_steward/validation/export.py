@@ -1,14 +1,20 @@
+import logging
 import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from glob import glob
 from io import open
 
 import bq_utils
 import resources
+from utils import bq_columns
 
 EXPORT_PATH = os.path.join(resources.resource_files_path, 'export')
 RESULTS_SCHEMA_PLACEHOLDER = '@results_database_schema.'
 VOCAB_SCHEMA_PLACEHOLDER = '@vocab_database_schema.'
 UNIONED_EHR = 'unioned_ehr'
+DEFAULT_MAX_WORKERS = 8
+CONVERTED_TYPES = [bq_columns.INTEGER, bq_columns.FLOAT]
 
 
 def list_files(base_path):
@@ -52,57 +58,161 @@ def is_hpo_id(hpo_id):
     return hpo_id in [item['hpo_id'] for item in bq_utils.get_hpo_info()]
 
 
-# TODO Make this function more generic.
-def export_from_path(p, datasource_id):
+def get_export_datasource_id(datasource_id):
     """
-    Export results
-    :param p: path to SQL file
+    Get the identifier used to qualify the tables queried by the export
+
     :param datasource_id: HPO or aggregate dataset to run export for
-    :return: `dict` structured for report render
+    :return: datasource_id if it identifies an HPO or the unioned EHR, None otherwise
     """
-    result = dict()
     if not is_hpo_id(datasource_id) and datasource_id != UNIONED_EHR:
-        datasource_id = None
-    for f in list_files_only(p):
-        name = f[0:-4].upper()
+        return None
+    return datasource_id
+
+
+def list_export_queries(p, datasource_id, keys=()):
+    """
+    Gather the rendered queries of the SQL files in a report folder and its subfolders
+
+    :param p: path to the report folder
+    :param datasource_id: identifier returned by get_export_datasource_id
+    :param keys: keys of the folder in the report payload
+    :return: list of (keys, path, sql) tuples where keys locate the query's payload in the report,
+        the SQL files of a folder come before its subfolders
+    """
+    queries = []
+    for f in sorted(list_files_only(p)):
         abs_path = os.path.join(p, f)
         with open(abs_path, 'r') as fp:
-            sql = fp.read()
-            sql = render(sql,
+            sql = render(fp.read(),
                          datasource_id,
                          results_schema=bq_utils.get_dataset_id(),
                          vocab_schema='')
-            query_result = bq_utils.query(sql)
-            # TODO reshape results
-            result[name] = query_result_to_payload(query_result)
-
-    for d in list_dirs_only(p):
-        abs_path = os.path.join(p, d)
-        name = d.upper()
-        # recursive call
-        dir_result = export_from_path(abs_path, datasource_id)
-        if name in result:
-            # a sql file generated the item already
-            result[name].update(dir_result)
-        else:
-            # add the item
-            result[name] = dir_result
+        queries.append((keys + (f[0:-4].upper(),), abs_path, sql))
+
+    for d in sorted(list_dirs_only(p)):
+        queries.extend(
+            list_export_queries(os.path.join(p, d), datasource_id,
+                                keys + (d.upper(),)))
+    return queries
+
+
+def add_payload(report, keys, payload):
+    """
+    Add the payload of a query to a report
+
+    A folder and a SQL file of the same name share an item, the folder's items
+    take precedence as they did when the export walked the folders in order.
+
+    :param report: `dict` structured for report render
+    :param keys: keys locating the payload in the report
+    :param payload: the result of query_result_to_payload
+    :return: None
+    """
+    item = report
+    for key in keys[:-1]:
+        item = item.setdefault(key, dict())
+    name = keys[-1]
+    if isinstance(item.get(name), dict):
+        # items of a folder of the same name arrived first
+        payload.update(item[name])
+    item[name] = payload
+
+
+def _run_export_query(keys, sql):
+    # TODO reshape results
+    return keys, query_result_to_payload(bq_utils.query(sql))
+
+
+def iter_reports(export_names, datasource_id, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Run the queries of several reports concurrently and yield each report once its queries finish
+
+    :param export_names: names of the report folders in EXPORT_PATH
+    :param datasource_id: HPO or aggregate dataset to run export for
+    :param max_workers: maximum number of queries running at the same time
+    :return: generator of (export_name, `dict` structured for report render) in the order the
+        reports are completed
+    """
+    datasource_id = get_export_datasource_id(datasource_id)
+    reports = OrderedDict()
+    pending = dict()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = dict()
+        for export_name in export_names:
+            reports[export_name] = dict()
+            queries = list_export_queries(
+                os.path.join(EXPORT_PATH, export_name), datasource_id)
+            pending[export_name] = len(queries)
+            for keys, _, sql in queries:
+                future = executor.submit(_run_export_query, keys, sql)
+                futures[future] = export_name
+
+        for export_name in export_names:
+            if not pending[export_name]:
+                yield export_name, reports[export_name]
+
+        for future in as_completed(futures):
+            export_name = futures[future]
+            keys, payload = future.result()
+            add_payload(reports[export_name], keys, payload)
+            pending[export_name] -= 1
+            if not pending[export_name]:
+                logging.info(f"Finished export queries of {export_name}")
+                yield export_name, reports[export_name]
+
+
+# TODO Make this function more generic.
+def export_from_path(p, datasource_id, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Export results
+    :param p: path to SQL file
+    :param datasource_id: HPO or aggregate dataset to run export for
+    :param max_workers: maximum number of queries running at the same time
+    :return: `dict` structured for report render
+    """
+    result = dict()
+    queries = list_export_queries(p, get_export_datasource_id(datasource_id))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_run_export_query, keys, sql)
+            for keys, _, sql in queries
+        ]
+        for future in as_completed(futures):
+            keys, payload = future.result()
+            add_payload(result, keys, payload)
     return result
 
 
-def convert_value(value, tpe):
+def plan_export(export_names, datasource_id, max_workers=DEFAULT_MAX_WORKERS):
     """
-    Cast to specified type
-    :param value: value to cast
-    :param tpe: name of the type as returned by bq
-    :return: casted value or the input value if it is falsey
+    List the queries of several reports with the bytes they would process, without running them
+
+    :param export_names: names of the report folders in EXPORT_PATH
+    :param datasource_id: HPO or aggregate dataset to run export for
+    :param max_workers: maximum number of dry runs at the same time
+    :return: list of dicts with keys report, path and total_bytes_processed, in the order of
+        the reports and their queries
     """
-    if value:
-        if tpe == 'INTEGER':
-            return int(value)
-        if tpe == 'FLOAT':
-            return float(value)
-    return value
+    datasource_id = get_export_datasource_id(datasource_id)
+    plan = []
+    for export_name in export_names:
+        for _, path, sql in list_export_queries(
+                os.path.join(EXPORT_PATH, export_name), datasource_id):
+            plan.append(dict(report=export_name, path=path, sql=sql))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        responses = executor.map(
+            lambda query: bq_utils.query(query['sql'], dry_run=True), plan)
+        for query, response in zip(plan, responses):
+            query.pop('sql')
+            query['total_bytes_processed'] = int(
+                response.get('totalBytesProcessed', 0))
+
+    total_bytes = sum(query['total_bytes_processed'] for query in plan)
+    logging.info(f"Export of {len(plan)} queries would process "
+                 f"{total_bytes} bytes")
+    return plan
 
 
 def query_result_to_payload(qr):
@@ -113,14 +223,16 @@ def query_result_to_payload(qr):
     """
     result = dict()
     rows = qr['rows'] if int(qr['totalRows']) > 0 else []
-    fields = qr['schema']['fields']
-    field_count = len(fields)
-    for i in range(0, field_count):
-        field = fields[i]
-        key = field['name'].upper()
-        tpe = field['type'].upper()
-        values = [convert_value(r['f'][i]['v'], tpe) for r in rows]
+    # only numbers are converted, other values are reported as returned
+    fields = [
+        dict(field, type=field['type'].upper()) if
+        field['type'].upper() in CONVERTED_TYPES else dict(field, type='STRING')
+        for field in qr['schema']['fields']
+    ]
+    columns = bq_columns.decode_rows(rows, fields)
+    for name, column in columns.items():
+        values = bq_columns.column_to_list(column)
         # according to AchillesWeb rjson serializes dataframes with 1 row as single element properties
         # see https://github.com/OHDSI/AchillesWeb/blob/master/js/app/common.js#L134
-        result[key] = values[0] if len(values) == 1 else values
+        result[name.upper()] = values[0] if len(values) == 1 else values
     return result
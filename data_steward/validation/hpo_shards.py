@@ -0,0 +1,100 @@
+"""
+Split the hpo sites validated on a schedule into shards.
+
+When validating every site exceeds the validation interval, the sites are split
+into shards, each scheduled by its own cron entry.  The entries are staggered so
+a single shard runs at a time and at most VALIDATION_HPO_WORKERS sites are
+validated at once.
+
+Shard membership is derived from the live list of hpo_ids and the number of
+shards scheduled in the cron file, so sites added after the cron file was
+generated still belong to a scheduled shard.
+"""
+# Python imports
+import os
+
+# Project imports
+from constants.validation import main as consts
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def get_hpo_workers():
+    """
+    Get the maximum number of hpo sites to validate at once
+
+    Each site runs its own BigQuery jobs, so this caps concurrent usage of quota.
+
+    :return: value of the VALIDATION_HPO_WORKERS environment variable if set,
+        otherwise the default
+    """
+    return int(
+        os.environ.get(consts.HPO_WORKERS_ENV, consts.DEFAULT_HPO_WORKERS))
+
+
+def get_num_shards(num_hpos,
+                   max_workers,
+                   hpo_seconds=consts.ESTIMATED_HPO_SECONDS,
+                   shard_seconds=consts.VALIDATION_INTERVAL_SECONDS):
+    """
+    Get the number of shards needed to validate each shard within its time slot
+
+    :param num_hpos: number of hpo sites to validate
+    :param max_workers: number of sites validated at once
+    :param hpo_seconds: estimated time to validate a single site
+    :param shard_seconds: time slot of a single shard
+    :return: the number of shards, at least 1
+    """
+    rounds_per_shard = max(1, shard_seconds // hpo_seconds)
+    shard_size = max_workers * rounds_per_shard
+    return max(1, -(-num_hpos // shard_size))
+
+
+def get_hpo_shards(hpo_ids, num_shards):
+    """
+    Split hpo_ids into contiguous shards of nearly equal size
+
+    Every hpo_id belongs to one of the shards, however many there are.
+
+    :param hpo_ids: identifies the hpo sites to validate
+    :param num_shards: number of shards scheduled
+    :return: list of num_shards lists of hpo_ids, in sorted order
+    """
+    hpo_ids = sorted(hpo_ids)
+    shard_size, remainder = divmod(len(hpo_ids), num_shards)
+    shards = []
+    start = 0
+    for shard_index in range(num_shards):
+        # the first shards take one of the remaining sites each
+        end = start + shard_size + (1 if shard_index < remainder else 0)
+        shards.append(hpo_ids[start:end])
+        start = end
+    return shards
+
+
+def get_shard_schedules(num_shards,
+                        shard_seconds=consts.VALIDATION_INTERVAL_SECONDS):
+    """
+    Get staggered cron schedules so the shards run one after another
+
+    Each shard starts in its own time slot and repeats once every shard had
+    its slot.
+
+    :param num_shards: number of shards scheduled
+    :param shard_seconds: time slot of a single shard
+    :return: list of cron schedule descriptions, one per shard
+    :raises ValueError: if the slots of all shards do not fit in a day
+    """
+    slot_minutes = shard_seconds // 60
+    cycle_minutes = num_shards * slot_minutes
+    if cycle_minutes > MINUTES_PER_DAY:
+        raise ValueError(
+            f"{num_shards} shards of {slot_minutes} minutes do not fit in a "
+            f"day. Increase {consts.HPO_WORKERS_ENV} to use fewer shards.")
+
+    schedules = []
+    for shard_index in range(num_shards):
+        hours, minutes = divmod(shard_index * slot_minutes, 60)
+        schedules.append(f"every {cycle_minutes} minutes from "
+                         f"{hours:02}:{minutes:02} to 23:59")
+    return schedules
@@ -11,6 +11,8 @@ import json
 import logging
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from io import StringIO, open
 
 # Third party imports
@@ -29,9 +31,14 @@ import resources
 from common import ACHILLES_EXPORT_PREFIX_STRING, ACHILLES_EXPORT_DATASOURCES_JSON
 from constants.validation import hpo_report as report_consts
 from constants.validation import main as consts
-from curation_logging.curation_gae_handler import begin_request_logging, end_request_logging, initialize_logging
+from curation_logging.curation_gae_handler import (begin_request_logging,
+                                                   end_request_logging,
+                                                   flush_thread_logs,
+                                                   initialize_logging)
 from retraction import retract_data_bq, retract_data_gcs
-from validation import achilles, achilles_heel, ehr_union, export, hpo_report
+from utils import service_cache
+from validation import (achilles, achilles_heel, ehr_union, export, hpo_report,
+                        hpo_shards)
 from validation.app_errors import (errors_blueprint, InternalValidationError,
                                    BucketDoesNotExistError)
 from validation.metrics import completeness, required_labs
@@ -82,16 +89,37 @@ def save_datasources_json(datasource_id=None,
     return result
 
 
-def run_export(datasource_id=None, folder_prefix="", target_bucket=None):
+def _upload_report(target_bucket, report_path, report):
+    """
+    Upload the JSON payload of a report
+
+    :param target_bucket: bucket to save the report to
+    :param report_path: path of the JSON file in the bucket
+    :param report: `dict` structured for report render
+    :return: metadata of the uploaded object
+    """
+    fp = StringIO(json.dumps(report))
+    return gcs_utils.upload_object(target_bucket, report_path, fp)
+
+
+def run_export(datasource_id=None,
+               folder_prefix="",
+               target_bucket=None,
+               max_workers=export.DEFAULT_MAX_WORKERS,
+               plan=False):
     """
     Run export queries for an HPO and store JSON payloads in specified folder in (optional) target bucket
 
+    The queries of all reports run concurrently and each report is uploaded as soon as its
+    queries have finished.
+
     :type datasource_id: ID of the HPO or aggregate dataset to run export for. This is the data source name in the report.
     :param folder_prefix: Relative base path to store report. empty by default.
     :param target_bucket: Bucket to save report. If None, use bucket associated with hpo_id.
+    :param max_workers: maximum number of queries or uploads running at the same time
+    :param plan: if True, only list the export queries with the bytes they would process
+    :return: list of uploaded objects' metadata, or the export plan if plan is True
     """
-    results = []
-
     # Using separate var rather than hpo_id here because hpo_id None needed in calls below
     if datasource_id is None and target_bucket is None:
         raise RuntimeError(
@@ -101,24 +129,31 @@ def run_export(datasource_id=None, folder_prefix="", target_bucket=None):
         if target_bucket is None:
             target_bucket = gcs_utils.get_hpo_bucket(datasource_id)
 
+    if plan:
+        return export.plan_export(common.ALL_REPORTS, datasource_id,
+                                  max_workers)
+
     logging.info(
         f"Exporting {datasource_name} report to bucket {target_bucket}")
 
     # Run export queries and store json payloads in specified folder in the target bucket
     reports_prefix = folder_prefix + ACHILLES_EXPORT_PREFIX_STRING + datasource_name + '/'
-    for export_name in common.ALL_REPORTS:
-        sql_path = os.path.join(export.EXPORT_PATH, export_name)
-        result = export.export_from_path(sql_path, datasource_id)
-        content = json.dumps(result)
-        fp = StringIO(content)
-        result = gcs_utils.upload_object(target_bucket,
-                                         reports_prefix + export_name + '.json',
-                                         fp)
-        results.append(result)
-    result = save_datasources_json(datasource_id=datasource_id,
-                                   folder_prefix=folder_prefix,
-                                   target_bucket=target_bucket)
-    results.append(result)
+    uploads = dict()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for export_name, report in export.iter_reports(common.ALL_REPORTS,
+                                                       datasource_id,
+                                                       max_workers):
+            uploads[export_name] = executor.submit(
+                _upload_report, target_bucket,
+                reports_prefix + export_name + '.json', report)
+        datasources_upload = executor.submit(save_datasources_json,
+                                             datasource_id=datasource_id,
+                                             folder_prefix=folder_prefix,
+                                             target_bucket=target_bucket)
+        results = [
+            uploads[export_name].result() for export_name in common.ALL_REPORTS
+        ]
+        results.append(datasources_upload.result())
     return results
 
 
@@ -187,12 +222,98 @@ def validate_all_hpos():
     """
     validation end point for all hpo_ids
     """
-    for item in bq_utils.get_hpo_info():
-        hpo_id = item['hpo_id']
-        process_hpo(hpo_id)
+    hpo_ids = [item['hpo_id'] for item in bq_utils.get_hpo_info()]
+    max_workers = hpo_shards.get_hpo_workers()
+    num_shards = hpo_shards.get_num_shards(len(hpo_ids), max_workers)
+    if num_shards > 1:
+        logging.warning(
+            f"Validating {len(hpo_ids)} hpo_ids is estimated to exceed "
+            f"{consts.VALIDATION_INTERVAL_SECONDS} seconds. Consider "
+            f"scheduling {num_shards} shards separately via "
+            f"{consts.PREFIX}ValidateHpoShard/<shard_index>/<num_shards>")
+    process_hpos(hpo_ids, max_workers)
     return 'validation done!'
 
 
+@api_util.auth_required_cron
+def validate_hpo_shard(shard_index, num_shards):
+    """
+    validation end point for one of num_shards shards of hpo_ids
+    """
+    hpo_ids = [item['hpo_id'] for item in bq_utils.get_hpo_info()]
+    if shard_index >= num_shards:
+        raise InternalValidationError(
+            f"Shard {shard_index} does not exist, there are {num_shards} shards"
+        )
+    shard = hpo_shards.get_hpo_shards(hpo_ids, num_shards)[shard_index]
+    process_hpos(shard, hpo_shards.get_hpo_workers())
+    return 'validation done!'
+
+
+def _timed_process_hpo(hpo_id):
+    """
+    Run process_hpo and isolate any errors from other sites
+
+    :param hpo_id: which hpo_id to run for
+    :return: tuple (hpo_id, status, elapsed seconds, error message or None)
+    """
+    start = time.time()
+    status = consts.HPO_STATUS_OK
+    error = None
+    try:
+        process_hpo(hpo_id)
+    except Exception as e:
+        logging.exception(f"Failed to process hpo_id '{hpo_id}'")
+        # other sites should not reuse clients with stale credentials
+        service_cache.invalidate_on_error(e)
+        status = consts.HPO_STATUS_FAILED
+        error = repr(e)
+    finally:
+        # worker threads are not tied to a request, so send their logs now
+        flush_thread_logs()
+    return hpo_id, status, time.time() - start, error
+
+
+def process_hpos(hpo_ids, max_workers=consts.DEFAULT_HPO_WORKERS):
+    """
+    Run validation for several hpo_ids concurrently
+
+    An error while processing one site does not affect the others. Failures are
+    raised together once every site has been processed.
+
+    :param hpo_ids: identifies the hpo sites to validate
+    :param max_workers: maximum number of sites to validate at once
+    :return: dict of hpo_id to dict with keys status, seconds and error
+    :raises InternalValidationError: if processing any of the sites failed
+    """
+    timings = dict()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_timed_process_hpo, hpo_id) for hpo_id in hpo_ids
+        ]
+        for future in as_completed(futures):
+            hpo_id, status, seconds, error = future.result()
+            timings[hpo_id] = dict(status=status, seconds=seconds, error=error)
+
+    summary_lines = []
+    for hpo_id, timing in sorted(timings.items(),
+                                 key=lambda item: -item[1]['seconds']):
+        summary_lines.append(
+            f"{hpo_id}: {timing['status']} in {timing['seconds']:.1f}s")
+    summary = '\n'.join(summary_lines)
+    logging.info(f"Validated {len(timings)} hpo_ids:\n{summary}")
+
+    failed = {
+        hpo_id: timing['error']
+        for hpo_id, timing in timings.items()
+        if timing['status'] == consts.HPO_STATUS_FAILED
+    }
+    if failed:
+        raise InternalValidationError(
+            f"Failed to process {len(failed)} hpo_id(s): {failed}")
+    return timings
+
+
 def list_bucket(bucket):
     try:
         return gcs_utils.list_bucket(bucket)
@@ -228,7 +349,22 @@ def categorize_folder_items(folder_items):
     return found_cdm_files, found_pii_files, unknown_files
 
 
-def validate_submission(hpo_id, bucket, folder_items, folder_prefix):
+def use_concurrent_loads():
+    """
+    Determine if the files of a submission are loaded concurrently
+
+    :return: False if the VALIDATION_CONCURRENT_LOADS environment variable is
+        set to false, True otherwise
+    """
+    value = os.environ.get(consts.CONCURRENT_LOADS_ENV, '')
+    return value.strip().lower() not in consts.FALSE_VALUES
+
+
+def validate_submission(hpo_id,
+                        bucket,
+                        folder_items,
+                        folder_prefix,
+                        concurrent_loads=None):
     """
     Load submission in BigQuery and summarize outcome
 
@@ -236,6 +372,9 @@ def validate_submission(hpo_id, bucket, folder_items, folder_prefix):
     :param bucket:
     :param folder_items:
     :param folder_prefix:
+    :param concurrent_loads: if True, submit the load jobs for every file in the
+        submission at once and wait on them together rather than loading one
+        file at a time.  Defaults to use_concurrent_loads()
     :return: a dict with keys results, errors, warnings
       results is list of tuples (file_name, found, parsed, loaded)
       errors and warnings are both lists of tuples (file_name, message)
@@ -256,17 +395,25 @@ def validate_submission(hpo_id, bucket, folder_items, folder_prefix):
         table_id = bq_utils.get_table_id(hpo_id, table_name)
         bq_utils.create_standard_table(table_name, table_id, drop_existing=True)
 
-    for cdm_file_name in sorted(resources.CDM_FILES):
-        file_results, file_errors = perform_validation_on_file(
-            cdm_file_name, found_cdm_files, hpo_id, folder_prefix, bucket)
-        results.extend(file_results)
-        errors.extend(file_errors)
+    if concurrent_loads is None:
+        concurrent_loads = use_concurrent_loads()
 
-    for pii_file_name in sorted(common.PII_FILES):
-        file_results, file_errors = perform_validation_on_file(
-            pii_file_name, found_pii_files, hpo_id, folder_prefix, bucket)
-        results.extend(file_results)
-        errors.extend(file_errors)
+    if concurrent_loads:
+        results, errors = perform_validation_on_files(
+            sorted(resources.CDM_FILES) + sorted(common.PII_FILES),
+            found_cdm_files + found_pii_files, hpo_id, folder_prefix, bucket)
+    else:
+        for cdm_file_name in sorted(resources.CDM_FILES):
+            file_results, file_errors = perform_validation_on_file(
+                cdm_file_name, found_cdm_files, hpo_id, folder_prefix, bucket)
+            results.extend(file_results)
+            errors.extend(file_errors)
+
+        for pii_file_name in sorted(common.PII_FILES):
+            file_results, file_errors = perform_validation_on_file(
+                pii_file_name, found_pii_files, hpo_id, folder_prefix, bucket)
+            results.extend(file_results)
+            errors.extend(file_errors)
 
     # (filename, message) for each unknown file
     warnings = [
@@ -648,6 +795,50 @@ def get_hpo_missing_pii_query(hpo_id):
         participant_match_table_id=participant_match_table_id)
 
 
+def _abort_incomplete_loads(hpo_id, incomplete_jobs, bucket, folder_prefix):
+    """
+    Abort processing a submission whose load jobs did not complete
+
+    Incomplete jobs are internal unrecoverable errors.  Aborting the process
+    allows for this submission to be validated when the system recovers.
+
+    :param hpo_id: identifies the hpo site
+    :param incomplete_jobs: ids of the jobs which did not complete
+    :param bucket: bucket containing the submission
+    :param folder_prefix: directory containing the submission
+    :raises InternalValidationError: always
+    """
+    message = (f"Loading hpo_id '{hpo_id}' failed because job id(s) "
+               f"{incomplete_jobs} did not complete.\n")
+    message += f"Aborting processing 'gs://{bucket}/{folder_prefix}'."
+    logging.error(message)
+    raise InternalValidationError(message)
+
+
+def _get_load_errors(file_name, load_job_id, bucket, folder_prefix):
+    """
+    Get the issues reported by the completed load job of a file
+
+    :param file_name: name of the loaded file
+    :param load_job_id: id of the load job
+    :param bucket: bucket containing the submission
+    :param folder_prefix: directory containing the submission
+    :return: list with a tuple (file_name, message) if the load failed,
+        empty list if the file was loaded
+    """
+    job_resource = bq_utils.get_job_details(job_id=load_job_id)
+    job_status = job_resource['status']
+    if 'errorResult' not in job_status:
+        return []
+
+    # These are issues (which we report back) as opposed to internal errors
+    issues = [item['message'] for item in job_status['errors']]
+    logging.info(f"Issues found in gs://{bucket}/{folder_prefix}/{file_name}")
+    for issue in issues:
+        logging.info(issue)
+    return [(file_name, ' || '.join(issues))]
+
+
 def perform_validation_on_file(file_name, found_file_names, hpo_id,
                                folder_prefix, bucket):
     """
@@ -673,31 +864,14 @@ def perform_validation_on_file(file_name, found_file_names, hpo_id,
         load_results = bq_utils.load_from_csv(hpo_id, table_name, folder_prefix)
         load_job_id = load_results['jobReference']['jobId']
         incomplete_jobs = bq_utils.wait_on_jobs([load_job_id])
+        if incomplete_jobs:
+            _abort_incomplete_loads(hpo_id, incomplete_jobs, bucket,
+                                    folder_prefix)
 
-        if not incomplete_jobs:
-            job_resource = bq_utils.get_job_details(job_id=load_job_id)
-            job_status = job_resource['status']
-            if 'errorResult' in job_status:
-                # These are issues (which we report back) as opposed to internal errors
-                issues = [item['message'] for item in job_status['errors']]
-                errors.append((file_name, ' || '.join(issues)))
-                logging.info(
-                    f"Issues found in gs://{bucket}/{folder_prefix}/{file_name}"
-                )
-                for issue in issues:
-                    logging.info(issue)
-            else:
-                # Processed ok
-                parsed = loaded = 1
-        else:
-            # Incomplete jobs are internal unrecoverable errors.
-            # Aborting the process allows for this submission to be validated when system recovers.
-            message = (
-                f"Loading hpo_id '{hpo_id}' table '{table_name}' failed because "
-                f"job id '{load_job_id}' did not complete.\n")
-            message += f"Aborting processing 'gs://{bucket}/{folder_prefix}'."
-            logging.error(message)
-            raise InternalValidationError(message)
+        errors = _get_load_errors(file_name, load_job_id, bucket, folder_prefix)
+        if not errors:
+            # Processed ok
+            parsed = loaded = 1
 
     if file_name in common.SUBMISSION_FILES:
         results.append((file_name, found, parsed, loaded))
@@ -705,6 +879,56 @@ def perform_validation_on_file(file_name, found_file_names, hpo_id,
     return results, errors
 
 
+def perform_validation_on_files(file_names, found_file_names, hpo_id,
+                                folder_prefix, bucket):
+    """
+    Attempts to load csv files into BigQuery concurrently
+
+    A load job is submitted for every found file before waiting on any of them,
+    so the total wait is bounded by the slowest load rather than the sum of all
+    loads.
+
+    :param file_names: names of the files to validate
+    :param found_file_names: files found in the submission folder
+    :param hpo_id: identifies the hpo site
+    :param folder_prefix: directory containing the submission
+    :param bucket: bucket containing the submission
+    :return: tuple (results, errors) where
+     results is list of tuples (file_name, found, parsed, loaded)
+     errors is list of tuples (file_name, message)
+    """
+    errors = []
+    results = []
+    load_job_ids = dict()
+    for file_name in file_names:
+        if file_name in found_file_names:
+            logging.info(f"Submitting load job for file '{file_name}'")
+            table_name = file_name.split('.')[0]
+            load_results = bq_utils.load_from_csv(hpo_id, table_name,
+                                                  folder_prefix)
+            load_job_ids[file_name] = load_results['jobReference']['jobId']
+
+    incomplete_jobs = bq_utils.wait_on_jobs(load_job_ids.values())
+    if incomplete_jobs:
+        _abort_incomplete_loads(hpo_id, incomplete_jobs, bucket, folder_prefix)
+
+    for file_name in file_names:
+        found = parsed = loaded = 0
+        if file_name in load_job_ids:
+            found = 1
+            file_errors = _get_load_errors(file_name, load_job_ids[file_name],
+                                           bucket, folder_prefix)
+            errors.extend(file_errors)
+            if not file_errors:
+                # Processed ok
+                parsed = loaded = 1
+
+        if file_name in common.SUBMISSION_FILES:
+            results.append((file_name, found, parsed, loaded))
+
+    return results, errors
+
+
 def _validation_done(bucket, folder):
     if gcs_utils.get_metadata(bucket=bucket,
                               name=folder + common.PROCESSED_TXT) is not None:
@@ -911,7 +1135,11 @@ def union_ehr():
     app_id = bq_utils.app_identity.get_application_id()
     input_dataset_id = bq_utils.get_dataset_id()
     output_dataset_id = bq_utils.get_unioned_dataset_id()
-    ehr_union.main(input_dataset_id, output_dataset_id, app_id)
+    # only the records of sites which submitted since the last union are replaced
+    ehr_union.main(input_dataset_id,
+                   output_dataset_id,
+                   app_id,
+                   incremental=True)
 
     run_achilles(hpo_id)
     now_date_string = datetime.datetime.now().strftime('%Y_%m_%d')
@@ -1007,6 +1235,12 @@ app.add_url_rule(consts.PREFIX + 'ValidateAllHpoFiles',
                  view_func=validate_all_hpos,
                  methods=['GET'])
 
+app.add_url_rule(consts.PREFIX +
+                 'ValidateHpoShard/<int:shard_index>/<int:num_shards>',
+                 endpoint='validate_hpo_shard',
+                 view_func=validate_hpo_shard,
+                 methods=['GET'])
+
 app.add_url_rule(consts.PREFIX + 'ValidateHpoFiles/<string:hpo_id>',
                  endpoint='validate_hpo_files',
                  view_func=validate_hpo_files,
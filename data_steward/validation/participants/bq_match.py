@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A module to perform participant identity matching within BigQuery.
+
+The normalizers of the normalizers module are declared as temporary SQL
+functions and every field of a site is compared in a single query, which inserts
+its results into the site's identity match table.  No PII values leave BigQuery.
+"""
+# Python imports
+import logging
+
+# Third party imports
+
+# Project imports
+import bq_utils
+from constants.validation.participants import bq_match as consts
+from constants.validation.participants import identity_match as id_match_consts
+from constants.validation.participants import normalizers as normalizer_consts
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _string_literal(value):
+    """
+    Quote a string as a SQL string literal.
+
+    :param value:  the string to quote
+    :return:  the quoted string
+    """
+    value = value.replace('\\', '\\\\').replace("'", "\\'")
+    return f"'{value}'"
+
+
+def _string_array(values):
+    """
+    Get an ARRAY<STRING> literal of the given strings.
+
+    :param values:  an iterable of strings
+    :return:  the SQL array literal
+    """
+    return '[{}]'.format(', '.join(_string_literal(value) for value in values))
+
+
+def _abbreviation_array(abbreviations):
+    """
+    Get an array literal of abbreviation and expansion structs.
+
+    :param abbreviations:  a dictionary of abbreviation to expansion
+    :return:  the SQL array literal
+    """
+    items = [
+        f'({_string_literal(abbreviation)}, {_string_literal(expansion)})'
+        for abbreviation, expansion in sorted(abbreviations.items())
+    ]
+    return 'ARRAY<STRUCT<abbreviation STRING, expansion STRING>>[{}]'.format(
+        ', '.join(items))
+
+
+def get_normalizer_functions():
+    """
+    Get the temporary SQL functions implementing the normalizers.
+
+    :return:  a string of CREATE TEMP FUNCTION statements
+    """
+    return consts.NORMALIZER_FUNCTIONS.format(
+        missing=consts.MISSING,
+        match=consts.MATCH,
+        mismatch=consts.MISMATCH,
+        at=normalizer_consts.AT,
+        states=_string_array(normalizer_consts.STATE_ABBREVIATIONS),
+        city_abbreviations=_abbreviation_array(
+            normalizer_consts.CITY_ABBREVIATIONS),
+        street_abbreviations=_abbreviation_array(
+            normalizer_consts.ADDRESS_ABBREVIATIONS),
+        numeric_endings=normalizer_consts.NUMERIC_ENDINGS_REGEX,
+        alpha_numeric=normalizer_consts.ALPHA_NUMERIC)
+
+
+def _get_rdr_values_query(project, validation_dataset):
+    """
+    Get the query pivoting the RDR values of the match values table.
+
+    :param project:  project containing the validation dataset
+    :param validation_dataset:  dataset of the match values table
+    :return:  a query returning one row per person and one column per field
+    """
+    field_values = [
+        consts.RDR_FIELD_VALUE.format(concept_id=concept_id, field=field)
+        for field, concept_id in consts.RDR_FIELD_CONCEPTS
+    ]
+    return consts.RDR_VALUES.format(project=project,
+                                    dataset=validation_dataset,
+                                    table=consts.ID_MATCH_TABLE,
+                                    field_values=', '.join(field_values))
+
+
+def _get_site_values_query(project, rdr_dataset, ehr_dataset, site, cte,
+                           table_suffix, columns, ehr_tables):
+    """
+    Get the query returning the PII values of a site, one row per person.
+
+    :param project:  project containing the datasets
+    :param rdr_dataset:  dataset containing the location table
+    :param ehr_dataset:  dataset containing the site's PII tables
+    :param site:  hpo site identifier
+    :param cte:  name of the common table expression of the values
+    :param table_suffix:  suffix of the site's table
+    :param columns:  list of (column, aggregate, type) of the values
+    :param ehr_tables:  the tables of the ehr dataset
+    :return:  the query, and None or the name of the missing table
+    """
+    table = site + table_suffix
+    if table not in ehr_tables:
+        empty_columns = [
+            f'CAST(NULL AS {column_type}) AS {column}'
+            for column, _, column_type in columns
+        ]
+        query = consts.EMPTY_SITE_VALUES.format(
+            columns=', '.join(empty_columns))
+        return query, table
+
+    join = ''
+    if cte == consts.ADDRESS_CTE:
+        join = consts.LOCATION_JOIN.format(project=project,
+                                           rdr_dataset=rdr_dataset,
+                                           location_table=consts.LOCATION_TABLE)
+    aggregates = [
+        f'{aggregate} AS {column}' for column, aggregate, _ in columns
+    ]
+    query = consts.SITE_VALUES.format(project=project,
+                                      dataset=ehr_dataset,
+                                      table=table,
+                                      aggregates=', '.join(aggregates),
+                                      join=join)
+    return query, None
+
+
+def get_site_match_query(project, validation_dataset, rdr_dataset, ehr_dataset,
+                         site, ehr_tables):
+    """
+    Get the query comparing every field of a site's participants.
+
+    Sites missing one of their PII tables are still matched, the fields of the
+    missing table are reported as missing.
+
+    :param project:  project containing the datasets
+    :param validation_dataset:  dataset of the match values table and the
+        site's identity match table
+    :param rdr_dataset:  dataset created from the rdr export, contains the
+        location table
+    :param ehr_dataset:  dataset containing the site's PII tables
+    :param site:  hpo site identifier
+    :param ehr_tables:  the tables of the ehr dataset
+    :return:  the query, and the list of the site's missing tables
+    """
+    ctes = [
+        consts.CTE.format(name=consts.RDR_CTE,
+                          query=_get_rdr_values_query(project,
+                                                      validation_dataset))
+    ]
+    missing_tables = []
+    for cte, table_suffix, columns in consts.SITE_SOURCES:
+        query, missing_table = _get_site_values_query(project, rdr_dataset,
+                                                      ehr_dataset, site, cte,
+                                                      table_suffix, columns,
+                                                      ehr_tables)
+        if missing_table:
+            missing_tables.append(missing_table)
+        ctes.append(consts.CTE.format(name=cte, query=query))
+
+    site_person_query = ' UNION DISTINCT '.join(
+        consts.SITE_PERSON_VALUES.format(cte=cte)
+        for cte, _, _ in consts.SITE_SOURCES)
+    ctes.append(
+        consts.CTE.format(name=consts.SITE_PERSON_CTE, query=site_person_query))
+
+    names = dict(rdr=consts.RDR_CTE,
+                 name=consts.NAME_CTE,
+                 email=consts.EMAIL_CTE,
+                 phone=consts.PHONE_CTE,
+                 address=consts.ADDRESS_CTE,
+                 person=consts.PERSON_CTE,
+                 site_person=consts.SITE_PERSON_CTE)
+    sex_cases = [
+        consts.SEX_VALUE_CASE.format(concept_id=concept_id, sex=sex)
+        for concept_id, sex in sorted(id_match_consts.SEX_CONCEPT_IDS.items())
+    ]
+    sex = consts.SEX_VALUE.format(cases=' '.join(sex_cases), **names)
+    matches = [
+        '{} AS {}'.format(
+            expression.format(missing=consts.MISSING,
+                              match=consts.MATCH,
+                              mismatch=consts.MISMATCH,
+                              yes=consts.YES,
+                              sex=sex,
+                              **names), field)
+        for field, expression in consts.FIELD_MATCHES
+    ]
+    joins = [
+        consts.CTE_JOIN.format(name=name, site_person=consts.SITE_PERSON_CTE)
+        for name in [consts.RDR_CTE] +
+        [cte for cte, _, _ in consts.SITE_SOURCES]
+    ]
+
+    query = consts.SITE_MATCH_QUERY.format(
+        functions=get_normalizer_functions(),
+        project=project,
+        dataset=validation_dataset,
+        table=site + id_match_consts.VALIDATION_TABLE_SUFFIX,
+        fields=', '.join(field for field, _ in consts.FIELD_MATCHES),
+        ctes=',\n'.join(ctes),
+        matches=',\n  '.join(matches),
+        site_person=consts.SITE_PERSON_CTE,
+        joins='\n'.join(joins))
+    return query, missing_tables
+
+
+def match_site(project, validation_dataset, rdr_dataset, ehr_dataset, site,
+               ehr_tables):
+    """
+    Compare a site's PII to the RDR values and write the site's match results.
+
+    The results are inserted into the site's existing identity match table.
+
+    :param project:  project containing the datasets
+    :param validation_dataset:  dataset of the match values table and the
+        site's identity match table
+    :param rdr_dataset:  dataset created from the rdr export
+    :param ehr_dataset:  dataset containing the site's PII tables
+    :param site:  hpo site identifier
+    :param ehr_tables:  the tables of the ehr dataset
+    :return:  the list of the site's missing tables
+    :raises:  BigQueryJobWaitError if the query does not complete,
+              RuntimeError if the query fails,
+              oauth2client.client.HttpAccessTokenRefreshError,
+              googleapiclient.errors.HttpError
+    """
+    query, missing_tables = get_site_match_query(project, validation_dataset,
+                                                 rdr_dataset, ehr_dataset, site,
+                                                 ehr_tables)
+    for table in missing_tables:
+        LOGGER.error(f"Table {table} doesnt exist, its fields are reported as "
+                     f"missing for site: {site}")
+
+    LOGGER.info(f"Participant validation ran the query\n{query}")
+    results = bq_utils.query(query)
+    query_job_id = results['jobReference']['jobId']
+    incomplete_jobs = bq_utils.wait_on_jobs([query_job_id])
+    if incomplete_jobs:
+        raise bq_utils.BigQueryJobWaitError(incomplete_jobs)
+
+    job_status = bq_utils.get_job_details(query_job_id)['status']
+    error_result = job_status.get('errorResult')
+    if error_result:
+        raise RuntimeError(f"Identity match query for site {site} failed: "
+                           f"{error_result.get('message')}")
+
+    return missing_tables
@@ -22,6 +22,7 @@ import gcs_utils
 from constants import bq_utils as bq_consts
 from constants.validation.participants import identity_match as consts
 import resources
+from validation.participants import bq_match
 from validation.participants import normalizers as normalizer
 from validation.participants import readers as readers
 from validation.participants import writers as writers
@@ -701,10 +702,18 @@ def _add_matches_to_results(results, matches, field):
     return results
 
 
-def match_participants(project, rdr_dataset, ehr_dataset, dest_dataset_id):
+def match_participants(project,
+                       rdr_dataset,
+                       ehr_dataset,
+                       dest_dataset_id,
+                       set_based=True):
     """
     Entry point for performing participant matching of PPI, EHR, and PII data.
 
+    By default each site is matched by a single query comparing all fields
+    within BigQuery.  Otherwise the values of each field are read and compared
+    with the normalizers, and the results are loaded into the site's table.
+
     :param project: a string representing the project name
     :param rdr_dataset:  the dataset created from the results given to us by
         the rdr team
@@ -712,6 +721,7 @@ def match_participants(project, rdr_dataset, ehr_dataset, dest_dataset_id):
         comparisons
     :param dest_dataset_id:  the desired identifier for the match values
         destination dataset
+    :param set_based:  compare the fields of a site in a single query
 
     :return: results of the field comparison for each hpo
     """
@@ -757,9 +767,26 @@ def match_participants(project, rdr_dataset, ehr_dataset, dest_dataset_id):
     read_errors = 0
     write_errors = 0
 
-    # validate first names
     for site in hpo_sites:
         LOGGER.info(f"Beginning identity validation for site: {site}")
+        if set_based:
+            try:
+                missing_tables = bq_match.match_site(project,
+                                                     validation_dataset,
+                                                     rdr_dataset, ehr_dataset,
+                                                     site, ehr_tables)
+            except (oauth2client.client.HttpAccessTokenRefreshError,
+                    googleapiclient.errors.HttpError, RuntimeError):
+                LOGGER.exception(
+                    f"Did not write site information to validation dataset:  {site}"
+                )
+                write_errors += 1
+            else:
+                read_errors += len(missing_tables)
+                LOGGER.info(f"Wrote validation results for site: {site}")
+            continue
+
+        # validate first names
         results = {}
 
         try:
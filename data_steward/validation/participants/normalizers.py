@@ -2,11 +2,19 @@
 # -*- coding: utf-8 -*-
 """
 A module to perform various normalizing functions for participant validation data.
+
+Each normalizer takes a single value and remembers the values it normalized
+most recently, as city, state and street values repeat heavily across
+participants.  The plural normalizers, such as normalize_streets, take a whole
+pandas Series or sequence of values and normalize each distinct value once.
 """
 # Python imports
+from functools import lru_cache
 import logging
 
 # Third party imports
+import numpy as np
+import pandas as pd
 
 # Project imports
 from constants.validation.participants import normalizers as consts
@@ -14,6 +22,25 @@ from constants.validation.participants import normalizers as consts
 LOGGER = logging.getLogger(__name__)
 
 
+def _to_string(value):
+    """
+    Get the string to normalize for a value.
+
+    :param value:  the value to normalize, possibly None or not a string
+    :return:  the value as a string or None
+    """
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+@lru_cache(maxsize=consts.NORMALIZER_CACHE_SIZE)
+def _normalize_city_name(city):
+    city = consts.COMPILED_NON_ALPHA_NUMERIC_OR_SPACE.sub('', city.lower())
+    return ' '.join(
+        consts.CITY_ABBREVIATIONS.get(part, part) for part in city.split())
+
+
 def normalize_city_name(city):
     """
     Helper function to return names with lowercase alphabetic characters only.
@@ -22,24 +49,11 @@ def normalize_city_name(city):
     :return:  a string with everything that is not an alphabetic character
         removed and all characters are lower cased.
     """
+    city = _to_string(city)
     if city is None:
         return ''
-    elif not isinstance(city, str):
-        city = str(city)
-
-    normalized_city = ''
-    city = city.lower()
-    for char in city:
-        if char.isalnum() or char.isspace():
-            normalized_city += char
 
-    for part in normalized_city.split():
-        expansion = consts.CITY_ABBREVIATIONS.get(part)
-        if expansion:
-            normalized_city = normalized_city.replace(part, expansion)
-
-    normalized_city = ' '.join(normalized_city.split())
-    return normalized_city
+    return _normalize_city_name(city)
 
 
 def _get_numeric_part_only(part):
@@ -87,6 +101,32 @@ def _get_alpha_numeric_parts(part):
     return None
 
 
+@lru_cache(maxsize=consts.NORMALIZER_CACHE_SIZE)
+def _normalize_street_part(part):
+    """
+    Normalize a single word of a street address.
+
+    :param part:  a lower cased alphanumeric word
+    :return:  the word with its abbreviation expanded, its numeric ending
+        removed and its digits split from its alphabetic characters
+    """
+    # expand recognized abbreviations
+    part = consts.ADDRESS_ABBREVIATIONS.get(part, part)
+
+    # normalize 7 and 7th as the same
+    part = _get_numeric_part_only(part) or part
+
+    # normalize 50A and 50 A as the same
+    return _get_alpha_numeric_parts(part) or part
+
+
+@lru_cache(maxsize=consts.NORMALIZER_CACHE_SIZE)
+def _normalize_street(street):
+    # replace all punctuation with a space
+    street = consts.COMPILED_NON_ALPHA_NUMERIC.sub(' ', street.lower())
+    return ' '.join(_normalize_street_part(part) for part in street.split())
+
+
 def normalize_street(street):
     """
     Helper function to return normalized street addresses.
@@ -96,44 +136,17 @@ def normalize_street(street):
         lower cased, leading and trailing white space stripped, abbreviations
         expanded, and punctuation removed or an empty string.
     """
+    street = _to_string(street)
     if street is None:
         return ''
-    elif not isinstance(street, str):
-        street = str(street)
 
-    normalized_street = ''
-    street = street.lower()
-    # replace all punctuation with a space
-    for char in street:
-        if char.isalnum():
-            normalized_street += char
-        else:
-            normalized_street += ' '
-
-    # for each part of the address, see if it exists in the list of known
-    # abbreviations.  if so, expand the abbreviation
-    for part in normalized_street.split():
-        expansion = consts.ADDRESS_ABBREVIATIONS.get(part)
-        # expand recognized abbreviations
-        if expansion:
-            normalized_street = normalized_street.replace(part, expansion)
-            part = expansion
-
-        # normalize 7 and 7th as the same
-        number = _get_numeric_part_only(part)
-        if number:
-            normalized_street = normalized_street.replace(part, number)
-            part = number
-
-        # normalize 50A and 50 A as the same
-        alpha_num = _get_alpha_numeric_parts(part)
-        if alpha_num:
-            normalized_street = normalized_street.replace(part, alpha_num)
-            part = alpha_num
-
-    # removes possible multiple spaces.
-    normalized_street = ' '.join(normalized_street.split())
-    return normalized_street
+    return _normalize_street(street)
+
+
+@lru_cache(maxsize=consts.NORMALIZER_CACHE_SIZE)
+def _normalize_state(state):
+    state = state.strip().lower()
+    return state if state in consts.STATE_ABBREVIATIONS else ''
 
 
 def normalize_state(state):
@@ -148,29 +161,15 @@ def normalize_state(state):
     :return:  a two character string with all alphabetic characters lower cased
         and all whitespace removed or empty string.
     """
+    state = _to_string(state)
     if state is None:
         return ''
-    elif not isinstance(state, str):
-        state = str(state)
-
-    normalized_state = state.strip()
-    normalized_state = normalized_state.lower()
-    return normalized_state if normalized_state in consts.STATE_ABBREVIATIONS else ''
-
 
-def normalize_zip(code):
-    """
-    Helper function to return 5 character zip codes only.
+    return _normalize_state(state)
 
-    :param code:  string to normalize and format as a zip code
-    :return: a five character digit string to compare as a zip code
-    """
-    if code is None:
-        return ''
-    elif not isinstance(code, str):
-        code = str(code)
 
-    normalized_code = ''
+@lru_cache(maxsize=consts.NORMALIZER_CACHE_SIZE)
+def _normalize_zip(code):
     code = code.strip()
 
     # ensure hyphenated part is ignored
@@ -180,11 +179,21 @@ def normalize_zip(code):
     # perform zero padding upto 5 chars
     code = code.zfill(5)
 
-    for char in code:
-        if char.isdigit():
-            normalized_code += char
+    return consts.COMPILED_NON_DIGIT.sub('', code)
+
+
+def normalize_zip(code):
+    """
+    Helper function to return 5 character zip codes only.
+
+    :param code:  string to normalize and format as a zip code
+    :return: a five character digit string to compare as a zip code
+    """
+    code = _to_string(code)
+    if code is None:
+        return ''
 
-    return normalized_code
+    return _normalize_zip(code)
 
 
 def normalize_phone(number):
@@ -194,16 +203,11 @@ def normalize_phone(number):
     :param number:  string to normalize.
     :return:  a string with everything that is not a digit removed.
     """
+    number = _to_string(number)
     if number is None:
         return ''
-    elif not isinstance(number, str):
-        number = str(number)
 
-    normalized_number = ''
-    for char in number:
-        if char.isdigit():
-            normalized_number += char
-    return normalized_number
+    return consts.COMPILED_NON_DIGIT.sub('', number)
 
 
 def normalize_email(email):
@@ -214,10 +218,9 @@ def normalize_email(email):
     :return:  a string with all alphabetic characters lower cased and all
         whitespace removed.
     """
+    email = _to_string(email)
     if email is None:
         return ''
-    elif not isinstance(email, str):
-        email = str(email)
 
     normalized_email = email.strip()
     return normalized_email.lower() if consts.AT in normalized_email else ''
@@ -231,13 +234,99 @@ def normalize_name(name):
     :return:  a string with everything that is not an alphabetic character
         removed and all characters are lower cased.
     """
+    name = _to_string(name)
     if name is None:
         return ''
-    elif not isinstance(name, str):
-        name = str(name)
-
-    normalized_name = ''
-    for char in name:
-        if char.isalpha():
-            normalized_name += char
-    return normalized_name.lower()
+
+    return consts.COMPILED_NON_ALPHA.sub('', name).lower()
+
+
+def _normalize_values(values, normalize):
+    """
+    Normalize each distinct value of a sequence once.
+
+    :param values:  a pandas Series or a sequence of values.  None and NaN
+        values are normalized to an empty string.
+    :param normalize:  the normalizer of a single value
+    :return:  a pandas Series of the normalized strings, with the index of
+        values if it is a Series
+    """
+    if not isinstance(values, pd.Series):
+        values = pd.Series(values, dtype=object)
+
+    codes, uniques = pd.factorize(values)
+    # missing values have the code -1, which selects the trailing empty string
+    normalized = np.empty(len(uniques) + 1, dtype=object)
+    normalized[:-1] = [normalize(value) for value in uniques]
+    normalized[-1] = ''
+    return pd.Series(normalized[codes], index=values.index)
+
+
+def normalize_city_names(cities):
+    """
+    Normalize a sequence of city names, see normalize_city_name.
+
+    :param cities:  a pandas Series or a sequence of values
+    :return:  a pandas Series of the normalized strings
+    """
+    return _normalize_values(cities, normalize_city_name)
+
+
+def normalize_streets(streets):
+    """
+    Normalize a sequence of street addresses, see normalize_street.
+
+    :param streets:  a pandas Series or a sequence of values
+    :return:  a pandas Series of the normalized strings
+    """
+    return _normalize_values(streets, normalize_street)
+
+
+def normalize_states(states):
+    """
+    Normalize a sequence of state abbreviations, see normalize_state.
+
+    :param states:  a pandas Series or a sequence of values
+    :return:  a pandas Series of the normalized strings
+    """
+    return _normalize_values(states, normalize_state)
+
+
+def normalize_zips(codes):
+    """
+    Normalize a sequence of zip codes, see normalize_zip.
+
+    :param codes:  a pandas Series or a sequence of values
+    :return:  a pandas Series of the normalized strings
+    """
+    return _normalize_values(codes, normalize_zip)
+
+
+def normalize_phones(numbers):
+    """
+    Normalize a sequence of phone numbers, see normalize_phone.
+
+    :param numbers:  a pandas Series or a sequence of values
+    :return:  a pandas Series of the normalized strings
+    """
+    return _normalize_values(numbers, normalize_phone)
+
+
+def normalize_emails(emails):
+    """
+    Normalize a sequence of email addresses, see normalize_email.
+
+    :param emails:  a pandas Series or a sequence of values
+    :return:  a pandas Series of the normalized strings
+    """
+    return _normalize_values(emails, normalize_email)
+
+
+def normalize_names(names):
+    """
+    Normalize a sequence of names, see normalize_name.
+
+    :param names:  a pandas Series or a sequence of values
+    :return:  a pandas Series of the normalized strings
+    """
+    return _normalize_values(names, normalize_name)
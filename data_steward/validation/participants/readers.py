@@ -124,7 +124,7 @@ def get_ehr_person_values(project, dataset, table_name, column_name):
 
     LOGGER.info(f"Participant validation ran the query\n{query_string}")
     results = bq_utils.query(query_string)
-    row_results = bq_utils.large_response_to_rowlist(results)
+    row_results = bq_utils.iter_response_rows(results)
 
     field_type = _get_field_type(table_name, column_name)
 
@@ -175,7 +175,7 @@ def get_rdr_match_values(project, dataset, table_name, concept_id):
 
     LOGGER.info(f"Participant validation ran the query\n{query_string}")
     results = bq_utils.query(query_string)
-    row_results = bq_utils.large_response_to_rowlist(results)
+    row_results = bq_utils.iter_response_rows(results)
 
     field_type = _get_field_type(table_name, 'observation_source_concept_id')
 
@@ -231,7 +231,7 @@ def get_pii_values(project, pii_dataset, hpo, table, field):
     LOGGER.info(f"Participant validation ran the query\n{query_string}")
 
     results = bq_utils.query(query_string)
-    row_results = bq_utils.large_response_to_rowlist(results)
+    row_results = bq_utils.iter_response_rows(results)
 
     field_type = _get_field_type(table, field)
 
@@ -285,7 +285,7 @@ def get_location_pii(project, rdr_dataset, pii_dataset, hpo, table, field):
     LOGGER.info(f"Participant validation ran the query\n{query_string}")
 
     results = bq_utils.query(query_string)
-    row_results = bq_utils.large_response_to_rowlist(results)
+    row_results = bq_utils.iter_response_rows(results)
 
     field_type = _get_field_type(table, field)
 
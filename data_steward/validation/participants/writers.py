@@ -193,7 +193,7 @@ def create_site_validation_report(project, dataset, hpo_list, bucket, filename):
             read_errors += 1
             continue
 
-        row_results = bq_utils.large_response_to_rowlist(results)
+        row_results = bq_utils.iter_response_rows(results)
         for item in row_results:
             address_values = [
                 item.get(consts.ADDRESS_ONE_FIELD),
@@ -1,7 +1,9 @@
+import logging
 import re
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from io import open
 
 import bq_utils
-from io import open
 
 COMMAND_SEP = ';'
 PREFIX_PLACEHOLDER = 'synpuf_100.'
@@ -9,6 +11,13 @@ TEMP_PREFIX = 'temp.'
 TEMP_TABLE_PATTERN = re.compile('\s*INTO\s+([^\s]+)')
 TRUNCATE_TABLE_PATTERN = re.compile('\s*truncate\s+table\s+([^\s]+)')
 DROP_TABLE_PATTERN = re.compile('\s*drop\s+table\s+([^\s]+)')
+INSERT_TABLE_PATTERN = re.compile(r'^\s*insert\s+into\s+([^\s(]+)',
+                                  re.IGNORECASE)
+READ_TABLE_PATTERN = re.compile(r'\b(?:from|join)\s+([A-Za-z_][\w.]*)',
+                                re.IGNORECASE)
+LINE_COMMENT_PATTERN = re.compile(r'--[^\n]*')
+BLOCK_COMMENT_PATTERN = re.compile(r'/\*.*?\*/', re.DOTALL)
+DEFAULT_MAX_CONCURRENT_JOBS = 10
 COMMENTED_BLOCK_REGEX = re.compile(
     '(?P<before_comment>(^)(.)*)(?P<comment>(\/\*)(.)*(\*\/))(?P<after_comment>(.)*$)',
     re.DOTALL)
@@ -178,3 +187,124 @@ def get_drop_table_name(q):
     """
     match = DROP_TABLE_PATTERN.search(q)
     return match.group(1)
+
+
+def strip_comments(q):
+    """
+    Remove the line and block comments of a statement
+    :param q:
+    :return:
+    """
+    q = BLOCK_COMMENT_PATTERN.sub(' ', q)
+    return LINE_COMMENT_PATTERN.sub('', q)
+
+
+def is_insert(q):
+    """
+    True if `q` is an INSERT INTO statement
+    :param q:
+    :return:
+    """
+    return INSERT_TABLE_PATTERN.search(strip_comments(q)) is not None
+
+
+def get_write_tables(q):
+    """
+    Get the tables a statement creates, truncates, drops or inserts into
+    :param q:
+    :return: set of table names
+    """
+    if is_truncate(q):
+        return {get_truncate_table_name(q)}
+    if is_drop(q):
+        return {get_drop_table_name(q)}
+    if is_to_temp_table(q):
+        return {get_temp_table_name(q)}
+    match = INSERT_TABLE_PATTERN.search(strip_comments(q))
+    if match:
+        return {match.group(1)}
+    return set()
+
+
+def get_read_tables(q):
+    """
+    Get the tables a statement selects from or joins with
+
+    Names of common table expressions are included as well.  They never match
+    a table written by another statement so they do not add dependencies.
+    :param q:
+    :return: set of table names
+    """
+    return set(READ_TABLE_PATTERN.findall(strip_comments(q)))
+
+
+def get_dependencies(commands):
+    """
+    Get the statements each statement must wait for
+
+    A statement depends on an earlier statement if it reads a table the earlier
+    statement writes, writes a table the earlier statement reads, or writes a
+    table the earlier statement also writes.  Inserts into the same table are
+    the exception to the last rule since appending rows commutes.
+    :param commands: list of statements in the order of the script
+    :return: list of the indexes each statement depends on, by statement index
+    """
+    reads = [get_read_tables(command) for command in commands]
+    writes = [get_write_tables(command) for command in commands]
+    inserts = [is_insert(command) for command in commands]
+    dependencies = []
+    for j in range(len(commands)):
+        depends_on = set()
+        for i in range(j):
+            if (reads[j] & writes[i] or writes[j] & reads[i] or
+                    writes[j] & writes[i] and not (inserts[i] and inserts[j])):
+                depends_on.add(i)
+        dependencies.append(depends_on)
+    return dependencies
+
+
+def run_commands(commands,
+                 run_command,
+                 max_concurrent_jobs=DEFAULT_MAX_CONCURRENT_JOBS):
+    """
+    Run statements concurrently, starting each one once the statements it depends on have finished
+
+    Independent statements are started in the order of the script.  No new statement is started
+    after one fails.  The first error is raised once the running statements have finished.
+    :param commands: list of statements in the order of the script
+    :param run_command: function running a single statement
+    :param max_concurrent_jobs: maximum number of statements running at the same time
+    :return: None
+    """
+    max_concurrent_jobs = max(1, max_concurrent_jobs)
+    remaining = dict(enumerate(get_dependencies(commands)))
+    running = dict()
+    error = None
+    with ThreadPoolExecutor(max_workers=max_concurrent_jobs) as executor:
+        while True:
+            if error is None:
+                ready = [
+                    index for index, depends_on in sorted(remaining.items())
+                    if not depends_on
+                ]
+                for index in ready[:max_concurrent_jobs - len(running)]:
+                    del remaining[index]
+                    running[executor.submit(run_command,
+                                            commands[index])] = index
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.exception('Statement %s failed' % index)
+                    error = error or e
+                    continue
+                for depends_on in remaining.values():
+                    depends_on.discard(index)
+
+    if error is not None:
+        raise error
@@ -2,23 +2,38 @@
 Utility for creating OMOP vocabulary DRC resources. OMOP vocabulary files are downloaded from
 [Athena](http://athena.ohdsi.org/) in tab-separated format. Before they can be loaded into BigQuery, they must
 be reformatted and records for the AOU Generalization and AOU Custom vocabularies must be added to them.
+
+prepare_files does both in a single pass over each file.  Files are split into
+byte ranges of whole lines, which are transformed in parallel by a process pool.
 """
 import csv
 import logging
 import os
 import sys
+import time
 import warnings
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 from common import (CONCEPT, VOCABULARY, DELIMITER, LINE_TERMINATOR,
                     TRANSFORM_FILES, APPEND_VOCABULARY, APPEND_CONCEPTS,
-                    ADD_AOU_VOCABS, ERRORS, ERROR_APPENDING, VOCABULARY_UPDATES,
-                    AOU_GEN_ID, AOU_CUSTOM_ID)
+                    ADD_AOU_VOCABS, PREPARE_VOCABULARY, VOCABULARY_CHUNK_SIZE,
+                    ERRORS, ERROR_APPENDING, VOCABULARY_UPDATES, AOU_GEN_ID,
+                    AOU_CUSTOM_ID)
 from resources import AOU_VOCAB_PATH, AOU_VOCAB_CONCEPT_CSV_PATH, hash_dir
 from io import open
 
 RAW_DATE_PATTERN = re.compile(r'\d{8}$')
 BQ_DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}$')
+# lines containing an AoU vocabulary id, dropped before the AoU rows are appended
+AOU_ROW_PATTERN = re.compile(
+    r'(?m)^[^\n]*(%s)[^\n]*\n' %
+    '|'.join(re.escape(vocab_id) for vocab_id in VOCABULARY_UPDATES))
+# the fields of a line before the field at a given index
+FIELDS_PREFIX = r'(?:[^\t\n]*\t){%d}'
+ERROR_TRANSFORMING = 'Error %s transforming row:\n%s\n'
+MEGABYTE = 1024 * 1024
 
 csv.field_size_limit(sys.maxsize)
 
@@ -158,20 +173,29 @@ def append_concepts(in_path, out_path):
                     out_fp.write(row)
 
         # append new rows
-        with open(AOU_VOCAB_CONCEPT_CSV_PATH, 'r') as aou_gen_fp:
-            # Sending the first five lines of the file because tab delimiters
-            # are causing trouble with the Sniffer and has_header method
-            five_lines = ''
-            for _ in range(0, 5):
-                five_lines += aou_gen_fp.readline()
-
-            has_header = csv.Sniffer().has_header(five_lines)
-            aou_gen_fp.seek(0)
-            # skip header if present
-            if has_header:
-                next(aou_gen_fp)
-            for row in aou_gen_fp:
-                out_fp.write(row)
+        _write_aou_concepts(out_fp)
+
+
+def _write_aou_concepts(out_fp):
+    """
+    Write the AOU-specific concepts, without a header
+
+    :param out_fp: file object of the concept file being written
+    """
+    with open(AOU_VOCAB_CONCEPT_CSV_PATH, 'r') as aou_gen_fp:
+        # Sending the first five lines of the file because tab delimiters
+        # are causing trouble with the Sniffer and has_header method
+        five_lines = ''
+        for _ in range(0, 5):
+            five_lines += aou_gen_fp.readline()
+
+        has_header = csv.Sniffer().has_header(five_lines)
+        aou_gen_fp.seek(0)
+        # skip header if present
+        if has_header:
+            next(aou_gen_fp)
+        for row in aou_gen_fp:
+            out_fp.write(row)
 
 
 def append_vocabulary(in_path, out_path):
@@ -182,8 +206,6 @@ def append_vocabulary(in_path, out_path):
     :param out_path: location to save the updated vocabulary file
     :return:
     """
-    aou_general_row = get_aou_vocabulary_row(AOU_GEN_ID)
-    aou_custom_row = get_aou_vocabulary_row(AOU_CUSTOM_ID)
     with open(out_path, 'w') as out_fp:
         # copy original rows line by line for memory efficiency
         with open(in_path, 'r') as in_fp:
@@ -196,19 +218,29 @@ def append_vocabulary(in_path, out_path):
                                                vocab_id=vocab_id_in_row))
                 else:
                     out_fp.write(row)
-        # append AoU_General and AoU_Custom
-        # newline needed here because write[lines] does not include line separator
-        out_fp.write(aou_general_row + '\n')
-        out_fp.write(aou_custom_row)
+        _write_aou_vocabularies(out_fp)
 
 
-def add_aou_vocabs(in_dir, out_dir):
+def _write_aou_vocabularies(out_fp):
     """
-    Add vocabularies AoU_General and AoU_Custom to the vocabulary at specified path
+    Write the rows of the vocabularies AoU_General and AoU_Custom
 
-    :param in_dir: existing vocabulary files
-    :param out_dir: location to save the updated vocabulary files
-    :return:
+    :param out_fp: file object of the vocabulary file being written
+    """
+    aou_general_row = get_aou_vocabulary_row(AOU_GEN_ID)
+    aou_custom_row = get_aou_vocabulary_row(AOU_CUSTOM_ID)
+    # newline needed here because write[lines] does not include line separator
+    out_fp.write(aou_general_row + '\n')
+    out_fp.write(aou_custom_row)
+
+
+def _find_concept_and_vocabulary(in_dir):
+    """
+    Find the concept and vocabulary files in a directory
+
+    :param in_dir: directory of the vocabulary files
+    :return: a tuple of the paths of the concept and vocabulary files
+    :raises: IOError if either file is missing
     """
     file_names = os.listdir(in_dir)
     concept_in_path = None
@@ -225,6 +257,18 @@ def add_aou_vocabs(in_dir, out_dir):
         raise IOError('CONCEPT.csv was not found in %s' % in_dir)
     if vocabulary_in_path is None:
         raise IOError('VOCABULARY.csv was not found in %s' % in_dir)
+    return concept_in_path, vocabulary_in_path
+
+
+def add_aou_vocabs(in_dir, out_dir):
+    """
+    Add vocabularies AoU_General and AoU_Custom to the vocabulary at specified path
+
+    :param in_dir: existing vocabulary files
+    :param out_dir: location to save the updated vocabulary files
+    :return:
+    """
+    concept_in_path, vocabulary_in_path = _find_concept_and_vocabulary(in_dir)
 
     concept_out_path = os.path.join(out_dir, os.path.basename(concept_in_path))
     append_concepts(concept_in_path, concept_out_path)
@@ -234,6 +278,218 @@ def add_aou_vocabs(in_dir, out_dir):
     append_vocabulary(vocabulary_in_path, vocabulary_out_path)
 
 
+def _get_chunks(file_path, start, chunk_size):
+    """
+    Split a file into byte ranges of whole lines
+
+    :param file_path: path of the file
+    :param start: offset of the first byte to split
+    :param chunk_size: approximate size of each byte range
+    :return: a generator of (start, end) offsets
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as fp:
+        while start < file_size:
+            end = start + chunk_size
+            if end < file_size:
+                # extend the range to the end of the line
+                fp.seek(end)
+                fp.readline()
+                end = fp.tell()
+            else:
+                end = file_size
+            yield start, end
+            start = end
+
+
+def _transform_text(text, date_indexes, drop_aou_rows):
+    """
+    Transform lines of a vocabulary file
+
+    Every date field of the lines is rewritten at once with a regular
+    expression over the whole text, rather than field by field.  Fields are
+    separated by tabs only, quotes are kept as they are.
+
+    :param text: whole lines of a vocabulary file, without its header
+    :param date_indexes: indexes of the date fields
+    :param drop_aou_rows: if True, lines containing AoU vocabulary ids are
+        dropped, so they can be appended
+    :return: a tuple of the transformed text, the text of the error messages
+        and the set of AoU vocabulary ids found
+    """
+    # standardize line endings and terminate the last line
+    text = text.replace('\r\n', LINE_TERMINATOR)
+    if text and not text.endswith(LINE_TERMINATOR):
+        text += LINE_TERMINATOR
+
+    vocab_ids = set()
+    if drop_aou_rows:
+
+        def drop_row(match):
+            vocab_ids.add(match.group(1))
+            return ''
+
+        text = AOU_ROW_PATTERN.sub(drop_row, text)
+
+    errors = []
+    for index in date_indexes:
+        prefix = FIELDS_PREFIX % index
+        # yyyymmdd to yyyy-mm-dd
+        text = re.sub(r'(?m)^(%s)(\d{4})(\d{2})(\d{2})(?=\t|$)' % prefix,
+                      r'\1\2-\3-\4', text)
+
+        def drop_invalid_row(match, index=index):
+            row = match.group(0)[:-1]
+            errors.append(
+                ERROR_TRANSFORMING %
+                ('Cannot parse date field %d' % index, row.split(DELIMITER)))
+            return ''
+
+        # lines without a valid date in the field
+        text = re.sub(r'(?m)^(?!%s\d{4}-\d{2}-\d{2}(?:\t|$))[^\n]*\n' % prefix,
+                      drop_invalid_row, text)
+
+    return text, ''.join(errors), vocab_ids
+
+
+def _transform_chunk(chunk):
+    """
+    Read and transform a byte range of a vocabulary file
+
+    :param chunk: a tuple of the file path, the start and end offsets, the
+        indexes of the date fields and whether to drop AoU rows
+    :return: see _transform_text
+    """
+    file_path, start, end, date_indexes, drop_aou_rows = chunk
+    with open(file_path, 'rb') as fp:
+        fp.seek(start)
+        text = fp.read(end - start).decode('utf-8')
+    return _transform_text(text, date_indexes, drop_aou_rows)
+
+
+def _map_ordered(executor, fn, items, max_pending):
+    """
+    Map items with an executor, in order, with a bounded number of pending items
+
+    :param executor: a concurrent.futures executor
+    :param fn: function to apply to each item
+    :param items: iterable of items
+    :param max_pending: the most items submitted and not yet returned
+    :return: a generator of the results in the order of the items
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, item))
+    while pending:
+        yield pending.popleft().result()
+
+
+def prepare_file(executor,
+                 file_path,
+                 out_dir,
+                 chunk_size=VOCABULARY_CHUNK_SIZE):
+    """
+    Transform a vocabulary file and add the AoU rows in one pass
+
+    Dates are formatted and line endings standardized as in transform_file.
+    Records for AoU_General and AoU_Custom are appended to the concept and
+    vocabulary files, replacing any existing ones, as in add_aou_vocabs.
+
+    :param executor: a concurrent.futures executor transforming the byte ranges
+    :param file_path: path of the vocabulary file
+    :param out_dir: directory to save the prepared file
+    :param chunk_size: approximate size in bytes of the ranges transformed
+        in parallel
+    :return: the number of bytes read
+    """
+    file_name = os.path.basename(file_path)
+    table_name, _ = os.path.splitext(file_name.lower())
+    drop_aou_rows = table_name in [CONCEPT, VOCABULARY]
+    out_file_name = os.path.join(out_dir, file_name)
+    err_file_name = os.path.join(out_dir, ERRORS, file_name)
+
+    with open(file_path, 'rb') as in_fp:
+        header = in_fp.readline().decode('utf-8').rstrip('\r\n')
+        start = in_fp.tell()
+    date_indexes = [
+        index for index, item in enumerate(header.split(DELIMITER))
+        if item.endswith('_date')
+    ]
+
+    chunks = (
+        (file_path, chunk_start, chunk_end, date_indexes, drop_aou_rows)
+        for chunk_start, chunk_end in _get_chunks(file_path, start, chunk_size))
+    # bound the transformed text waiting to be written
+    max_pending = 2 * (getattr(executor, '_max_workers', 1) or 1)
+
+    vocab_ids = set()
+    with open(out_file_name, 'w') as out_fp, open(err_file_name, 'w') as err_fp:
+        out_fp.write(header + LINE_TERMINATOR)
+        for text, errors, chunk_vocab_ids in _map_ordered(
+                executor, _transform_chunk, chunks, max_pending):
+            out_fp.write(text)
+            err_fp.write(errors)
+            vocab_ids.update(chunk_vocab_ids)
+
+        for vocab_id in sorted(vocab_ids):
+            # existing rows are dropped so they are appended below
+            warnings.warn(
+                ERROR_APPENDING.format(in_path=file_path, vocab_id=vocab_id))
+
+        if table_name == CONCEPT:
+            _write_aou_concepts(out_fp)
+        elif table_name == VOCABULARY:
+            _write_aou_vocabularies(out_fp)
+
+    return os.path.getsize(file_path)
+
+
+def prepare_files(in_dir,
+                  out_dir,
+                  processes=None,
+                  chunk_size=VOCABULARY_CHUNK_SIZE):
+    """
+    Transform vocabulary files and add vocabularies AoU_General and AoU_Custom
+
+    Combines transform_files and add_aou_vocabs, reading and writing each file
+    once.  The throughput of each file and of all files is logged in MB/s.
+
+    :param in_dir: Directory containing vocabulary csv files
+    :param out_dir: Directory to save the prepared files
+    :param processes: number of processes transforming the files, defaults
+        to the number of CPUs
+    :param chunk_size: approximate size in bytes of the ranges transformed
+        in parallel
+    :return: a dictionary of file names to the MB/s they were prepared at
+    """
+    # fail before transforming anything if the AoU rows can't be added
+    _find_concept_and_vocabulary(in_dir)
+    os.makedirs(os.path.join(out_dir, ERRORS), exist_ok=True)
+
+    rates = {}
+    total_bytes = 0
+    total_start = time.time()
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for file_name in sorted(os.listdir(in_dir)):
+            file_path = os.path.join(in_dir, file_name)
+            start = time.time()
+            file_bytes = prepare_file(executor, file_path, out_dir, chunk_size)
+            elapsed = max(time.time() - start, 1e-6)
+            rates[file_name] = file_bytes / MEGABYTE / elapsed
+            total_bytes += file_bytes
+            logging.info(f"Prepared {file_name}:\t"
+                         f"{file_bytes / MEGABYTE:.1f} MB in {elapsed:.1f}s\t"
+                         f"({rates[file_name]:.1f} MB/s)")
+
+    elapsed = max(time.time() - total_start, 1e-6)
+    logging.info(f"Prepared vocabulary files in {in_dir}:\t"
+                 f"{total_bytes / MEGABYTE:.1f} MB in {elapsed:.1f}s\t"
+                 f"({total_bytes / MEGABYTE / elapsed:.1f} MB/s)")
+    return rates
+
+
 if __name__ == '__main__':
     import argparse
 
@@ -242,12 +498,17 @@ if __name__ == '__main__':
     arg_parser.add_argument('command',
                             choices=[
                                 TRANSFORM_FILES, ADD_AOU_VOCABS,
-                                APPEND_VOCABULARY, APPEND_CONCEPTS
+                                APPEND_VOCABULARY, APPEND_CONCEPTS,
+                                PREPARE_VOCABULARY
                             ])
     arg_parser.add_argument('--in_dir', required=True)
     arg_parser.add_argument('--out_dir', required=True)
+    arg_parser.add_argument('--processes', type=int, default=None)
     args = arg_parser.parse_args()
-    if args.command == TRANSFORM_FILES:
+    if args.command == PREPARE_VOCABULARY:
+        logging.basicConfig(level=logging.INFO)
+        prepare_files(args.in_dir, args.out_dir, processes=args.processes)
+    elif args.command == TRANSFORM_FILES:
         transform_files(args.in_dir, args.out_dir)
     elif args.command == ADD_AOU_VOCABS:
         add_aou_vocabs(args.in_dir, args.out_dir)
@@ -1,12 +1,46 @@
+import json
+import threading
 import unittest
 from datetime import datetime
 
 import mock
+from googleapiclient.errors import HttpError
 
 import bq_utils
 from constants import bq_utils as bq_utils_consts
 
 
+def _result_pages(row_count, page_size):
+    """
+    Get fake getQueryResults pages of a single integer column
+    """
+    pages = []
+    for start in range(0, row_count, page_size):
+        stop = min(start + page_size, row_count)
+        page = {
+            'jobReference': {
+                'jobId': 'fake_job'
+            },
+            'totalRows': str(row_count),
+            'schema': {
+                'fields': [{
+                    'name': 'person_id',
+                    'type': 'INTEGER',
+                    'mode': 'NULLABLE'
+                }]
+            },
+            'rows': [{
+                'f': [{
+                    'v': str(i)
+                }]
+            } for i in range(start, stop)]
+        }
+        if stop < row_count:
+            page['pageToken'] = 'token_%d' % stop
+        pages.append(page)
+    return pages
+
+
 class BqUtilsTest(unittest.TestCase):
 
     @classmethod
@@ -22,55 +56,228 @@ class BqUtilsTest(unittest.TestCase):
         self.assertRaises(ValueError, bq_utils.load_cdm_csv, self.hpo_id,
                           'not_a_cdm_table')
 
-    @mock.patch('bq_utils.job_status_done', lambda x: True)
-    def test_wait_on_jobs_already_done(self):
+    @staticmethod
+    def _job_resources(job_ids, done_polls):
+        """
+        Fake batched job polling
+
+        :param job_ids: ids of the jobs being waited on
+        :param done_polls: list with an entry per poll, each a list of
+            booleans indicating whether the outstanding jobs are done
+        :return: side effect for get_jobs_details
+        """
+        outstanding = list(job_ids)
+        polls = iter(done_polls)
+
+        def get_jobs_details(ids):
+            assert list(ids) == outstanding
+            states = next(polls)
+            resources = dict()
+            for job_id, done in zip(ids, states):
+                state = 'DONE' if done else 'RUNNING'
+                resources[job_id] = {'status': {'state': state}}
+            outstanding[:] = [
+                job_id for job_id, done in zip(ids, states) if not done
+            ]
+            return resources
+
+        return get_jobs_details
+
+    @mock.patch('bq_utils.sleeper')
+    @mock.patch('bq_utils.get_jobs_details')
+    def test_wait_on_jobs_already_done(self, mock_get_jobs_details,
+                                       mock_sleeper):
         job_ids = range(3)
+        mock_get_jobs_details.side_effect = self._job_resources(
+            job_ids, [[True, True, True]])
         actual = bq_utils.wait_on_jobs(job_ids)
         expected = []
         self.assertEqual(actual, expected)
+        # all jobs are polled with a single batch
+        self.assertEqual(mock_get_jobs_details.call_count, 1)
 
     @mock.patch('time.sleep', return_value=None)
-    @mock.patch('bq_utils.job_status_done', return_value=False)
-    def test_wait_on_jobs_all_fail(self, mock_job_status_done, mock_time_sleep):
+    @mock.patch('bq_utils.get_jobs_details')
+    def test_wait_on_jobs_all_fail(self, mock_get_jobs_details,
+                                   mock_time_sleep):
         job_ids = list(range(3))
+        mock_get_jobs_details.side_effect = self._job_resources(
+            job_ids,
+            [[False, False, False]] * bq_utils_consts.BQ_DEFAULT_RETRY_COUNT)
         actual = bq_utils.wait_on_jobs(job_ids)
         expected = job_ids
         self.assertEqual(actual, expected)
-        # TODO figure out how to count this
-        # self.assertEquals(mock_time_sleep.call_count, bq_utils.BQ_DEFAULT_RETRY_COUNT)
+        self.assertEqual(mock_time_sleep.call_count,
+                         bq_utils_consts.BQ_DEFAULT_RETRY_COUNT)
 
     @mock.patch('time.sleep', return_value=None)
-    @mock.patch(
-        'bq_utils.job_status_done',
-        side_effect=[False, False, False, True, False, False, True, True, True])
-    def test_wait_on_jobs_get_done(self, mock_job_status_done, mock_time_sleep):
+    @mock.patch('bq_utils.get_jobs_details')
+    def test_wait_on_jobs_get_done(self, mock_get_jobs_details,
+                                   mock_time_sleep):
         job_ids = list(range(3))
+        mock_get_jobs_details.side_effect = self._job_resources(
+            job_ids,
+            [[False, False, False], [True, False, False], [True, True]])
         actual = bq_utils.wait_on_jobs(job_ids)
         expected = []
         self.assertEqual(actual, expected)
+        self.assertEqual(mock_get_jobs_details.call_count, 3)
 
     @mock.patch('time.sleep', return_value=None)
-    @mock.patch('bq_utils.job_status_done',
-                side_effect=[
-                    False, False, True, False, False, False, False, False,
-                    False, False, False, False
-                ])
-    def test_wait_on_jobs_some_fail(self, mock_job_status_done,
+    @mock.patch('bq_utils.get_jobs_details')
+    def test_wait_on_jobs_some_fail(self, mock_get_jobs_details,
                                     mock_time_sleep):
         job_ids = list(range(2))
+        mock_get_jobs_details.side_effect = self._job_resources(
+            job_ids, [[False, False], [True, False]] + [[False]] *
+            (bq_utils_consts.BQ_DEFAULT_RETRY_COUNT - 2))
         actual = bq_utils.wait_on_jobs(job_ids)
         expected = [1]
         self.assertEqual(actual, expected)
 
     @mock.patch('bq_utils.sleeper')
-    @mock.patch('bq_utils.job_status_done')
-    def test_wait_on_jobs_retry_count(self, mock_job_status, mock_sleep):
+    @mock.patch('bq_utils.get_jobs_details')
+    def test_wait_on_jobs_retry_count(self, mock_get_jobs_details, mock_sleep):
         max_sleep_interval = 512
-        mock_job_status.return_value = False
         job_ids = ["job_1", "job_2"]
+        mock_get_jobs_details.side_effect = self._job_resources(
+            job_ids, [[False, False]] * bq_utils_consts.BQ_DEFAULT_RETRY_COUNT)
         bq_utils.wait_on_jobs(job_ids)
         mock_sleep.assert_called_with(max_sleep_interval)
 
+    @mock.patch('bq_utils.time.time')
+    @mock.patch('bq_utils.sleeper')
+    @mock.patch('bq_utils.get_jobs_details')
+    def test_wait_on_jobs_slowest_job_interval(self, mock_get_jobs_details,
+                                               mock_sleep, mock_time):
+        now = 10000.0
+        mock_time.return_value = now
+        running_since = {'job_1': now - 10, 'job_2': now - 400}
+        job_resources = {
+            job_id: {
+                'status': {
+                    'state': 'RUNNING'
+                },
+                'statistics': {
+                    'startTime': str(int(start * 1000))
+                }
+            } for job_id, start in running_since.items()
+        }
+        mock_get_jobs_details.return_value = job_resources
+
+        bq_utils.wait_on_jobs(list(running_since.keys()), retry_count=3)
+
+        # the interval is based on the job which has been running for 400s
+        expected_interval = 400 * bq_utils_consts.POLL_RUNTIME_FRACTION
+        self.assertEqual([
+            mock.call(1),
+            mock.call(expected_interval),
+            mock.call(expected_interval)
+        ], mock_sleep.mock_calls)
+
+    @mock.patch('bq_utils.app_identity.get_application_id')
+    @mock.patch('bq_utils.create_service')
+    def test_get_jobs_details(self, mock_create_service,
+                              mock_get_application_id):
+        mock_get_application_id.return_value = 'fake_project'
+        job_ids = [
+            f'job_{i}' for i in range(bq_utils_consts.JOB_BATCH_SIZE + 5)
+        ]
+        job_states = {job_id: 'DONE' for job_id in job_ids}
+        job_states['job_1'] = 'RUNNING'
+        bq_service = mock_create_service.return_value
+        bq_service.jobs.return_value.get.side_effect = (
+            lambda projectId, jobId: jobId)
+
+        batches = []
+
+        def new_batch_http_request(callback):
+            batch = mock.MagicMock()
+            batch.add.side_effect = lambda job_id, request_id: callback(
+                request_id, {'status': {
+                    'state': job_states[job_id]
+                }}, None)
+            batches.append(batch)
+            return batch
+
+        bq_service.new_batch_http_request.side_effect = new_batch_http_request
+
+        actual = bq_utils.get_jobs_details(job_ids)
+        self.assertCountEqual(job_ids, actual.keys())
+        self.assertEqual('RUNNING', actual['job_1']['status']['state'])
+        # requests are batched
+        self.assertEqual(2, bq_service.new_batch_http_request.call_count)
+
+        # finished jobs are not fetched again
+        batches.clear()
+        actual = bq_utils.get_jobs_details(job_ids)
+        self.assertCountEqual(job_ids, actual.keys())
+        self.assertEqual(1, len(batches))
+        self.assertEqual([mock.call('job_1', request_id='job_1')],
+                         batches[0].add.mock_calls)
+        self.assertEqual(actual['job_0'], bq_utils.get_job_details('job_0'))
+        bq_service.jobs.return_value.get.return_value.execute.assert_not_called(
+        )
+
+    @mock.patch('bq_utils.sleeper')
+    @mock.patch('bq_utils.app_identity.get_application_id')
+    @mock.patch('bq_utils.create_service')
+    def test_get_jobs_details_retries(self, mock_create_service,
+                                      mock_get_application_id, mock_sleep):
+        mock_get_application_id.return_value = 'fake_project'
+        job_ids = ['retry_job_0', 'retry_job_1', 'retry_job_2']
+        unavailable = HttpError(mock.Mock(status=503), b'unavailable')
+        not_found = HttpError(mock.Mock(status=404), b'not found')
+        bq_service = mock_create_service.return_value
+        bq_service.jobs.return_value.get.side_effect = (
+            lambda projectId, jobId: jobId)
+        bq_service.jobs.return_value.get.return_value.execute.side_effect = (
+            lambda num_retries: {
+                'status': {
+                    'state': 'DONE'
+                }
+            })
+        done = {'status': {'state': 'DONE'}}
+        # errors of each job's request, per batch
+        batch_errors = [{
+            'retry_job_0': unavailable,
+            'retry_job_2': not_found
+        }, {}]
+        batches = []
+
+        def new_batch_http_request(callback):
+            errors = batch_errors.pop(0)
+            batch = mock.MagicMock()
+            batch.add.side_effect = lambda job_id, request_id: callback(
+                request_id, None
+                if job_id in errors else done, errors.get(job_id))
+            batches.append(batch)
+            return batch
+
+        bq_service.new_batch_http_request.side_effect = new_batch_http_request
+
+        # only the request with a transient error is sent again
+        actual = bq_utils.get_jobs_details(job_ids)
+        self.assertCountEqual(['retry_job_0', 'retry_job_1'], actual.keys())
+        self.assertEqual(2, len(batches))
+        self.assertEqual([mock.call('retry_job_0', request_id='retry_job_0')],
+                         batches[1].add.mock_calls)
+        mock_sleep.assert_called_once_with(1)
+
+        # jobs of failing batches are fetched one at a time
+        batches.clear()
+        batch_errors = [{}] * bq_utils_consts.JOB_BATCH_RETRY_COUNT
+        execute = mock.MagicMock(side_effect=unavailable)
+        bq_service.jobs.return_value.get.side_effect = None
+        bq_service.new_batch_http_request.side_effect = (
+            lambda callback: mock.MagicMock(execute=execute))
+        actual = bq_utils.get_jobs_details(['retry_job_2', 'retry_job_3'])
+        self.assertCountEqual(['retry_job_2', 'retry_job_3'], actual.keys())
+        self.assertEqual(bq_utils_consts.JOB_BATCH_RETRY_COUNT,
+                         execute.call_count)
+        bq_service.jobs.return_value.get.return_value.execute.assert_called_with(
+            num_retries=bq_utils_consts.BQ_DEFAULT_RETRY_COUNT)
+
     @mock.patch('bq_utils.os.environ.get')
     def test_get_validation_results_dataset_id_not_existing(self, mock_env_var):
         # preconditions
@@ -95,3 +302,232 @@ class BqUtilsTest(unittest.TestCase):
         # post conditions
         expected = 'dataset_foo'
         self.assertEqual(result_id, expected)
+
+    def _mock_query_results_page(self, mock_get_query_results_page, pages,
+                                 page_size):
+        fetched = threading.Event()
+
+        def get_query_results_page(job_id,
+                                   page_token=None,
+                                   start_index=None,
+                                   max_results=None):
+            if page_token is not None:
+                start_index = int(page_token.split('_')[1])
+            fetched.set()
+            return pages[start_index // page_size]
+
+        mock_get_query_results_page.side_effect = get_query_results_page
+        return fetched
+
+    @mock.patch('bq_utils.get_query_results_page')
+    def test_iter_response_rows_prefetch(self, mock_get_query_results_page):
+        pages = _result_pages(10, 4)
+        fetched = self._mock_query_results_page(mock_get_query_results_page,
+                                                pages, 4)
+
+        rows = bq_utils.iter_response_rows(pages[0])
+        self.assertEqual(next(rows), {'person_id': 0})
+        # the second page is fetched while the first one is processed
+        self.assertTrue(fetched.wait(timeout=5))
+        self.assertEqual([row['person_id'] for row in rows], list(range(1, 10)))
+        self.assertEqual([
+            mock.call('fake_job', page_token='token_4'),
+            mock.call('fake_job', page_token='token_8')
+        ], mock_get_query_results_page.mock_calls)
+
+    @mock.patch('bq_utils.get_query_results_page')
+    def test_iter_response_rows_no_prefetch(self, mock_get_query_results_page):
+        pages = _result_pages(10, 4)
+        self._mock_query_results_page(mock_get_query_results_page, pages, 4)
+
+        rows = bq_utils.iter_response_rows(pages[0], prefetch=False)
+        self.assertEqual(next(rows), {'person_id': 0})
+        mock_get_query_results_page.assert_not_called()
+        self.assertEqual([row['person_id'] for row in rows], list(range(1, 10)))
+
+    @mock.patch('bq_utils.get_query_results_page')
+    def test_iter_response_batches(self, mock_get_query_results_page):
+        pages = _result_pages(10, 4)
+        self._mock_query_results_page(mock_get_query_results_page, pages, 4)
+
+        batches = list(bq_utils.iter_response_batches(pages[0]))
+        self.assertEqual([len(batch['person_id'].values) for batch in batches],
+                         [4, 4, 2])
+
+    @mock.patch('bq_utils.get_query_results_page')
+    def test_large_response_to_rowlist(self, mock_get_query_results_page):
+        pages = _result_pages(10, 4)
+        self._mock_query_results_page(mock_get_query_results_page, pages, 4)
+
+        expected = [{'person_id': i} for i in range(10)]
+        self.assertEqual(bq_utils.large_response_to_rowlist(pages[0]), expected)
+
+        mock_get_query_results_page.reset_mock()
+        actual = bq_utils.large_response_to_rowlist(pages[0],
+                                                    parallel=True,
+                                                    max_workers=2)
+        self.assertEqual(actual, expected)
+        self.assertCountEqual([
+            mock.call('fake_job', start_index=4, max_results=4),
+            mock.call('fake_job', start_index=8, max_results=4)
+        ], mock_get_query_results_page.mock_calls)
+
+        # a single page is not fetched again
+        mock_get_query_results_page.reset_mock()
+        single_page = _result_pages(3, 4)[0]
+        self.assertEqual(
+            bq_utils.large_response_to_rowlist(single_page, parallel=True),
+            expected[:3])
+        mock_get_query_results_page.assert_not_called()
+
+    def _lookup_fields(self):
+        return [{
+            'name': 'concept_id',
+            'type': 'integer',
+            'mode': 'required'
+        }, {
+            'name': 'concept_name',
+            'type': 'string',
+            'mode': 'required'
+        }, {
+            'name': 'value',
+            'type': 'float',
+            'mode': 'nullable'
+        }]
+
+    def test_row_to_json_record(self):
+        field_map = bq_utils.get_field_map(self._lookup_fields())
+
+        record = bq_utils.row_to_json_record(
+            {
+                'concept_id': '1234',
+                'concept_name': '',
+                'value': ''
+            }, field_map)
+        self.assertEqual(json.loads(record), {
+            'concept_id': 1234,
+            'concept_name': ''
+        })
+
+        record = bq_utils.row_to_json_record(
+            {
+                'concept_id': 0,
+                'concept_name': 'zero',
+                'value': '0.5'
+            }, field_map)
+        self.assertEqual(json.loads(record), {
+            'concept_id': 0,
+            'concept_name': 'zero',
+            'value': 0.5
+        })
+
+        with self.assertRaises(bq_utils.InvalidOperationError):
+            bq_utils.row_to_json_record({'concept_id': ''}, field_map)
+        with self.assertRaises(bq_utils.InvalidOperationError):
+            bq_utils.row_to_json_record({'unknown': '1'}, field_map)
+
+    @mock.patch('bq_utils.get_job_details')
+    @mock.patch('bq_utils.wait_on_jobs')
+    @mock.patch('bq_utils.create_service')
+    def test_load_table_from_rows(self, mock_create_service, mock_wait_on_jobs,
+                                  mock_get_job_details):
+        rows = [{
+            'concept_id': str(i),
+            'concept_name': 'name_%d' % i,
+            'value': ''
+        } for i in range(3)]
+        jobs = mock_create_service.return_value.jobs.return_value
+        jobs.insert.return_value.execute.return_value = {
+            'jobReference': {
+                'jobId': 'fake_job'
+            }
+        }
+        mock_wait_on_jobs.return_value = []
+        job = {'status': {'state': 'DONE'}}
+        mock_get_job_details.return_value = job
+
+        actual = bq_utils.load_table_from_rows('fake_project', 'fake_dataset',
+                                               'fake_table', rows,
+                                               self._lookup_fields())
+
+        self.assertEqual(actual, job)
+        insert_kwargs = jobs.insert.call_args[1]
+        load = insert_kwargs['body']['configuration']['load']
+        self.assertEqual(load['destinationTable']['tableId'], 'fake_table')
+        self.assertEqual(load['sourceFormat'], 'NEWLINE_DELIMITED_JSON')
+        media = insert_kwargs['media_body']
+        uploaded = media.getbytes(0, media.size()).decode('utf-8')
+        self.assertEqual([json.loads(line) for line in uploaded.splitlines()],
+                         [{
+                             'concept_id': i,
+                             'concept_name': 'name_%d' % i
+                         } for i in range(3)])
+        mock_wait_on_jobs.assert_called_once_with(['fake_job'])
+
+        # a failed load job is raised
+        mock_get_job_details.return_value = {
+            'status': {
+                'state': 'DONE',
+                'errorResult': {
+                    'reason': 'invalid',
+                    'message': 'bad row'
+                }
+            }
+        }
+        with self.assertRaises(bq_utils.LoadJobError):
+            bq_utils.load_table_from_rows('fake_project', 'fake_dataset',
+                                          'fake_table', rows,
+                                          self._lookup_fields())
+
+    @mock.patch('bq_utils.query')
+    @mock.patch('bq_utils.create_table')
+    @mock.patch('bq_utils.create_service')
+    def test_load_table_from_rows_quota_fallback(self, mock_create_service,
+                                                 mock_create_table, mock_query):
+        rows = [{
+            'concept_id': str(i),
+            'concept_name': 'name_%d' % i,
+            'value': ''
+        } for i in range(bq_utils_consts.INSERT_CHUNK_SIZE + 1)]
+        jobs = mock_create_service.return_value.jobs.return_value
+        content = json.dumps({
+            'error': {
+                'errors': [{
+                    'reason': 'quotaExceeded',
+                    'message': 'Quota exceeded'
+                }]
+            }
+        }).encode('utf-8')
+        jobs.insert.return_value.execute.side_effect = HttpError(
+            mock.MagicMock(status=403), content)
+        mock_query.return_value = {'jobReference': {'jobId': 'fake_job'}}
+
+        actual = bq_utils.load_table_from_rows('fake_project', 'fake_dataset',
+                                               'fake_table', rows,
+                                               self._lookup_fields())
+
+        self.assertEqual(actual, mock_query.return_value)
+        self.assertTrue(mock_create_table.called)
+        # rows are inserted in chunks
+        self.assertEqual(mock_query.call_count, 2)
+        self.assertIn("(0,'name_0',NULL)", mock_query.call_args_list[0][0][0])
+        self.assertIn("(1000,'name_1000',NULL)",
+                      mock_query.call_args_list[1][0][0])
+
+        # other errors are raised
+        jobs.insert.return_value.execute.side_effect = HttpError(
+            mock.MagicMock(status=400), b'{}')
+        with self.assertRaises(HttpError):
+            bq_utils.load_table_from_rows('fake_project', 'fake_dataset',
+                                          'fake_table', rows,
+                                          self._lookup_fields())
+
+    @mock.patch('bq_utils.load_table_from_rows')
+    def test_load_table_from_csv(self, mock_load_table_from_rows):
+        bq_utils.load_table_from_csv('fake_project', 'fake_dataset',
+                                     'achilles_analysis')
+
+        args = mock_load_table_from_rows.call_args[0]
+        self.assertEqual(args[2], 'achilles_analysis')
+        self.assertEqual(args[3][0]['analysis_id'], '0')
+        self.assertIn('analysis_id', [field['name'] for field in args[4]])
@@ -1,6 +1,8 @@
+import threading
 import unittest
 import mock
 import bq_utils
+from google.api_core.exceptions import GoogleAPIError
 from googleapiclient.errors import HttpError
 from cdr_cleaner import clean_cdr_engine
 from constants.cdr_cleaner import clean_cdr as cdr_consts
@@ -18,6 +20,24 @@ class CleanCDREngineTest(unittest.TestCase):
     def setUp(self):
 
         self.project = 'test-project'
+        mock_get_job_details_patcher = mock.patch('bq_utils.get_job_details')
+        self.mock_get_job_details = mock_get_job_details_patcher.start()
+        self.mock_get_job_details.return_value = {
+            'statistics': {
+                'creationTime': '1000',
+                'startTime': '3500',
+                'totalSlotMs': '1200',
+                'query': {
+                    'totalBytesProcessed': '2048',
+                    'numDmlAffectedRows': '7'
+                }
+            }
+        }
+        self.addCleanup(mock_get_job_details_patcher.stop)
+        mock_save_run_report_patcher = mock.patch(
+            'cdr_cleaner.clean_cdr_engine.run_report.save_run_report')
+        self.mock_save_run_report = mock_save_run_report_patcher.start()
+        self.addCleanup(mock_save_run_report_patcher.stop)
         self.dry_run = False
         self.statement_one = {
             cdr_consts.QUERY: 'query one',
@@ -72,10 +92,21 @@ class CleanCDREngineTest(unittest.TestCase):
                                                (True,
                                                 self.exception_statement_one)]
 
-        clean_cdr_engine.clean_dataset(self.project, self.statements)
+        report = clean_cdr_engine.clean_dataset(self.project, self.statements)
 
         self.assertEqual(mock_bq_utils.call_count, len(self.statements))
         self.assertEqual(mock_format_failure_message.call_count, 1)
+        self.assertEqual(report['successes'], 1)
+        self.assertEqual(report['failures'], 1)
+        self.mock_save_run_report.assert_called_once_with(report)
+        for record, statement in zip(report['statements'], self.statements):
+            self.assertEqual(record['module_name'],
+                             statement[cdr_consts.MODULE_NAME])
+            self.assertEqual(record['queue_seconds'], 2.5)
+            self.assertEqual(record['total_bytes_processed'], 2048)
+            self.assertEqual(record['total_slot_ms'], 1200)
+            self.assertEqual(record['rows_affected'], 7)
+        self.assertEqual(report['statements'][1]['status'], 'failed')
 
         mock_bq_utils.assert_any_call(
             self.statement_one.get(cdr_consts.QUERY),
@@ -112,9 +143,11 @@ class CleanCDREngineTest(unittest.TestCase):
             mock.Mock(return_value={'status': 404}),
             self.exception_statement_one)
 
-        clean_cdr_engine.clean_dataset(self.project, self.statements)
+        report = clean_cdr_engine.clean_dataset(self.project, self.statements)
 
         self.assertEqual(mock_wait_on_jobs.call_count, 0)
+        self.assertEqual(report['failures'], 2)
+        self.assertIsNone(report['statements'][0]['job_id'])
         self.assertEqual(mock_job_status_errored.call_count, 0)
         self.assertEqual(mock_format_failure_message.call_count, 2)
 
@@ -128,6 +161,137 @@ class CleanCDREngineTest(unittest.TestCase):
         with self.assertRaises(bq_utils.BigQueryJobWaitError):
             clean_cdr_engine.clean_dataset(self.project, self.statements)
 
+    def _rule_statement(self, rule_name, tables, depends_on=None):
+        return {
+            cdr_consts.QUERY: f'query for {rule_name}',
+            cdr_consts.RULE_NAME: rule_name,
+            cdr_consts.DEPENDS_ON: depends_on if depends_on else [],
+            cdr_consts.AFFECTED_TABLES: tables
+        }
+
+    def test_get_statement_dependencies(self):
+        statements = [
+            self._rule_statement('DrugRule', ['drug_exposure']),
+            self._rule_statement('DeathRule', ['death']),
+            self._rule_statement('DrugRule', ['drug_exposure']),
+            self._rule_statement('PersonRule', ['person'], ['DeathRule']),
+            self._rule_statement('ObservationRule', ['observation']),
+            # legacy function based rule without rule information
+            self.statement_one,
+            self._rule_statement('DeathRule', ['death']),
+            dict(self._rule_statement('SandboxRule', []),
+                 **{cdr_consts.DESTINATION_TABLE: 'sandbox_observation'}),
+            self._rule_statement('UndeclaredRule', [])
+        ]
+
+        actual = clean_cdr_engine.get_statement_dependencies(statements)
+
+        expected = [
+            set(),
+            set(),
+            # the previous query of the same rule
+            {0},
+            # the rule it depends on
+            {1},
+            set(),
+            # legacy statements wait for everything before them
+            {0, 1, 2, 3, 4},
+            # and everything after them waits for them
+            {5},
+            {5},
+            # rules without any table are treated like legacy statements
+            {0, 1, 2, 3, 4, 5, 6, 7}
+        ]
+        self.assertListEqual(expected, actual)
+
+    @mock.patch('bq_utils.job_status_errored')
+    @mock.patch('bq_utils.wait_on_jobs')
+    @mock.patch('bq_utils.query')
+    def test_clean_dataset_concurrent(self, mock_bq_utils, mock_wait_on_jobs,
+                                      mock_job_status_errored):
+        statements = [
+            self._rule_statement('DrugRule', ['drug_exposure']),
+            self._rule_statement('DeathRule', ['death']),
+            self._rule_statement('DrugRule', ['drug_exposure']),
+            self.statement_one
+        ]
+        started = []
+        running = set()
+        concurrent = []
+        lock = threading.Lock()
+        independent_started = threading.Barrier(2, timeout=5)
+
+        def query(rule_query, **kwargs):
+            with lock:
+                started.append(rule_query)
+                running.add(rule_query)
+                concurrent.append(set(running))
+            if rule_query in ('query for DeathRule', 'query for DrugRule'):
+                # both independent rules must be running at the same time
+                if len(started) <= 2:
+                    independent_started.wait()
+            with lock:
+                running.remove(rule_query)
+            return {'jobReference': {'jobId': rule_query}}
+
+        mock_bq_utils.side_effect = query
+        mock_wait_on_jobs.return_value = []
+        mock_job_status_errored.return_value = (False, None)
+
+        clean_cdr_engine.clean_dataset(self.project,
+                                       statements,
+                                       max_concurrent_jobs=4)
+
+        self.assertEqual(mock_bq_utils.call_count, len(statements))
+        self.assertSetEqual({'query for DrugRule', 'query for DeathRule'},
+                            set(started[:2]))
+        # the legacy statement runs last and alone
+        self.assertEqual(started[-1], self.statement_one[cdr_consts.QUERY])
+        self.assertSetEqual({self.statement_one[cdr_consts.QUERY]},
+                            concurrent[-1])
+
+    @mock.patch('bq_utils.job_status_errored')
+    @mock.patch('bq_utils.wait_on_jobs')
+    @mock.patch('bq_utils.query')
+    def test_clean_dataset_concurrent_incomplete(self, mock_bq_utils,
+                                                 mock_wait_on_jobs,
+                                                 mock_job_status_errored):
+        mock_bq_utils.return_value = self.job_results_success
+        mock_wait_on_jobs.return_value = [self.job_id_success]
+
+        with self.assertRaises(bq_utils.BigQueryJobWaitError):
+            clean_cdr_engine.clean_dataset(self.project,
+                                           self.statements,
+                                           max_concurrent_jobs=4)
+
+        # legacy statements are barriers, so the second one never starts
+        self.assertEqual(mock_bq_utils.call_count, 1)
+        self.assertEqual(mock_job_status_errored.call_count, 0)
+
+    @mock.patch('cdr_cleaner.clean_cdr_engine.run_report.upload_run_report')
+    @mock.patch('bq_utils.job_status_errored')
+    @mock.patch('bq_utils.wait_on_jobs')
+    @mock.patch('bq_utils.query')
+    def test_clean_dataset_report_upload(self, mock_bq_utils, mock_wait_on_jobs,
+                                         mock_job_status_errored,
+                                         mock_upload_run_report):
+        mock_bq_utils.return_value = self.job_results_success
+        mock_wait_on_jobs.return_value = []
+        mock_job_status_errored.return_value = (False, None)
+
+        report = clean_cdr_engine.clean_dataset(self.project,
+                                                self.statements,
+                                                report_dataset_id='sandbox')
+        mock_upload_run_report.assert_called_once_with(report, self.project,
+                                                       'sandbox')
+
+        # failing to upload the report does not fail the run
+        mock_upload_run_report.side_effect = GoogleAPIError('upload failed')
+        report = clean_cdr_engine.clean_dataset(self.project,
+                                                self.statements,
+                                                report_dataset_id='sandbox')
+        self.assertEqual(report['successes'], 2)
+
     def test_format_failure_message(self):
 
         expected_failure_message = clean_cdr_engine.FAILURE_MESSAGE_TEMPLATE.format(
@@ -1,6 +1,8 @@
 import mock
 import unittest
 from cdr_cleaner import clean_cdr
+from cdr_cleaner.cleaning_rules import negative_ages, temporal_consistency
+from constants import bq_utils as bq_consts
 from constants.cdr_cleaner import clean_cdr as cdr_consts
 
 
@@ -53,3 +55,123 @@ class CleanCDRTest(unittest.TestCase):
 
         mock_get_module.assert_called_once_with(mock_function)
         mock_getsourcelines.assert_called_once_with(mock_function)
+
+    def test_add_rule_info(self):
+        rule = clean_cdr.EnsureDateDatetimeConsistency(self.project_id,
+                                                       self.dataset_id,
+                                                       self.sandbox_dataset_id)
+
+        actual_query_dict = clean_cdr.add_rule_info([self.query_dict], rule)
+
+        expected_rule_info_dict = {
+            cdr_consts.RULE_NAME: 'EnsureDateDatetimeConsistency',
+            cdr_consts.DEPENDS_ON: [
+                clazz.__name__ for clazz in rule.get_depends_on_classes()
+            ],
+            cdr_consts.AFFECTED_TABLES: rule.affected_tables
+        }
+        expected_query_dict = [
+            dict(**self.query_dict, **expected_rule_info_dict)
+        ]
+
+        self.assertListEqual(actual_query_dict, expected_query_dict)
+
+    def _fusible_query(self, table, query, module_name):
+        return {
+            cdr_consts.QUERY: query,
+            cdr_consts.DESTINATION_TABLE: table,
+            cdr_consts.DESTINATION_DATASET: 'dataset',
+            cdr_consts.DISPOSITION: bq_consts.WRITE_TRUNCATE,
+            cdr_consts.FUSIBLE: True,
+            cdr_consts.MODULE_NAME: module_name
+        }
+
+    def test_fuse_queries(self):
+        filter_measurement = self._fusible_query(
+            'measurement', 'SELECT * FROM `project.dataset.measurement` '
+            'WHERE measurement_id > 0', 'rule_one')
+        filter_observation = self._fusible_query(
+            'observation', 'SELECT * FROM `project.dataset.observation` '
+            'WHERE observation_id > 0', 'rule_one')
+        update_measurement = self._fusible_query(
+            'measurement', 'SELECT m.measurement_id, 1 AS value '
+            'FROM `project.dataset.measurement` m', 'rule_two')
+        sandbox_measurement = {
+            cdr_consts.QUERY: 'SELECT * FROM `project.dataset.measurement`',
+            cdr_consts.DESTINATION_TABLE: 'sandbox_measurement',
+            cdr_consts.DESTINATION_DATASET: 'sandbox',
+            cdr_consts.DISPOSITION: bq_consts.WRITE_TRUNCATE
+        }
+        # not opted in
+        other_measurement = dict(update_measurement)
+        other_measurement.pop(cdr_consts.FUSIBLE)
+
+        actual = clean_cdr.fuse_queries([
+            filter_measurement, filter_observation, update_measurement,
+            sandbox_measurement, filter_measurement, update_measurement,
+            other_measurement
+        ])
+
+        expected_fused_query = cdr_consts.FUSED_QUERY_TEMPLATE.format(
+            steps=', '.join([
+                cdr_consts.FUSED_STEP_TEMPLATE.format(
+                    step_name='fused_measurement_0',
+                    query=filter_measurement[cdr_consts.QUERY]),
+                cdr_consts.FUSED_STEP_TEMPLATE.format(
+                    step_name='fused_measurement_1',
+                    query='SELECT m.measurement_id, 1 AS value '
+                    'FROM fused_measurement_0 m')
+            ]),
+            last_step_name='fused_measurement_1')
+
+        self.assertEqual(len(actual), 5)
+        self.assertEqual(actual[0][cdr_consts.QUERY], expected_fused_query)
+        self.assertEqual(actual[0][cdr_consts.MODULE_NAME],
+                         'rule_one + rule_two')
+        self.assertEqual(actual[0][cdr_consts.DESTINATION_TABLE], 'measurement')
+        self.assertEqual(actual[0][cdr_consts.DISPOSITION],
+                         bq_consts.WRITE_TRUNCATE)
+        self.assertIs(actual[1], filter_observation)
+        # the sandbox query sees the same rows and breaks the chain
+        self.assertIs(actual[2], sandbox_measurement)
+        self.assertEqual(actual[3][cdr_consts.QUERY], expected_fused_query)
+        self.assertIs(actual[4], other_measurement)
+
+    def test_fuse_queries_reading_rewritten_table(self):
+        filter_person = self._fusible_query(
+            'person', 'SELECT * FROM `project.dataset.person` '
+            'WHERE year_of_birth > 1800', 'rule_one')
+        filter_measurement = self._fusible_query(
+            'measurement', 'SELECT * FROM `project.dataset.measurement` '
+            'WHERE measurement_id > 0', 'rule_one')
+        join_person = self._fusible_query(
+            'measurement', 'SELECT m.* FROM `project.dataset.measurement` m '
+            'JOIN `project.dataset.person` p USING (person_id)', 'rule_two')
+
+        actual = clean_cdr.fuse_queries(
+            [filter_person, filter_measurement, join_person])
+
+        # the join must see the rewritten person table
+        self.assertListEqual(actual,
+                             [filter_person, filter_measurement, join_person])
+
+    def test_fuse_rule_queries(self):
+        project_id = 'test-project'
+        queries = negative_ages.get_negative_ages_queries(project_id, 'dataset')
+        queries.extend(
+            temporal_consistency.get_bad_end_date_queries(
+                project_id, 'dataset'))
+
+        actual = clean_cdr.fuse_queries(queries)
+
+        destinations = [query[cdr_consts.DESTINATION_TABLE] for query in actual]
+        # one rewrite per table until the visit_occurrence end dates are
+        # populated from the other rewritten tables
+        self.assertEqual(len(set(destinations)), len(destinations) - 1)
+        self.assertEqual(destinations[-1], 'visit_occurrence')
+        self.assertEqual(len(actual), len(negative_ages.date_fields) + 1 + 1)
+        condition_query = actual[destinations.index('condition_occurrence')]
+        self.assertIn('fused_condition_occurrence_2',
+                      condition_query[cdr_consts.QUERY])
+        self.assertIn(f'`{project_id}.dataset.person`',
+                      condition_query[cdr_consts.QUERY])
@@ -89,6 +89,7 @@ class EnsureDateDatetime(unittest.TestCase):
                 cols=self.query_class.get_cols(table))
             query[cdr_consts.DESTINATION_TABLE] = table
             query[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+            query[cdr_consts.FUSIBLE] = True
             query[cdr_consts.DESTINATION_DATASET] = self.dataset_id
             expected_list.append(query)
         self.assertEqual(result_list, expected_list)
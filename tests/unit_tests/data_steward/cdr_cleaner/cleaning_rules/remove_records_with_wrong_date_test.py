@@ -139,6 +139,7 @@ class RemoveRecordsWithWrongDateTest(unittest.TestCase):
         query[cdr_consts.QUERY] = self.observation_query
         query[cdr_consts.DESTINATION_TABLE] = OBSERVATION_TABLE
         query[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+        query[cdr_consts.FUSIBLE] = True
         query[cdr_consts.DESTINATION_DATASET] = self.dataset_id
         query[cdr_consts.BATCH] = True
         expected_queries.append(query)
@@ -147,6 +148,7 @@ class RemoveRecordsWithWrongDateTest(unittest.TestCase):
         query[cdr_consts.QUERY] = self.condition_query
         query[cdr_consts.DESTINATION_TABLE] = self.condition_occurrence
         query[cdr_consts.DISPOSITION] = bq_consts.WRITE_TRUNCATE
+        query[cdr_consts.FUSIBLE] = True
         query[cdr_consts.DESTINATION_DATASET] = self.dataset_id
         query[cdr_consts.BATCH] = True
         expected_queries.append(query)
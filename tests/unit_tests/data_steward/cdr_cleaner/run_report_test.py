@@ -0,0 +1,198 @@
+"""
+Unit test for the run_report module.
+"""
+# Python imports
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+# Third party imports
+import mock
+
+# Project imports
+from cdr_cleaner import run_report
+from constants.cdr_cleaner import clean_cdr as cdr_consts
+from constants.cdr_cleaner import run_report as consts
+
+
+class RunReportTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.project_id = 'test-project'
+        self.dataset_id = 'test_sandbox'
+        self.run_date = datetime(2020, 6, 1, 12, 30, 15)
+        self.fast_statement = {
+            cdr_consts.QUERY: 'fast query',
+            cdr_consts.MODULE_NAME: 'cdr_cleaner.fast_rule',
+            cdr_consts.FUNCTION_NAME: 'get_queries'
+        }
+        self.slow_statement = {
+            cdr_consts.QUERY: 'slow query',
+            cdr_consts.MODULE_NAME: 'cdr_cleaner.slow_rule',
+            cdr_consts.FUNCTION_NAME: 'get_query_specs'
+        }
+        self.job_resource = {
+            'statistics': {
+                'creationTime': '1591014615000',
+                'startTime': '1591014617500',
+                'endTime': '1591014627500',
+                'totalSlotMs': '5000',
+                'query': {
+                    'totalBytesProcessed': '1048576',
+                    'numDmlAffectedRows': '12'
+                }
+            }
+        }
+        self.records = [
+            run_report.get_statement_record(self.slow_statement, 0,
+                                            consts.STATUS_SUCCESS, 30.0,
+                                            'job_0', self.job_resource),
+            run_report.get_statement_record(self.fast_statement, 1,
+                                            consts.STATUS_FAILED, 1.5),
+            run_report.get_statement_record(self.slow_statement, 2,
+                                            consts.STATUS_SUCCESS, 20.0,
+                                            'job_2', self.job_resource)
+        ]
+
+    def test_get_statement_record(self):
+        expected = {
+            consts.STATEMENT_INDEX: 0,
+            consts.MODULE_NAME: 'cdr_cleaner.slow_rule',
+            consts.FUNCTION_NAME: 'get_query_specs',
+            consts.JOB_ID: 'job_0',
+            consts.STATUS: consts.STATUS_SUCCESS,
+            consts.WALL_SECONDS: 30.0,
+            consts.QUEUE_SECONDS: 2.5,
+            consts.TOTAL_BYTES_PROCESSED: 1048576,
+            consts.TOTAL_SLOT_MS: 5000,
+            consts.ROWS_AFFECTED: 12
+        }
+        self.assertDictEqual(expected, self.records[0])
+
+        # statements which failed before a job was created have no statistics
+        self.assertIsNone(self.records[1][consts.JOB_ID])
+        self.assertIsNone(self.records[1][consts.QUEUE_SECONDS])
+        self.assertIsNone(self.records[1][consts.TOTAL_BYTES_PROCESSED])
+
+    def test_get_statement_record_destination_table(self):
+        # a SELECT writing a destination table has no numDmlAffectedRows
+        job_resource = {
+            'kind': 'bigquery#job',
+            'id': 'test-project:US.job_3',
+            'configuration': {
+                'query': {
+                    'query': 'SELECT * FROM `test-project.test_dataset.person`',
+                    'destinationTable': {
+                        'projectId': 'test-project',
+                        'datasetId': 'test_sandbox',
+                        'tableId': 'person'
+                    },
+                    'writeDisposition': 'WRITE_TRUNCATE'
+                },
+                'jobType': 'QUERY'
+            },
+            'statistics': {
+                'creationTime': '1591014615000',
+                'startTime': '1591014616000',
+                'endTime': '1591014620000',
+                'totalBytesProcessed': '2048',
+                'query': {
+                    'queryPlan': [{
+                        'name': 'S00: Input',
+                        'recordsRead': '40',
+                        'recordsWritten': '40'
+                    }, {
+                        'name': 'S01: Output',
+                        'recordsRead': '40',
+                        'recordsWritten': '25'
+                    }],
+                    'totalBytesProcessed': '2048',
+                    'totalSlotMs': '300',
+                    'statementType': 'SELECT'
+                }
+            },
+            'status': {
+                'state': 'DONE'
+            }
+        }
+
+        actual = run_report.get_statement_record(self.slow_statement, 3,
+                                                 consts.STATUS_SUCCESS, 5.0,
+                                                 'job_3', job_resource)
+
+        self.assertEqual(1.0, actual[consts.QUEUE_SECONDS])
+        self.assertEqual(2048, actual[consts.TOTAL_BYTES_PROCESSED])
+        self.assertEqual(300, actual[consts.TOTAL_SLOT_MS])
+        self.assertEqual(25, actual[consts.ROWS_AFFECTED])
+
+    def test_get_slowest_rules(self):
+        actual = run_report.get_slowest_rules(self.records)
+
+        expected = [{
+            consts.MODULE_NAME: 'cdr_cleaner.slow_rule',
+            consts.FUNCTION_NAME: 'get_query_specs',
+            consts.STATEMENT_COUNT: 2,
+            consts.WALL_SECONDS: 50.0,
+            consts.TOTAL_BYTES_PROCESSED: 2097152,
+            consts.TOTAL_SLOT_MS: 10000
+        }, {
+            consts.MODULE_NAME: 'cdr_cleaner.fast_rule',
+            consts.FUNCTION_NAME: 'get_queries',
+            consts.STATEMENT_COUNT: 1,
+            consts.WALL_SECONDS: 1.5,
+            consts.TOTAL_BYTES_PROCESSED: 0,
+            consts.TOTAL_SLOT_MS: 0
+        }]
+        self.assertListEqual(expected, actual)
+        self.assertListEqual(expected[:1],
+                             run_report.get_slowest_rules(self.records, 1))
+
+    def test_build_and_save_run_report(self):
+        report = run_report.build_run_report(self.project_id, 'combined',
+                                             self.run_date, 60.0,
+                                             list(reversed(self.records)))
+
+        self.assertEqual(report[consts.RUN_ID], 'combined_20200601_123015')
+        self.assertEqual(report[consts.SUCCESSES], 2)
+        self.assertEqual(report[consts.FAILURES], 1)
+        self.assertListEqual(report[consts.STATEMENTS], self.records)
+
+        report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, report_dir)
+        report_path = run_report.save_run_report(report, report_dir)
+
+        self.assertEqual(
+            os.path.join(report_dir, 'combined_20200601_123015.json'),
+            report_path)
+        with open(report_path) as report_file:
+            self.assertDictEqual(report, json.load(report_file))
+
+    def test_upload_run_report(self):
+        report = run_report.build_run_report(self.project_id, 'rdr',
+                                             self.run_date, 60.0, self.records)
+        client = mock.MagicMock()
+
+        run_report.upload_run_report(report, self.project_id, self.dataset_id,
+                                     client)
+
+        args, kwargs = client.load_table_from_json.call_args
+        rows, table_id = args
+        self.assertEqual(
+            f'{self.project_id}.{self.dataset_id}.'
+            f'{consts.RUN_REPORT_TABLE}', table_id)
+        self.assertEqual(len(self.records), len(rows))
+        self.assertEqual(rows[0][consts.RUN_ID], 'rdr_20200601_123015')
+        self.assertEqual(rows[0][consts.RUN_DATE], '2020-06-01T12:30:15')
+        self.assertEqual(kwargs['job_config'].write_disposition, 'WRITE_APPEND')
+        schema_names = {field.name for field in kwargs['job_config'].schema}
+        self.assertSetEqual(schema_names, set(rows[0].keys()))
+        client.load_table_from_json.return_value.result.assert_called_once()
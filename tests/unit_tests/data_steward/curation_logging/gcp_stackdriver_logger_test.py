@@ -1,18 +1,21 @@
 import logging
 import mock
+import threading
 import unittest
 from datetime import datetime, timedelta
 from logging import LogRecord
 from mock import patch
 from mock import MagicMock, PropertyMock
 
+import flask
 from google.api.monitored_resource_pb2 import MonitoredResource
+from google.api_core.exceptions import BadRequest, ServiceUnavailable
 from google.cloud.logging_v2.proto.log_entry_pb2 import LogEntryOperation
 from google.protobuf import json_format as gcp_json_format, any_pb2 as gcp_any_pb2
 import pytz
 
 from curation_logging import curation_gae_handler
-from curation_logging.curation_gae_handler import GCPStackDriverLogger, LogCompletionStatusEnum
+from curation_logging.curation_gae_handler import GCPStackDriverLogger, LogCompletionStatusEnum, LogEntryPublisher
 from curation_logging.curation_gae_handler import GAE_LOGGING_MODULE_ID, GAE_LOGGING_VERSION_ID
 
 LOG_BUFFER_SIZE = 3
@@ -125,6 +128,8 @@ class GCPStackDriverLoggerTest(unittest.TestCase):
         )
         self.mock_logging_service_client = self.mock_logging_service_client_patcher.start(
         )
+        self.mock_write_log_entries = self.mock_logging_service_client.return_value.write_log_entries
+        self.publisher = LogEntryPublisher(retry_delay=0)
 
     def tearDown(self):
         self.mock_logging_service_client_patcher.stop()
@@ -153,7 +158,8 @@ class GCPStackDriverLoggerTest(unittest.TestCase):
         mock_datetime.utcfromtimestamp.return_value = self.log_record_created
 
         # Initialize GCPStackDriverLogger
-        self.gcp_stackdriver_logger = GCPStackDriverLogger(LOG_BUFFER_SIZE)
+        self.gcp_stackdriver_logger = GCPStackDriverLogger(
+            LOG_BUFFER_SIZE, publisher=self.publisher)
         self.gcp_stackdriver_logger.setup_from_request(self.request)
 
         self.assertIsNone(self.gcp_stackdriver_logger._first_log_ts)
@@ -180,6 +186,7 @@ class GCPStackDriverLoggerTest(unittest.TestCase):
         self.assertEqual(
             len(self.gcp_stackdriver_logger._buffer), 0,
             'expected log buffer to flush itself after being filled')
+        self.assertTrue(self.publisher.flush())
         self.assertEqual(
             self.mock_logging_service_client.return_value.write_log_entries.
             call_count, 1)
@@ -195,6 +202,105 @@ class GCPStackDriverLoggerTest(unittest.TestCase):
         self.assertEqual(self.gcp_stackdriver_logger._request_log_id, None)
         self.assertEqual(self.gcp_stackdriver_logger._trace, None)
 
+    def test_publisher_batches(self):
+        publisher = LogEntryPublisher(batch_size=2)
+        # hold the worker until every entry is queued
+        release = threading.Event()
+        self.mock_write_log_entries.side_effect = lambda *args, **kwargs: release.wait(
+        )
+
+        for entry in ['entry_1', 'entry_2', 'entry_3', 'entry_4', 'entry_5']:
+            self.assertTrue(publisher.enqueue(entry))
+        release.set()
+        self.assertTrue(publisher.flush())
+
+        published = [
+            call[0][0] for call in self.mock_write_log_entries.call_args_list
+        ]
+        # the first entry may be taken before the others are queued
+        self.assertEqual(
+            ['entry_1', 'entry_2', 'entry_3', 'entry_4', 'entry_5'],
+            [entry for batch in published for entry in batch])
+        self.assertLessEqual(max(len(batch) for batch in published), 2)
+        log_name = curation_gae_handler.LOG_NAME_TEMPLATE.format(
+            project_id=self.project_id)
+        for call in self.mock_write_log_entries.call_args_list:
+            self.assertEqual(log_name, call[1]['log_name'])
+
+        stats = publisher.get_stats()
+        self.assertEqual(5, stats['enqueued'])
+        self.assertEqual(5, stats['published'])
+        self.assertEqual(len(published), stats['batches'])
+        self.assertEqual(0, stats['pending'])
+        self.assertGreaterEqual(stats['max_latency'], stats['avg_latency'])
+
+    def test_publisher_retries(self):
+        self.mock_write_log_entries.side_effect = [
+            ServiceUnavailable('unavailable'), None
+        ]
+        self.publisher.enqueue('entry_1')
+        self.assertTrue(self.publisher.flush())
+
+        self.assertEqual(2, self.mock_write_log_entries.call_count)
+        stats = self.publisher.get_stats()
+        self.assertEqual(1, stats['retries'])
+        self.assertEqual(1, stats['published'])
+        self.assertEqual(0, stats['failed'])
+
+        # errors which are not transient are not retried
+        self.mock_write_log_entries.reset_mock()
+        self.mock_write_log_entries.side_effect = BadRequest('bad entry')
+        self.publisher.enqueue('entry_2')
+        self.assertTrue(self.publisher.flush())
+        self.assertEqual(1, self.mock_write_log_entries.call_count)
+        self.assertEqual(1, self.publisher.get_stats()['failed'])
+
+        # entries are counted as failed once the retries are exhausted
+        self.mock_write_log_entries.reset_mock()
+        self.mock_write_log_entries.side_effect = ServiceUnavailable(
+            'unavailable')
+        self.publisher.enqueue('entry_3')
+        self.assertTrue(self.publisher.flush())
+        self.assertEqual(curation_gae_handler._PUBLISH_RETRIES + 1,
+                         self.mock_write_log_entries.call_count)
+        self.assertEqual(2, self.publisher.get_stats()['failed'])
+
+    def test_publisher_drops_when_full(self):
+        publisher = LogEntryPublisher(queue_size=2)
+        release = threading.Event()
+        started = threading.Event()
+
+        def write_log_entries(*args, **kwargs):
+            started.set()
+            release.wait()
+
+        self.mock_write_log_entries.side_effect = write_log_entries
+
+        # the worker holds the first entry while the queue fills up
+        self.assertTrue(publisher.enqueue('entry_1'))
+        started.wait()
+        self.assertTrue(publisher.enqueue('entry_2'))
+        self.assertTrue(publisher.enqueue('entry_3'))
+        self.assertFalse(publisher.enqueue('entry_4'))
+        self.assertFalse(publisher.flush(timeout=0.01))
+
+        release.set()
+        self.assertTrue(publisher.flush())
+        stats = publisher.get_stats()
+        self.assertEqual(1, stats['dropped'])
+        self.assertEqual(3, stats['published'])
+
+    @mock.patch('curation_logging.curation_gae_handler.get_publisher')
+    @mock.patch('curation_logging.curation_gae_handler.get_gcp_logger')
+    def test_end_request_logging(self, mock_get_gcp_logger, mock_get_publisher):
+        response = MagicMock()
+        with flask.Flask(__name__).test_request_context():
+            actual = curation_gae_handler.end_request_logging(response)
+
+        self.assertIs(response, actual)
+        mock_get_gcp_logger.return_value.finalize.assert_called_once()
+        mock_get_publisher.return_value.flush.assert_called_once_with()
+
     @mock.patch('curation_logging.curation_gae_handler.get_gcp_logger')
     def test_initialize_logging(self, mock_get_gcp_logger):
         with patch.dict('os.environ', {'GAE_ENV': ''}):
@@ -0,0 +1,142 @@
+# Python imports
+import os
+import shutil
+import tempfile
+import unittest
+
+# Third party imports
+from mock import patch
+
+# Project imports
+from deid import plan
+
+
+class PlanTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+        self.rules_path = os.path.join(self.temp_dir, 'config.json')
+        with open(self.rules_path, 'w') as rules_file:
+            rules_file.write('[{"_id": "shift"}]')
+
+        self.columns = ['observation_id', 'person_id', 'observation_date']
+        self.plan = plan.create_plan(
+            'fake_key', 'observation', 'foo_input', 'foo_output_deid',
+            ['shift', 'compute'],
+            [('observation_id', 'observation_id'),
+             ('person_id', '(SELECT research_id) AS person_id'),
+             ('observation_date', 'DATE_SUB(observation_date) AS '
+              'observation_date')], [{
+                  'filter': 'person_id IN (SELECT person_id)'
+              }], [{
+                  'name': 'person_id',
+                  'label': 'compute.id',
+                  'apply': '(SELECT research_id) AS person_id'
+              }],
+            ['SELECT observation_id,\n  person_id FROM foo_input.observation'],
+            [])
+
+    def test_get_plan_key(self):
+        # test
+        key = plan.get_plan_key([self.rules_path, 'not/a/file.json'],
+                                self.columns,
+                                idataset='foo_input')
+
+        # post conditions
+        self.assertEqual(
+            key,
+            plan.get_plan_key([self.rules_path, 'not/a/file.json'],
+                              self.columns,
+                              idataset='foo_input'))
+        self.assertNotEqual(
+            key,
+            plan.get_plan_key([self.rules_path],
+                              self.columns[:2],
+                              idataset='foo_input'))
+        self.assertNotEqual(
+            key,
+            plan.get_plan_key([self.rules_path, 'not/a/file.json'],
+                              self.columns,
+                              idataset='bar_input'))
+
+        # a change to the compiler modules changes the key
+        with patch('deid.plan.get_compiler_hash', return_value='changed'):
+            self.assertNotEqual(
+                key,
+                plan.get_plan_key([self.rules_path, 'not/a/file.json'],
+                                  self.columns,
+                                  idataset='foo_input'))
+
+        # pre conditions
+        with open(self.rules_path, 'w') as rules_file:
+            rules_file.write('[{"_id": "compute"}]')
+
+        # test
+        self.assertNotEqual(
+            key,
+            plan.get_plan_key([self.rules_path, 'not/a/file.json'],
+                              self.columns,
+                              idataset='foo_input'))
+
+    def test_save_load_plan(self):
+        # pre conditions
+        path = plan.get_plan_path(os.path.join(self.temp_dir, 'plans'),
+                                  'observation', 'fake_key')
+
+        # test
+        self.assertIsNone(plan.load_plan(path))
+        plan.save_plan(self.plan, path)
+        result = plan.load_plan(path)
+
+        # post conditions
+        self.assertEqual(result, self.plan)
+
+        # pre conditions
+        with patch('deid.plan.PLAN_VERSION', plan.PLAN_VERSION + 1):
+            # test
+            self.assertIsNone(plan.load_plan(path))
+
+    def test_diff_plans(self):
+        # pre conditions
+        new_plan = dict(self.plan)
+        new_plan['columns'] = [['observation_id', 'observation_id'],
+                               ['person_id', 'person_id'],
+                               ['observation_date', 'observation_date']]
+
+        # test
+        self.assertEqual(plan.diff_plans(self.plan, self.plan), [])
+        result = plan.diff_plans(self.plan, new_plan)
+
+        # post conditions
+        self.assertIn('-person_id: (SELECT research_id) AS person_id', result)
+        self.assertIn('+person_id: person_id', result)
+        self.assertNotIn('+observation_id: observation_id', result)
+        self.assertIn(
+            'SELECT observation_id, person_id FROM foo_input.observation',
+            plan.format_plan(self.plan))
+
+    def test_main(self):
+        # pre conditions
+        old_path = os.path.join(self.temp_dir, 'old.json')
+        new_path = os.path.join(self.temp_dir, 'new.json')
+        plan.save_plan(self.plan, old_path)
+        plan.save_plan(dict(self.plan, dml=['DELETE FROM foo WHERE true']),
+                       new_path)
+
+        # test
+        with patch('builtins.print') as mock_print:
+            self.assertEqual(plan.main([old_path, old_path]), 0)
+            self.assertEqual(mock_print.call_count, 0)
+            self.assertEqual(plan.main([old_path, new_path]), 1)
+
+        # post conditions
+        printed = [call[0][0] for call in mock_print.call_args_list]
+        self.assertIn('+DELETE FROM foo WHERE true', printed)
@@ -1,11 +1,13 @@
 # Python imports
+import os
 import unittest
 
 # Third party imports
+import pandas as pd
 from mock import patch
 
 # Project imports
-from deid.press import Press
+from deid.press import Press, ROW_SUPPRESSION, SAMPLE_PERCENT
 
 
 class BasePass(Press):
@@ -90,3 +92,237 @@ class PressTest(unittest.TestCase):
         # post conditions
         expected = ['delete * from ' + table_path]
         self.assertEqual(result, expected)
+
+    def _get_simulation_info(self):
+        self.press_obj.pipeline = ['generalize', 'suppress', 'shift', 'compute']
+        self.press_obj.deid_rules['suppress']['FILTERS'] = [{
+            'filter': 'person_id IN (SELECT person_id FROM :idataset._deid_map)'
+        }]
+        return [{
+            'apply': 'CASE WHEN value_as_number > 10 THEN 10 ELSE '
+                     'value_as_number END AS value_as_number',
+            'name': 'value_as_number',
+            'label': 'generalize.VALUE',
+            'on': {
+                'field': 'observation_source_concept_id',
+                'qualifier': 'IN',
+                'values': [1585]
+            }
+        }, {
+            'apply': 'DATE_SUB(CAST(obs_date AS DATE), INTERVAL 5 DAY) '
+                     'AS obs_date',
+            'name': 'obs_date',
+            'label': 'shift.date'
+        }, {
+            'apply': 'person_source_value',
+            'name': 'person_source_value',
+            'label': 'suppress.DEMOGRAPHICS-COLUMNS'
+        }, {
+            'apply': '(SELECT research_id FROM :idataset._deid_map) '
+                     'AS person_id',
+            'name': 'person_id',
+            'label': 'compute.id'
+        }, {
+            'apply': 'LOWER(obs_text) AS obs_text',
+            'name': 'obs_text',
+            'label': 'skipped.RULE'
+        }]
+
+    def test_get_simulation_sql(self):
+        # pre-conditions
+        info = self._get_simulation_info()
+
+        # test
+        sql, counts = self.press_obj.get_simulation_sql(info)
+
+        # post conditions
+        self.assertEqual(counts, {
+            'generalize': 1,
+            'shift': 1,
+            'suppress': 1,
+            'compute': 1
+        })
+        self.assertIn(
+            f'WITH {self.tablename} AS (\n  SELECT * FROM '
+            f'`{self.input_dataset}.{self.tablename}` '
+            'TABLESAMPLE SYSTEM (10 PERCENT)', sql)
+        self.assertNotIn(':idataset', sql)
+        # one select per simulated field and one for row suppression
+        self.assertEqual(sql.count('UNION ALL'), 2)
+        self.assertIn("'value_as_number' AS attribute", sql)
+        self.assertIn('observation_source_concept_id IN ( 1585 )', sql)
+        self.assertIn("'obs_date' AS attribute", sql)
+        self.assertIn('LIMIT 5', sql)
+        self.assertNotIn("'person_id' AS attribute", sql)
+        self.assertNotIn("'obs_text' AS attribute", sql)
+        self.assertIn(
+            'COUNTIF(observation_source_concept_id IN ( 1585 ) OR person_id IN '
+            f'(SELECT person_id FROM {self.input_dataset}._deid_map))', sql)
+
+        # pre-conditions
+        self.press_obj.sample_percent = 100
+
+        # test
+        sql, _ = self.press_obj.get_simulation_sql(info)
+
+        # post conditions
+        self.assertNotIn('TABLESAMPLE', sql)
+
+    @patch('deid.press.os.makedirs')
+    @patch.object(pd.DataFrame, 'to_csv', autospec=True)
+    def test_simulate(self, mock_to_csv, mock_makedirs):
+        # pre-conditions
+        info = self._get_simulation_info()
+        results = pd.DataFrame({
+            'attribute': ['value_as_number', 'obs_date', ROW_SUPPRESSION],
+            'task': ['GENERALIZE VALUE', 'SHIFT DATE', ROW_SUPPRESSION],
+            'original': ['12', '2020-01-06', None],
+            'transformed': ['10', '2020-01-01', None],
+            'row_count': [3, 2, 7]
+        })
+
+        with patch.object(self.press_obj, 'get_dataframe',
+                          return_value=results) as mock_dataframe:
+            # test
+            self.press_obj.simulate(info)
+
+        # post conditions
+        self.assertEqual(mock_dataframe.call_count, 1)
+        self.assertEqual(mock_to_csv.call_count, 2)
+        written = {
+            os.path.basename(call[0][1]).split('-')[0]: call[0][0]
+            for call in mock_to_csv.call_args_list
+        }
+        samples = written['samples']
+        self.assertEqual(samples['attribute'].tolist(),
+                         ['value_as_number', 'obs_date'])
+        self.assertEqual(samples['row_count'].tolist(), [3, 2])
+        self.assertEqual(samples['sample_percent'].tolist(),
+                         [SAMPLE_PERCENT] * 2)
+        stats = written['stats']
+        # the suppressed rows of the sample are scaled to the whole table
+        self.assertEqual(
+            stats.set_index('operation')['count'].to_dict(), {
+                'generalize': 1,
+                'shift': 1,
+                'suppress': 1,
+                'compute': 1,
+                'row-suppression': 7 * 100 // SAMPLE_PERCENT
+            })
+        self.assertEqual(set(stats['sample_percent']), {SAMPLE_PERCENT})
+
+    @patch('deid.press.bq_utils.get_table_info')
+    def test_get_column_expressions(self, mock_table_info):
+        # pre-conditions
+        mock_table_info.return_value = {
+            'schema': {
+                'fields': [{
+                    'name': 'person_id'
+                }, {
+                    'name': 'obs_date'
+                }, {
+                    'name': 'value'
+                }]
+            }
+        }
+        self.press_obj.pipeline = ['generalize', 'shift', 'compute']
+        info = [{
+            'name': 'obs_date',
+            'label': 'shift.date',
+            'apply': 'DATE_SUB(obs_date) AS obs_date'
+        }, {
+            'name': 'obs_date',
+            'label': 'generalize.DATE',
+            'apply': 'NULL AS obs_date'
+        }, {
+            'name': 'person_id',
+            'label': 'compute.id',
+            'apply': 'research_id AS person_id'
+        }, {
+            'name': 'missing',
+            'label': 'compute.id',
+            'apply': 'missing'
+        }]
+
+        # test
+        result = self.press_obj.get_column_expressions(info)
+        sql = self.press_obj.to_sql(info)
+
+        # post conditions
+        # the first operation of the pipeline sets the expression
+        self.assertEqual(result, [('person_id', 'research_id AS person_id'),
+                                  ('obs_date', 'NULL AS obs_date'),
+                                  ('value', 'value')])
+        self.assertTrue(
+            sql.startswith('SELECT research_id AS person_id,NULL AS obs_date,'
+                           'value FROM  foo_input.bar_table'))
+        # the schema is only requested once
+        self.assertEqual(mock_table_info.call_count, 1)
+
+    @patch('deid.press.deid_plan')
+    def test_prepare(self, mock_plan):
+        # pre-conditions
+        self.press_obj.action = ['debug']
+        self.press_obj.pipeline = ['generalize']
+        mock_plan.load_plan.return_value = {
+            'pipeline': ['generalize', 'dml_statements'],
+            'filters': [{
+                'filter': 'person_id IN (1)'
+            }],
+            'rules': [{
+                'name': 'value'
+            }],
+            'sql': ['SELECT value FROM foo_input.bar_table'],
+            'dml': []
+        }
+
+        with patch.object(self.press_obj, 'get_plan_key',
+                          return_value='fake_key'), \
+                patch.object(self.press_obj, 'compile') as mock_compile:
+            # test
+            result = self.press_obj.prepare()
+
+            # post conditions
+            self.assertEqual(mock_compile.call_count, 0)
+            self.assertEqual(result, ([{
+                'name': 'value'
+            }], ['SELECT value FROM foo_input.bar_table'], []))
+            self.assertEqual(self.press_obj.pipeline,
+                             ['generalize', 'dml_statements'])
+            self.assertEqual(self.press_obj.deid_rules['suppress']['FILTERS'],
+                             [{
+                                 'filter': 'person_id IN (1)'
+                             }])
+            mock_plan.get_plan_path.assert_called_once_with(
+                self.press_obj.plan_dir, self.tablename, 'fake_key')
+
+            # pre-conditions
+            mock_plan.load_plan.return_value = None
+            mock_compile.return_value = ([], ['SELECT 1'], [])
+
+            with patch.object(self.press_obj,
+                              'get_column_expressions',
+                              return_value=[]):
+                # test
+                result = self.press_obj.prepare()
+
+            # post conditions
+            self.assertEqual(mock_compile.call_count, 1)
+            self.assertEqual(result, ([], ['SELECT 1'], []))
+            mock_plan.save_plan.assert_called_once_with(
+                mock_plan.create_plan.return_value,
+                mock_plan.get_plan_path.return_value)
+
+            # pre-conditions
+            self.press_obj.rebuild_plans = True
+            mock_plan.load_plan.reset_mock()
+
+            with patch.object(self.press_obj,
+                              'get_column_expressions',
+                              return_value=[]):
+                # test
+                self.press_obj.prepare()
+
+            # post conditions
+            mock_plan.load_plan.assert_not_called()
+            self.assertEqual(mock_compile.call_count, 2)
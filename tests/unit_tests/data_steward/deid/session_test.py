@@ -0,0 +1,178 @@
+# Python imports
+import threading
+import unittest
+
+# Third party imports
+from google.api_core.exceptions import NotFound
+from mock import MagicMock, patch
+
+# Project imports
+from deid import session
+
+
+class DeidSessionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.input_dataset = 'foo_input'
+        self.private_key = 'fake/SA/file/path.json'
+        self.project = 'foo_project'
+
+        self.client = MagicMock()
+        self.client.project = self.project
+        self.query_results = []
+        mock_job = self.client.query.return_value
+        mock_job.result.side_effect = lambda: self.query_results.pop(0)
+
+        self.session = session.DeidSession(self.input_dataset,
+                                           self.private_key,
+                                           client=self.client)
+
+    def _queries(self):
+        return [call[0][0] for call in self.client.query.call_args_list]
+
+    def test_initialize_participant_map_matches(self):
+        # pre conditions
+        self.query_results = [[{
+            'expected_count': 10,
+            'mapped_count': 10,
+            'difference_count': 0
+        }]]
+
+        # test
+        self.assertTrue(self.session.initialize_participant_map(age_limit=89))
+        # a second table of the run does not query again
+        self.assertTrue(self.session.initialize_participant_map(age_limit=89))
+
+        # post conditions
+        queries = self._queries()
+        self.assertEqual(len(queries), 1)
+        self.assertIn('FULL OUTER JOIN', queries[0])
+        self.assertIn(f'`{self.project}.{self.input_dataset}._deid_map`',
+                      queries[0])
+        self.assertIn('year_of_birth < 89', queries[0])
+        self.client.get_table.assert_called_once_with(
+            f'{self.project}.{self.input_dataset}._deid_map')
+
+    def test_initialize_participant_map_differs(self):
+        # pre conditions
+        self.query_results = [[{
+            'expected_count': 10,
+            'mapped_count': 9,
+            'difference_count': 3
+        }], []]
+
+        # test
+        self.assertTrue(
+            self.session.initialize_participant_map(age_limit=89,
+                                                    max_day_shift=365))
+
+        # post conditions
+        queries = self._queries()
+        self.assertEqual(len(queries), 2)
+        self.assertIn('ROW_NUMBER() OVER (ORDER BY RAND())', queries[1])
+        self.assertIn('AS research_id', queries[1])
+        self.assertIn('(365 - 1) * RAND()', queries[1])
+        job_config = self.client.query.call_args[1]['job_config']
+        self.assertEqual(job_config.write_disposition, 'WRITE_TRUNCATE')
+
+    def test_initialize_participant_map_missing(self):
+        # pre conditions
+        self.client.get_table.side_effect = NotFound('no map')
+        self.query_results = [[{'expected_count': 5}], []]
+
+        # test
+        self.assertTrue(self.session.initialize_participant_map())
+
+        # post conditions
+        queries = self._queries()
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('FULL OUTER JOIN', queries[0])
+        self.assertIn('AS shift', queries[1])
+
+    def test_initialize_participant_map_no_participants(self):
+        # pre conditions
+        self.client.get_table.side_effect = NotFound('no map')
+        self.query_results = [[{'expected_count': 0}]]
+
+        # test
+        self.assertFalse(self.session.initialize_participant_map())
+
+        # post conditions
+        self.assertEqual(len(self._queries()), 1)
+
+    @patch('deid.session.create_person_id_src_hpo_map')
+    @patch('deid.session.open')
+    def test_initialize_observation_maps(self, mock_open, mock_src_hpo_map):
+        # pre conditions
+        self.query_results = [[{
+            'expected_count': 4,
+            'mapped_count': 4,
+            'difference_count': 0
+        }]]
+
+        # test
+        self.session.initialize_observation_maps()
+        self.session.initialize_observation_maps()
+
+        # post conditions
+        self.assertEqual(self.client.load_table_from_file.call_count, 1)
+        job_config = self.client.load_table_from_file.call_args[1]['job_config']
+        self.assertEqual(job_config.schema, session.ALLOWED_STATES_SCHEMA)
+        queries = self._queries()
+        self.assertEqual(len(queries), 1)
+        self.assertIn('questionnaire_response_id IS NOT NULL', queries[0])
+        mock_src_hpo_map.assert_called_once_with(self.input_dataset,
+                                                 self.session.credentials)
+
+    def test_ensure_dataset(self):
+        # test
+        self.session.ensure_dataset('foo_deid')
+        self.session.ensure_dataset('foo_deid')
+
+        # post conditions
+        self.assertEqual(self.client.create_dataset.call_count, 1)
+        self.assertTrue(
+            self.client.create_dataset.call_args[1].get('exists_ok'))
+
+    def test_job_monitor_wait(self):
+        # pre conditions
+        running = MagicMock(state='RUNNING')
+        states = {
+            'job1': [running, MagicMock(state='DONE')],
+            'job2': [running, running,
+                     MagicMock(state='DONE')]
+        }
+        self.client.get_job.side_effect = lambda job_id: states[job_id].pop(0)
+        monitor = session.JobMonitor(self.client, poll_interval=0)
+        results = {}
+
+        def wait(job_id):
+            results[job_id] = monitor.wait(job_id)
+
+        # test
+        threads = [
+            threading.Thread(target=wait, args=(job_id,)) for job_id in states
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=10)
+
+        # post conditions
+        self.assertEqual(results['job1'].state, 'DONE')
+        self.assertEqual(results['job2'].state, 'DONE')
+        self.assertEqual(states, {'job1': [], 'job2': []})
+
+    def test_job_monitor_wait_error(self):
+        # pre conditions
+        self.client.get_job.side_effect = NotFound('no job')
+        monitor = session.JobMonitor(self.client, poll_interval=0)
+
+        # test
+        self.assertRaises(NotFound, monitor.wait, 'job1')
@@ -1,5 +1,9 @@
 import unittest
 
+import mock
+import pandas as pd
+from google.api_core.exceptions import BadRequest
+
 import common
 from retraction import participant_row_counts as prc
 from tests.unit_tests.data_steward.retraction.retract_utils_test import RetractUtilsTest
@@ -106,3 +110,64 @@ class ParticipantPrevalenceTest(RetractUtilsTest, unittest.TestCase):
             table = tables[0]
             self.assertIn(table, self.ehr_tables)
             self.assertIn('COUNT(*) AS ehr_count', query)
+
+    @mock.patch('retraction.participant_row_counts.bq.get_client')
+    @mock.patch('retraction.participant_row_counts.bq.query')
+    @mock.patch(
+        'retraction.participant_row_counts.bq.get_table_info_for_dataset')
+    @mock.patch('retraction.participant_row_counts.ru.get_dataset_ids_to_target'
+               )
+    def test_count_pid_rows_in_project(self, mock_get_dataset_ids,
+                                       mock_get_table_info, mock_query,
+                                       mock_get_client):
+        dataset_ids = ['unioned_ehr_1', 'bad_dataset', 'unioned_ehr_2']
+        mock_get_dataset_ids.return_value = dataset_ids
+
+        def get_table_info(project_id, dataset_id, client=None):
+            if dataset_id == 'bad_dataset':
+                raise BadRequest('not a conforming dataset')
+            return self.table_df
+
+        mock_get_table_info.side_effect = get_table_info
+        mock_query.side_effect = lambda query, project_id, client=None: pd.DataFrame(
+            [['person', 1, 1, 1, 0], ['observation', 3, 3, 3, 0]],
+            columns=[
+                'table_id', consts.ALL_COUNT, 'map_count', 'ehr_count', consts.
+                MAP_EHR_COUNT
+            ])
+
+        actual = prc.count_pid_rows_in_project(self.project_id,
+                                               self.hpo_id,
+                                               self.pid_table_str,
+                                               max_workers=2)
+
+        # metadata is queried once per dataset and a single client is shared
+        self.assertEqual(len(dataset_ids), mock_get_table_info.call_count)
+        self.assertEqual(2, mock_query.call_count)
+        mock_get_client.assert_called_once_with(self.project_id)
+        for call in mock_query.call_args_list:
+            self.assertIs(mock_get_client.return_value, call[1]['client'])
+
+        self.assertEqual(consts.DATASET_ID, actual.columns[0])
+        self.assertListEqual([
+            'unioned_ehr_1', 'unioned_ehr_1', 'unioned_ehr_2', 'unioned_ehr_2'
+        ], actual[consts.DATASET_ID].tolist())
+        self.assertListEqual(['observation', 'person'] * 2,
+                             actual['table_id'].tolist())
+
+    @mock.patch('retraction.participant_row_counts.bq.get_client')
+    @mock.patch(
+        'retraction.participant_row_counts.bq.get_table_info_for_dataset')
+    @mock.patch('retraction.participant_row_counts.ru.get_dataset_ids_to_target'
+               )
+    def test_count_pid_rows_in_project_no_results(self, mock_get_dataset_ids,
+                                                  mock_get_table_info,
+                                                  mock_get_client):
+        mock_get_dataset_ids.return_value = ['bad_dataset']
+        mock_get_table_info.side_effect = BadRequest('not conforming')
+
+        actual = prc.count_pid_rows_in_project(self.project_id, self.hpo_id,
+                                               self.pid_table_str)
+
+        self.assertTrue(actual.empty)
+        self.assertIn(consts.DATASET_ID, actual.columns)
@@ -0,0 +1,129 @@
+"""
+Unit test for the retract_data_gcs module.
+
+Files are streamed in small chunks so lines are split across chunk boundaries.
+"""
+# Python imports
+import unittest
+
+# Third party imports
+import mock
+
+# Project imports
+from retraction import retract_data_gcs as rd
+
+
+class RetractDataGcsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.bucket = 'fake_bucket'
+        self.folder_prefix = 'fake_hpo/site_bucket/2020-01-01/'
+        self.pids = {17, 20}
+        self.person_csv = (b'person_id,gender_concept_id\n'
+                           b'10,8507\n'
+                           b'17,8532\n'
+                           b'\n'
+                           b'abc,8507\n'
+                           b'20,8507\n'
+                           b'25,8532')
+        self.visit_csv = (b'visit_occurrence_id,person_id,visit_concept_id\n'
+                          b'1,17,9201\n'
+                          b'2,10,9202\n'
+                          b'ill-formed\n')
+        self.objects = {
+            self.folder_prefix + 'person.csv':
+                self.person_csv,
+            self.folder_prefix + 'visit_occurrence.csv':
+                self.visit_csv,
+            self.folder_prefix + 'observation.csv':
+                b'observation_id,person_id\n'
+        }
+        self.uploads = {}
+
+        def iter_object_chunks(bucket, name, chunk_size):
+            contents = self.objects[name]
+            for start in range(0, max(len(contents), 1), 4):
+                yield contents[start:start + 4]
+
+        def upload_object(bucket, name, fp, chunk_size):
+            self.uploads[name] = fp.read()
+            return {'name': name}
+
+        mock_iter_patcher = mock.patch(
+            'retraction.retract_data_gcs.gcs_utils.iter_object_chunks')
+        self.mock_iter_object_chunks = mock_iter_patcher.start()
+        self.mock_iter_object_chunks.side_effect = iter_object_chunks
+        self.addCleanup(mock_iter_patcher.stop)
+
+        mock_upload_patcher = mock.patch(
+            'retraction.retract_data_gcs.gcs_utils.upload_object')
+        self.mock_upload_object = mock_upload_patcher.start()
+        self.mock_upload_object.side_effect = upload_object
+        self.addCleanup(mock_upload_patcher.stop)
+
+    def test_retract_file(self):
+        upload_result, bytes_read = rd.retract_file(self.pids, self.bucket,
+                                                    self.folder_prefix,
+                                                    'person.csv', 4)
+
+        self.assertEqual(upload_result,
+                         {'name': self.folder_prefix + 'person.csv'})
+        self.assertEqual(bytes_read, len(self.person_csv))
+        self.assertEqual(
+            self.uploads[self.folder_prefix + 'person.csv'],
+            b'person_id,gender_concept_id\n10,8507\nabc,8507\n25,8532\n')
+
+    def test_retract_file_not_updated(self):
+        upload_result, bytes_read = rd.retract_file({99}, self.bucket,
+                                                    self.folder_prefix,
+                                                    'person.csv', 4)
+
+        self.assertIsNone(upload_result)
+        self.assertEqual(bytes_read, len(self.person_csv))
+        self.mock_upload_object.assert_not_called()
+
+    def test_retract(self):
+        found_files = ['person.csv', 'visit_occurrence.csv', 'observation.csv']
+
+        actual = rd.retract(self.pids,
+                            self.bucket,
+                            found_files,
+                            self.folder_prefix,
+                            force_flag=True,
+                            max_workers=3)
+
+        # only updated files are returned, in order
+        self.assertListEqual(actual, [{
+            'name': self.folder_prefix + 'person.csv'
+        }, {
+            'name': self.folder_prefix + 'visit_occurrence.csv'
+        }])
+        self.assertEqual(
+            self.uploads[self.folder_prefix + 'visit_occurrence.csv'],
+            b'visit_occurrence_id,person_id,visit_concept_id\n'
+            b'2,10,9202\nill-formed\n')
+
+    def test_retract_files(self):
+        other_prefix = 'fake_hpo/site_bucket/2020-02-02/'
+        self.objects[other_prefix + 'person.csv'] = self.person_csv
+
+        actual = rd.retract_files(self.pids, self.bucket,
+                                  [(self.folder_prefix, 'person.csv'),
+                                   (other_prefix, 'person.csv'),
+                                   (self.folder_prefix, 'observation.csv')])
+
+        self.assertDictEqual(
+            actual, {
+                self.folder_prefix: [{
+                    'name': self.folder_prefix + 'person.csv'
+                }],
+                other_prefix: [{
+                    'name': other_prefix + 'person.csv'
+                }]
+            })
@@ -253,3 +253,156 @@ class RetractDeactivatedEHRDataBqTest(unittest.TestCase):
                         'retraction'
                 })
         self.assertEqual(returned_queries, expected_queries)
+
+    @mock.patch(
+        'retraction.retract_deactivated_pids.get_date_info_for_pids_tables')
+    @mock.patch(
+        'retraction.retract_deactivated_pids.check_and_create_sandbox_dataset')
+    @mock.patch('retraction.retract_deactivated_pids.check_pid_exist')
+    def test_create_set_based_queries(self, mock_pid_exist, mock_check_sandbox,
+                                      mock_date_info):
+        # preconditions
+        deid_dataset_id = 'R2019q4r3_deid'
+        d = {
+            'project_id': [self.project_id] * 3,
+            'dataset_id': [
+                self.pids_dataset_id, self.pids_dataset_id, deid_dataset_id
+            ],
+            'table': [
+                'fake_condition_occurrence', 'fake_measurement',
+                'fake_observation'
+            ],
+            'date_column': [None, 'measurement_date', 'observation_date'],
+            'start_date_column': ['condition_start_date', None, None],
+            'end_date_column': ['condition_end_date', None, None]
+        }
+        retraction_info = pd.DataFrame(data=d)
+        mock_date_info.return_value = retraction_info
+        mock_pid_exist.return_value = 1
+        mock_check_sandbox.side_effect = lambda project, dataset: dataset + '_sandbox'
+
+        # test
+        returned_queries = retract_deactivated_pids.create_set_based_queries(
+            self.project_id, self.ticket_number, self.pids_project_id,
+            self.pids_dataset_id, self.pids_table)
+
+        # post conditions
+        # one sandbox and one delete query per table, without querying pids
+        self.assertEqual(2 * len(retraction_info), len(returned_queries))
+        self.mock_bq_client.return_value.query.assert_not_called()
+        self.assertEqual(2, mock_check_sandbox.call_count)
+
+        pids_table = f'`{self.pids_project_id}.{self.pids_dataset_id}.{self.pids_table}`'
+        for retraction_row, sandbox_query, delete_query in zip(
+                retraction_info.itertuples(index=False), returned_queries[::2],
+                returned_queries[1::2]):
+            sandbox_dataset = retraction_row.dataset_id + '_sandbox'
+            self.assertEqual('sandbox', sandbox_query['type'])
+            self.assertEqual('delete', delete_query['type'])
+            self.assertEqual(
+                f'{self.project_id}.{sandbox_dataset}.{self.ticket_number}_{retraction_row.table}',
+                sandbox_query[clean_consts.DESTINATION])
+            self.assertEqual(bq_consts.WRITE_APPEND,
+                             sandbox_query[clean_consts.DISPOSITION])
+            self.assertNotIn(clean_consts.DESTINATION, delete_query)
+            self.assertTrue(delete_query[clean_consts.QUERY].strip().startswith(
+                f'DELETE FROM `{self.project_id}.{retraction_row.dataset_id}.{retraction_row.table}`'
+            ))
+
+            for query_dict in [sandbox_query, delete_query]:
+                query = query_dict[clean_consts.QUERY]
+                self.assertEqual(retraction_row.dataset_id,
+                                 query_dict[clean_consts.DESTINATION_DATASET])
+                self.assertEqual(retraction_row.table,
+                                 query_dict[clean_consts.DESTINATION_TABLE])
+                self.assertIn(pids_table, query)
+                self.assertNotIn('&', query)
+                if pd.isnull(retraction_row.date_column):
+                    self.assertIn(
+                        'COALESCE(t.condition_end_date, t.condition_start_date) >= d.deactivated_date',
+                        query)
+                else:
+                    self.assertIn(
+                        f't.{retraction_row.date_column} >= d.deactivated_date',
+                        query)
+                if retraction_row.dataset_id == deid_dataset_id:
+                    self.assertIn(
+                        f'`{self.project_id}.2019q4r3_combined._deid_map`',
+                        query)
+                    self.assertIn('m.research_id AS person_id', query)
+                else:
+                    self.assertNotIn('_deid_map', query)
+
+    def test_get_removed_rows_summary(self):
+        # preconditions
+        queries = [{
+            clean_consts.QUERY:
+                f'SELECT * FROM `{self.project_id}.fake_dataset_1.observation`',
+            clean_consts.DESTINATION:
+                f'{self.project_id}.fake_dataset_1_sandbox.{self.ticket_number}_observation',
+            clean_consts.DESTINATION_DATASET:
+                'fake_dataset_1',
+            clean_consts.DESTINATION_TABLE:
+                'observation',
+            'type':
+                'sandbox'
+        }, {
+            clean_consts.DESTINATION_DATASET: 'fake_dataset_1',
+            clean_consts.DESTINATION_TABLE: 'observation',
+            'type': 'delete'
+        }, {
+            clean_consts.QUERY:
+                f'SELECT * FROM `{self.project_id}.fake_dataset_1.measurement`',
+            clean_consts.DESTINATION:
+                f'{self.project_id}.fake_dataset_1_sandbox.{self.ticket_number}_measurement',
+            clean_consts.DESTINATION_DATASET:
+                'fake_dataset_1',
+            clean_consts.DESTINATION_TABLE:
+                'measurement',
+            'type':
+                'sandbox'
+        }, {
+            clean_consts.QUERY:
+                f'SELECT * FROM `{self.project_id}.fake_dataset_2.observation`',
+            clean_consts.DESTINATION:
+                f'{self.project_id}.fake_dataset_2_sandbox.{self.ticket_number}_observation',
+            clean_consts.DESTINATION_DATASET:
+                'fake_dataset_2',
+            clean_consts.DESTINATION_TABLE:
+                'observation',
+            'type':
+                'sandbox'
+        }]
+        columns = ['dataset_id', 'table_id', 'person_id', 'row_count']
+        removed_rows = [
+            pd.DataFrame([['fake_dataset_1', 'observation', 1, 3],
+                          ['fake_dataset_1', 'measurement', 1, 2]],
+                         columns=columns),
+            pd.DataFrame([['fake_dataset_2', 'observation', 2, 4]],
+                         columns=columns)
+        ]
+        self.mock_bq_client.query.return_value.to_dataframe.side_effect = removed_rows
+
+        # test
+        summary_df = retract_deactivated_pids.get_removed_rows_summary(
+            queries, self.mock_bq_client)
+
+        # post conditions
+        # one query per sandbox dataset
+        self.assertEqual(2, self.mock_bq_client.query.call_count)
+        query = self.mock_bq_client.query.call_args_list[0][0][0]
+        # rows are counted from the sandbox queries, since sandbox tables may hold rows of earlier runs
+        self.assertIn(
+            f'FROM (SELECT * FROM `{self.project_id}.fake_dataset_1.observation`)',
+            query)
+        self.assertIn(
+            f'FROM (SELECT * FROM `{self.project_id}.fake_dataset_1.measurement`)',
+            query)
+        self.assertNotIn('_sandbox', query)
+        self.assertEqual(3, len(summary_df))
+        self.assertDictEqual(
+            {
+                1: 5,
+                2: 4
+            },
+            summary_df.groupby('person_id')['row_count'].sum().to_dict())
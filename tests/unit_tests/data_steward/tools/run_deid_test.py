@@ -5,6 +5,7 @@ test_parse_args -- ensures the output dataset name includes _deid
 test_main -- ensures the parameter list contains the output dataset command line argument
 test_known_tables -- ensures all table names known to curation are returned
 test_get_output_table_schemas -- ensures only table schemas for suppressed tables are copied
+test_deid_tables -- ensures prepared tables are executed and their exceptions reported
 
 Original Issue: DC-744
 """
@@ -14,7 +15,8 @@ import unittest
 import os
 
 # Third party imports
-from mock import patch
+from google.api_core.exceptions import GoogleAPIError
+from mock import ANY, MagicMock, patch
 
 # Project imports
 from tools import run_deid
@@ -78,6 +80,9 @@ class RunDeidTest(unittest.TestCase):
         # setting correct_parameter_dict values not set in setUp function
         correct_parameter_dict['console_log'] = False
         correct_parameter_dict['interactive_mode'] = False
+        correct_parameter_dict[
+            'max_concurrent_tables'] = run_deid.MAX_CONCURRENT_TABLES
+        correct_parameter_dict['rebuild_plans'] = False
         correct_parameter_dict['input_dataset'] = self.input_dataset
 
         # need to delete idataset argument from correct_parameter_dict because input_dataset argument is returned
@@ -91,11 +96,13 @@ class RunDeidTest(unittest.TestCase):
         # Post conditions
         self.assertEqual(correct_parameter_dict, results_dict)
 
+    @patch('tools.run_deid.DeidSession')
     @patch('tools.run_deid.fields_for')
     @patch('tools.run_deid.copy_suppressed_table_schemas')
-    @patch('deid.aou.main')
+    @patch('deid.aou.prepare')
     @patch('tools.run_deid.get_output_tables')
-    def test_main(self, mock_tables, mock_main, mock_suppressed, mock_fields):
+    def test_main(self, mock_tables, mock_prepare, mock_suppressed, mock_fields,
+                  mock_session):
         # Tests if incorrect parameters are given
         self.assertRaises(SystemExit, run_deid.main,
                           self.incorrect_parameter_list)
@@ -108,14 +115,41 @@ class RunDeidTest(unittest.TestCase):
         run_deid.main(self.correct_parameter_list)
 
         # Post conditions
-        mock_main.assert_called_once_with([
+        mock_session.assert_called_once_with(self.input_dataset,
+                                             self.private_key)
+        mock_prepare.assert_called_once_with([
             '--rules',
             os.path.join(DEID_PATH, 'config', 'ids', 'config.json'),
             '--private_key', self.private_key, '--table', 'fake1', '--action',
             self.action, '--idataset', self.input_dataset, '--log', 'LOGS',
             '--odataset', self.output_dataset
-        ])
-        self.assertEqual(mock_main.call_count, 1)
+        ],
+                                             session=mock_session.return_value)
+        self.assertEqual(mock_prepare.call_count, 1)
+        mock_prepare.return_value.run.assert_called_once_with()
+        mock_suppressed.assert_called_once_with(ANY, self.output_dataset)
+
+    def test_deid_tables(self):
+        # pre conditions
+        handles = {
+            'fake1': MagicMock(),
+            'fake2': MagicMock(),
+            'fake3': MagicMock()
+        }
+        handles['fake2'].run.side_effect = GoogleAPIError('bad table')
+
+        # test
+        successes, exceptions = run_deid.deid_tables(handles,
+                                                     max_concurrent_tables=2)
+
+        # post conditions
+        self.assertEqual(sorted(successes), ['fake1', 'fake3'])
+        self.assertEqual(exceptions, ['fake2'])
+        for handle in handles.values():
+            handle.run.assert_called_once_with()
+
+        # no tables to execute
+        self.assertEqual(run_deid.deid_tables({}), ([], []))
 
     @patch('tools.run_deid.os.walk')
     def test_known_tables(self, mock_walk):
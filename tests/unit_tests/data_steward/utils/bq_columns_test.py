@@ -0,0 +1,287 @@
+"""
+Unit test for the bq_columns module.
+
+Ensures columnar decoding returns the same rows as decoding cell by cell, and
+includes a benchmark decoding a synthetic response. The benchmark decodes
+100,000 rows by default, set BQ_COLUMNS_BENCHMARK_ROWS=1000000 to reproduce
+the figures on a million rows.
+"""
+# Python imports
+import os
+import time
+import unittest
+
+# Third party imports
+import numpy as np
+import pandas as pd
+
+# Project imports
+import bq_utils
+from utils import bq_columns
+from validation import export
+
+BENCHMARK_ROWS_ENV = 'BQ_COLUMNS_BENCHMARK_ROWS'
+DEFAULT_BENCHMARK_ROWS = 100000
+
+FIELDS = [{
+    'name': 'person_id',
+    'type': 'INTEGER',
+    'mode': 'NULLABLE'
+}, {
+    'name': 'value_as_number',
+    'type': 'FLOAT',
+    'mode': 'NULLABLE'
+}, {
+    'name': 'is_valid',
+    'type': 'BOOLEAN',
+    'mode': 'NULLABLE'
+}, {
+    'name': 'created',
+    'type': 'TIMESTAMP',
+    'mode': 'NULLABLE'
+}, {
+    'name': 'value_source_value',
+    'type': 'STRING',
+    'mode': 'NULLABLE'
+}]
+
+
+def _reference_transform_row(row, schema):
+    """
+    Decode a row cell by cell, as bq_utils did before columnar decoding
+    """
+    log = {}
+    for index, col_dict in enumerate(schema):
+        col_name = col_dict['name']
+        row_value = row['f'][index]['v']
+        if row_value is None:
+            log[col_name] = None
+            continue
+        if col_dict['type'] == 'RECORD':
+            if col_dict['mode'] == 'REPEATED' and isinstance(row_value, list):
+                row_value = [
+                    _reference_transform_row(record['v'], col_dict['fields'])
+                    for record in row_value
+                ]
+            else:
+                row_value = _reference_transform_row(row_value,
+                                                     col_dict['fields'])
+        elif col_dict['type'] == 'INTEGER':
+            row_value = int(row_value)
+        elif col_dict['type'] == 'FLOAT':
+            row_value = float(row_value)
+        elif col_dict['type'] == 'BOOLEAN':
+            row_value = row_value in ('True', 'true', 'TRUE')
+        elif col_dict['type'] == 'TIMESTAMP':
+            row_value = float(row_value)
+        log[col_name] = row_value
+    return log
+
+
+def _row(*values):
+    return {'f': [{'v': value} for value in values]}
+
+
+def _synthetic_response(row_count):
+    # cells are shared between rows to keep the response's memory in check
+    cells = [[{
+        'v': str(i)
+    }, {
+        'v': str(i / 4.0)
+    }, {
+        'v': 'true' if i % 2 else 'false'
+    }, {
+        'v': '1.5770304E9'
+    }, {
+        'v': 'value_%d' % i
+    }] for i in range(1000)]
+    null_cells = [{'v': None}] * len(FIELDS)
+    rows = [{
+        'f': null_cells if i % 100 == 0 else cells[i % 1000]
+    } for i in range(row_count)]
+    return {
+        'schema': {
+            'fields': FIELDS
+        },
+        'rows': rows,
+        'totalRows': str(row_count)
+    }
+
+
+class BqColumnsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.response = {
+            'schema': {
+                'fields': FIELDS
+            },
+            'rows': [
+                _row('1', '0.5', 'true', '1.5770304E9', 'a'),
+                _row(None, None, None, None, None),
+                _row('3', '-2', 'FALSE', '0', 'c'),
+            ],
+            'totalRows': '3'
+        }
+
+    def test_decode_response(self):
+        columns = bq_columns.decode_response(self.response)
+
+        self.assertEqual(list(columns.keys()),
+                         [field['name'] for field in FIELDS])
+        person_id = columns['person_id']
+        self.assertEqual(person_id.values.dtype, np.int64)
+        self.assertEqual(person_id.mask.tolist(), [False, True, False])
+        self.assertEqual(columns['value_as_number'].values.dtype, np.float64)
+        self.assertEqual(columns['is_valid'].values.tolist(),
+                         [True, False, False])
+        self.assertEqual(columns['created'].values.dtype, np.float64)
+        self.assertEqual(columns['value_source_value'].values.dtype, object)
+
+    def test_response2rows(self):
+        expected = [
+            _reference_transform_row(row, FIELDS)
+            for row in self.response['rows']
+        ]
+        actual = bq_utils.response2rows(self.response)
+        self.assertEqual(actual, expected)
+        self.assertIsInstance(actual[0]['person_id'], int)
+        self.assertIsNone(actual[1]['value_as_number'])
+
+        self.assertEqual(bq_utils.response2rows({}), [])
+        self.assertEqual(bq_utils.response2rows({'schema': {
+            'fields': FIELDS
+        }}), [])
+
+    def test_response2rows_nested(self):
+        fields = [{
+            'name': 'id',
+            'type': 'INTEGER',
+            'mode': 'NULLABLE'
+        }, {
+            'name': 'address',
+            'type': 'RECORD',
+            'mode': 'NULLABLE',
+            'fields': [{
+                'name': 'zip',
+                'type': 'INTEGER',
+                'mode': 'NULLABLE'
+            }]
+        }, {
+            'name': 'names',
+            'type': 'RECORD',
+            'mode': 'REPEATED',
+            'fields': [{
+                'name': 'given',
+                'type': 'STRING',
+                'mode': 'NULLABLE'
+            }]
+        }]
+        response = {
+            'schema': {
+                'fields': fields
+            },
+            'rows': [
+                _row('1', _row('12345'), [{
+                    'v': _row('ann')
+                }, {
+                    'v': _row('anne')
+                }]),
+                _row('2', None, []),
+                _row('3', _row(None), [{
+                    'v': _row('bo')
+                }]),
+            ]
+        }
+        expected = [
+            _reference_transform_row(row, fields) for row in response['rows']
+        ]
+        self.assertEqual(bq_utils.response2rows(response), expected)
+
+    def test_response2rows_repeated(self):
+        fields = [{'name': 'codes', 'type': 'INTEGER', 'mode': 'REPEATED'}]
+        response = {
+            'schema': {
+                'fields': fields
+            },
+            'rows': [
+                _row([{
+                    'v': '1'
+                }, {
+                    'v': '2'
+                }]),
+                _row([]),
+                _row([{
+                    'v': '3'
+                }]),
+            ]
+        }
+        self.assertEqual(bq_utils.response2rows(response), [{
+            'codes': [1, 2]
+        }, {
+            'codes': []
+        }, {
+            'codes': [3]
+        }])
+
+    def test_response_to_dataframe(self):
+        df = bq_columns.response_to_dataframe(self.response)
+
+        self.assertEqual(list(df.columns), [field['name'] for field in FIELDS])
+        self.assertEqual(str(df['person_id'].dtype), 'Int64')
+        self.assertTrue(pd.isna(df['person_id'][1]))
+        self.assertEqual(df['person_id'][2], 3)
+        self.assertTrue(np.isnan(df['value_as_number'][1]))
+        self.assertIsNone(df['is_valid'][1])
+        self.assertEqual(df['value_source_value'].tolist(), ['a', None, 'c'])
+
+    def test_query_result_to_payload(self):
+        payload = export.query_result_to_payload(self.response)
+
+        self.assertEqual(payload['PERSON_ID'], [1, None, 3])
+        self.assertEqual(payload['VALUE_AS_NUMBER'], [0.5, None, -2.0])
+        # only numbers are converted
+        self.assertEqual(payload['IS_VALID'], ['true', None, 'FALSE'])
+
+        single_row = dict(self.response,
+                          rows=self.response['rows'][:1],
+                          totalRows='1')
+        payload = export.query_result_to_payload(single_row)
+        self.assertEqual(payload['PERSON_ID'], 1)
+
+        empty = dict(self.response, totalRows='0')
+        payload = export.query_result_to_payload(empty)
+        self.assertEqual(payload['PERSON_ID'], [])
+
+    def test_benchmark(self):
+        """
+        Benchmark decoding a synthetic response cell by cell and by column
+        """
+        row_count = int(
+            os.environ.get(BENCHMARK_ROWS_ENV, DEFAULT_BENCHMARK_ROWS))
+        response = _synthetic_response(row_count)
+
+        start = time.time()
+        expected = [
+            _reference_transform_row(row, FIELDS) for row in response['rows']
+        ]
+        reference_seconds = time.time() - start
+
+        start = time.time()
+        actual = bq_utils.response2rows(response)
+        rows_seconds = time.time() - start
+
+        start = time.time()
+        df = bq_columns.response_to_dataframe(response)
+        dataframe_seconds = time.time() - start
+
+        print(f"Decoded {row_count} rows: {reference_seconds:.2f}s cell by "
+              f"cell, {rows_seconds:.2f}s by column to dicts, "
+              f"{dataframe_seconds:.2f}s by column to a DataFrame")
+        self.assertEqual(actual, expected)
+        self.assertEqual(len(df), row_count)
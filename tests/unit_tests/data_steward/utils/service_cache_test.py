@@ -0,0 +1,178 @@
+"""
+Unit test for the service_cache module.
+
+Ensures discovery clients are built once per thread and reused, and includes a
+micro-benchmark counting the clients built while validating a submission.
+"""
+# Python imports
+import os
+import threading
+import unittest
+
+# Third party imports
+import mock
+from google.auth.exceptions import RefreshError
+from googleapiclient.errors import HttpError
+
+# Project imports
+import bq_utils
+import common
+import gcs_utils
+import resources
+from utils import service_cache
+from validation import main
+
+
+class ServiceCacheTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        service_cache.invalidate()
+        mock_build_patcher = mock.patch(
+            'utils.service_cache.googleapiclient.discovery.build')
+        self.mock_build = mock_build_patcher.start()
+        self.mock_build.side_effect = lambda *args, **kwargs: mock.MagicMock()
+        self.addCleanup(mock_build_patcher.stop)
+        self.addCleanup(service_cache.invalidate)
+
+    def test_get_service_reused(self):
+        bq_service = bq_utils.create_service()
+        gcs_service = gcs_utils.create_service()
+
+        self.assertIs(bq_service, bq_utils.create_service())
+        self.assertIs(gcs_service, gcs_utils.create_service())
+        self.assertIsNot(bq_service, gcs_service)
+        self.assertEqual(2, self.mock_build.call_count)
+
+    def test_get_service_per_thread(self):
+        services = []
+
+        def get_service():
+            services.append(bq_utils.create_service())
+            services.append(bq_utils.create_service())
+
+        threads = [threading.Thread(target=get_service) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # each thread builds a single client of its own
+        self.assertEqual(3, self.mock_build.call_count)
+        self.assertEqual(3, len(set(id(service) for service in services)))
+
+    def test_invalidate(self):
+        service = bq_utils.create_service()
+        service_cache.invalidate()
+        self.assertIsNot(service, bq_utils.create_service())
+        self.assertEqual(2, self.mock_build.call_count)
+
+        # changing credentials discards the cached client
+        service = bq_utils.create_service()
+        with mock.patch.dict(os.environ,
+                             {service_cache.CREDENTIALS_ENV: 'other.json'}):
+            self.assertIsNot(service, bq_utils.create_service())
+        self.assertEqual(3, self.mock_build.call_count)
+
+    def test_invalidate_on_error(self):
+        service = bq_utils.create_service()
+
+        # errors a new client would also get keep the cached clients
+        for error in [
+                HttpError(mock.Mock(status=404), b'not found'),
+                ValueError('bad value')
+        ]:
+            self.assertFalse(service_cache.invalidate_on_error(error))
+            self.assertIs(service, bq_utils.create_service())
+
+        # credential and transport errors discard them
+        for error in [
+                HttpError(mock.Mock(status=401), b'unauthorized'),
+                RefreshError('expired'),
+                ConnectionResetError('reset')
+        ]:
+            self.assertTrue(service_cache.invalidate_on_error(error))
+            self.assertIsNot(service, bq_utils.create_service())
+            service = bq_utils.create_service()
+
+    @mock.patch('bq_utils.sleeper')
+    @mock.patch('bq_utils.app_identity.get_application_id')
+    def test_get_jobs_details_rebuilds_client(self, mock_get_application_id,
+                                              mock_sleeper):
+        mock_get_application_id.return_value = 'fake_project'
+        services = []
+
+        def build(*args, **kwargs):
+            service = mock.MagicMock()
+            batch = service.new_batch_http_request.return_value
+            if not services:
+                # the connection of the first client is broken
+                batch.execute.side_effect = ConnectionResetError('reset')
+            else:
+                batch.add.side_effect = lambda request, request_id: (
+                    service.new_batch_http_request.call_args[1]['callback']
+                    (request_id, {
+                        'status': {
+                            'state': 'DONE'
+                        }
+                    }, None))
+            services.append(service)
+            return service
+
+        self.mock_build.side_effect = build
+        actual = bq_utils.get_jobs_details(['stale_client_job'])
+
+        self.assertEqual(['stale_client_job'], list(actual))
+        self.assertEqual(2, len(services))
+
+    @mock.patch('bq_utils.app_identity.get_application_id')
+    @mock.patch('bq_utils.get_dataset_id')
+    @mock.patch('bq_utils.sleeper')
+    @mock.patch('gcs_utils.get_hpo_bucket')
+    def test_builds_per_validate_submission(self, mock_get_hpo_bucket,
+                                            mock_sleeper, mock_get_dataset_id,
+                                            mock_get_application_id):
+        """
+        Micro-benchmark of the clients built while processing a submission
+
+        Every table is created and every submitted file is loaded and polled,
+        which used to build a new client for each API call.
+        """
+        mock_get_hpo_bucket.return_value = 'fake_bucket'
+        mock_get_dataset_id.return_value = 'fake_dataset'
+        mock_get_application_id.return_value = 'fake_project'
+        bq_service = mock.MagicMock()
+        jobs = bq_service.jobs.return_value
+        jobs.insert.return_value.execute.return_value = {
+            'jobReference': {
+                'jobId': 'fake_job'
+            }
+        }
+        job_resource = {'status': {'state': 'DONE'}}
+        jobs.get.return_value.execute.return_value = job_resource
+
+        def new_batch_http_request(callback):
+            batch = mock.MagicMock()
+            batch.add.side_effect = lambda request, request_id: callback(
+                request_id, job_resource, None)
+            return batch
+
+        bq_service.new_batch_http_request.side_effect = new_batch_http_request
+        self.mock_build.side_effect = None
+        self.mock_build.return_value = bq_service
+
+        folder_items = ['person.csv', 'visit_occurrence.csv', 'pii_name.csv']
+        main.validate_submission('fake_hpo', 'fake_bucket', folder_items,
+                                 'fake_folder/')
+
+        api_calls = bq_service.tables.call_count + bq_service.jobs.call_count
+        print(f"{api_calls} BigQuery API calls for "
+              f"{len(resources.CDM_FILES + common.PII_FILES)} tables built "
+              f"{self.mock_build.call_count} client(s)")
+        self.assertGreater(api_calls, 1)
+        self.assertEqual(1, self.mock_build.call_count)
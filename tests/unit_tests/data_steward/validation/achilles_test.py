@@ -3,6 +3,7 @@ import os
 import unittest
 
 # Third party imports
+import mock
 
 # Project imports
 from validation import achilles
@@ -36,3 +37,14 @@ class AchillesTest(unittest.TestCase):
         for command in commands:
             is_temp = sql_wrangle.is_to_temp_table(command)
             self.assertFalse(is_temp, command)
+
+    @mock.patch('validation.achilles.run_analysis_job')
+    def test_run_analyses(self, mock_run_analysis_job):
+        achilles.run_analyses(self.hpo_id, max_concurrent_jobs=4)
+
+        commands = achilles._get_run_analysis_commands(self.hpo_id)
+        run_commands = [
+            call_args[0][0]
+            for call_args in mock_run_analysis_job.call_args_list
+        ]
+        self.assertCountEqual(run_commands, commands)
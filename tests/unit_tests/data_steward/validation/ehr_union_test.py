@@ -0,0 +1,452 @@
+"""
+Unit test for the task graph of the ehr_union module.
+
+The union queries themselves are covered by the integration tests.
+"""
+# Python imports
+import threading
+import unittest
+from collections import OrderedDict
+
+# Third party imports
+import mock
+
+# Project imports
+import bq_utils
+import cdm
+import common
+import resources
+from constants.tools.combine_ehr_rdr import PERSON_TABLE, OBSERVATION_TABLE
+from constants.validation import ehr_union as eu_constants
+from validation import ehr_union
+
+
+class EhrUnionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.input_dataset_id = 'fake_input'
+        self.output_dataset_id = 'fake_output'
+        self.project_id = 'fake_project'
+        # a tuple, so recorded calls can be looked up
+        self.hpo_ids = ('fake_1', 'fake_2')
+
+    def test_load_dependencies(self):
+        self.assertListEqual([common.MEASUREMENT],
+                             ehr_union.load_dependencies(
+                                 eu_constants.FACT_RELATIONSHIP))
+        self.assertListEqual([], ehr_union.load_dependencies(common.DEATH))
+        self.assertListEqual([eu_constants.CARE_SITE, eu_constants.LOCATION],
+                             ehr_union.load_dependencies(PERSON_TABLE))
+        self.assertListEqual(
+            [eu_constants.VISIT_OCCURRENCE, eu_constants.CARE_SITE],
+            ehr_union.load_dependencies(eu_constants.VISIT_OCCURRENCE))
+        self.assertListEqual(
+            [common.MEASUREMENT, eu_constants.VISIT_OCCURRENCE],
+            ehr_union.load_dependencies(common.MEASUREMENT))
+
+    def _run_main(self, max_concurrent_jobs):
+        """
+        Run the union with each step replaced by a mock recording its calls
+
+        :param max_concurrent_jobs: maximum number of steps running at the same time
+        :return: tuple of the report and the list of (step, args) calls in the order they were made
+        """
+        calls = []
+        lock = threading.Lock()
+
+        def record(step):
+
+            def run(*args):
+                with lock:
+                    calls.append((step, args))
+
+            return run
+
+        steps = [
+            'create_output_table', 'mapping', 'load',
+            'map_ehr_person_to_observation', 'move_ehr_person_to_observation'
+        ]
+        for step in steps:
+            patcher = mock.patch(f'validation.ehr_union.{step}',
+                                 side_effect=record(step))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        for function, return_value in [('table_exists', True),
+                                       ('delete_table', None)]:
+            patcher = mock.patch(f'validation.ehr_union.bq_utils.{function}',
+                                 return_value=return_value)
+            setattr(self, f'mock_{function}', patcher.start())
+            self.addCleanup(patcher.stop)
+
+        report = ehr_union.main(self.input_dataset_id, self.output_dataset_id,
+                                self.project_id, self.hpo_ids,
+                                max_concurrent_jobs)
+        return report, calls
+
+    def test_main(self):
+        report, calls = self._run_main(max_concurrent_jobs=4)
+
+        # the same steps are run as by the sequential union
+        expected_calls = [('create_output_table', (table,
+                                                   self.output_dataset_id))
+                          for table in resources.CDM_TABLES]
+        expected_calls += [('mapping',
+                            (table, self.hpo_ids, self.input_dataset_id,
+                             self.output_dataset_id, self.project_id))
+                           for table in cdm.tables_to_map() + [PERSON_TABLE]]
+        expected_calls += [('load', (table, self.hpo_ids, self.input_dataset_id,
+                                     self.output_dataset_id))
+                           for table in resources.CDM_TABLES]
+        expected_calls += [
+            ('map_ehr_person_to_observation', (self.output_dataset_id,)),
+            ('move_ehr_person_to_observation', (self.output_dataset_id,))
+        ]
+        self.assertCountEqual(expected_calls, calls)
+
+        # each table is loaded after it is created and the mappings it reads exist
+        positions = {call: position for position, call in enumerate(calls)}
+        for table in resources.CDM_TABLES:
+            load_position = positions[('load', (table, self.hpo_ids,
+                                                self.input_dataset_id,
+                                                self.output_dataset_id))]
+            self.assertLess(
+                positions[('create_output_table',
+                           (table, self.output_dataset_id))], load_position)
+            for mapped_table in ehr_union.load_dependencies(table):
+                self.assertLess(
+                    positions[('mapping',
+                               (mapped_table, self.hpo_ids,
+                                self.input_dataset_id, self.output_dataset_id,
+                                self.project_id))], load_position)
+
+        # person records are mapped to observation once observation is loaded
+        self.assertLess(
+            positions[('load',
+                       (OBSERVATION_TABLE, self.hpo_ids, self.input_dataset_id,
+                        self.output_dataset_id))],
+            positions[('map_ehr_person_to_observation',
+                       (self.output_dataset_id,))])
+        tasks = ehr_union.get_union_tasks(self.input_dataset_id,
+                                          self.output_dataset_id,
+                                          self.project_id, self.hpo_ids)
+        self.assertIn(
+            ehr_union._task_name(eu_constants.LOAD_STEP, OBSERVATION_TABLE),
+            tasks[ehr_union._task_name(
+                eu_constants.PERSON_TO_OBSERVATION_MAPPING_STEP,
+                OBSERVATION_TABLE)][eu_constants.DEPENDS_ON])
+
+        # person to observation runs last
+        self.assertListEqual(
+            ['map_ehr_person_to_observation', 'move_ehr_person_to_observation'],
+            [step for step, _ in calls[-2:]])
+
+        # every table has timings for its steps
+        self.assertSetEqual(set(resources.CDM_TABLES), set(report))
+        self.assertCountEqual([
+            eu_constants.CREATE_STEP, eu_constants.MAPPING_STEP,
+            eu_constants.LOAD_STEP
+        ], report[common.MEASUREMENT])
+        self.assertIn(eu_constants.PERSON_TO_OBSERVATION_STEP,
+                      report[OBSERVATION_TABLE])
+
+        # the next incremental union unions all HPOs
+        self.mock_delete_table.assert_called_once_with(
+            eu_constants.UNION_METADATA_TABLE, self.output_dataset_id)
+
+    def test_main_sequential(self):
+        _, calls = self._run_main(max_concurrent_jobs=1)
+
+        # tasks start in the order they are defined when they can
+        steps = [step for step, _ in calls]
+        self.assertListEqual(['create_output_table'] *
+                             len(resources.CDM_TABLES),
+                             steps[:len(resources.CDM_TABLES)])
+
+    def test_run_tasks_concurrent(self):
+        # both tasks must be running at the same time to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+        tasks = OrderedDict()
+        tasks['first'] = ehr_union._task('load', 'first', barrier.wait, ())
+        tasks['second'] = ehr_union._task('load', 'second', barrier.wait, ())
+        tasks['third'] = ehr_union._task('load', 'third', lambda: None, (),
+                                         ['first', 'second'])
+
+        timings = ehr_union.run_tasks(tasks, max_concurrent_jobs=2)
+
+        self.assertEqual(3, len(timings))
+        self.assertEqual('third', timings[-1][eu_constants.TABLE])
+
+    def test_run_tasks_failure(self):
+        run = mock.MagicMock()
+        tasks = OrderedDict()
+        tasks['fails'] = ehr_union._task('mapping', 'fails',
+                                         mock.MagicMock(side_effect=ValueError),
+                                         ())
+        tasks['dependent'] = ehr_union._task('load', 'dependent', run, (),
+                                             ['fails'])
+
+        self.assertRaises(ValueError, ehr_union.run_tasks, tasks)
+        run.assert_not_called()
+
+        tasks['dependent'][eu_constants.DEPENDS_ON] = ['missing']
+        self.assertRaises(RuntimeError, ehr_union.run_tasks, tasks)
+
+    def test_get_submission_times(self):
+        tables_last_modified = {
+            'fake_1_person': 100,
+            'fake_1_measurement': 300,
+            'fake_1_not_a_cdm_table': 500,
+            'fake_2_achilles_results': 200
+        }
+        self.assertDictEqual({
+            'fake_1': 300,
+            'fake_2': None
+        }, ehr_union.get_submission_times(tables_last_modified, self.hpo_ids))
+
+    def test_get_changed_hpo_ids(self):
+        hpo_offsets = ehr_union.get_hpo_offsets(['fake_1', 'fake_2', 'fake_3'])
+        metadata = {
+            hpo_id: {
+                eu_constants.HPO_ID: hpo_id,
+                eu_constants.HPO_OFFSET: hpo_offsets[hpo_id],
+                eu_constants.LAST_MODIFIED_TIME: 100
+            } for hpo_id in ['fake_1', 'fake_2']
+        }
+
+        # fake_2 submitted since the last union and fake_3 is new
+        submission_times = {'fake_1': 100, 'fake_2': 200, 'fake_3': 200}
+        self.assertListEqual(['fake_2', 'fake_3'],
+                             ehr_union.get_changed_hpo_ids(
+                                 metadata, hpo_offsets, submission_times))
+
+        # fake_2 is no longer unioned
+        hpo_offsets = ehr_union.get_hpo_offsets(['fake_1'])
+        self.assertListEqual(['fake_2'],
+                             ehr_union.get_changed_hpo_ids(
+                                 metadata, hpo_offsets, submission_times))
+
+        # the ids of fake_2 would change
+        hpo_offsets = ehr_union.get_hpo_offsets(['fake_0', 'fake_1', 'fake_2'])
+        self.assertIsNone(
+            ehr_union.get_changed_hpo_ids(metadata, hpo_offsets,
+                                          submission_times))
+
+    def test_get_incremental_union_tasks(self):
+        hpo_ids = ['fake_1', 'fake_2']
+        tables_last_modified = {
+            bq_utils.get_table_id(hpo_id, table): 100 for hpo_id in hpo_ids
+            for table in resources.CDM_TABLES
+        }
+        # fake_2 did not submit a note table
+        del tables_last_modified[bq_utils.get_table_id('fake_2', common.NOTE)]
+
+        tasks = ehr_union.get_incremental_union_tasks(self.input_dataset_id,
+                                                      self.output_dataset_id,
+                                                      self.project_id, hpo_ids,
+                                                      ['fake_2'],
+                                                      tables_last_modified)
+
+        # the slices of fake_2 are removed, remapped and reloaded
+        measurement_tasks = [
+            tasks[ehr_union._task_name(step, common.MEASUREMENT)] for step in [
+                eu_constants.REMOVE_STEP, eu_constants.MAPPING_STEP,
+                eu_constants.LOAD_STEP
+            ]
+        ]
+        self.assertEqual(['fake_2'], measurement_tasks[0][eu_constants.ARGS][1])
+        mapping_function = measurement_tasks[1][eu_constants.FUNCTION]
+        self.assertEqual('WRITE_APPEND',
+                         mapping_function.keywords['write_disposition'])
+        self.assertDictEqual(ehr_union.get_hpo_offsets(hpo_ids),
+                             mapping_function.keywords['hpo_offsets'])
+        self.assertEqual(['fake_2'], measurement_tasks[1][eu_constants.ARGS][1])
+        self.assertEqual(['fake_2'], measurement_tasks[2][eu_constants.ARGS][1])
+        self.assertIn(
+            ehr_union._task_name(eu_constants.MAPPING_STEP,
+                                 eu_constants.VISIT_OCCURRENCE),
+            measurement_tasks[2][eu_constants.DEPENDS_ON])
+        self.assertNotIn(
+            ehr_union._task_name(eu_constants.CREATE_STEP, common.MEASUREMENT),
+            tasks)
+
+        # nothing is loaded from a table fake_2 did not submit
+        self.assertNotIn(
+            ehr_union._task_name(eu_constants.MAPPING_STEP, common.NOTE), tasks)
+        self.assertNotIn(
+            ehr_union._task_name(eu_constants.LOAD_STEP, common.NOTE), tasks)
+
+        # tables which cannot be traced back to an HPO are rebuilt from all HPOs
+        for table in [
+                PERSON_TABLE, common.DEATH, eu_constants.FACT_RELATIONSHIP
+        ]:
+            self.assertIn(ehr_union._task_name(eu_constants.CREATE_STEP, table),
+                          tasks)
+            load_task = tasks[ehr_union._task_name(eu_constants.LOAD_STEP,
+                                                   table)]
+            self.assertEqual(hpo_ids, load_task[eu_constants.ARGS][1])
+        person_mapping = tasks[ehr_union._task_name(eu_constants.MAPPING_STEP,
+                                                    PERSON_TABLE)]
+        self.assertEqual(hpo_ids, person_mapping[eu_constants.ARGS][1])
+
+        # only the persons of fake_2 are mapped, the persons removed with its slice are moved again
+        map_task = tasks[ehr_union._task_name(
+            eu_constants.PERSON_TO_OBSERVATION_MAPPING_STEP, OBSERVATION_TABLE)]
+        self.assertEqual((self.output_dataset_id, ['fake_2']),
+                         map_task[eu_constants.ARGS])
+        move_task = tasks[ehr_union._task_name(
+            eu_constants.PERSON_TO_OBSERVATION_STEP, OBSERVATION_TABLE)]
+        self.assertEqual((self.output_dataset_id,),
+                         move_task[eu_constants.ARGS])
+        self.assertTrue(
+            move_task[eu_constants.FUNCTION].keywords['missing_only'])
+        self.assertIn(
+            ehr_union._task_name(eu_constants.LOAD_STEP, OBSERVATION_TABLE),
+            move_task[eu_constants.DEPENDS_ON])
+
+        # every dependency exists
+        for task in tasks.values():
+            self.assertTrue(set(task[eu_constants.DEPENDS_ON]).issubset(tasks))
+
+    @mock.patch('validation.ehr_union.save_union_metadata')
+    @mock.patch('validation.ehr_union._run_union')
+    @mock.patch('validation.ehr_union.bq_utils.list_all_table_ids')
+    @mock.patch('validation.ehr_union.get_union_metadata')
+    @mock.patch('validation.ehr_union.get_tables_last_modified')
+    def test_incremental_union(self, mock_tables_last_modified,
+                               mock_union_metadata, mock_list_all_table_ids,
+                               mock_run_union, mock_save_union_metadata):
+        hpo_ids = ['fake_1', 'fake_2']
+        hpo_offsets = ehr_union.get_hpo_offsets(hpo_ids)
+        mock_tables_last_modified.return_value = {
+            'fake_1_person': 100,
+            'fake_2_person': 100
+        }
+        mock_list_all_table_ids.return_value = [
+            ehr_union.output_table_for(table) for table in resources.CDM_TABLES
+        ] + [
+            ehr_union.mapping_table_for(table) for table in cdm.tables_to_map()
+        ]
+        unioned = {
+            hpo_id: {
+                eu_constants.HPO_ID: hpo_id,
+                eu_constants.HPO_OFFSET: hpo_offsets[hpo_id],
+                eu_constants.LAST_MODIFIED_TIME: 100
+            } for hpo_id in hpo_ids
+        }
+
+        # nothing was submitted since the last union
+        mock_union_metadata.return_value = unioned
+        self.assertDictEqual({},
+                             ehr_union.main(self.input_dataset_id,
+                                            self.output_dataset_id,
+                                            self.project_id,
+                                            hpo_ids,
+                                            incremental=True))
+        mock_run_union.assert_not_called()
+        mock_save_union_metadata.assert_not_called()
+
+        # fake_1 submitted since the last union
+        mock_tables_last_modified.return_value = {
+            'fake_1_person': 200,
+            'fake_2_person': 100
+        }
+        ehr_union.incremental_union(self.input_dataset_id,
+                                    self.output_dataset_id, self.project_id,
+                                    hpo_ids)
+        tasks = mock_run_union.call_args[0][0]
+        self.assertIn(
+            ehr_union._task_name(eu_constants.REMOVE_STEP, common.MEASUREMENT),
+            tasks)
+        mock_save_union_metadata.assert_called_once_with(
+            self.output_dataset_id, hpo_offsets, {
+                'fake_1': 200,
+                'fake_2': 100
+            })
+
+        # the dataset was not unioned incrementally before
+        mock_union_metadata.return_value = None
+        ehr_union.incremental_union(self.input_dataset_id,
+                                    self.output_dataset_id, self.project_id,
+                                    hpo_ids)
+        tasks = mock_run_union.call_args[0][0]
+        self.assertNotIn(
+            ehr_union._task_name(eu_constants.REMOVE_STEP, common.MEASUREMENT),
+            tasks)
+        self.assertIn(
+            ehr_union._task_name(eu_constants.CREATE_STEP, common.MEASUREMENT),
+            tasks)
+        self.assertEqual(2, mock_save_union_metadata.call_count)
+
+    @mock.patch('validation.ehr_union.bq_utils.job_status_errored')
+    @mock.patch('validation.ehr_union.bq_utils.wait_on_jobs')
+    @mock.patch('validation.ehr_union.bq_utils.query')
+    def test_remove_hpo_slice(self, mock_query, mock_wait_on_jobs,
+                              mock_job_status_errored):
+        mock_query.return_value = {'jobReference': {'jobId': 'fake_job'}}
+        mock_wait_on_jobs.return_value = []
+        mock_job_status_errored.return_value = (False, None)
+
+        ehr_union.remove_hpo_slice(common.MEASUREMENT, ['fake_2', 'fake_1'],
+                                   self.output_dataset_id, self.project_id)
+
+        output_query, mapping_query = [
+            call[0][0] for call in mock_query.call_args_list
+        ]
+        self.assertIn(
+            f'DELETE FROM `{self.project_id}.{self.output_dataset_id}.unioned_ehr_measurement`',
+            output_query)
+        self.assertIn(
+            f'FROM `{self.project_id}.{self.output_dataset_id}._mapping_measurement`',
+            output_query)
+        self.assertIn(
+            f'DELETE FROM `{self.project_id}.{self.output_dataset_id}._mapping_measurement`',
+            mapping_query)
+        for q in [output_query, mapping_query]:
+            self.assertIn("src_hpo_id IN ('fake_1', 'fake_2')", q)
+
+        mock_job_status_errored.return_value = (True, 'fake error')
+        with self.assertRaises(bq_utils.InvalidOperationError) as cm:
+            ehr_union.remove_hpo_slice(common.MEASUREMENT, ['fake_1'],
+                                       self.output_dataset_id, self.project_id)
+        self.assertIn('fake error', str(cm.exception))
+
+    @mock.patch('validation.ehr_union.query')
+    def test_person_to_observation_shared_person(self, mock_query):
+        # fake_1 and fake_2 both submitted a person with the same person_id, and fake_2 changed.
+        # The observations derived from the person have the same ids for both HPOs.
+        ehr_union.map_ehr_person_to_observation(self.output_dataset_id,
+                                                ['fake_2'])
+        ehr_union.move_ehr_person_to_observation(self.output_dataset_id,
+                                                 missing_only=True)
+
+        (map_query, map_table, _), map_kwargs = mock_query.call_args_list[0]
+        (move_query, move_table, _), move_kwargs = mock_query.call_args_list[1]
+
+        # only fake_2 is mapped again, the mapping of fake_1 is kept
+        self.assertEqual('_mapping_observation', map_table)
+        self.assertEqual('WRITE_APPEND', map_kwargs['write_disposition'])
+        self.assertIn("mp.src_hpo_id IN ('fake_2')", map_query)
+        self.assertNotIn('fake_1', map_query)
+
+        # removing the slice of fake_2 removed the observations of the person for both HPOs,
+        # so they are moved again for the persons missing them, whichever HPO submitted them
+        self.assertEqual('unioned_ehr_observation', move_table)
+        self.assertEqual('WRITE_APPEND', move_kwargs['write_disposition'])
+        self.assertIn(
+            f'person_id NOT IN (\n  SELECT person_id\n'
+            f'  FROM {self.output_dataset_id}.unioned_ehr_observation',
+            move_query)
+        self.assertIn(
+            f'observation_id >= {eu_constants.EHR_PERSON_TO_OBS_CONSTANT}',
+            move_query)
+        self.assertIn(
+            f'observation_id < {eu_constants.EHR_ID_MULTIPLIER_START * common.ID_CONSTANT_FACTOR}',
+            move_query)
+        self.assertNotIn('_mapping_person', move_query)
@@ -0,0 +1,152 @@
+"""
+Unit test for the export module.
+
+Ensures the queries of the reports are gathered up front, run concurrently and
+assembled into the same payloads, and that the plan only dry runs the queries.
+"""
+# Python imports
+import os
+import unittest
+
+# Third party imports
+import mock
+
+# Project imports
+import common
+from validation import export
+from validation import main
+
+
+def _query_response(name, value):
+    return {
+        'totalRows': '1',
+        'schema': {
+            'fields': [{
+                'name': name,
+                'type': 'INTEGER'
+            }]
+        },
+        'rows': [{
+            'f': [{
+                'v': str(value)
+            }]
+        }]
+    }
+
+
+def _fake_query(sql, dry_run=False):
+    if dry_run:
+        return {'totalBytesProcessed': str(len(sql))}
+    return _query_response('query_length', len(sql))
+
+
+class ExportTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.hpo_id = 'fake'
+        self.bucket = 'fake_bucket'
+
+        mock_query_patcher = mock.patch('validation.export.bq_utils.query')
+        self.mock_query = mock_query_patcher.start()
+        self.mock_query.side_effect = _fake_query
+        self.addCleanup(mock_query_patcher.stop)
+
+        mock_is_hpo_id_patcher = mock.patch('validation.export.is_hpo_id')
+        self.mock_is_hpo_id = mock_is_hpo_id_patcher.start()
+        self.mock_is_hpo_id.return_value = True
+        self.addCleanup(mock_is_hpo_id_patcher.stop)
+
+        mock_dataset_id_patcher = mock.patch(
+            'validation.export.bq_utils.get_dataset_id')
+        self.mock_dataset_id = mock_dataset_id_patcher.start()
+        self.mock_dataset_id.return_value = 'fake_dataset'
+        self.addCleanup(mock_dataset_id_patcher.stop)
+
+    def test_list_export_queries(self):
+        person_path = os.path.join(export.EXPORT_PATH, common.PERSON_REPORT)
+        queries = export.list_export_queries(person_path, self.hpo_id)
+        keys = [query_keys for query_keys, _, _ in queries]
+
+        # sql files of a folder come before its subfolders
+        self.assertEqual(keys[-1], ('BIRTH_YEAR_HISTOGRAM', 'DATA'))
+        self.assertIn(('BIRTH_YEAR_HISTOGRAM',), keys[:-1])
+        self.assertEqual(len(keys), 6)
+        for _, path, sql in queries:
+            self.assertTrue(path.endswith('.sql'))
+            self.assertNotIn(export.RESULTS_SCHEMA_PLACEHOLDER, sql)
+
+    def test_add_payload(self):
+        report = dict()
+        export.add_payload(report, ('ITEM', 'DATA'), {'A': 1})
+        export.add_payload(report, ('ITEM',), {'A': 2, 'DATA': 'file'})
+        self.assertEqual(report, {'ITEM': {'A': 2, 'DATA': {'A': 1}}})
+
+        report = dict()
+        export.add_payload(report, ('ITEM',), {'A': 2, 'DATA': 'file'})
+        export.add_payload(report, ('ITEM', 'DATA'), {'A': 1})
+        self.assertEqual(report, {'ITEM': {'A': 2, 'DATA': {'A': 1}}})
+
+    def test_iter_reports(self):
+        reports = dict(
+            export.iter_reports(common.ALL_REPORTS, self.hpo_id, max_workers=3))
+
+        self.assertCountEqual(reports.keys(), common.ALL_REPORTS)
+        person = reports[common.PERSON_REPORT]
+        self.assertCountEqual(person.keys(), [
+            'BIRTH_YEAR_HISTOGRAM', 'ETHNICITY_DATA', 'GENDER_DATA',
+            'RACE_DATA', 'SUMMARY'
+        ])
+        self.assertIn('DATA', person['BIRTH_YEAR_HISTOGRAM'])
+        self.assertIn('QUERY_LENGTH', person['BIRTH_YEAR_HISTOGRAM'])
+        self.assertIn('MESSAGES', reports[common.ACHILLES_HEEL_REPORT])
+        # the site's membership is only looked up once per export
+        self.assertEqual(self.mock_is_hpo_id.call_count, 1)
+
+    def test_export_from_path(self):
+        person_path = os.path.join(export.EXPORT_PATH, common.PERSON_REPORT)
+        result = export.export_from_path(person_path, self.hpo_id)
+        reports = dict(export.iter_reports([common.PERSON_REPORT], self.hpo_id))
+        self.assertEqual(result, reports[common.PERSON_REPORT])
+
+    def test_plan_export(self):
+        plan = export.plan_export(common.ALL_REPORTS, self.hpo_id)
+
+        self.assertEqual(len(plan), self.mock_query.call_count)
+        for call_args in self.mock_query.call_args_list:
+            self.assertTrue(call_args[1]['dry_run'])
+        self.assertEqual([query['report'] for query in plan][0],
+                         common.ALL_REPORTS[0])
+        for query in plan:
+            self.assertGreater(query['total_bytes_processed'], 0)
+            self.assertNotIn('sql', query)
+
+    @mock.patch('validation.main.gcs_utils.upload_object')
+    def test_run_export(self, mock_upload_object):
+        mock_upload_object.side_effect = lambda bucket, path, fp: path
+        folder_prefix = 'folder/'
+
+        results = main.run_export(datasource_id=self.hpo_id,
+                                  folder_prefix=folder_prefix,
+                                  target_bucket=self.bucket)
+
+        reports_prefix = folder_prefix + common.ACHILLES_EXPORT_PREFIX_STRING + self.hpo_id + '/'
+        expected = [
+            reports_prefix + report for report in common.ALL_REPORT_FILES
+        ]
+        expected.append(folder_prefix + common.ACHILLES_EXPORT_DATASOURCES_JSON)
+        self.assertEqual(results, expected)
+
+    @mock.patch('validation.main.gcs_utils.upload_object')
+    def test_run_export_plan(self, mock_upload_object):
+        plan = main.run_export(datasource_id=self.hpo_id,
+                               target_bucket=self.bucket,
+                               plan=True)
+
+        self.assertGreater(len(plan), 0)
+        self.assertFalse(mock_upload_object.called)
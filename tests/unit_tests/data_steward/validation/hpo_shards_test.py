@@ -0,0 +1,81 @@
+# Python imports
+import unittest
+
+# Project imports
+from validation import hpo_shards
+
+
+class HpoShardsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.hpo_ids = [f'hpo_{i:03}' for i in range(100)]
+
+    def test_get_num_shards(self):
+        # everything fits in a single slot
+        self.assertEqual(
+            1,
+            hpo_shards.get_num_shards(100,
+                                      max_workers=10,
+                                      hpo_seconds=60,
+                                      shard_seconds=600))
+
+        # 4 workers run 2 rounds of sites per slot
+        self.assertEqual(
+            13,
+            hpo_shards.get_num_shards(100,
+                                      max_workers=4,
+                                      hpo_seconds=60,
+                                      shard_seconds=120))
+
+        # a single site exceeding the slot is still scheduled
+        self.assertEqual(
+            3,
+            hpo_shards.get_num_shards(3,
+                                      max_workers=1,
+                                      hpo_seconds=60,
+                                      shard_seconds=30))
+        self.assertEqual(1, hpo_shards.get_num_shards(0, max_workers=4))
+
+    def test_get_hpo_shards(self):
+        shuffled_hpo_ids = self.hpo_ids[1::2] + self.hpo_ids[::2]
+
+        shards = hpo_shards.get_hpo_shards(shuffled_hpo_ids, 13)
+        self.assertEqual(13, len(shards))
+        self.assertEqual([8] * 9 + [7] * 4, [len(shard) for shard in shards])
+        self.assertEqual(self.hpo_ids,
+                         [hpo_id for shard in shards for hpo_id in shard])
+
+        # sites added after the shards were scheduled still belong to a shard
+        shards = hpo_shards.get_hpo_shards(self.hpo_ids + ['zzz'], 13)
+        self.assertEqual(13, len(shards))
+        self.assertEqual('zzz', shards[-1][-1])
+
+        # more shards than sites
+        shards = hpo_shards.get_hpo_shards(self.hpo_ids[:2], 3)
+        self.assertEqual([['hpo_000'], ['hpo_001'], []], shards)
+
+    def test_get_shard_schedules(self):
+        schedules = hpo_shards.get_shard_schedules(3, shard_seconds=3 * 60 * 60)
+        self.assertEqual([
+            'every 540 minutes from 00:00 to 23:59',
+            'every 540 minutes from 03:00 to 23:59',
+            'every 540 minutes from 06:00 to 23:59'
+        ], schedules)
+
+        schedules = hpo_shards.get_shard_schedules(2, shard_seconds=45 * 60)
+        self.assertEqual([
+            'every 90 minutes from 00:00 to 23:59',
+            'every 90 minutes from 00:45 to 23:59'
+        ], schedules)
+
+        # shards would overlap
+        self.assertRaises(ValueError,
+                          hpo_shards.get_shard_schedules,
+                          9,
+                          shard_seconds=3 * 60 * 60)
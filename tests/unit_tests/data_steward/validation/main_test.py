@@ -199,12 +199,133 @@ class ValidationMainTest(TestCase):
 
         mock_perform_validation_on_file.side_effect = perform_validation_on_file
 
-        actual_result = main.validate_submission(self.hpo_id, self.hpo_bucket,
-                                                 folder_items, folder_prefix)
+        actual_result = main.validate_submission(self.hpo_id,
+                                                 self.hpo_bucket,
+                                                 folder_items,
+                                                 folder_prefix,
+                                                 concurrent_loads=False)
         self.assertCountEqual(expected_results, actual_result.get('results'))
         self.assertCountEqual(expected_errors, actual_result.get('errors'))
         self.assertCountEqual(expected_warnings, actual_result.get('warnings'))
 
+    @mock.patch('bq_utils.create_standard_table')
+    @mock.patch('validation.main.perform_validation_on_files')
+    @mock.patch('validation.main.perform_validation_on_file')
+    def test_validate_submission_default_loads(self,
+                                               mock_perform_validation_on_file,
+                                               mock_perform_validation_on_files,
+                                               mock_create_standard_table):
+        mock_perform_validation_on_files.return_value = [], []
+        folder_items = ['person.csv']
+
+        # concurrent loads are enabled by default
+        with mock.patch.dict('os.environ', clear=True):
+            self.assertTrue(main.use_concurrent_loads())
+            main.validate_submission(self.hpo_id, self.hpo_bucket, folder_items,
+                                     '2019-01-01/')
+        self.assertEqual(1, mock_perform_validation_on_files.call_count)
+        mock_perform_validation_on_file.assert_not_called()
+
+        # and can be disabled by configuration
+        mock_perform_validation_on_file.return_value = [], []
+        with mock.patch.dict('os.environ',
+                             {main_consts.CONCURRENT_LOADS_ENV: 'False'}):
+            self.assertFalse(main.use_concurrent_loads())
+            main.validate_submission(self.hpo_id, self.hpo_bucket, folder_items,
+                                     '2019-01-01/')
+        self.assertEqual(1, mock_perform_validation_on_files.call_count)
+        self.assertTrue(mock_perform_validation_on_file.called)
+
+    @mock.patch('bq_utils.sleeper')
+    @mock.patch('bq_utils.get_jobs_details')
+    @mock.patch('bq_utils.get_job_details')
+    @mock.patch('bq_utils.load_from_csv')
+    @mock.patch('bq_utils.create_standard_table')
+    def test_validate_submission_concurrent_loads(
+        self, mock_create_standard_table, mock_load_from_csv,
+        mock_get_job_details, mock_get_jobs_details, mock_sleeper):
+        """
+        Load jobs are all submitted before any of them is waited on
+
+        A fake BigQuery jobs service reports each job as RUNNING for a number of
+        polls that depends on the table, simulating load latency.
+        """
+        folder_prefix = '2019-01-01/'
+        folder_items = [
+            'person.csv', 'visit_occurrence.csv', 'measurement.csv',
+            'pii_name.csv', 'invalid_file.csv'
+        ]
+        polls_until_done = {
+            'person': 1,
+            'visit_occurrence': 2,
+            'measurement': 4,
+            'pii_name': 3
+        }
+        failed_tables = {'visit_occurrence'}
+        polls = dict()
+        submitted = []
+
+        def load_from_csv(hpo_id, table_name, source_folder_prefix=""):
+            # no job may be waited on before all jobs are submitted
+            self.assertFalse(polls)
+            submitted.append(table_name)
+            return {'jobReference': {'jobId': table_name}}
+
+        def get_job_details(job_id):
+            polls[job_id] = polls.get(job_id, 0) + 1
+            if polls[job_id] < polls_until_done[job_id]:
+                return {'status': {'state': 'RUNNING'}}
+            status = {'state': 'DONE'}
+            if job_id in failed_tables:
+                status['errorResult'] = {'message': 'Fake parsing error'}
+                status['errors'] = [{'message': 'Fake parsing error'}]
+            return {'status': status}
+
+        def get_jobs_details(job_ids):
+            return {job_id: get_job_details(job_id) for job_id in job_ids}
+
+        mock_load_from_csv.side_effect = load_from_csv
+        mock_get_job_details.side_effect = get_job_details
+        mock_get_jobs_details.side_effect = get_jobs_details
+
+        actual_result = main.validate_submission(self.hpo_id,
+                                                 self.hpo_bucket,
+                                                 folder_items,
+                                                 folder_prefix,
+                                                 concurrent_loads=True)
+
+        self.assertCountEqual(polls_until_done.keys(), submitted)
+        # jobs are polled together, so the wait is bounded by the slowest job
+        self.assertEqual(mock_sleeper.call_count,
+                         max(polls_until_done.values()))
+
+        expected_results = []
+        for file_name in sorted(resources.CDM_FILES) + sorted(common.PII_FILES):
+            table_name = file_name.split('.')[0]
+            found = parsed = loaded = 0
+            if table_name in polls_until_done:
+                found = 1
+                if table_name not in failed_tables:
+                    parsed = loaded = 1
+            if file_name in common.SUBMISSION_FILES:
+                expected_results.append((file_name, found, parsed, loaded))
+        self.assertEqual(expected_results, actual_result.get('results'))
+        self.assertCountEqual([('visit_occurrence.csv', 'Fake parsing error')],
+                              actual_result.get('errors'))
+        self.assertCountEqual([('invalid_file.csv', 'Unknown file')],
+                              actual_result.get('warnings'))
+
+        # a job that never completes aborts the submission
+        polls.clear()
+        polls_until_done['measurement'] = float('inf')
+        self.assertRaises(main.InternalValidationError,
+                          main.validate_submission,
+                          self.hpo_id,
+                          self.hpo_bucket,
+                          folder_items,
+                          folder_prefix,
+                          concurrent_loads=True)
+
     @mock.patch('validation.main.gcs_utils.get_hpo_bucket')
     @mock.patch('bq_utils.get_hpo_info')
     @mock.patch('validation.main.list_bucket')
@@ -224,6 +345,31 @@ class ValidationMainTest(TestCase):
                 f"HTTP error: {http_error_string}")
             self.assertIn(expected_call, mock_logging_error.mock_calls)
 
+    @mock.patch('validation.main.process_hpo')
+    def test_process_hpos(self, mock_process_hpo):
+        hpo_ids = ['hpo_a', 'hpo_b', 'hpo_c', 'hpo_d']
+
+        def process_hpo(hpo_id, force_run=False):
+            if hpo_id == 'hpo_b':
+                raise main.InternalValidationError('fake internal error')
+
+        mock_process_hpo.side_effect = process_hpo
+
+        # a failure in one site does not prevent the others from running
+        with self.assertRaises(main.InternalValidationError) as cm:
+            main.process_hpos(hpo_ids, max_workers=2)
+        self.assertIn('hpo_b', str(cm.exception))
+        self.assertCountEqual([mock.call(hpo_id) for hpo_id in hpo_ids],
+                              mock_process_hpo.mock_calls)
+
+        mock_process_hpo.side_effect = None
+        timings = main.process_hpos(hpo_ids, max_workers=2)
+        self.assertCountEqual(hpo_ids, timings.keys())
+        for timing in timings.values():
+            self.assertEqual(main_consts.HPO_STATUS_OK, timing['status'])
+            self.assertGreaterEqual(timing['seconds'], 0)
+            self.assertIsNone(timing['error'])
+
     def test_extract_date_from_rdr(self):
         rdr_dataset_id = 'rdr20200201'
         bad_rdr_dataset_id = 'ehr2019-02-01'
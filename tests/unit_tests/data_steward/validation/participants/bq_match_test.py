@@ -0,0 +1,161 @@
+# Python imports
+import re
+import unittest
+
+# Third party imports
+from mock import patch
+
+# Project imports
+from constants.validation.participants import identity_match as consts
+from constants.validation.participants import normalizers as normalizer_consts
+from validation.participants import bq_match
+
+
+class BqMatchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('**************************************************************')
+        print(cls.__name__)
+        print('**************************************************************')
+
+    def setUp(self):
+        self.project = 'foo'
+        self.validation_dataset = 'baz20190503'
+        self.rdr_dataset = 'bar20190503'
+        self.ehr_dataset = 'foo20190503'
+        self.site = 'awesome-site'
+        self.ehr_tables = [
+            self.site + consts.PII_NAME_TABLE,
+            self.site + consts.PII_EMAIL_TABLE,
+            self.site + consts.PII_PHONE_TABLE,
+            self.site + consts.PII_ADDRESS_TABLE,
+            self.site + consts.EHR_PERSON_TABLE_SUFFIX,
+        ]
+        self.job_id = 'fake_job_id'
+
+        mock_query_patcher = patch(
+            'validation.participants.bq_match.bq_utils.query')
+        self.mock_query = mock_query_patcher.start()
+        self.mock_query.return_value = {'jobReference': {'jobId': self.job_id}}
+        self.addCleanup(mock_query_patcher.stop)
+
+        mock_wait_patcher = patch(
+            'validation.participants.bq_match.bq_utils.wait_on_jobs')
+        self.mock_wait = mock_wait_patcher.start()
+        self.mock_wait.return_value = []
+        self.addCleanup(mock_wait_patcher.stop)
+
+        mock_job_details_patcher = patch(
+            'validation.participants.bq_match.bq_utils.get_job_details')
+        self.mock_job_details = mock_job_details_patcher.start()
+        self.mock_job_details.return_value = {'status': {'state': 'DONE'}}
+        self.addCleanup(mock_job_details_patcher.stop)
+
+    def test_get_normalizer_functions(self):
+        # test
+        functions = bq_match.get_normalizer_functions()
+
+        # post conditions
+        declared = re.findall(r'CREATE TEMP FUNCTION (\w+)', functions)
+        for function in [
+                'NormalizeName', 'NormalizeEmail', 'NormalizePhone',
+                'NormalizeState', 'NormalizeZip', 'NormalizeCity',
+                'NormalizeStreet', 'StreetTokens', 'MatchResult'
+        ]:
+            self.assertIn(function, declared)
+        self.assertIn(r"r'[^\p{L}]'", functions)
+        self.assertIn("('apt', 'apartment')", functions)
+        self.assertIn("('st', 'saint')", functions)
+        self.assertIn("'{}'".format(normalizer_consts.STATE_ABBREVIATIONS[0]),
+                      functions)
+
+    def test_get_site_match_query(self):
+        # test
+        query, missing_tables = bq_match.get_site_match_query(
+            self.project, self.validation_dataset, self.rdr_dataset,
+            self.ehr_dataset, self.site, self.ehr_tables)
+
+        # post conditions
+        self.assertEqual(missing_tables, [])
+        self.assertIn(
+            'INSERT INTO `{}.{}.{}{}`'.format(self.project,
+                                              self.validation_dataset,
+                                              self.site,
+                                              consts.VALIDATION_TABLE_SUFFIX),
+            query)
+        for table in self.ehr_tables:
+            self.assertIn(
+                '`{}.{}.{}`'.format(self.project, self.ehr_dataset, table),
+                query)
+        self.assertIn('`{}.{}.location`'.format(self.project, self.rdr_dataset),
+                      query)
+        self.assertIn(
+            '`{}.{}.{}`'.format(self.project, self.validation_dataset,
+                                consts.ID_MATCH_TABLE), query)
+        for concept_id in [
+                consts.OBS_PII_NAME_FIRST, consts.OBS_PII_STREET_ADDRESS_ZIP,
+                consts.OBS_PII_SEX
+        ]:
+            self.assertIn(
+                'observation_source_concept_id = {}'.format(concept_id), query)
+        # every field of the identity match table is written
+        for field in consts.VALIDATION_FIELDS:
+            self.assertIn(' AS {},'.format(field), query)
+        self.assertIn("'{}' AS middle_name".format(consts.MISSING), query)
+
+    def test_get_site_match_query_missing_tables(self):
+        # pre conditions
+        ehr_tables = self.ehr_tables[:1]
+
+        # test
+        query, missing_tables = bq_match.get_site_match_query(
+            self.project, self.validation_dataset, self.rdr_dataset,
+            self.ehr_dataset, self.site, ehr_tables)
+
+        # post conditions
+        self.assertEqual(missing_tables, self.ehr_tables[1:])
+        for table in missing_tables:
+            self.assertNotIn(table, query)
+        self.assertIn('CAST(NULL AS STRING) AS email LIMIT 0', query)
+        self.assertIn('CAST(NULL AS DATE) AS birth_date LIMIT 0', query)
+
+    def test_match_site(self):
+        # test
+        missing_tables = bq_match.match_site(self.project,
+                                             self.validation_dataset,
+                                             self.rdr_dataset, self.ehr_dataset,
+                                             self.site, self.ehr_tables)
+
+        # post conditions
+        self.assertEqual(missing_tables, [])
+        self.assertEqual(self.mock_query.call_count, 1)
+        query = self.mock_query.call_args[0][0]
+        self.assertTrue(query.strip().startswith('CREATE TEMP FUNCTION'))
+        self.mock_wait.assert_called_once_with([self.job_id])
+        self.mock_job_details.assert_called_once_with(self.job_id)
+
+    def test_match_site_errors(self):
+        # pre conditions
+        self.mock_job_details.return_value = {
+            'status': {
+                'state': 'DONE',
+                'errorResult': {
+                    'message': 'bad query'
+                }
+            }
+        }
+
+        # test
+        self.assertRaises(RuntimeError, bq_match.match_site, self.project,
+                          self.validation_dataset, self.rdr_dataset,
+                          self.ehr_dataset, self.site, self.ehr_tables)
+
+        # pre conditions
+        self.mock_wait.return_value = [self.job_id]
+
+        # test
+        self.assertRaises(bq_match.bq_utils.BigQueryJobWaitError,
+                          bq_match.match_site, self.project,
+                          self.validation_dataset, self.rdr_dataset,
+                          self.ehr_dataset, self.site, self.ehr_tables)
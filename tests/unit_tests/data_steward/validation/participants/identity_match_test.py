@@ -249,8 +249,11 @@ class IdentityMatchTest(unittest.TestCase):
         # pre conditions
 
         # test
-        id_match.match_participants(self.project, self.rdr_dataset,
-                                    self.pii_dataset, self.dest_dataset)
+        id_match.match_participants(self.project,
+                                    self.rdr_dataset,
+                                    self.pii_dataset,
+                                    self.dest_dataset,
+                                    set_based=False)
 
         # post conditions
         self.assertEqual(self.mock_dest_dataset.call_count, 1)
@@ -290,8 +293,11 @@ class IdentityMatchTest(unittest.TestCase):
             500, b'bar', b'baz')
 
         # test
-        id_match.match_participants(self.project, self.rdr_dataset,
-                                    self.pii_dataset, self.dest_dataset)
+        id_match.match_participants(self.project,
+                                    self.rdr_dataset,
+                                    self.pii_dataset,
+                                    self.dest_dataset,
+                                    set_based=False)
 
         # post conditions
         self.assertEqual(self.mock_dest_dataset.call_count, 1)
@@ -331,8 +337,11 @@ class IdentityMatchTest(unittest.TestCase):
             500, b'bar', b'baz')
 
         # test
-        id_match.match_participants(self.project, self.rdr_dataset,
-                                    self.pii_dataset, self.dest_dataset)
+        id_match.match_participants(self.project,
+                                    self.rdr_dataset,
+                                    self.pii_dataset,
+                                    self.dest_dataset,
+                                    set_based=False)
 
         # post conditions
         self.assertEqual(self.mock_dest_dataset.call_count, 1)
@@ -373,8 +382,11 @@ class IdentityMatchTest(unittest.TestCase):
             500, b'bar', b'baz')
 
         # test
-        id_match.match_participants(self.project, self.rdr_dataset,
-                                    self.pii_dataset, self.dest_dataset)
+        id_match.match_participants(self.project,
+                                    self.rdr_dataset,
+                                    self.pii_dataset,
+                                    self.dest_dataset,
+                                    set_based=False)
 
         # post conditions
         self.assertEqual(self.mock_dest_dataset.call_count, 1)
@@ -414,8 +426,11 @@ class IdentityMatchTest(unittest.TestCase):
             500, b'bar', b'baz')
 
         # test
-        id_match.match_participants(self.project, self.rdr_dataset,
-                                    self.pii_dataset, self.dest_dataset)
+        id_match.match_participants(self.project,
+                                    self.rdr_dataset,
+                                    self.pii_dataset,
+                                    self.dest_dataset,
+                                    set_based=False)
 
         # post conditions
         self.assertEqual(self.mock_dest_dataset.call_count, 1)
@@ -449,6 +464,35 @@ class IdentityMatchTest(unittest.TestCase):
         self.assertEqual(self.mock_drc_bucket.call_count, 0)
         self.assertEqual(self.mock_validation_report.call_count, 0)
 
+    @patch('validation.participants.identity_match.bq_match.match_site')
+    def test_match_participants_set_based(self, mock_match_site):
+        # pre conditions
+        mock_match_site.side_effect = [
+            ['bogus-site' + consts.PII_NAME_TABLE],
+            [],
+            googleapiclient.errors.HttpError(500, b'bar', b'baz'),
+        ]
+
+        # test
+        errors = id_match.match_participants(self.project, self.rdr_dataset,
+                                             self.pii_dataset,
+                                             self.dest_dataset)
+
+        # post conditions
+        num_sites = len(self.site_list)
+        self.assertEqual(errors, 2)
+        self.assertEqual(self.mock_pii_match_tables.call_count, num_sites)
+        self.assertEqual(mock_match_site.call_args_list, [
+            call(self.project, self.dest_dataset, self.rdr_dataset,
+                 self.pii_dataset, site, self.dataset_contents)
+            for site in self.site_list
+        ])
+        self.assertEqual(self.mock_ehr_person.call_count, 0)
+        self.assertEqual(self.mock_rdr_values.call_count, 0)
+        self.assertEqual(self.mock_pii_values.call_count, 0)
+        self.assertEqual(self.mock_location_pii.call_count, 0)
+        self.assertEqual(self.mock_table_write.call_count, 0)
+
     def test_write_results_to_site_buckets(self):
         # pre conditions
 
@@ -1,7 +1,71 @@
+"""
+Unit test for the normalizers module.
+
+Includes a benchmark normalizing synthetic street addresses one by one and as a
+batch.  The benchmark normalizes 100,000 addresses by default, set
+NORMALIZERS_BENCHMARK_ROWS=10000000 to measure the throughput on ten million
+addresses.
+"""
+# Python imports
+import os
+import time
 import unittest
 
+# Third party imports
+import numpy as np
+import pandas as pd
+
+# Project imports
+from constants.validation.participants import normalizers as consts
 from validation.participants import normalizers as normalizer
 
+BENCHMARK_ROWS_ENV = 'NORMALIZERS_BENCHMARK_ROWS'
+DEFAULT_BENCHMARK_ROWS = 100000
+
+
+def _reference_normalize_street(street):
+    """
+    Normalize a street character by character, as normalize_street did before
+    """
+    normalized_street = ''
+    for char in street.lower():
+        if char.isalnum():
+            normalized_street += char
+        else:
+            normalized_street += ' '
+
+    parts = []
+    for part in normalized_street.split():
+        part = consts.ADDRESS_ABBREVIATIONS.get(part, part)
+        if consts.COMPILED_NUMERIC_ENDINGS_REGEX.match(part):
+            part = part[0:-2]
+        if consts.COMPILED_ALPHA_NUMERIC.match(part):
+            digits = ''
+            alphas = ''
+            for char in part:
+                if char.isalpha():
+                    alphas += char
+                elif char.isdigit():
+                    digits += char
+            part = ' '.join([digits, alphas])
+        parts.append(part)
+    return ' '.join(parts)
+
+
+def _synthetic_streets(row_count):
+    numbers = np.arange(row_count) % 2000 + 1
+    names = np.array(
+        ['Main', 'Oak', 'Elm', 'Lincoln', '5th', '21st', 'Park', 'Hill'])
+    suffixes = np.array(['St.', 'Ave', 'Rd', 'Blvd.', 'Street', 'Ln'])
+    units = np.array(['', ' Apt. 4E', ' Ste 200', ' #12b'])
+    streets = [
+        f'{number} {name} {suffix}{unit}' for number, name, suffix, unit in zip(
+            numbers, names[np.arange(row_count) % len(names)], suffixes[
+                np.arange(row_count) // 7 %
+                len(suffixes)], units[np.arange(row_count) // 3 % len(units)])
+    ]
+    return pd.Series(streets, dtype=object)
+
 
 class NormalizersTest(unittest.TestCase):
 
@@ -266,3 +330,77 @@ class NormalizersTest(unittest.TestCase):
         # post condition
         expected = 'joanne'
         self.assertEqual(actual, expected)
+
+    def test_normalize_city_name_expands_whole_words(self):
+        # test
+        actual = normalizer.normalize_city_name('West St. Louis')
+
+        # post condition
+        expected = 'west saint louis'
+        self.assertEqual(actual, expected)
+
+    def test_normalize_street_expands_whole_words(self):
+        # test
+        actual = normalizer.normalize_street('1 E First St')
+
+        # post condition
+        expected = '1 east first street'
+        self.assertEqual(actual, expected)
+
+    def test_normalize_batches(self):
+        # pre conditions
+        values = pd.Series(
+            ['Apt. 50a', None, '71st Street', 'Apt. 50a', np.nan, 1492.0],
+            index=[5, 4, 3, 2, 1, 0])
+        batches = [
+            (normalizer.normalize_city_names, normalizer.normalize_city_name),
+            (normalizer.normalize_streets, normalizer.normalize_street),
+            (normalizer.normalize_states, normalizer.normalize_state),
+            (normalizer.normalize_zips, normalizer.normalize_zip),
+            (normalizer.normalize_phones, normalizer.normalize_phone),
+            (normalizer.normalize_emails, normalizer.normalize_email),
+            (normalizer.normalize_names, normalizer.normalize_name),
+        ]
+
+        for normalize_batch, normalize in batches:
+            # test
+            actual = normalize_batch(values)
+
+            # post conditions
+            expected = [
+                normalize(None if pd.isna(value) else value) for value in values
+            ]
+            self.assertEqual(actual.tolist(), expected)
+            self.assertEqual(actual.index.tolist(), values.index.tolist())
+
+        # test
+        actual = normalizer.normalize_streets(['Elm St', 'Elm St'])
+
+        # post conditions
+        self.assertEqual(actual.tolist(), ['elm street', 'elm street'])
+        self.assertEqual(normalizer.normalize_streets([]).tolist(), [])
+
+    def test_benchmark(self):
+        """
+        Benchmark normalizing synthetic streets one by one and as a batch
+        """
+        row_count = int(
+            os.environ.get(BENCHMARK_ROWS_ENV, DEFAULT_BENCHMARK_ROWS))
+        streets = _synthetic_streets(row_count)
+        sample = streets[:min(row_count, DEFAULT_BENCHMARK_ROWS)]
+
+        start = time.time()
+        expected = [_reference_normalize_street(street) for street in sample]
+        reference_seconds = time.time() - start
+
+        start = time.time()
+        actual = normalizer.normalize_streets(streets)
+        batch_seconds = time.time() - start
+
+        reference_rate = len(sample) / max(reference_seconds, 1e-6)
+        batch_rate = row_count / max(batch_seconds, 1e-6)
+        print(f"Normalized {len(sample)} streets one by one at "
+              f"{reference_rate:,.0f} streets/s, {row_count} streets as a "
+              f"batch in {batch_seconds:.2f}s at {batch_rate:,.0f} streets/s")
+        self.assertEqual(actual[:len(sample)].tolist(), expected)
+        self.assertEqual(len(actual), row_count)
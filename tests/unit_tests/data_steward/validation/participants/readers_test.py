@@ -68,7 +68,7 @@ class ReadersTest(unittest.TestCase):
                 batch=True), None)
 
     @patch('validation.participants.readers.rc.fields_for')
-    @patch('validation.participants.readers.bq_utils.large_response_to_rowlist')
+    @patch('validation.participants.readers.bq_utils.iter_response_rows')
     @patch('validation.participants.readers.bq_utils.query')
     def test_get_ehr_person_values_with_duplicate_keys(self, mock_query,
                                                        mock_response,
@@ -122,7 +122,7 @@ class ReadersTest(unittest.TestCase):
                                                 field=column_name)), None)
 
     @patch('validation.participants.readers.rc.fields_for')
-    @patch('validation.participants.readers.bq_utils.large_response_to_rowlist')
+    @patch('validation.participants.readers.bq_utils.iter_response_rows')
     @patch('validation.participants.readers.bq_utils.query')
     def test_get_ehr_person_values(self, mock_query, mock_response,
                                    mock_fields):
@@ -167,7 +167,7 @@ class ReadersTest(unittest.TestCase):
                                                 field=column_name)), None)
 
     @patch('validation.participants.readers.rc.fields_for')
-    @patch('validation.participants.readers.bq_utils.large_response_to_rowlist')
+    @patch('validation.participants.readers.bq_utils.iter_response_rows')
     @patch('validation.participants.readers.bq_utils.query')
     def test_get_rdr_match_values(self, mock_query, mock_response, mock_fields):
         # pre conditions
@@ -209,7 +209,7 @@ class ReadersTest(unittest.TestCase):
                                                      field_value=12345)), None)
 
     @patch('validation.participants.readers.rc.fields_for')
-    @patch('validation.participants.readers.bq_utils.large_response_to_rowlist')
+    @patch('validation.participants.readers.bq_utils.iter_response_rows')
     @patch('validation.participants.readers.bq_utils.query')
     def test_get_rdr_match_values_with_duplicates(self, mock_query,
                                                   mock_response, mock_fields):
@@ -260,7 +260,7 @@ class ReadersTest(unittest.TestCase):
                                                      field_value=12345)), None)
 
     @patch('validation.participants.readers.rc.fields_for')
-    @patch('validation.participants.readers.bq_utils.large_response_to_rowlist')
+    @patch('validation.participants.readers.bq_utils.iter_response_rows')
     @patch('validation.participants.readers.bq_utils.query')
     def test_get_pii_values(self, mock_query, mock_response, mock_fields):
         # pre conditions
@@ -303,7 +303,7 @@ class ReadersTest(unittest.TestCase):
                                          field=12345)), None)
 
     @patch('validation.participants.readers.rc.fields_for')
-    @patch('validation.participants.readers.bq_utils.large_response_to_rowlist')
+    @patch('validation.participants.readers.bq_utils.iter_response_rows')
     @patch('validation.participants.readers.bq_utils.query')
     def test_get_pii_values_with_duplicates(self, mock_query, mock_response,
                                             mock_fields):
@@ -356,7 +356,7 @@ class ReadersTest(unittest.TestCase):
                                          field=12345)), None)
 
     @patch('validation.participants.readers.rc.fields_for')
-    @patch('validation.participants.readers.bq_utils.large_response_to_rowlist')
+    @patch('validation.participants.readers.bq_utils.iter_response_rows')
     @patch('validation.participants.readers.bq_utils.query')
     def test_get_location_pii(self, mock_query, mock_response, mock_fields):
         # pre conditions
@@ -412,7 +412,7 @@ class ReadersTest(unittest.TestCase):
                                                   id_list='85, 90, 115')), None)
 
     @patch('validation.participants.readers.rc.fields_for')
-    @patch('validation.participants.readers.bq_utils.large_response_to_rowlist')
+    @patch('validation.participants.readers.bq_utils.iter_response_rows')
     @patch('validation.participants.readers.bq_utils.query')
     def test_get_ehr_person_values_birthdates(self, mock_query, mock_response,
                                               mock_fields):
@@ -457,7 +457,7 @@ class ReadersTest(unittest.TestCase):
                                                 field=column_name)), None)
 
     @patch('validation.participants.readers.rc.fields_for')
-    @patch('validation.participants.readers.bq_utils.large_response_to_rowlist')
+    @patch('validation.participants.readers.bq_utils.iter_response_rows')
     @patch('validation.participants.readers.bq_utils.query')
     def test_get_ehr_person_values_bytes(self, mock_query, mock_response,
                                          mock_fields):
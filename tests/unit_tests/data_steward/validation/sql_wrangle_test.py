@@ -1,5 +1,6 @@
 # Python imports
 import os
+import threading
 import unittest
 
 # Third party imports
@@ -196,5 +197,78 @@ class SQLWrangleTest(unittest.TestCase):
                                        hpo_id='pitt_temple')
         self.assertEqual(r, 'pitt_temple_achilles_results')
 
+    def test_get_write_and_read_tables(self):
+        insert = (
+            '-- 1 Number of persons from the person table\n'
+            'insert into fake_achilles_results (analysis_id, count_value)\n'
+            'select 1 as analysis_id, COUNT(distinct person_id)\n'
+            ' from fake_person p join fake_observation_period op\n'
+            ' on p.person_id = op.person_id')
+        self.assertTrue(sql_wrangle.is_insert(insert))
+        self.assertEqual(sql_wrangle.get_write_tables(insert),
+                         {'fake_achilles_results'})
+        self.assertEqual(sql_wrangle.get_read_tables(insert),
+                         {'fake_person', 'fake_observation_period'})
+
+        self.assertFalse(sql_wrangle.is_insert(self.query_2))
+        self.assertEqual(sql_wrangle.get_write_tables(self.query_2),
+                         {'temp.rawdata_1006'})
+        self.assertIn('synpuf_100.person',
+                      sql_wrangle.get_read_tables(self.query_2))
+
+        self.assertEqual(
+            sql_wrangle.get_write_tables('truncate table fake_temp_results'),
+            {'fake_temp_results'})
+        self.assertEqual(
+            sql_wrangle.get_write_tables('drop table fake_temp_results'),
+            {'fake_temp_results'})
+
+    def test_get_dependencies(self):
+        commands = [
+            'insert into fake_results (a) select a from fake_person',
+            'insert into fake_results (a) select a from fake_visit',
+            'INTO fake_temp select count(*) from fake_results',
+            'insert into fake_derived (a) select a from fake_temp',
+            'insert into fake_results (a) select a from fake_person',
+            'truncate table fake_temp',
+        ]
+        self.assertEqual(sql_wrangle.get_dependencies(commands),
+                         [set(), set(), {0, 1}, {2}, {2}, {2, 3}])
+
+    def test_run_commands(self):
+        commands = [
+            'insert into fake_results (a) select a from fake_person',
+            'insert into fake_results (a) select a from fake_visit',
+            'INTO fake_temp select count(*) from fake_results',
+            'insert into fake_derived (a) select a from fake_temp',
+        ]
+        finished = []
+        both_started = threading.Barrier(2, timeout=5)
+
+        def run_command(command):
+            if command in commands[:2]:
+                # the independent inserts only pass once both are running
+                both_started.wait()
+            finished.append(command)
+
+        sql_wrangle.run_commands(commands, run_command, max_concurrent_jobs=2)
+        self.assertCountEqual(finished[:2], commands[:2])
+        self.assertEqual(finished[2:], commands[2:])
+
+    def test_run_commands_error(self):
+        commands = [
+            'insert into fake_results (a) select a from fake_person',
+            'INTO fake_temp select count(*) from fake_results',
+        ]
+        started = []
+
+        def run_command(command):
+            started.append(command)
+            raise RuntimeError('Job taking too long')
+
+        with self.assertRaises(RuntimeError):
+            sql_wrangle.run_commands(commands, run_command)
+        self.assertEqual(started, commands[:1])
+
     def tearDown(self):
         pass
@@ -14,7 +14,8 @@ from resources import AOU_VOCAB_CONCEPT_CSV_PATH
 from tests.test_util import TEST_VOCABULARY_VOCABULARY_CSV, TEST_VOCABULARY_CONCEPT_CSV
 from vocabulary import (_transform_csv, format_date_str, get_aou_vocabulary_row,
                         append_vocabulary, append_concepts, AOU_GEN_ID,
-                        AOU_CUSTOM_ID, _vocab_id_match)
+                        AOU_CUSTOM_ID, _vocab_id_match, transform_files,
+                        add_aou_vocabs, prepare_files)
 
 
 class VocabularyTest(unittest.TestCase):
@@ -131,3 +132,75 @@ class VocabularyTest(unittest.TestCase):
                 warn_call.assert_called()
         finally:
             shutil.rmtree(out_dir)
+
+    def test_prepare_files(self):
+        concept_rows = [
+            'concept_id\tconcept_name\tvocabulary_id\tvalid_start_date\tvalid_end_date',
+            '1\tfoo\tSNOMED\t20170517\t20991231',
+            '2\tbar\tRxNorm\t2019-01-01\t20991231',
+            '3\tbaz\t%s\t20190101\t20991231' % AOU_GEN_ID,
+            '4\tbad\tSNOMED\tnot a date\t20991231',
+            '5\tqux\tLOINC\t20200202\t20991231'
+        ]
+        vocabulary_rows = [
+            'vocabulary_id\tvocabulary_name\tvocabulary_concept_id',
+            'SNOMED\tSystematic Nomenclature\t44819097'
+        ]
+        relationship_rows = [
+            'relationship_id\trelationship_name',
+            'Maps to\tNon-standard to Standard map'
+        ]
+        in_dir = tempfile.mkdtemp()
+        old_dir = tempfile.mkdtemp()
+        new_dir = tempfile.mkdtemp()
+        files = {
+            'CONCEPT.csv': concept_rows,
+            'VOCABULARY.csv': vocabulary_rows,
+            'RELATIONSHIP.csv': relationship_rows
+        }
+
+        try:
+            for file_name, rows in files.items():
+                with open(os.path.join(in_dir, file_name), 'w',
+                          newline='') as fp:
+                    fp.write('\r\n'.join(rows) + '\r\n')
+
+            # prepare as transform_files followed by add_aou_vocabs
+            transformed_dir = os.path.join(old_dir, 'transformed')
+            os.makedirs(transformed_dir)
+            with mock.patch('warnings.warn'):
+                transform_files(in_dir, transformed_dir)
+                add_aou_vocabs(transformed_dir, old_dir)
+
+            # small ranges so each file is split across the processes
+            with mock.patch('warnings.warn') as warn_call:
+                rates = prepare_files(in_dir,
+                                      new_dir,
+                                      processes=2,
+                                      chunk_size=16)
+                self.assertEqual(warn_call.call_count, 1)
+                self.assertIn(AOU_GEN_ID, warn_call.call_args[0][0])
+
+            self.assertEqual(set(rates), set(files))
+            for file_name in files:
+                # add_aou_vocabs only writes the concept and vocabulary files
+                old_path = os.path.join(old_dir, file_name)
+                if not os.path.exists(old_path):
+                    old_path = os.path.join(transformed_dir, file_name)
+                with open(old_path) as old_fp, open(
+                        os.path.join(new_dir, file_name)) as new_fp:
+                    self.assertEqual(old_fp.read(), new_fp.read())
+
+            with open(os.path.join(new_dir, 'errors', 'CONCEPT.csv')) as fp:
+                errors = fp.read()
+            self.assertIn("'bad'", errors)
+            self.assertNotIn("'foo'", errors)
+            with open(os.path.join(new_dir, 'errors', 'VOCABULARY.csv')) as fp:
+                self.assertEqual(fp.read(), '')
+
+            # the AoU rows can't be added without the vocabulary file
+            os.remove(os.path.join(in_dir, 'VOCABULARY.csv'))
+            self.assertRaises(IOError, prepare_files, in_dir, new_dir)
+        finally:
+            for path in [in_dir, old_dir, new_dir]:
+                shutil.rmtree(path)